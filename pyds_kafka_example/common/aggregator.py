@@ -0,0 +1,145 @@
+################################################################################
+# SPDX-FileCopyrightText: Copyright (c) 2019-2021 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+################################################################################
+
+"""Time-windowed aggregation of line-crossing counts.
+
+The probe feeds the per-frame counts of every frame with a crossing and
+publishes one message per closed window and stream instead of one per frame:
+
+    aggregator = WindowAggregator(window=5.0)
+    aggregator.add(pad_index, {"straight": (curr, cum)}, now)
+    for window in aggregator.flush(now):
+        ...
+
+Windows are tumbling by default, or hopping when hop < window (each count
+then lands in window / hop overlapping windows). A window is emitted once a
+later count of the same stream shows it has ended, and at the latest
+max_latency seconds after its end, so quiet streams still publish.
+"""
+
+import math
+
+
+class WindowCounts:
+    """Aggregated counts of one stream over [start, end).
+
+    counts maps each line label to (summed current count, latest
+    cumulative count).
+    """
+
+    def __init__(self, pad_index, start, end):
+        self.pad_index = pad_index
+        self.start = start
+        self.end = end
+        self.counts = {}
+        self.frames = 0
+
+    def add(self, counts):
+        for label, (curr, cum) in counts.items():
+            total, _ = self.counts.get(label, (0, 0))
+            self.counts[label] = (total + curr, cum)
+        self.frames += 1
+
+    def __repr__(self):
+        return "WindowCounts(pad_index={0}, start={1:.3f}, end={2:.3f}, " \
+               "counts={3})".format(self.pad_index, self.start, self.end,
+                                    self.counts)
+
+
+class WindowAggregator:
+    def __init__(self, window, hop=None, max_latency=0.0):
+        if window <= 0:
+            raise ValueError("window must be positive")
+        hop = window if hop is None else hop
+        if hop <= 0 or hop > window:
+            raise ValueError("hop must be in (0, window]")
+        self.window = window
+        self.hop = hop
+        self.max_latency = max_latency
+        # open windows keyed by (pad_index, window index)
+        self._open = {}
+        # latest timestamp seen per stream
+        self._watermark = {}
+
+    def _windows(self, ts):
+        # indices k of all windows [k * hop, k * hop + window) containing ts;
+        # integer keys keep float hops from splitting a window in two
+        last = int(math.floor(ts / self.hop))
+        first = last - int(math.ceil(self.window / self.hop)) + 1
+        return [k for k in range(first, last + 1)
+                if k * self.hop + self.window > ts]
+
+    def add(self, pad_index, counts, ts):
+        """Adds the {label: (current, cumulative)} counts of one frame."""
+        self._watermark[pad_index] = max(ts, self._watermark.get(pad_index, ts))
+        for k in self._windows(ts):
+            window = self._open.get((pad_index, k))
+            if window is None:
+                start = k * self.hop
+                window = self._open[(pad_index, k)] = WindowCounts(
+                    pad_index, start, start + self.window)
+            window.add(counts)
+
+    def flush(self, now):
+        """Returns the windows that are complete at time now, oldest first."""
+        closed = [key for key, window in self._open.items()
+                  if window.end <= self._watermark[window.pad_index] or
+                  window.end + self.max_latency <= now]
+        closed.sort(key=lambda key: key[1])
+        return [self._open.pop(key) for key in closed]
+
+    def flush_all(self):
+        """Returns all open windows, e.g. at end of stream."""
+        windows = sorted(self._open.values(), key=lambda w: w.start)
+        self._open.clear()
+        return windows
+
+
+def _check_aggregation():
+    tumbling = WindowAggregator(window=1.0, max_latency=0.5)
+    for ts in (0.1, 0.2, 0.9):
+        tumbling.add(0, {"straight": (1, int(ts * 10))}, ts)
+    tumbling.add(1, {"straight": (2, 40)}, 0.3)
+    assert tumbling.flush(0.95) == []
+    tumbling.add(0, {"straight": (1, 11)}, 1.1)
+    windows = tumbling.flush(1.2)
+    assert [(w.pad_index, w.start, w.counts) for w in windows] == \
+        [(0, 0.0, {"straight": (3, 9)})]
+    # stream 1 has no later count, max_latency closes its window
+    windows = tumbling.flush(1.5)
+    assert [(w.pad_index, w.counts) for w in windows] == \
+        [(1, {"straight": (2, 40)})]
+    assert [w.start for w in tumbling.flush_all()] == [1.0]
+
+    hopping = WindowAggregator(window=2.0, hop=1.0)
+    hopping.add(0, {"straight": (1, 1)}, 1.5)
+    assert sorted(w.start for w in hopping.flush_all()) == [0.0, 1.0]
+
+    # one message per window instead of one per frame
+    aggregator = WindowAggregator(window=5.0)
+    frames = messages = 0
+    for n in range(30 * 60):
+        ts = n / 30.0
+        aggregator.add(0, {"straight": (1, n)}, ts)
+        frames += 1
+        messages += len(aggregator.flush(ts))
+    messages += len(aggregator.flush_all())
+    print("{0} frames with crossings -> {1} messages".format(frames, messages))
+
+
+if __name__ == "__main__":
+    _check_aggregation()
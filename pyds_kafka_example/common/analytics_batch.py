@@ -0,0 +1,181 @@
+################################################################################
+# SPDX-FileCopyrightText: Copyright (c) 2019-2021 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+################################################################################
+
+import numpy as np
+
+
+class AnalyticsBatch:
+    """nvdsanalytics counts of one batch, indexed by (frame, label).
+
+    lc_curr / lc_cum / roi / oc follow the label order of the
+    AnalyticsLabels the batch was extracted with.
+    """
+
+    def __init__(self, frame_meta, pad_index, frame_num, has_analytics,
+                 lc_curr, lc_cum, roi, oc):
+        self.frame_meta = frame_meta
+        self.pad_index = pad_index
+        self.frame_num = frame_num
+        self.has_analytics = has_analytics
+        self.lc_curr = lc_curr
+        self.lc_cum = lc_cum
+        self.roi = roi
+        self.oc = oc
+
+    def __len__(self):
+        return len(self.pad_index)
+
+    def frames_with_crossings(self):
+        return np.flatnonzero(self.lc_curr.sum(axis=1))
+
+    def get_frame_meta(self, pyds, i):
+        # The native extractor returns addresses, the Python walk returns
+        # the frame meta objects themselves.
+        frame_meta = self.frame_meta[i]
+        if isinstance(frame_meta, np.integer):
+            return pyds.NvDsFrameMeta.cast(int(frame_meta))
+        return frame_meta
+
+
+def _walk_batch(pyds, batch_meta, labels):
+    # Python fallback for bindings built without nvds_analytics_batch_counts.
+    analytics_meta_type = pyds.nvds_get_user_meta_type(
+        "NVIDIA.DSANALYTICSFRAME.USER_META")
+    frames = []
+    l_frame = batch_meta.frame_meta_list
+    while l_frame is not None:
+        frames.append(pyds.NvDsFrameMeta.cast(l_frame.data))
+        l_frame = l_frame.next
+
+    num_frames = len(frames)
+    lc_curr = np.zeros((num_frames, len(labels.lc)), dtype=np.uint32)
+    lc_cum = np.zeros((num_frames, len(labels.lc)), dtype=np.uint32)
+    roi = np.zeros((num_frames, len(labels.roi)), dtype=np.uint32)
+    oc = np.zeros((num_frames, len(labels.oc)), dtype=bool)
+    has_analytics = np.zeros(num_frames, dtype=bool)
+
+    for i, frame_meta in enumerate(frames):
+        l_user = frame_meta.frame_user_meta_list
+        while l_user is not None:
+            user_meta = pyds.NvDsUserMeta.cast(l_user.data)
+            if user_meta.base_meta.meta_type == analytics_meta_type:
+                meta = pyds.NvDsAnalyticsFrameMeta.cast(
+                    user_meta.user_meta_data)
+                has_analytics[i] = True
+                for row, counts, names in ((lc_curr, meta.objLCCurrCnt, labels.lc),
+                                           (lc_cum, meta.objLCCumCnt, labels.lc),
+                                           (roi, meta.objInROIcnt, labels.roi),
+                                           (oc, meta.ocStatus, labels.oc)):
+                    for j, name in enumerate(names):
+                        if name in counts:
+                            row[i, j] = counts[name]
+            l_user = l_user.next
+
+    return AnalyticsBatch(
+        frame_meta=frames,
+        pad_index=np.array([f.pad_index for f in frames], dtype=np.uint32),
+        frame_num=np.array([f.frame_num for f in frames], dtype=np.int32),
+        has_analytics=has_analytics,
+        lc_curr=lc_curr, lc_cum=lc_cum, roi=roi, oc=oc)
+
+
+def extract_analytics_batch(pyds, batch_meta, labels):
+    """Returns the AnalyticsBatch of batch_meta for the given labels.
+
+    Uses the native pyds.nvds_analytics_batch_counts when the bindings
+    provide it, so the probe does not walk the meta lists in Python.
+    """
+    native = getattr(pyds, "nvds_analytics_batch_counts", None)
+    if native is None:
+        return _walk_batch(pyds, batch_meta, labels)
+    return AnalyticsBatch(**native(batch_meta, labels.lc, labels.roi,
+                                   labels.oc))
+
+
+class CrossingObjects:
+    """Objects of one batch that crossed a line, one row per object and
+    crossed label, in frame order. label indexes the lc labels the
+    objects were extracted with; bbox rows hold (left, top, width,
+    height)."""
+
+    def __init__(self, frame, object_id, class_id, bbox, label):
+        self.frame = frame
+        self.object_id = object_id
+        self.class_id = class_id
+        self.bbox = bbox
+        self.label = label
+
+    def __len__(self):
+        return len(self.frame)
+
+    def frame_rows(self, i):
+        """Returns the slice of the rows of frame i of the batch."""
+        start, stop = np.searchsorted(self.frame, [i, i + 1])
+        return slice(int(start), int(stop))
+
+
+def _walk_crossings(pyds, batch_meta, lc_labels):
+    # Python fallback for bindings built without
+    # nvds_analytics_batch_crossings.
+    obj_meta_type = pyds.nvds_get_user_meta_type(
+        "NVIDIA.DSANALYTICSOBJ.USER_META")
+    label_index = dict((label, j) for j, label in enumerate(lc_labels))
+    rows = []
+    i = 0
+    l_frame = batch_meta.frame_meta_list
+    while l_frame is not None:
+        frame_meta = pyds.NvDsFrameMeta.cast(l_frame.data)
+        l_obj = frame_meta.obj_meta_list
+        while l_obj is not None:
+            obj_meta = pyds.NvDsObjectMeta.cast(l_obj.data)
+            l_user = obj_meta.obj_user_meta_list
+            while l_user is not None:
+                user_meta = pyds.NvDsUserMeta.cast(l_user.data)
+                if user_meta.base_meta.meta_type == obj_meta_type:
+                    info = pyds.NvDsAnalyticsObjInfo.cast(
+                        user_meta.user_meta_data)
+                    rect = obj_meta.rect_params
+                    for status in info.lcStatus:
+                        if status in label_index:
+                            rows.append((i, obj_meta.object_id,
+                                         obj_meta.class_id,
+                                         (rect.left, rect.top, rect.width,
+                                          rect.height),
+                                         label_index[status]))
+                l_user = l_user.next
+            l_obj = l_obj.next
+        l_frame = l_frame.next
+        i += 1
+
+    return CrossingObjects(
+        frame=np.array([r[0] for r in rows], dtype=np.int32),
+        object_id=np.array([r[1] for r in rows], dtype=np.uint64),
+        class_id=np.array([r[2] for r in rows], dtype=np.int32),
+        bbox=np.array([r[3] for r in rows], dtype=np.float32).reshape(-1, 4),
+        label=np.array([r[4] for r in rows], dtype=np.uint32))
+
+
+def extract_crossing_objects(pyds, batch_meta, labels):
+    """Returns the CrossingObjects of batch_meta for the lc labels.
+
+    Uses the native pyds.nvds_analytics_batch_crossings when the bindings
+    provide it.
+    """
+    native = getattr(pyds, "nvds_analytics_batch_crossings", None)
+    if native is None:
+        return _walk_crossings(pyds, batch_meta, labels.lc)
+    return CrossingObjects(**native(batch_meta, labels.lc))
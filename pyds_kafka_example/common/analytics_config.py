@@ -0,0 +1,163 @@
+################################################################################
+# SPDX-FileCopyrightText: Copyright (c) 2019-2021 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+################################################################################
+
+import atexit
+import configparser
+import os
+import shutil
+import tempfile
+
+# Key prefixes of the nvdsanalytics rule groups, e.g. [line-crossing-stream-0]
+# holds "line-crossing-<label>" keys and [roi-filtering-stream-0] holds
+# "roi-<label>" keys.
+LC_GROUP = "line-crossing-stream-"
+ROI_GROUP = "roi-filtering-stream-"
+OC_GROUP = "overcrowding-stream-"
+DIR_GROUP = "direction-detection-stream-"
+
+LC_KEY = "line-crossing-"
+ROI_KEY = "roi-"
+DIR_KEY = "direction-"
+
+# directory of the generated stream configs of this process, see
+# stream_config_file()
+_generated_dir = None
+
+
+def read_analytics_config(config_file):
+    # nvdsanalytics labels are case sensitive and the values hold ';'
+    # separated coordinates, so disable key folding and interpolation.
+    config = configparser.ConfigParser(interpolation=None)
+    config.optionxform = str
+    config.read(config_file)
+    return config
+
+
+def _labels(config, group_prefix, key_prefix):
+    labels = []
+    for section in config.sections():
+        if not section.startswith(group_prefix):
+            continue
+        if config.get(section, "enable", fallback="1").strip() != "1":
+            continue
+        for key in config[section]:
+            if key.startswith(key_prefix):
+                label = key[len(key_prefix):]
+                if label not in labels:
+                    labels.append(label)
+    return labels
+
+
+class AnalyticsLabels:
+    """Ordered line-crossing, ROI and overcrowding labels of an
+    nvdsanalytics config, used as the label axis of the count arrays."""
+
+    def __init__(self, lc=(), roi=(), oc=()):
+        self.lc = list(lc)
+        self.roi = list(roi)
+        self.oc = list(oc)
+
+    @classmethod
+    def from_config(cls, config_file):
+        return cls.from_parser(read_analytics_config(config_file))
+
+    @classmethod
+    def from_parser(cls, config):
+        return cls(lc=_labels(config, LC_GROUP, LC_KEY),
+                   roi=_labels(config, ROI_GROUP, ROI_KEY),
+                   oc=_labels(config, OC_GROUP, ROI_KEY))
+
+
+def expand_stream_groups(config, num_streams):
+    """Copies the stream-0 rule groups to streams 1..num_streams-1 that have
+    no group of their own. Returns True if a group was added."""
+    added = False
+    for prefix in (LC_GROUP, ROI_GROUP, OC_GROUP, DIR_GROUP):
+        template = prefix + "0"
+        if not config.has_section(template):
+            continue
+        for stream in range(1, num_streams):
+            section = prefix + str(stream)
+            if config.has_section(section):
+                continue
+            config.add_section(section)
+            for key, value in config.items(template, raw=True):
+                config.set(section, key, value)
+            added = True
+    return added
+
+
+def _generated_config_dir():
+    global _generated_dir
+    if _generated_dir is None:
+        _generated_dir = tempfile.mkdtemp(prefix="ds-analytics-")
+        atexit.register(shutil.rmtree, _generated_dir, True)
+    return _generated_dir
+
+
+def stream_config_file(config_file, num_streams, out_dir=None):
+    """Returns an nvdsanalytics config file with rule groups for
+    num_streams streams.
+
+    That is config_file itself if it already covers them, otherwise a
+    generated "<name>_<num_streams>streams.txt" in out_dir in which the
+    stream-0 groups are used for the streams without groups. Without
+    out_dir it goes to a temporary directory removed when the process
+    exits.
+    """
+    config = read_analytics_config(config_file)
+    if not expand_stream_groups(config, num_streams):
+        return config_file
+    root, ext = os.path.splitext(os.path.basename(config_file))
+    out_file = os.path.join(out_dir or _generated_config_dir(),
+                            "{0}_{1}streams{2}".format(root, num_streams,
+                                                       ext or ".txt"))
+    with open(out_file, "w") as f:
+        # nvdsanalytics reads it as a GKeyFile, keep plain key=value lines
+        config.write(f, space_around_delimiters=False)
+    return out_file
+
+
+def shard_config(config, streams):
+    """Returns a copy of config for a pipeline that runs the global streams
+    streams: its stream j gets the rule groups of stream streams[j], or
+    the stream-0 groups if that stream has none."""
+    shard = read_analytics_config([])
+    for section in config.sections():
+        if not section.startswith((LC_GROUP, ROI_GROUP, OC_GROUP, DIR_GROUP)):
+            shard.add_section(section)
+            for key, value in config.items(section, raw=True):
+                shard.set(section, key, value)
+    for prefix in (LC_GROUP, ROI_GROUP, OC_GROUP, DIR_GROUP):
+        for j, stream in enumerate(streams):
+            source = prefix + str(stream)
+            if not config.has_section(source):
+                source = prefix + "0"
+                if not config.has_section(source):
+                    continue
+            shard.add_section(prefix + str(j))
+            for key, value in config.items(source, raw=True):
+                shard.set(prefix + str(j), key, value)
+    return shard
+
+
+def write_shard_config(config_file, streams, out_file):
+    """Writes the shard_config() of config_file for streams to out_file."""
+    config = shard_config(read_analytics_config(config_file), streams)
+    with open(out_file, "w") as f:
+        config.write(f, space_around_delimiters=False)
+    return out_file
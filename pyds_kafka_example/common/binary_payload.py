@@ -0,0 +1,325 @@
+################################################################################
+# SPDX-FileCopyrightText: Copyright (c) 2019-2021 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+################################################################################
+
+"""Encoder/decoder for the compact binary event payload (schema-type 2).
+
+nvmsgconv writes each event as a MessagePack array with positional fields
+(see generate_event_message_binary in eventmsg_payload.cpp):
+
+    [version, message id (16 bytes), timestamp ms, device id, module id,
+     [[label, current, cumulative], ...]
+     (, [[tracking id, class id, label index, left, top, width, height],
+         ...] (, [capture ns, buffer PTS ns, capture to probe us,
+                  probe to serialization us]))]
+
+The crossing objects field is only present for events with objects that
+crossed a line (run.py --object-events) or a trace, nil for a trace
+without objects; the label index points into the line crossings. The
+trace field is only present for events traced with run.py --trace, see
+common/tracing.py.
+
+Only the MessagePack types the schema uses are handled, so consumers do
+not need the msgpack package. Run this module to compare the payload size
+and encode time with the JSON schema.
+"""
+
+import datetime
+import json
+import struct
+import time
+import timeit
+import uuid
+
+SCHEMA_VERSION = 1
+
+
+def _pack_uint(out, value):
+    if value < 0x80:
+        out.append(value)
+    elif value <= 0xff:
+        out += struct.pack(">BB", 0xcc, value)
+    elif value <= 0xffff:
+        out += struct.pack(">BH", 0xcd, value)
+    elif value <= 0xffffffff:
+        out += struct.pack(">BI", 0xce, value)
+    else:
+        out += struct.pack(">BQ", 0xcf, value)
+
+
+def _pack_array(out, size):
+    if size < 16:
+        out.append(0x90 | size)
+    elif size <= 0xffff:
+        out += struct.pack(">BH", 0xdc, size)
+    else:
+        out += struct.pack(">BI", 0xdd, size)
+
+
+def _pack_str(out, value):
+    if value is None:
+        out.append(0xc0)
+        return
+    data = value.encode("utf-8")
+    if len(data) < 32:
+        out.append(0xa0 | len(data))
+    elif len(data) <= 0xff:
+        out += struct.pack(">BB", 0xd9, len(data))
+    elif len(data) <= 0xffff:
+        out += struct.pack(">BH", 0xda, len(data))
+    else:
+        out += struct.pack(">BI", 0xdb, len(data))
+    out += data
+
+
+def _stamp_serialize_ts(event):
+    # like stamp_serialize_ts() of nvmsgconv, the stamp stays in the event;
+    # returns None for untraced events
+    trace = event.get("trace")
+    if not trace or not trace.get("probeTs"):
+        return None
+    trace["serializeTs"] = time.time_ns()
+    return trace
+
+
+def _trace_stage_us(start, end):
+    return (end - start) // 1000 if start and end > start else 0
+
+
+def _compact_trace(trace):
+    return [trace["captureTs"], trace["bufPts"],
+            _trace_stage_us(trace["captureTs"], trace["probeTs"]),
+            _trace_stage_us(trace["probeTs"], trace["serializeTs"])]
+
+
+def _pack_event(out, event):
+    objects = event.get("crossingObjects")
+    trace = _stamp_serialize_ts(event)
+    _pack_array(out, 8 if trace else 7 if objects else 6)
+    _pack_uint(out, SCHEMA_VERSION)
+    out += struct.pack(">BB", 0xc4, 16) + event["messageid"].bytes
+    _pack_uint(out, event["timestamp"])
+    _pack_str(out, event.get("deviceId"))
+    _pack_str(out, event.get("moduleId"))
+    crossings = event.get("lineCrossings", {})
+    _pack_array(out, len(crossings))
+    for label, (curr, cum) in crossings.items():
+        _pack_array(out, 3)
+        _pack_str(out, label)
+        _pack_uint(out, curr)
+        _pack_uint(out, cum)
+    if objects:
+        _pack_objects(out, objects, list(crossings))
+    elif trace:
+        out.append(0xc0)
+    if trace:
+        compact = _compact_trace(trace)
+        _pack_array(out, len(compact))
+        for value in compact:
+            _pack_uint(out, value)
+
+
+def _pack_objects(out, objects, labels):
+    _pack_array(out, len(objects))
+    for tracking_id, class_id, label, bbox in objects:
+        _pack_array(out, 7)
+        _pack_uint(out, tracking_id)
+        _pack_uint(out, max(class_id, 0))
+        _pack_uint(out, labels.index(label))
+        for value in bbox:
+            _pack_uint(out, max(int(value), 0))
+
+
+def encode_event_message(event):
+    """Encodes an event dict as returned by decode_event_message."""
+    out = bytearray()
+    _pack_event(out, event)
+    return bytes(out)
+
+
+class _Reader(object):
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def take(self, size):
+        if self.pos + size > len(self.data):
+            raise ValueError("truncated binary payload")
+        chunk = self.data[self.pos:self.pos + size]
+        self.pos += size
+        return chunk
+
+    def unpack(self, fmt):
+        return struct.unpack(fmt, self.take(struct.calcsize(fmt)))[0]
+
+    def read(self):
+        tag = self.unpack(">B")
+        if tag < 0x80:
+            return tag
+        if 0x90 <= tag <= 0x9f:
+            return [self.read() for _ in range(tag & 0x0f)]
+        if 0xa0 <= tag <= 0xbf:
+            return self.take(tag & 0x1f).decode("utf-8")
+        if tag == 0xc0:
+            return None
+        if tag == 0xc4:
+            return bytes(self.take(self.unpack(">B")))
+        if tag in _UINT_FORMATS:
+            return self.unpack(_UINT_FORMATS[tag])
+        if tag in _STR_FORMATS:
+            return self.take(self.unpack(_STR_FORMATS[tag])).decode("utf-8")
+        if tag in _ARRAY_FORMATS:
+            return [self.read() for _ in range(self.unpack(_ARRAY_FORMATS[tag]))]
+        raise ValueError("unsupported MessagePack type 0x%02x" % tag)
+
+
+_UINT_FORMATS = {0xcc: ">B", 0xcd: ">H", 0xce: ">I", 0xcf: ">Q"}
+_STR_FORMATS = {0xd9: ">B", 0xda: ">H", 0xdb: ">I"}
+_ARRAY_FORMATS = {0xdc: ">H", 0xdd: ">I"}
+
+
+def _to_event(fields):
+    if not isinstance(fields, list) or len(fields) < 6:
+        raise ValueError("not a binary event message")
+    if fields[0] != SCHEMA_VERSION:
+        raise ValueError("unsupported binary schema version %r" % fields[0])
+    event = {
+        "messageid": uuid.UUID(bytes=fields[1]),
+        "timestamp": fields[2],
+        "deviceId": fields[3],
+        "moduleId": fields[4],
+        "lineCrossings": dict((label, (curr, cum))
+                              for label, curr, cum in fields[5]),
+    }
+    if len(fields) > 6 and fields[6] is not None:
+        labels = [crossing[0] for crossing in fields[5]]
+        event["crossingObjects"] = [
+            (obj[0], obj[1], labels[obj[2]] if obj[2] < len(labels) else None,
+             tuple(obj[3:7])) for obj in fields[6]]
+    if len(fields) > 7:
+        event["trace"] = dict(zip(
+            ("captureTs", "bufPts", "captureToProbeUs", "probeToSerializeUs"),
+            fields[7]))
+    return event
+
+
+def decode_event_message(data):
+    """Decodes one binary payload.
+
+    Returns an event dict, or a list of them for batch-mode=1 payloads.
+    """
+    reader = _Reader(data)
+    value = reader.read()
+    if value == [] or (value and isinstance(value[0], list)):
+        return [_to_event(fields) for fields in value]
+    return _to_event(value)
+
+
+def new_event(device_id, module_id, line_crossings, timestamp=None,
+              crossing_objects=None, trace=None):
+    """Returns an event dict for {label: (current, cumulative)} counts,
+    stamped with the current time unless timestamp (ms) is given.
+    crossing_objects lists (tracking id, class id, label, (left, top,
+    width, height)) of the objects that crossed a line, trace the
+    (capture, buffer PTS, probe) ns of the frame; the encoders add the
+    serialization time."""
+    if timestamp is None:
+        timestamp = int(time.time() * 1000)
+    event = {"messageid": uuid.uuid4(), "timestamp": timestamp,
+             "deviceId": device_id, "moduleId": module_id,
+             "lineCrossings": dict(line_crossings)}
+    if crossing_objects:
+        event["crossingObjects"] = list(crossing_objects)
+    if trace is not None:
+        event["trace"] = dict(zip(("captureTs", "bufPts", "probeTs"),
+                                  (int(v) for v in trace)), serializeTs=0)
+    return event
+
+
+def _timestamp_str(ms):
+    ts = datetime.datetime.fromtimestamp(ms / 1000.0, datetime.timezone.utc)
+    return ts.strftime("%Y-%m-%dT%H:%M:%S.") + "%03dZ" % (ms % 1000)
+
+
+ANALYTICS_MODULE_KEYS = ("description", "source", "version")
+
+
+def json_event_message(event, compact_trace=False, module_info=None):
+    """Encodes an event dict like the full JSON schema of nvmsgconv.
+    module_info holds the description, source and version of the
+    analyticsModule, read from the [analytics0] group of the msgconv
+    config; missing ones are empty like in nvmsgconv."""
+    # Same members as the full-schema fast path in eventmsg_payload.cpp
+    module = {"id": event["moduleId"]}
+    for key in ANALYTICS_MODULE_KEYS:
+        module[key] = (module_info or {}).get(key, "")
+    for label, (curr, cum) in event["lineCrossings"].items():
+        module["lc_curr_" + label] = curr
+        module["lc_cum_" + label] = cum
+    message = {"messageid": str(event["messageid"]),
+               "@timestamp": _timestamp_str(event["timestamp"]),
+               "deviceId": event["deviceId"],
+               "analyticsModule": module}
+    if event.get("crossingObjects"):
+        message["crossingObjects"] = [
+            {"trackingId": tracking_id, "classId": class_id, "label": label,
+             "bbox": [int(v) for v in bbox]}
+            for tracking_id, class_id, label, bbox in event["crossingObjects"]]
+    trace = _stamp_serialize_ts(event)
+    if trace:
+        message["trace"] = _compact_trace(trace) if compact_trace else \
+            dict(trace)
+    return json.dumps(message, separators=(",", ":"))
+
+
+def main():
+    event = {
+        "messageid": uuid.uuid4(),
+        "timestamp": 1660986301695,
+        "deviceId": "device_test",
+        "moduleId": "XYZ",
+        "lineCrossings": {"straight": (3, 1284)},
+    }
+    binary = encode_event_message(event)
+    assert decode_event_message(binary) == event
+    assert decode_event_message(b"\x91" + binary) == [event]
+    with_objects = dict(event, crossingObjects=[
+        (1042, 0, "straight", (812, 640, 96, 180))])
+    assert decode_event_message(encode_event_message(with_objects)) == \
+        with_objects
+    traced = new_event("device_test", "XYZ", {"straight": (3, 1284)},
+                       trace=(1660986301600000000, 0, 1660986301650000000))
+    decoded = decode_event_message(encode_event_message(traced))
+    assert "crossingObjects" not in decoded
+    assert decoded["trace"]["captureToProbeUs"] == 50000
+    traced["crossingObjects"] = with_objects["crossingObjects"]
+    decoded = decode_event_message(encode_event_message(traced))
+    assert decoded["crossingObjects"] == with_objects["crossingObjects"]
+    module = json.loads(json_event_message(event, module_info={
+        "description": "Line crossing", "source": "OpenALR"}))
+    assert module["analyticsModule"]["source"] == "OpenALR"
+    assert module["analyticsModule"]["version"] == ""
+    runs = 10000
+    for name, encode in (("binary", encode_event_message),
+                         ("json", json_event_message)):
+        size = len(encode(event))
+        secs = timeit.timeit(lambda: encode(event), number=runs)
+        print("%-6s payload: %4d bytes, %.2f us/encode" %
+              (name, size, secs * 1e6 / runs))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,638 @@
+################################################################################
+# SPDX-FileCopyrightText: Copyright (c) 2019-2021 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+################################################################################
+
+"""On-node archive of the line-crossing counts, queried by time range.
+
+run.py --archive-dir keeps the counts of every frame with a crossing here,
+whatever happens to the broker, so they can be looked up or back-filled
+later. Each row is (ts ms, source, label, current count, cumulative
+count); sources (device ids) and labels are numbered in names.json.
+
+Rows are kept in chunk files of chunk_rows rows sorted by time, one
+column after the other:
+
+    header  b"DSCA", u16 version, u32 row count
+    columns ts i64[rows], source u32[rows], label u16[rows],
+            curr u32[rows], cum u32[rows]  (little endian)
+
+The last chunk is rewritten every flush_interval seconds until it is
+full; after that it never changes and its (chunk number, rows, min ts,
+max ts) is appended to the index file. A query only opens the chunks
+whose time range overlaps its own, and of those only the pages of the ts
+column around the range plus the matching rows of the other columns
+(numpy.memmap).
+
+Minute and hour rollups (sum of the current counts, highest cumulative
+count per source, label and bucket) are kept the same way in rollup-60s/
+and rollup-3600s/, built incrementally on the flush thread: a bucket is
+added once rows lateness past its end came in, and the watermark file
+records up to where all buckets were added. A row arriving later than
+that is added as a further row of its bucket, so the rollup rows of a
+bucket always add up. count() takes whole hours from the hourly rollup,
+whole minutes around them from the minute rollup and only the minutes at
+the edges from the raw chunks:
+
+    archive = CountArchive("counts").start()
+    archive.add_batch(batch, sources.sensor_id, analytics_labels.lc,
+                      int(time.time() * 1000))
+    archive.count("cam-3", "entry", t1, t2)
+
+Rows added since the last flush are lost with the process. Opening an
+archive rebuilds the buckets after the watermark from the raw chunks.
+"""
+
+import json
+import os
+import struct
+import threading
+
+import numpy as np
+
+MAGIC = b"DSCA"
+VERSION = 1
+MINUTE = 60 * 1000
+HOUR = 60 * MINUTE
+# rollup bucket sizes in ms, coarsest first
+ROLLUPS = (HOUR, MINUTE)
+CHUNK_ROWS = 1 << 16
+# ms rows may arrive after newer ones and still go into an open bucket
+LATENESS = 5000
+NAMES_FILE = "names.json"
+INDEX_FILE = "index"
+WATERMARK_FILE = "watermark"
+
+ROW_DTYPE = np.dtype([("ts", "<i8"), ("source", "<u4"), ("label", "<u2"),
+                      ("curr", "<u4"), ("cum", "<u4")])
+
+_HEADER = struct.Struct("<4sHI")
+_INDEX = struct.Struct("<IIqq")
+_WATERMARK = struct.Struct("<q")
+
+
+def _replace(path, data):
+    with open(path + ".tmp", "wb") as f:
+        f.write(data)
+    os.replace(path + ".tmp", path)
+
+
+class _ChunkStore:
+    """The chunk files of one directory and the rows not written yet.
+
+    append() and memory() are called with the archive lock held, write()
+    only from the flush thread.
+    """
+
+    def __init__(self, directory, chunk_rows):
+        self.directory = directory
+        self.chunk_rows = chunk_rows
+        os.makedirs(directory, exist_ok=True)
+        # (chunk number, rows, min ts, max ts) of the full chunks
+        self.chunks = []
+        index_path = os.path.join(directory, INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path, "rb") as f:
+                data = f.read()
+            # a torn last entry is dropped, its chunk indexed again below
+            for pos in range(0, len(data) - _INDEX.size + 1, _INDEX.size):
+                self.chunks.append(_INDEX.unpack_from(data, pos))
+            if len(data) % _INDEX.size:
+                with open(index_path, "r+b") as f:
+                    f.truncate(len(self.chunks) * _INDEX.size)
+        self._index = open(index_path, "ab")
+        known = set(entry[0] for entry in self.chunks)
+        for name in sorted(os.listdir(directory)):
+            if name.startswith("chunk-") and name.endswith(".col") and \
+                    int(name[6:-4]) not in known:
+                # the last chunk of an earlier run stays as it is
+                number = int(name[6:-4])
+                ts = self._column(number, "ts")
+                if len(ts):
+                    self.chunks.append(self._add_index(
+                        number, len(ts), ts[0], ts[-1]))
+        self._tail_number = max([entry[0] for entry in self.chunks] or
+                                [-1]) + 1
+        self._tail = np.zeros(chunk_rows, dtype=ROW_DTYPE)
+        self._tail_rows = 0
+        # (chunk number, rows) of full chunks not written yet
+        self._full = []
+        self._dirty = False
+
+    def _path(self, number):
+        return os.path.join(self.directory, "chunk-%08d.col" % number)
+
+    def _add_index(self, number, rows, min_ts, max_ts):
+        entry = (number, rows, int(min_ts), int(max_ts))
+        self._index.write(_INDEX.pack(*entry))
+        self._index.flush()
+        return entry
+
+    def _column(self, number, name, start=0, stop=None):
+        path = self._path(number)
+        with open(path, "rb") as f:
+            magic, version, rows = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not a count archive chunk: " + path)
+        offset = _HEADER.size
+        for field in ROW_DTYPE.names:
+            dtype = ROW_DTYPE[field]
+            if field == name:
+                break
+            offset += rows * dtype.itemsize
+        if not rows:
+            return np.zeros(0, dtype=dtype)
+        column = np.memmap(path, dtype=dtype, mode="r", offset=offset,
+                           shape=(rows,))
+        return column[start:stop]
+
+    def append(self, rows):
+        while len(rows):
+            n = min(len(rows), self.chunk_rows - self._tail_rows)
+            self._tail[self._tail_rows:self._tail_rows + n] = rows[:n]
+            self._tail_rows += n
+            self._dirty = True
+            rows = rows[n:]
+            if self._tail_rows == self.chunk_rows:
+                self._full.append((self._tail_number, self._tail))
+                self._tail_number += 1
+                self._tail = np.zeros(self.chunk_rows, dtype=ROW_DTYPE)
+                self._tail_rows = 0
+
+    def memory(self):
+        """The rows not in self.chunks."""
+        return [rows for number, rows in self._full] + \
+            [self._tail[:self._tail_rows]]
+
+    def pending(self):
+        """What write() has to write: the full chunks and a copy of the
+        last one if it changed."""
+        tail = None
+        if self._dirty:
+            tail = (self._tail_number, self._tail[:self._tail_rows].copy())
+            self._dirty = False
+        return list(self._full), tail
+
+    def write(self, full, tail):
+        """Writes pending(); returns the index entries of the full chunks,
+        to be handed to done() with the lock held."""
+        entries = []
+        for number, rows in full:
+            self._write_chunk(number, rows)
+            entries.append(self._add_index(number, len(rows), rows["ts"][0],
+                                           rows["ts"][-1]))
+        if tail is not None and len(tail[1]):
+            self._write_chunk(*tail)
+        return entries
+
+    def done(self, entries):
+        self.chunks.extend(entries)
+        del self._full[:len(entries)]
+
+    def _write_chunk(self, number, rows):
+        rows = np.sort(rows, order="ts", kind="stable")
+        _replace(self._path(number), b"".join(
+            [_HEADER.pack(MAGIC, VERSION, len(rows))] +
+            [np.ascontiguousarray(rows[name]).tobytes()
+             for name in ROW_DTYPE.names]))
+
+    def overlapping(self, start, end):
+        return [entry for entry in self.chunks
+                if entry[3] >= start and entry[2] < end]
+
+    def read(self, entry, start, end):
+        """Returns the rows of chunk entry with start <= ts < end."""
+        number = entry[0]
+        ts = self._column(number, "ts")
+        lo, hi = np.searchsorted(ts, [start, end])
+        rows = np.zeros(hi - lo, dtype=ROW_DTYPE)
+        if hi > lo:
+            rows["ts"] = ts[lo:hi]
+            for name in ROW_DTYPE.names[1:]:
+                rows[name] = self._column(number, name, lo, hi)
+        return rows
+
+    def close(self):
+        self._index.close()
+
+
+def _select(rows, start, end, source=None, label=None):
+    keep = (rows["ts"] >= start) & (rows["ts"] < end)
+    if source is not None:
+        keep &= rows["source"] == source
+    if label is not None:
+        keep &= rows["label"] == label
+    return rows[keep]
+
+
+class CountArchive:
+    def __init__(self, directory, chunk_rows=CHUNK_ROWS, flush_interval=10.0,
+                 lateness=LATENESS):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.lateness = lateness
+        os.makedirs(directory, exist_ok=True)
+        self.raw = _ChunkStore(os.path.join(directory, "raw"), chunk_rows)
+        self.rollups = dict(
+            (size, _ChunkStore(os.path.join(
+                directory, "rollup-{0}s".format(size // 1000)), chunk_rows))
+            for size in ROLLUPS)
+        self._names_path = os.path.join(directory, NAMES_FILE)
+        names = {"sources": [], "labels": []}
+        if os.path.exists(self._names_path):
+            with open(self._names_path) as f:
+                names = json.load(f)
+        self.sources = dict((name, i) for i, name in
+                            enumerate(names["sources"]))
+        self.labels = dict((name, i) for i, name in enumerate(names["labels"]))
+
+        # size -> {(source, label, bucket start): [curr sum, max cum]}
+        self._open = dict((size, {}) for size in ROLLUPS)
+        # size -> every bucket ending at or before it is in the rollup
+        self._watermark = {}
+        for size, store in self.rollups.items():
+            path = os.path.join(store.directory, WATERMARK_FILE)
+            self._watermark[size] = 0
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    self._watermark[size] = _WATERMARK.unpack(f.read())[0]
+        self._max_ts = None
+        # raw rows not rolled up yet
+        self._unrolled = []
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread = threading.Thread(target=self._run,
+                                        name="count-archive", daemon=True)
+        self.stats = {"rows": 0, "chunks_read": 0}
+
+        # buckets after the watermark were still open: rebuild them from
+        # the raw rows, which hold no row rolled up after the watermark
+        start = min(self._watermark.values())
+        for entry in self.raw.overlapping(start, 1 << 62):
+            self._roll(self.raw.read(entry, start, 1 << 62), recovering=True)
+
+    def _id(self, table, name):
+        # called with _cond held
+        index = table.get(name)
+        if index is None:
+            index = table[name] = len(table)
+            names = {"sources": sorted(self.sources, key=self.sources.get),
+                     "labels": sorted(self.labels, key=self.labels.get)}
+            _replace(self._names_path, json.dumps(names).encode("utf-8"))
+        return index
+
+    def add(self, ts, sources, labels, curr, cum):
+        """Appends rows given as equally long sequences of ts (ms), source
+        and label names and counts."""
+        if not len(ts):
+            return
+        with self._cond:
+            rows = np.zeros(len(ts), dtype=ROW_DTYPE)
+            rows["ts"] = ts
+            rows["source"] = [self._id(self.sources, s) for s in sources]
+            rows["label"] = [self._id(self.labels, l) for l in labels]
+            rows["curr"] = curr
+            rows["cum"] = cum
+            self._append(rows)
+
+    def add_batch(self, batch, sensor_id, labels, ts):
+        """Appends the counts of the frames of an AnalyticsBatch that have
+        a crossing, stamped ts (ms); sensor_id(pad_index) names the source,
+        labels the lc columns. Called from the probe."""
+        frames, columns = np.nonzero(batch.lc_curr)
+        if not len(frames):
+            return
+        with self._cond:
+            pads = batch.pad_index[frames]
+            rows = np.zeros(len(frames), dtype=ROW_DTYPE)
+            rows["ts"] = ts
+            rows["source"] = [self._id(self.sources, sensor_id(pad))
+                              for pad in pads.tolist()]
+            rows["label"] = [self._id(self.labels, labels[column])
+                             for column in columns.tolist()]
+            rows["curr"] = batch.lc_curr[frames, columns]
+            rows["cum"] = batch.lc_cum[frames, columns]
+            self._append(rows)
+
+    def _append(self, rows):
+        # called with _cond held
+        self.stats["rows"] += len(rows)
+        self.raw.append(rows)
+        self._unrolled.append(rows)
+
+    def _roll(self, rows, recovering=False):
+        # called with _cond held; adds rows to the open rollup buckets and
+        # moves the buckets that ended lateness ago to the rollup stores
+        if not len(rows):
+            return
+        max_ts = int(rows["ts"].max())
+        if self._max_ts is None or max_ts > self._max_ts:
+            self._max_ts = max_ts
+        for size in ROLLUPS:
+            buckets = self._open[size]
+            watermark = self._watermark[size]
+            late = []
+            for ts, source, label, curr, cum in zip(
+                    (rows["ts"] // size * size).tolist(),
+                    rows["source"].tolist(), rows["label"].tolist(),
+                    rows["curr"].tolist(), rows["cum"].tolist()):
+                if ts + size <= watermark:
+                    # recovering: rolled up before the watermark was saved
+                    if not recovering:
+                        late.append((ts, source, label, curr, cum))
+                    continue
+                bucket = buckets.get((source, label, ts))
+                if bucket is None:
+                    buckets[(source, label, ts)] = [curr, cum]
+                else:
+                    bucket[0] += curr
+                    bucket[1] = max(bucket[1], cum)
+            if late:
+                self.rollups[size].append(np.array(late, dtype=ROW_DTYPE))
+            if not recovering:
+                self._close_buckets(size, (self._max_ts - self.lateness) //
+                                    size * size)
+
+    def _close_buckets(self, size, watermark):
+        # called with _cond held
+        if watermark <= self._watermark[size]:
+            return
+        buckets = self._open[size]
+        done = sorted(key for key in buckets if key[2] + size <= watermark)
+        if done:
+            self.rollups[size].append(np.array(
+                [(key[2], key[0], key[1]) + tuple(buckets.pop(key))
+                 for key in done], dtype=ROW_DTYPE))
+        self._watermark[size] = watermark
+
+    def _roll_added(self):
+        # called with _cond held
+        for rows in self._unrolled:
+            self._roll(rows)
+        del self._unrolled[:]
+
+    def flush(self):
+        """Rolls up the rows added so far and writes what changed."""
+        with self._cond:
+            self._roll_added()
+            watermarks = dict(self._watermark)
+            pending = [(store, store.pending()) for store in
+                       list(self.rollups.values()) + [self.raw]]
+        # rollups first: raw rows that made it to disk without their
+        # buckets are rolled up again on open, the other way round a
+        # crash would leave counts out of the rollups
+        written = []
+        for store, (full, tail) in pending:
+            written.append((store, store.write(full, tail)))
+        for size, store in self.rollups.items():
+            _replace(os.path.join(store.directory, WATERMARK_FILE),
+                     _WATERMARK.pack(watermarks[size]))
+        with self._cond:
+            for store, entries in written:
+                store.done(entries)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._stop:
+                    self._cond.wait(self.flush_interval)
+                stop = self._stop
+            self.flush()
+            if stop:
+                return
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def close(self):
+        with self._cond:
+            self._stop = True
+            self._roll_added()
+            # this process adds nothing more to the open buckets
+            if self._max_ts is not None:
+                for size in ROLLUPS:
+                    self._close_buckets(size,
+                                        (self._max_ts // size + 1) * size)
+            self._cond.notify()
+        if self._thread.is_alive():
+            self._thread.join()
+        else:
+            self.flush()
+        for store in [self.raw] + list(self.rollups.values()):
+            store.close()
+
+    def _read(self, store, start, end, source, label):
+        with self._cond:
+            chunks = store.overlapping(start, end)
+            parts = [_select(rows, start, end, source, label)
+                     for rows in store.memory()]
+            self.stats["chunks_read"] += len(chunks)
+        parts += [_select(store.read(entry, start, end), start, end, source,
+                          label) for entry in chunks]
+        return np.concatenate(parts)
+
+    def _ids(self, source, label):
+        source_id = label_id = None
+        if source is not None:
+            source_id = self.sources.get(source, -1)
+        if label is not None:
+            label_id = self.labels.get(label, -1)
+        return source_id, label_id
+
+    def query(self, start, end, source=None, label=None):
+        """Returns the raw rows with start <= ts < end (ms), of source and
+        label if given, sorted by time."""
+        source_id, label_id = self._ids(source, label)
+        if source_id == -1 or label_id == -1:
+            return np.zeros(0, dtype=ROW_DTYPE)
+        rows = self._read(self.raw, start, end, source_id, label_id)
+        return np.sort(rows, order="ts", kind="stable")
+
+    def count(self, source, label, start, end):
+        """Returns the crossings of label at source with start <= ts < end
+        (ms)."""
+        source_id, label_id = self._ids(source, label)
+        if source_id == -1 or label_id == -1:
+            return 0
+        with self._cond:
+            # late rows go into the rollups as they are rolled up
+            self._roll_added()
+            watermarks = dict(self._watermark)
+        return self._count(0, watermarks, source_id, label_id, start, end)
+
+    def _count(self, level, watermarks, source, label, start, end):
+        if start >= end:
+            return 0
+        if level == len(ROLLUPS):
+            return int(self._read(self.raw, start, end, source,
+                                  label)["curr"].sum())
+        size = ROLLUPS[level]
+        lo = -(-start // size) * size
+        hi = min(end // size * size, watermarks[size])
+        if lo >= hi:
+            return self._count(level + 1, watermarks, source, label, start,
+                               end)
+        rows = self._read(self.rollups[size], lo, hi, source, label)
+        return (self._count(level + 1, watermarks, source, label, start, lo) +
+                int(rows["curr"].sum()) +
+                self._count(level + 1, watermarks, source, label, hi, end))
+
+    def series(self, source, label, start, end, step=MINUTE):
+        """Returns the start (ms) and crossings of the step-sized buckets
+        holding start .. end, step one of ROLLUPS."""
+        source_id, label_id = self._ids(source, label)
+        buckets = np.arange(start // step * step, end, step, dtype=np.int64)
+        counts = np.zeros(len(buckets), dtype=np.int64)
+        if source_id == -1 or label_id == -1 or not len(buckets):
+            return buckets, counts
+        stop = int(buckets[-1]) + step
+        with self._cond:
+            self._roll_added()
+            watermark = self._watermark[step]
+        rows = self._read(self.rollups[step], int(buckets[0]),
+                          min(stop, watermark), source_id, label_id)
+        np.add.at(counts, (rows["ts"] - buckets[0]) // step, rows["curr"])
+        # buckets not rolled up yet come from the raw rows
+        if watermark < stop:
+            rows = self._read(self.raw, max(int(buckets[0]), watermark), stop,
+                              source_id, label_id)
+            np.add.at(counts, (rows["ts"] - buckets[0]) // step,
+                      rows["curr"])
+        return buckets, counts
+
+
+def _check_count_archive():
+    import shutil
+    import tempfile
+    import time
+    from common.analytics_batch import AnalyticsBatch
+
+    rng = np.random.default_rng(3)
+    directory = tempfile.mkdtemp(prefix="ds-archive-")
+    try:
+        # 4 cameras, 2 lines, one batch a second for 3 hours
+        sensor_ids = ["cam-{0}".format(i) for i in range(4)]
+        labels = ["entry", "exit"]
+        t0 = 1700000000000 + 17 * MINUTE + 3500
+        archive = CountArchive(directory, chunk_rows=4096,
+                               flush_interval=0.05).start()
+        truth = []
+        cum = np.zeros((4, 2), dtype=np.uint32)
+        add_seconds = 0.0
+        for n in range(3 * 3600):
+            curr = (rng.random((4, 2)) < 0.3).astype(np.uint32)
+            curr *= rng.integers(1, 4, size=(4, 2), dtype=np.uint32)
+            cum += curr
+            ts = t0 + n * 1000
+            # every 50th batch reaches the probe 3 s late
+            if n % 50 == 49:
+                ts -= 3000
+            batch = AnalyticsBatch(
+                frame_meta=[None] * 4, pad_index=np.arange(4, dtype=np.uint32),
+                frame_num=np.full(4, n, dtype=np.int32),
+                has_analytics=np.ones(4, dtype=bool),
+                lc_curr=curr.copy(), lc_cum=cum.copy(),
+                roi=np.zeros((4, 0), dtype=np.uint32),
+                oc=np.zeros((4, 0), dtype=bool))
+            start = time.perf_counter()
+            archive.add_batch(batch, sensor_ids.__getitem__, labels, ts)
+            add_seconds += time.perf_counter() - start
+            for i, j in zip(*np.nonzero(curr)):
+                truth.append((ts, i, j, int(curr[i, j])))
+        truth = np.array(truth, dtype=np.int64)
+
+        def expected(source, label, t1, t2):
+            keep = (truth[:, 0] >= t1) & (truth[:, 0] < t2) & \
+                (truth[:, 1] == source) & (truth[:, 2] == label)
+            return int(truth[keep, 3].sum())
+
+        ranges = [(t0, t0 + 3 * HOUR), (t0 + 5 * MINUTE + 17, t0 + 2 * HOUR),
+                  (t0 + 40 * MINUTE, t0 + 41 * MINUTE + 999),
+                  (t0 + 2 * HOUR + 43 * MINUTE, t0 + 4 * HOUR),
+                  (t0 - HOUR, t0)]
+
+        def check(archive):
+            for t1, t2 in ranges:
+                for source in range(4):
+                    for label in range(2):
+                        assert archive.count(sensor_ids[source], labels[label],
+                                             t1, t2) == \
+                            expected(source, label, t1, t2), (t1, t2)
+
+        # answered partly from memory while the flusher writes
+        check(archive)
+        archive.flush()
+        check(archive)
+        assert archive.count("cam-9", "entry", t0, t0 + HOUR) == 0
+        buckets, counts = archive.series("cam-1", "exit", t0, t0 + HOUR,
+                                         MINUTE)
+        assert len(buckets) == 61 and counts.sum() == expected(
+            1, 1, buckets[0], buckets[-1] + MINUTE)
+        rows = archive.query(t0 + 10 * MINUTE, t0 + 11 * MINUTE, "cam-2")
+        assert (np.diff(rows["ts"]) >= 0).all() and len(rows)
+        archive.close()
+
+        # reopened: names, chunks and rollups come back, open buckets are
+        # rebuilt, and an hour in the middle reads only a few chunks
+        archive = CountArchive(directory, chunk_rows=4096)
+        check(archive)
+        raw_chunks = len(archive.raw.chunks)
+        archive.stats["chunks_read"] = 0
+        start = time.perf_counter()
+        runs = 200
+        for _ in range(runs):
+            archive.count("cam-3", "entry", t0 + HOUR + 90 * 1000,
+                          t0 + 2 * HOUR - 30 * 1000)
+        query_seconds = (time.perf_counter() - start) / runs
+        per_query = archive.stats["chunks_read"] / float(runs)
+        assert per_query < raw_chunks, (per_query, raw_chunks)
+        scan = time.perf_counter()
+        full = np.concatenate([archive.raw.read(entry, t0 - HOUR,
+                                                t0 + 4 * HOUR)
+                               for entry in archive.raw.chunks])
+        scan_seconds = time.perf_counter() - scan
+        assert full["curr"].sum() == truth[:, 3].sum()
+
+        # a crash after a flush: the buckets still open are rebuilt from
+        # the raw rows on open, none is counted twice
+        late = [(t0 + 3 * HOUR + n * 700, n % 4, n % 2, 1 + n % 3)
+                for n in range(5000)]
+        late.append((t0 + 30 * MINUTE, 2, 1, 5))
+        archive.add([row[0] for row in late],
+                    [sensor_ids[row[1]] for row in late],
+                    [labels[row[2]] for row in late],
+                    [row[3] for row in late], [0] * len(late))
+        archive.flush()
+        for store in [archive.raw] + list(archive.rollups.values()):
+            store.close()
+        truth = np.concatenate([truth, np.array(late, dtype=np.int64)])
+        ranges.append((t0, t0 + 5 * HOUR))
+        archive = CountArchive(directory, chunk_rows=4096)
+        check(archive)
+        archive.close()
+        print("{0} rows in {1} raw chunks, {2:.1f} us/batch added; hour "
+              "count: {3:.2f} ms reading {4:.0f} chunks (full scan {5:.2f} "
+              "ms)".format(len(truth), raw_chunks,
+                           add_seconds * 1e6 / (3 * 3600),
+                           query_seconds * 1000, per_query,
+                           scan_seconds * 1000))
+        print("count archive checks passed")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    _check_count_archive()
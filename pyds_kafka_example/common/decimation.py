@@ -0,0 +1,253 @@
+################################################################################
+# SPDX-FileCopyrightText: Copyright (c) 2019-2021 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+################################################################################
+
+"""Probe only every Nth batch without losing line crossings.
+
+objLCCumCnt only grows while a stream runs, so the crossings of the
+batches the probe skipped are the difference between the cumulative counts
+of two inspected frames of a stream:
+
+    decimator = Decimator(interval=10)
+    # probe
+    if decimator.skip():
+        return Gst.PadProbeReturn.OK
+    batch = extract_analytics_batch(pyds, batch_meta, labels)
+    batch.lc_curr = decimator.reconcile(batch)
+
+After reconcile() lc_curr holds the crossings since the previous inspected
+frame of the stream instead of those of the frame alone. With max_interval
+above interval the decimator doubles the interval after each inspected
+batch without crossings, up to max_interval, and halves it again once a
+batch has some.
+
+Counts drop back to 0 when a stream restarts. reconcile() spots that
+(cumulative counts or frame_num going down) and counts the new stream from
+0, but the crossings of the old stream after its last inspected frame
+would be lost. So run.py calls hold() when streammux gets EOS or a flush on
+a sink pad, which makes the probe inspect every batch until the last frames
+of that stream went by: release() on the stream-eos event of the stream,
+when reconcile() sees the restart, or after hold_batches batches.
+
+relabel() carries the last counts over when the line-crossing labels
+change (run.py --watch-config): kept lines keep theirs, new ones start
+from 0.
+"""
+
+import threading
+
+import numpy as np
+
+# batches a hold() lasts if neither the stream-eos event nor a restart of
+# the stream reaches the probe
+HOLD_BATCHES = 300
+
+
+class Decimator:
+    def __init__(self, interval, max_interval=None, hold_batches=HOLD_BATCHES):
+        self.interval = max(1, interval)
+        self.max_interval = max(self.interval, max_interval or 1)
+        self.hold_batches = hold_batches
+        # current interval, between interval and max_interval
+        self.current = self.interval
+        self.batches = 0
+        # batches left until the next inspected one
+        self._countdown = 0
+        # last inspected cumulative counts and frame_num of each stream
+        self._cum = {}
+        self._frame_num = {}
+        # stream -> batch number its hold ends
+        self._held = {}
+        self._lock = threading.Lock()
+        self.stats = {"inspected": 0, "skipped": 0, "restarts": 0,
+                      "holds": 0}
+
+    def skip(self):
+        """Called for every batch before looking at its meta; returns True
+        if the probe may pass the batch on without inspecting it."""
+        self.batches += 1
+        if self._held:
+            with self._lock:
+                for stream, until in list(self._held.items()):
+                    if self.batches > until:
+                        del self._held[stream]
+            if self._held:
+                self.stats["inspected"] += 1
+                return False
+        if self._countdown > 0:
+            self._countdown -= 1
+            self.stats["skipped"] += 1
+            return True
+        self.stats["inspected"] += 1
+        return False
+
+    def hold(self, stream):
+        """Inspect every batch until release(stream): the stream is about
+        to end or restart (called from streaming threads)."""
+        with self._lock:
+            self._held[stream] = self.batches + self.hold_batches
+            self.stats["holds"] += 1
+
+    def release(self, stream=None):
+        """Ends the hold of stream, of all streams if None."""
+        with self._lock:
+            if stream is None:
+                self._held.clear()
+            else:
+                self._held.pop(stream, None)
+
+    def relabel(self, old_labels, new_labels):
+        """Reorders the last cumulative counts of each stream from the
+        old_labels to the new_labels axis; call it from the probe thread
+        before reconciling the first batch with new_labels."""
+        columns = [old_labels.index(label) if label in old_labels else -1
+                   for label in new_labels]
+        with self._lock:
+            for stream, last in self._cum.items():
+                self._cum[stream] = np.array(
+                    [last[j] if j >= 0 else 0 for j in columns],
+                    dtype=np.int64)
+
+    def reconcile(self, batch):
+        """Returns the lc counts of each frame of the inspected batch since
+        the previous inspected frame of its stream, shaped like
+        batch.lc_curr."""
+        lc_cum = batch.lc_cum.astype(np.int64)
+        counts = np.zeros(lc_cum.shape, dtype=np.int64)
+        active = False
+        for i, (stream, frame_num) in enumerate(zip(
+                batch.pad_index.tolist(), batch.frame_num.tolist())):
+            if not batch.has_analytics[i]:
+                continue
+            last = self._cum.get(stream)
+            if last is None:
+                # counts start at 0 with the stream
+                counts[i] = lc_cum[i]
+            elif (lc_cum[i] < last).any() or \
+                    frame_num < self._frame_num[stream]:
+                # restarted: everything of the old stream has gone by
+                self.stats["restarts"] += 1
+                self.release(stream)
+                counts[i] = lc_cum[i]
+            else:
+                counts[i] = lc_cum[i] - last
+            self._cum[stream] = lc_cum[i]
+            self._frame_num[stream] = frame_num
+            active = active or counts[i].any()
+        if self.max_interval > self.interval:
+            if active:
+                self.current = max(self.interval, self.current // 2)
+            else:
+                self.current = min(self.max_interval, self.current * 2)
+        self._countdown = self.current - 1
+        return counts.astype(batch.lc_curr.dtype)
+
+
+def _check_decimation():
+    import time
+    from common.analytics_batch import extract_analytics_batch
+    from common.analytics_config import AnalyticsLabels
+    from common.fake_pyds import FakePyds, make_batch
+
+    labels = AnalyticsLabels(lc=["in", "out"])
+    pyds = FakePyds()
+    rng = np.random.default_rng(1)
+
+    # 3 streams, 1000 batches; stream 1 restarts at batch 400 with its EOS
+    # reaching streammux 3 batches before its last frame reaches the
+    # probe, stream 2 ends at batch 777
+    num_batches = 1000
+    cum = np.zeros((3, 2), dtype=np.int64)
+    frame_num = [0, 0, 0]
+    batches = []
+    total = np.zeros((3, 2), dtype=np.int64)
+    events = {}
+    for n in range(num_batches):
+        if n == 400:
+            cum[1] = 0
+            frame_num[1] = 0
+        if n == 397:
+            events[n] = ("hold", 1)
+        if n == 774:
+            events[n] = ("hold", 2)
+        if n == 778:
+            events[n] = ("release", 2)
+        frames = []
+        for stream in range(3):
+            if stream == 2 and n > 777:
+                continue
+            curr = (rng.random(2) < 0.05).astype(np.int64)
+            cum[stream] += curr
+            total[stream] += curr
+            frames.append({"pad_index": stream, "frame_num": frame_num[stream],
+                           "objLCCurrCnt": dict(zip(labels.lc, curr.tolist())),
+                           "objLCCumCnt": dict(zip(labels.lc,
+                                                   cum[stream].tolist()))})
+            frame_num[stream] += 1
+        batches.append(make_batch(frames))
+
+    def replay(decimator):
+        counted = np.zeros((3, 2), dtype=np.int64)
+        for n, batch_meta in enumerate(batches):
+            action = events.get(n)
+            if action is not None and decimator is not None:
+                getattr(decimator, action[0])(action[1])
+            if decimator is not None and decimator.skip():
+                continue
+            batch = extract_analytics_batch(pyds, batch_meta, labels)
+            if decimator is not None:
+                batch.lc_curr = decimator.reconcile(batch)
+            np.add.at(counted, batch.pad_index, batch.lc_curr)
+        return counted
+
+    start = time.perf_counter()
+    assert (replay(None) == total).all()
+    full = time.perf_counter() - start
+    for interval, max_interval in ((10, None), (4, 32)):
+        decimator = Decimator(interval, max_interval)
+        start = time.perf_counter()
+        counted = replay(decimator)
+        elapsed = time.perf_counter() - start
+        assert (counted == total).all(), (counted, total)
+        assert decimator.stats["restarts"] == 1
+        print("interval {0}-{1}: {2} of {3} batches inspected, {4:.1f}x "
+              "faster, counts exact".format(
+                  interval, decimator.max_interval,
+                  decimator.stats["inspected"], num_batches, full / elapsed))
+
+    # a line added in front of "out" and "in" dropped: "out" keeps counting
+    # from its last cumulative count, the new line from 0
+    decimator = Decimator(10)
+    decimator.skip()
+    first = extract_analytics_batch(pyds, make_batch([
+        {"pad_index": 0, "objLCCumCnt": {"in": 4, "out": 7}}]), labels)
+    decimator.reconcile(first)
+    new_labels = AnalyticsLabels(lc=["new", "out"])
+    decimator.relabel(labels.lc, new_labels.lc)
+    for _ in range(9):
+        assert decimator.skip()
+    decimator.skip()
+    later = extract_analytics_batch(pyds, make_batch([
+        {"pad_index": 0, "frame_num": 10,
+         "objLCCumCnt": {"new": 2, "out": 9}}]), new_labels)
+    assert decimator.reconcile(later).tolist() == [[2, 2]]
+    assert decimator.stats["restarts"] == 0
+
+    print("decimation checks passed")
+
+
+if __name__ == "__main__":
+    _check_decimation()
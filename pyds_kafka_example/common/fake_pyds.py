@@ -0,0 +1,361 @@
+################################################################################
+# SPDX-FileCopyrightText: Copyright (c) 2019-2021 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+################################################################################
+
+"""Fake pyds metadata for exercising the analytics probe path without a GPU.
+
+FakePyds mimics the subset of the pyds module used by the probe: the meta
+casts, user meta type lookup and event meta attachment. Batches are built
+from plain dicts with make_batch():
+
+    batch_meta = make_batch([
+        {"pad_index": 0, "frame_num": 7,
+         "objLCCurrCnt": {"straight": 1}, "objLCCumCnt": {"straight": 12}},
+    ])
+
+Running this module checks the analytics batch extraction against a set of
+fake batches.
+"""
+
+import time
+
+ANALYTICS_FRAME_META_TYPE = 0x1000
+ANALYTICS_OBJ_META_TYPE = 0x1001
+NVDS_EVENT_MSG_META = 0x101
+
+
+class FakeList:
+    def __init__(self, data, next=None):
+        self.data = data
+        self.next = next
+
+
+def make_list(items):
+    head = None
+    for item in reversed(items):
+        head = FakeList(item, head)
+    return head
+
+
+class FakeBaseMeta:
+    def __init__(self, meta_type=0):
+        self.meta_type = meta_type
+
+
+class FakeUserMeta:
+    def __init__(self, meta_type=0, user_meta_data=None):
+        self.base_meta = FakeBaseMeta(meta_type)
+        self.user_meta_data = user_meta_data
+
+
+class FakeAnalyticsFrameMeta:
+    def __init__(self, objLCCurrCnt=None, objLCCumCnt=None, objInROIcnt=None,
+                 ocStatus=None, objCnt=None):
+        self.objLCCurrCnt = dict(objLCCurrCnt or {})
+        self.objLCCumCnt = dict(objLCCumCnt or {})
+        self.objInROIcnt = dict(objInROIcnt or {})
+        self.ocStatus = dict(ocStatus or {})
+        self.objCnt = dict(objCnt or {})
+
+
+class FakeAnalyticsObjInfo:
+    def __init__(self, lcStatus=None, roiStatus=None, ocStatus=None,
+                 dirStatus=""):
+        self.lcStatus = list(lcStatus or [])
+        self.roiStatus = list(roiStatus or [])
+        self.ocStatus = list(ocStatus or [])
+        self.dirStatus = dirStatus
+
+
+class FakeRect:
+    def __init__(self, left=0.0, top=0.0, width=0.0, height=0.0):
+        self.left = left
+        self.top = top
+        self.width = width
+        self.height = height
+
+
+class FakeObjectMeta:
+    def __init__(self, object_id=0, class_id=0, lcStatus=None, bbox=None):
+        self.object_id = object_id
+        self.class_id = class_id
+        self.rect_params = FakeRect(*(bbox or ()))
+        self.obj_user_meta_list = None
+        if lcStatus is not None:
+            self.obj_user_meta_list = make_list([FakeUserMeta(
+                ANALYTICS_OBJ_META_TYPE, FakeAnalyticsObjInfo(lcStatus))])
+
+
+class FakeBuffer:
+    """Stands in for the Gst.Buffer of a probe; hash() is its address."""
+
+    def __init__(self, batch_meta):
+        self.batch_meta = batch_meta
+
+
+class FakeProbeInfo:
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+    def get_buffer(self):
+        return self.buffer
+
+
+class FakeFrameMeta:
+    def __init__(self, pad_index=0, frame_num=0, source_id=None,
+                 ntp_timestamp=0, buf_pts=0):
+        self.pad_index = pad_index
+        self.source_id = pad_index if source_id is None else source_id
+        self.frame_num = frame_num
+        self.ntp_timestamp = ntp_timestamp
+        self.buf_pts = buf_pts
+        self.frame_user_meta_list = None
+        self.obj_meta_list = None
+        self.user_metas = []
+
+    def add_user_meta(self, user_meta):
+        self.user_metas.append(user_meta)
+        self.frame_user_meta_list = make_list(self.user_metas)
+
+    def remove_user_meta(self, user_meta):
+        self.user_metas.remove(user_meta)
+        self.frame_user_meta_list = make_list(self.user_metas)
+
+
+class FakeBatchMeta:
+    def __init__(self, frames):
+        self.frames = list(frames)
+        self.frame_meta_list = make_list(self.frames)
+        self.num_frames_in_batch = len(self.frames)
+
+
+class FakeEventMsgMeta:
+    def __init__(self):
+        self.sensorId = 0
+        self.sensorStr = None
+        self.frameId = 0
+        self.ts = None
+        self.lc_curr_straight = 0
+        self.lc_cum_straight = 0
+        self.lc_counts = []
+        self.lc_objects = []
+        self.trace = (0, 0, 0, 0)
+        self.trace_compact = False
+
+    def set_trace(self, capture_ts, buf_pts, probe_ts, compact=False):
+        self.trace = (int(capture_ts), int(buf_pts), int(probe_ts), 0)
+        self.trace_compact = bool(compact)
+
+    def set_lc_counts(self, labels, current, cumulative):
+        if not len(labels) == len(current) == len(cumulative):
+            raise ValueError("set_lc_counts needs one current and "
+                             "cumulative count per label")
+        self.lc_counts = [(label[:31], int(curr), int(cum)) for label, curr, cum
+                          in zip(labels, current, cumulative)]
+
+    @property
+    def numLcCounts(self):
+        return len(self.lc_counts)
+
+    def set_lc_objects(self, tracking_id, class_id, bbox, lc_index):
+        if not len(tracking_id) == len(class_id) == len(bbox) == len(lc_index):
+            raise ValueError("set_lc_objects needs a class id, bbox and lc "
+                             "index per tracking id")
+        self.lc_objects = [(int(t), int(c), tuple(float(v) for v in b), int(i))
+                           for t, c, b, i in zip(tracking_id, class_id, bbox,
+                                                 lc_index)]
+
+    @property
+    def numLcObjects(self):
+        return len(self.lc_objects)
+
+
+class _Caster:
+    # pyds.<Type>.cast() on fake objects is the identity.
+    @staticmethod
+    def cast(data):
+        return data
+
+
+class _MetaType:
+    NVDS_EVENT_MSG_META = NVDS_EVENT_MSG_META
+
+
+class FakePyds:
+    NvDsFrameMeta = _Caster
+    NvDsUserMeta = _Caster
+    NvDsAnalyticsFrameMeta = _Caster
+    NvDsAnalyticsObjInfo = _Caster
+    NvDsObjectMeta = _Caster
+    NvDsEventMsgMeta = _Caster
+    NvDsMetaType = _MetaType
+
+    def __init__(self):
+        self.attached = []
+        self._buffers = {}
+        self.pool = {"capacity": 0, "available": 0, "in_use": 0,
+                     "hits": 0, "misses": 0, "high_water": 0}
+
+    def nvds_get_user_meta_type(self, name):
+        if name == "NVIDIA.DSANALYTICSFRAME.USER_META":
+            return ANALYTICS_FRAME_META_TYPE
+        if name == "NVIDIA.DSANALYTICSOBJ.USER_META":
+            return ANALYTICS_OBJ_META_TYPE
+        return 0
+
+    def gst_buffer_get_nvds_batch_meta(self, address):
+        buffer = self._buffers.get(address)
+        return buffer.batch_meta if buffer is not None else None
+
+    def make_buffer(self, batch_meta):
+        """Returns a FakeBuffer of batch_meta that the probe can look up
+        with gst_buffer_get_nvds_batch_meta(hash(buffer))."""
+        buffer = FakeBuffer(batch_meta)
+        self._buffers[hash(buffer)] = buffer
+        return buffer
+
+    def gst_buffer_add_event_batch_meta(self, address, pad_indices):
+        self._buffers[address] = FakeBuffer(FakeBatchMeta(
+            [FakeFrameMeta(pad_index=pad_index) for pad_index in pad_indices]))
+
+    def release_buffer(self, buffer):
+        self._buffers.pop(hash(buffer), None)
+
+    def alloc_nvds_event_msg_meta(self):
+        return FakeEventMsgMeta()
+
+    def event_msg_meta_pool_init(self, capacity):
+        self.pool.update(capacity=capacity, available=capacity, in_use=0,
+                         hits=0, misses=0, high_water=0)
+
+    def acquire_nvds_event_msg_meta(self):
+        meta = FakeEventMsgMeta()
+        meta.ts = bytearray(65)
+        meta.pooled = self.pool["available"] > 0
+        if meta.pooled:
+            self.pool["available"] -= 1
+            self.pool["in_use"] += 1
+            self.pool["hits"] += 1
+            self.pool["high_water"] = max(self.pool["high_water"],
+                                          self.pool["in_use"])
+        else:
+            self.pool["misses"] += 1
+        return meta
+
+    def release_nvds_event_msg_meta(self, meta):
+        if getattr(meta, "pooled", False):
+            meta.pooled = False
+            self.pool["available"] += 1
+            self.pool["in_use"] -= 1
+
+    def event_msg_meta_pool_stats(self):
+        return dict(self.pool)
+
+    def alloc_buffer(self, size):
+        return bytearray(size)
+
+    def generate_ts_rfc3339(self, buffer, size):
+        ts = time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime())
+        buffer[:len(ts)] = ts.encode()[:size]
+
+    def nvds_acquire_user_meta_from_pool(self, batch_meta):
+        return FakeUserMeta()
+
+    def nvds_add_user_meta_to_frame(self, frame_meta, user_meta):
+        frame_meta.add_user_meta(user_meta)
+        self.attached.append((frame_meta, user_meta))
+
+    def set_event_msg_meta_callbacks(self, user_meta):
+        pass
+
+
+def make_batch(frames):
+    """Builds a FakeBatchMeta from dicts of frame fields and analytics
+    counts (objLCCurrCnt, objLCCumCnt, objInROIcnt, ocStatus, objCnt).
+    "objects" holds FakeObjectMeta keyword dicts, e.g.
+    {"object_id": 5, "lcStatus": ["straight"], "bbox": (10, 20, 30, 40)}."""
+    metas = []
+    for frame in frames:
+        frame = dict(frame)
+        objects = frame.pop("objects", [])
+        counts = {key: frame.pop(key) for key in
+                  ("objLCCurrCnt", "objLCCumCnt", "objInROIcnt", "ocStatus",
+                   "objCnt") if key in frame}
+        frame_meta = FakeFrameMeta(**frame)
+        if objects:
+            frame_meta.obj_meta_list = make_list(
+                [FakeObjectMeta(**obj) for obj in objects])
+        if counts:
+            frame_meta.add_user_meta(FakeUserMeta(
+                ANALYTICS_FRAME_META_TYPE, FakeAnalyticsFrameMeta(**counts)))
+        metas.append(frame_meta)
+    return FakeBatchMeta(metas)
+
+
+def _check_extraction():
+    from common.analytics_batch import (extract_analytics_batch,
+                                        extract_crossing_objects)
+    from common.analytics_config import AnalyticsLabels
+
+    pyds = FakePyds()
+    labels = AnalyticsLabels(lc=["straight", "left"], roi=["RF"],
+                             oc=["OC"])
+    batch_meta = make_batch([
+        {"pad_index": 0, "frame_num": 3,
+         "objLCCurrCnt": {"straight": 2, "left": 0},
+         "objLCCumCnt": {"straight": 10, "left": 4},
+         "objInROIcnt": {"RF": 5}, "ocStatus": {"OC": True},
+         "objects": [{"object_id": 7, "class_id": 2, "lcStatus": ["straight"],
+                      "bbox": (10, 20, 30, 40)},
+                     {"object_id": 8, "lcStatus": []},
+                     {"object_id": 9, "lcStatus": ["straight"]}]},
+        {"pad_index": 1, "frame_num": 9},
+        {"pad_index": 2, "frame_num": 1,
+         "objLCCurrCnt": {"left": 1, "unknown": 7},
+         "objLCCumCnt": {"left": 1},
+         "objects": [{"object_id": 3, "lcStatus": ["unknown", "left"]}]},
+    ])
+    batch = extract_analytics_batch(pyds, batch_meta, labels)
+
+    assert len(batch) == 3
+    assert batch.pad_index.tolist() == [0, 1, 2]
+    assert batch.frame_num.tolist() == [3, 9, 1]
+    assert batch.has_analytics.tolist() == [True, False, True]
+    assert batch.lc_curr.tolist() == [[2, 0], [0, 0], [0, 1]]
+    assert batch.lc_cum.tolist() == [[10, 4], [0, 0], [0, 1]]
+    assert batch.roi.tolist() == [[5], [0], [0]]
+    assert batch.oc.tolist() == [[True], [False], [False]]
+    assert batch.frames_with_crossings().tolist() == [0, 2]
+    assert batch.get_frame_meta(pyds, 2) is batch_meta.frames[2]
+
+    empty = extract_analytics_batch(pyds, make_batch([]), labels)
+    assert len(empty) == 0 and empty.lc_curr.shape == (0, 2)
+
+    crossings = extract_crossing_objects(pyds, batch_meta, labels)
+    assert crossings.frame.tolist() == [0, 0, 2]
+    assert crossings.object_id.tolist() == [7, 9, 3]
+    assert crossings.class_id.tolist() == [2, 0, 0]
+    assert crossings.label.tolist() == [0, 0, 1]
+    assert crossings.bbox[0].tolist() == [10, 20, 30, 40]
+    assert crossings.frame_rows(1) == slice(2, 2)
+    assert crossings.object_id[crossings.frame_rows(2)].tolist() == [3]
+    assert crossings.bbox.shape == (3, 4)
+    assert len(extract_crossing_objects(pyds, make_batch([]), labels)) == 0
+
+
+if __name__ == "__main__":
+    _check_extraction()
+    print("fake metadata checks passed")
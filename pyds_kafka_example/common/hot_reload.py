@@ -0,0 +1,176 @@
+################################################################################
+# SPDX-FileCopyrightText: Copyright (c) 2019-2021 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+################################################################################
+
+"""Reloads config files while the pipeline runs.
+
+ConfigReloader polls the files it watches and calls their handler once a
+changed file stayed unchanged for settle seconds, so a file is not read
+halfway through being saved. request() (SIGHUP) reloads all of them at the
+next poll. Both run on the GLib main loop:
+
+    reloader = ConfigReloader()
+    reloader.watch("config_nvdsanalytics.txt", reload_analytics_config)
+    GLib.timeout_add(500, reloader.poll)
+    GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGHUP,
+                         reloader.request)
+
+A handler returns True once the new config is in use. If it returns False
+or raises, the running config stays and the file is read again when it
+changes next.
+"""
+
+import os
+import time
+
+# seconds a changed file has to stay unchanged before it is read
+SETTLE = 0.5
+
+
+class _Watched:
+    def __init__(self, handler, stat):
+        self.handler = handler
+        self.stat = stat
+        # monotonic time of the last change not reloaded yet
+        self.changed = None
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class ConfigReloader:
+    def __init__(self, settle=SETTLE):
+        self.settle = settle
+        self._files = {}
+        self.stats = {"reloads": 0, "failed": 0}
+
+    def watch(self, path, handler):
+        """Calls handler(path) whenever path changed."""
+        self._files[path] = _Watched(handler, _stat(path))
+
+    def request(self, *args):
+        """Reloads every watched file at the next poll(); returns True so it
+        can be a GLib signal or timeout callback."""
+        for watched in self._files.values():
+            watched.changed = float("-inf")
+        return True
+
+    def poll(self, now=None):
+        """Reloads the files that are due; returns True to keep the GLib
+        timeout."""
+        if now is None:
+            now = time.monotonic()
+        for path, watched in self._files.items():
+            stat = _stat(path)
+            if stat != watched.stat:
+                # still being written maybe, wait until it settles
+                watched.stat = stat
+                watched.changed = now
+                continue
+            if watched.changed is None or now - watched.changed < self.settle:
+                continue
+            watched.changed = None
+            if stat is None:
+                print("Reload: {0} is missing, keeping the running "
+                      "config".format(path))
+                self.stats["failed"] += 1
+                continue
+            self._reload(path, watched)
+        return True
+
+    def _reload(self, path, watched):
+        try:
+            ok = watched.handler(path)
+        except Exception as e:
+            print("Reload of {0} failed, keeping the running config: "
+                  "{1}".format(path, e))
+            ok = False
+        self.stats["reloads" if ok else "failed"] += 1
+
+
+def _check_hot_reload():
+    import shutil
+    import tempfile
+
+    directory = tempfile.mkdtemp(prefix="ds-reload-")
+    try:
+        lines = os.path.join(directory, "lines.txt")
+        sensors = os.path.join(directory, "sensors.txt")
+        for path in (lines, sensors):
+            with open(path, "w") as f:
+                f.write("v1\n")
+        loaded = []
+
+        def read(path):
+            with open(path) as f:
+                value = f.read().strip()
+            if value == "bad":
+                raise ValueError("cannot parse " + value)
+            loaded.append((os.path.basename(path), value))
+            return True
+
+        reloader = ConfigReloader(settle=0.5)
+        reloader.watch(lines, read)
+        reloader.watch(sensors, read)
+        reloader.poll(0.0)
+        assert loaded == []
+
+        with open(lines, "w") as f:
+            f.write("v2 longer\n")
+        # seen changed, read once it settled
+        reloader.poll(1.0)
+        reloader.poll(1.2)
+        assert loaded == []
+        reloader.poll(1.6)
+        assert loaded == [("lines.txt", "v2 longer")]
+        reloader.poll(5.0)
+        assert len(loaded) == 1
+
+        # a bad file keeps the running config and is retried on change
+        with open(sensors, "w") as f:
+            f.write("bad\n")
+        reloader.poll(6.0)
+        reloader.poll(7.0)
+        assert reloader.stats == {"reloads": 1, "failed": 1}
+        with open(sensors, "w") as f:
+            f.write("v3 sensors\n")
+        reloader.poll(8.0)
+        reloader.poll(9.0)
+        assert loaded[-1] == ("sensors.txt", "v3 sensors")
+
+        # SIGHUP reloads everything at the next poll
+        reloader.request()
+        reloader.poll(9.1)
+        assert [name for name, _ in loaded[-2:]] == ["lines.txt",
+                                                     "sensors.txt"]
+
+        # a missing file is reported, not read
+        os.remove(lines)
+        reloader.poll(10.0)
+        reloader.poll(11.0)
+        assert reloader.stats["failed"] == 2
+        print("hot reload checks passed: {0}".format(reloader.stats))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    _check_hot_reload()
@@ -0,0 +1,355 @@
+################################################################################
+# SPDX-FileCopyrightText: Copyright (c) 2019-2021 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+################################################################################
+
+"""Line-crossing counts on the CPU from tracked object boxes.
+
+Evaluates the [line-crossing-stream-N] rules of an nvdsanalytics config
+the way the nvdsanalytics element does, for pipelines or replays that
+only have tracker output:
+
+    engine = LineCrossingEngine.from_config("config_nvdsanalytics.txt")
+    crossings = engine.process_frame(stream, object_ids, class_ids, bboxes)
+    crossings.lc_curr, crossings.lc_cum   # per label of engine.labels
+
+A rule "line-crossing-<label>=dx1;dy1;dx2;dy2;x1;y1;x2;y2" holds a
+direction vector followed by the line. An object crosses when the bottom
+centre of its box moves from one side of the line to the other between
+two frames it was tracked in, through the line segment (or anywhere on
+the infinite line with extended=1), in the rule's direction. The mode sets
+how far the movement may deviate from the direction: loose up to 90
+degrees, balanced up to 60 and strict up to 30. nvdsanalytics is closed
+source, so these angles approximate its modes rather than reproduce them.
+"""
+
+import collections
+
+import numpy as np
+
+from common.analytics_config import (AnalyticsLabels, LC_GROUP, LC_KEY,
+                                     expand_stream_groups,
+                                     read_analytics_config)
+
+# cosine of the largest angle between movement and direction per mode
+MODE_MIN_COS = {"loose": 0.0, "balanced": 0.5, "strict": 0.866}
+
+LineCrossings = collections.namedtuple(
+    "LineCrossings", ["lc_curr", "lc_cum", "crossed"])
+LineCrossings.__doc__ = """Result of one frame: lc_curr and lc_cum count
+the crossings per label in the frame and since the start of the stream
+(objLCCurrCnt / objLCCumCnt), crossed[i, j] is True if object i crossed
+a line of label j (its lcStatus)."""
+
+
+class LineCrossingRule:
+    def __init__(self, label, direction, line, class_id=-1, extended=False,
+                 mode="loose"):
+        if mode not in MODE_MIN_COS:
+            raise ValueError("unknown line-crossing mode {0!r}".format(mode))
+        self.label = label
+        self.direction = np.asarray(direction, dtype=np.float64).reshape(2, 2)
+        self.line = np.asarray(line, dtype=np.float64).reshape(2, 2)
+        self.class_id = class_id
+        self.extended = extended
+        self.mode = mode
+
+    def scaled(self, sx, sy):
+        scale = np.array([sx, sy])
+        return LineCrossingRule(self.label, self.direction * scale,
+                                self.line * scale, self.class_id,
+                                self.extended, self.mode)
+
+    def __repr__(self):
+        return "LineCrossingRule({0!r}, direction={1}, line={2}, " \
+               "class_id={3}, extended={4}, mode={5!r})".format(
+                   self.label, self.direction.ravel().tolist(),
+                   self.line.ravel().tolist(), self.class_id,
+                   self.extended, self.mode)
+
+
+def parse_line_crossing_rules(config):
+    """Returns {stream: [LineCrossingRule]} of the enabled line-crossing
+    groups of a parsed nvdsanalytics config."""
+    rules = {}
+    for section in config.sections():
+        if not section.startswith(LC_GROUP):
+            continue
+        group = config[section]
+        if group.get("enable", "1").strip() != "1":
+            continue
+        stream = int(section[len(LC_GROUP):])
+        class_id = int(group.get("class-id", "-1"))
+        extended = group.get("extended", "0").strip() == "1"
+        mode = group.get("mode", "loose").strip()
+        for key, value in group.items():
+            if not key.startswith(LC_KEY):
+                continue
+            label = key[len(LC_KEY):]
+            coords = [c for c in value.split(";") if c.strip()]
+            if len(coords) != 8:
+                raise ValueError("{0} of [{1}] needs 8 coordinates, got "
+                                 "{2}".format(key, section, len(coords)))
+            coords = [float(c) for c in coords]
+            rules.setdefault(stream, []).append(LineCrossingRule(
+                label, coords[:4], coords[4:], class_id, extended, mode))
+    return rules
+
+
+class _StreamLines:
+    """The rules of one stream as arrays, one row per line."""
+
+    def __init__(self, rules, labels):
+        self.start = np.array([r.line[0] for r in rules]).reshape(-1, 2)
+        self.edge = np.array([r.line[1] - r.line[0]
+                              for r in rules]).reshape(-1, 2)
+        direction = np.array([r.direction[1] - r.direction[0]
+                              for r in rules]).reshape(-1, 2)
+        norm = np.hypot(direction[:, 0], direction[:, 1])
+        self.direction = direction / np.where(norm > 0, norm, 1.0)[:, None]
+        self.min_cos = np.array([MODE_MIN_COS[r.mode] for r in rules])
+        self.class_id = np.array([r.class_id for r in rules], dtype=np.int64)
+        self.extended = np.array([r.extended for r in rules], dtype=bool)
+        self.label = np.array([labels.index(r.label) for r in rules],
+                              dtype=np.intp)
+
+
+class _Tracks:
+    """Last anchor point of each tracked object of one stream, sorted by
+    object id so a frame's objects are matched with one searchsorted."""
+
+    def __init__(self):
+        self.ids = np.zeros(0, dtype=np.uint64)
+        self.points = np.zeros((0, 2))
+        self.seen = np.zeros(0, dtype=np.int64)
+
+    def update(self, ids, points, frame, max_age):
+        """Stores points as the latest of ids; returns the previous points
+        and a mask of the objects that had one within max_age frames."""
+        idx = np.searchsorted(self.ids, ids)
+        idx = np.minimum(idx, max(len(self.ids) - 1, 0))
+        if len(self.ids):
+            found = self.ids[idx] == ids
+            previous = self.points[idx]
+            valid = found & (frame - self.seen[idx] <= max_age)
+        else:
+            found = valid = np.zeros(len(ids), dtype=bool)
+            previous = np.zeros((len(ids), 2))
+
+        keep = frame - self.seen < max_age
+        keep[idx[found]] = False
+        order = np.argsort(np.concatenate([self.ids[keep], ids]),
+                           kind="stable")
+        self.ids = np.concatenate([self.ids[keep], ids])[order]
+        self.points = np.concatenate([self.points[keep], points])[order]
+        self.seen = np.concatenate(
+            [self.seen[keep], np.full(len(ids), frame, dtype=np.int64)])[order]
+        return previous, valid
+
+
+class LineCrossingEngine:
+    """Counts line crossings per stream from tracked object boxes.
+
+    rules maps each stream to its LineCrossingRules, labels is the label
+    axis of the counts (by default in the order of AnalyticsLabels).
+    Objects unseen for more than max_age frames are forgotten.
+    """
+
+    def __init__(self, rules, labels=None, max_age=30):
+        if labels is None:
+            labels = []
+            for stream in sorted(rules):
+                for rule in rules[stream]:
+                    if rule.label not in labels:
+                        labels.append(rule.label)
+        self.labels = list(labels)
+        self.max_age = max_age
+        self._lines = dict((stream, _StreamLines(stream_rules, self.labels))
+                           for stream, stream_rules in rules.items()
+                           if stream_rules)
+        self._tracks = {}
+        self._frames = {}
+        self._cum = {}
+
+    @classmethod
+    def from_config(cls, config_file, num_streams=None, frame_width=None,
+                    frame_height=None, max_age=30):
+        """Reads the rules of an nvdsanalytics config. Coordinates are
+        scaled from config-width x config-height to the frame size, and
+        streams without a group of their own use stream 0's with
+        num_streams, like stream_config_file()."""
+        config = read_analytics_config(config_file)
+        if num_streams:
+            expand_stream_groups(config, num_streams)
+        rules = parse_line_crossing_rules(config)
+        width = config.getfloat("property", "config-width", fallback=0)
+        height = config.getfloat("property", "config-height", fallback=0)
+        if frame_width and frame_height and width and height:
+            sx, sy = frame_width / width, frame_height / height
+            rules = dict((stream, [r.scaled(sx, sy) for r in stream_rules])
+                         for stream, stream_rules in rules.items())
+        return cls(rules, AnalyticsLabels.from_parser(config).lc, max_age)
+
+    def lc_cum(self, stream):
+        cum = self._cum.get(stream)
+        if cum is None:
+            cum = self._cum[stream] = np.zeros(len(self.labels),
+                                               dtype=np.uint64)
+        return cum
+
+    def reset(self, stream):
+        """Forgets the tracks and cumulative counts of stream, e.g. at EOS."""
+        self._tracks.pop(stream, None)
+        self._frames.pop(stream, None)
+        self._cum.pop(stream, None)
+
+    def process_frame(self, stream, object_ids, class_ids, bboxes):
+        """Evaluates one frame of stream. bboxes holds the (left, top,
+        width, height) of each object. Returns LineCrossings."""
+        object_ids = np.asarray(object_ids, dtype=np.uint64)
+        class_ids = np.asarray(class_ids, dtype=np.int64)
+        bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        frame = self._frames.get(stream, -1) + 1
+        self._frames[stream] = frame
+        lc_cum = self.lc_cum(stream)
+        lines = self._lines.get(stream)
+
+        points = np.empty((len(object_ids), 2))
+        points[:, 0] = bboxes[:, 0] + bboxes[:, 2] / 2
+        points[:, 1] = bboxes[:, 1] + bboxes[:, 3]
+        tracks = self._tracks.get(stream)
+        if tracks is None:
+            tracks = self._tracks[stream] = _Tracks()
+        previous, valid = tracks.update(object_ids, points, frame,
+                                        self.max_age)
+
+        lc_curr = np.zeros(len(self.labels), dtype=np.uint64)
+        crossed = np.zeros((len(object_ids), len(self.labels)), dtype=bool)
+        if lines is None or not valid.any():
+            return LineCrossings(lc_curr, lc_cum.copy(), crossed)
+
+        hits = self._crossings(lines, previous[valid], points[valid],
+                               class_ids[valid])
+        np.add.at(lc_curr, lines.label, hits.sum(axis=0, dtype=np.uint64))
+        lc_cum += lc_curr
+        rows = np.flatnonzero(valid)
+        for j, label in enumerate(lines.label):
+            crossed[rows[hits[:, j]], label] = True
+        return LineCrossings(lc_curr, lc_cum.copy(), crossed)
+
+    @staticmethod
+    def _crossings(lines, p0, p1, class_ids):
+        # (objects, lines) matrix of side changes; a side is the sign of the
+        # cross product of the line edge and the point relative to the line
+        # start. Most pairs do not change sides, the other tests only run
+        # on the pairs that do.
+        ex, ey = lines.edge[:, 0], lines.edge[:, 1]
+        ax, ay = lines.start[:, 0], lines.start[:, 1]
+        side0 = ex * (p0[:, 1:2] - ay) - ey * (p0[:, 0:1] - ax)
+        side1 = ex * (p1[:, 1:2] - ay) - ey * (p1[:, 0:1] - ax)
+        hits = (side0 * side1 <= 0) & (side0 != 0)
+        i, j = np.nonzero(hits)
+        if not len(i):
+            return hits
+
+        rx, ry = p0[i, 0] - ax[j], p0[i, 1] - ay[j]
+        dx, dy = p1[i, 0] - p0[i, 0], p1[i, 1] - p0[i, 1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # position of the crossing along the segment, 0..1 inside it
+            t = (rx * dy - ry * dx) / (ex[j] * dy - ey[j] * dx)
+        ok = lines.extended[j] | ((t >= 0) & (t <= 1))
+        along = dx * lines.direction[j, 0] + dy * lines.direction[j, 1]
+        ok &= along > lines.min_cos[j] * np.hypot(dx, dy)
+        ok &= (lines.class_id[j] < 0) | (class_ids[i] == lines.class_id[j])
+        hits[i[~ok], j[~ok]] = False
+        return hits
+
+
+def _check_line_crossing():
+    import os
+    import time
+
+    config_file = os.path.join(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))), "config_nvdsanalytics.txt")
+    engine = LineCrossingEngine.from_config(config_file, num_streams=2)
+    assert engine.labels == ["straight"]
+
+    # the straight line runs from (851, 773) to (1203, 732), its direction
+    # points down: object 1 crosses downwards, object 2 upwards, object 3
+    # misses the segment, object 4 is class 2
+    down = [(1000, 700), (1000, 800)]
+    up = [(1000, 800), (1000, 700)]
+    beside = [(500, 700), (500, 800)]
+    tracks = {1: down, 2: up, 3: beside, 4: down}
+    classes = {1: 0, 2: 0, 3: 0, 4: 2}
+
+    def boxes(n):
+        # anchor is the bottom centre of a 40x80 box
+        return [(x - 20, y - 80, 40, 80) for x, y in
+                (tracks[i][n] for i in sorted(tracks))]
+
+    ids = sorted(tracks)
+    class_ids = [classes[i] for i in ids]
+    first = engine.process_frame(0, ids, class_ids, boxes(0))
+    assert first.lc_curr.tolist() == [0]
+    second = engine.process_frame(0, ids, class_ids, boxes(1))
+    assert second.lc_curr.tolist() == [1] and second.lc_cum.tolist() == [1]
+    assert second.crossed[:, 0].tolist() == [True, False, False, False]
+    # stream 1 uses the stream-0 group and counts on its own
+    engine.process_frame(1, [1], [0], [boxes(0)[0]])
+    assert engine.process_frame(1, [1], [0], [boxes(1)[0]]).lc_cum.tolist() \
+        == [1]
+    assert engine.lc_cum(0).tolist() == [1]
+
+    # extended lines count the crossing beside the segment, strict mode
+    # rejects a 45 degree movement that loose mode accepts
+    rule = LineCrossingRule("l", [0, 0, 0, 10], [0, 0, 10, 0],
+                            extended=True)
+    strict = LineCrossingRule("s", [0, 0, 0, 10], [0, 0, 10, 0],
+                              mode="strict")
+    engine = LineCrossingEngine({0: [rule, strict]})
+    engine.process_frame(0, [1, 2], [0, 0], [(-60, -10, 0, 5),
+                                             (4, -10, 0, 5)])
+    result = engine.process_frame(0, [1, 2], [0, 0], [(-60, -5, 0, 10),
+                                                      (14, -5, 0, 10)])
+    assert result.lc_curr.tolist() == [2, 0]
+
+    # thousands of tracks moving through a line per frame
+    num_tracks, num_frames = 4000, 50
+    rng = np.random.default_rng(0)
+    rules = {0: [LineCrossingRule("l{0}".format(i),
+                                  [0, 0, 0, 1], [0, 100 * i, 1920, 100 * i])
+                 for i in range(1, 9)]}
+    engine = LineCrossingEngine(rules)
+    ids = rng.permutation(num_tracks * 4)[:num_tracks].astype(np.uint64)
+    start = rng.uniform(0, 1000, (num_tracks, 2))
+    speed = rng.uniform(-5, 20, (num_tracks, 2))
+    class_ids = np.zeros(num_tracks, dtype=np.int64)
+    elapsed = 0.0
+    for n in range(num_frames):
+        points = start + speed * n
+        bboxes = np.column_stack([points[:, 0] - 20, points[:, 1] - 80,
+                                  np.full(num_tracks, 40.0),
+                                  np.full(num_tracks, 80.0)])
+        t = time.perf_counter()
+        result = engine.process_frame(0, ids, class_ids, bboxes)
+        elapsed += time.perf_counter() - t
+    print("{0} tracks x {1} lines: {2:.2f} ms/frame, {3} crossings".format(
+        num_tracks, len(rules[0]), elapsed * 1000 / num_frames,
+        int(result.lc_cum.sum())))
+
+
+if __name__ == "__main__":
+    _check_line_crossing()
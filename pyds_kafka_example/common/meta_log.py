@@ -0,0 +1,273 @@
+################################################################################
+# SPDX-FileCopyrightText: Copyright (c) 2019-2021 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+################################################################################
+
+"""Compact binary log of the nvdsanalytics metadata of each batch.
+
+run.py --record FILE writes it from the probe; replay_bench.py reads it
+back as fake_pyds batches to benchmark the message path without a GPU.
+
+Layout (little endian):
+
+    header  b"DSML", u16 version, u16 label count,
+            per label: u8 length, utf-8 name
+    batch   u32 byte length of the rest of the batch, u16 frame count,
+            per frame:
+              u32 source id (pad_index), i32 frame number,
+              u64 ntp timestamp, u64 buffer pts, u16 object count,
+              u16 flags (bit 0: frame has analytics meta),
+              u32 current count per label, u32 cumulative count per label,
+              per object with a line crossing:
+                u64 object id, u32 bit mask of the crossed labels
+
+Labels are the line-crossing labels of the nvdsanalytics config, at most
+32 so an object's crossings fit the mask.
+"""
+
+import struct
+
+import numpy as np
+
+MAGIC = b"DSML"
+VERSION = 1
+MAX_LABELS = 32
+FLAG_ANALYTICS = 1
+
+_HEADER = struct.Struct("<4sHH")
+_BATCH = struct.Struct("<IH")
+_FRAME = struct.Struct("<IiQQHH")
+_OBJECT = struct.Struct("<QI")
+
+
+class MetaLogWriter:
+    def __init__(self, path, labels):
+        if len(labels) > MAX_LABELS:
+            raise ValueError("at most {0} line-crossing labels".format(MAX_LABELS))
+        self.labels = list(labels)
+        self._counts = struct.Struct("<{0}I".format(2 * len(self.labels)))
+        self._file = open(path, "wb")
+        header = [_HEADER.pack(MAGIC, VERSION, len(self.labels))]
+        for label in self.labels:
+            name = label.encode("utf-8")
+            header.append(struct.pack("<B", len(name)) + name)
+        self._file.write(b"".join(header))
+        self.batches = 0
+        self.frames = 0
+
+    def write_frames(self, frames):
+        """Writes one batch of frame dicts in fake_pyds.make_batch() form."""
+        body = []
+        for frame in frames:
+            curr = frame.get("objLCCurrCnt")
+            cum = frame.get("objLCCumCnt", {})
+            objects = [obj for obj in frame.get("objects", [])
+                       if obj.get("lcStatus")]
+            body.append(_FRAME.pack(
+                frame.get("pad_index", 0), frame.get("frame_num", 0),
+                frame.get("ntp_timestamp", 0), frame.get("buf_pts", 0),
+                len(objects), FLAG_ANALYTICS if curr is not None else 0))
+            curr = curr or {}
+            body.append(self._counts.pack(
+                *([curr.get(label, 0) for label in self.labels] +
+                  [cum.get(label, 0) for label in self.labels])))
+            for obj in objects:
+                body.append(_OBJECT.pack(obj["object_id"],
+                                         self._mask(obj["lcStatus"])))
+        body = b"".join(body)
+        # the length counts everything after itself: frame count and frames
+        self._file.write(_BATCH.pack(len(body) + 2, len(frames)) + body)
+        self.batches += 1
+        self.frames += len(frames)
+
+    def _mask(self, lc_status):
+        mask = 0
+        for label in lc_status:
+            if label in self.labels:
+                mask |= 1 << self.labels.index(label)
+        return mask
+
+    def write_batch(self, pyds, batch, object_meta_type=None):
+        """Records an AnalyticsBatch extracted in the probe, including the
+        line-crossing status of each object."""
+        if object_meta_type is None:
+            object_meta_type = pyds.nvds_get_user_meta_type(
+                "NVIDIA.DSANALYTICSOBJ.USER_META")
+        frames = []
+        for i in range(len(batch)):
+            frame_meta = batch.get_frame_meta(pyds, i)
+            frame = {"pad_index": int(batch.pad_index[i]),
+                     "frame_num": int(batch.frame_num[i]),
+                     "ntp_timestamp": frame_meta.ntp_timestamp,
+                     "buf_pts": frame_meta.buf_pts,
+                     "objects": _crossing_objects(pyds, frame_meta,
+                                                  object_meta_type)}
+            if batch.has_analytics[i]:
+                frame["objLCCurrCnt"] = dict(zip(self.labels,
+                                                 batch.lc_curr[i].tolist()))
+                frame["objLCCumCnt"] = dict(zip(self.labels,
+                                                batch.lc_cum[i].tolist()))
+            frames.append(frame)
+        self.write_frames(frames)
+
+    def close(self):
+        self._file.close()
+
+
+def _crossing_objects(pyds, frame_meta, object_meta_type):
+    objects = []
+    l_obj = frame_meta.obj_meta_list
+    while l_obj is not None:
+        obj_meta = pyds.NvDsObjectMeta.cast(l_obj.data)
+        l_user = obj_meta.obj_user_meta_list
+        while l_user is not None:
+            user_meta = pyds.NvDsUserMeta.cast(l_user.data)
+            if user_meta.base_meta.meta_type == object_meta_type:
+                info = pyds.NvDsAnalyticsObjInfo.cast(user_meta.user_meta_data)
+                if info.lcStatus:
+                    objects.append({"object_id": obj_meta.object_id,
+                                    "lcStatus": list(info.lcStatus)})
+            l_user = l_user.next
+        l_obj = l_obj.next
+    return objects
+
+
+class MetaLogReader:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._data = f.read()
+        magic, version, num_labels = _HEADER.unpack_from(self._data)
+        if magic != MAGIC:
+            raise ValueError("{0} is not a metadata log".format(path))
+        if version != VERSION:
+            raise ValueError("unsupported metadata log version {0}".format(version))
+        pos = _HEADER.size
+        self.labels = []
+        for _ in range(num_labels):
+            length = self._data[pos]
+            self.labels.append(self._data[pos + 1:pos + 1 + length].decode("utf-8"))
+            pos += 1 + length
+        self._start = pos
+        self._counts = struct.Struct("<{0}I".format(2 * num_labels))
+
+    def __iter__(self):
+        """Yields each batch as a list of frame dicts (make_batch() form)."""
+        data = self._data
+        labels = self.labels
+        pos = self._start
+        while pos + _BATCH.size <= len(data):
+            length, num_frames = _BATCH.unpack_from(data, pos)
+            end = pos + 4 + length
+            if end > len(data):
+                break
+            pos += _BATCH.size
+            frames = []
+            for _ in range(num_frames):
+                pad_index, frame_num, ntp, pts, num_objects, flags = \
+                    _FRAME.unpack_from(data, pos)
+                pos += _FRAME.size
+                counts = self._counts.unpack_from(data, pos)
+                pos += self._counts.size
+                frame = {"pad_index": pad_index, "frame_num": frame_num,
+                         "ntp_timestamp": ntp, "buf_pts": pts}
+                if flags & FLAG_ANALYTICS:
+                    frame["objLCCurrCnt"] = dict(zip(labels, counts[:len(labels)]))
+                    frame["objLCCumCnt"] = dict(zip(labels, counts[len(labels):]))
+                objects = []
+                for _ in range(num_objects):
+                    object_id, mask = _OBJECT.unpack_from(data, pos)
+                    pos += _OBJECT.size
+                    objects.append({"object_id": object_id,
+                                    "lcStatus": [label for bit, label in
+                                                 enumerate(labels)
+                                                 if mask & (1 << bit)]})
+                if objects:
+                    frame["objects"] = objects
+                frames.append(frame)
+            pos = end
+            yield frames
+
+
+def write_synthetic_log(path, labels, num_streams=4, num_batches=1000,
+                        crossing_rate=0.1, fps=30, seed=0):
+    """Writes a log of num_batches batches of num_streams frames in which
+    each label is crossed with probability crossing_rate per frame."""
+    rng = np.random.default_rng(seed)
+    writer = MetaLogWriter(path, labels)
+    cumulative = np.zeros((num_streams, len(labels)), dtype=np.int64)
+    next_object = 1
+    for n in range(num_batches):
+        crossed = rng.random((num_streams, len(labels))) < crossing_rate
+        cumulative += crossed
+        frames = []
+        for stream in range(num_streams):
+            objects = []
+            for j in np.flatnonzero(crossed[stream]):
+                objects.append({"object_id": next_object,
+                                "lcStatus": [labels[j]]})
+                next_object += 1
+            frames.append({
+                "pad_index": stream, "frame_num": n,
+                "ntp_timestamp": n * 1000000000 // fps,
+                "buf_pts": n * 1000000000 // fps,
+                "objLCCurrCnt": dict(zip(labels, crossed[stream].astype(int).tolist())),
+                "objLCCumCnt": dict(zip(labels, cumulative[stream].tolist())),
+                "objects": objects})
+        writer.write_frames(frames)
+    writer.close()
+    return writer.frames
+
+
+def _check_meta_log():
+    import os
+    import tempfile
+    from common.analytics_batch import extract_analytics_batch
+    from common.analytics_config import AnalyticsLabels
+    from common.fake_pyds import FakePyds, make_batch
+
+    labels = ["straight", "left"]
+    frames = [{"pad_index": 0, "frame_num": 7, "ntp_timestamp": 11,
+               "buf_pts": 12, "objLCCurrCnt": {"straight": 1, "left": 0},
+               "objLCCumCnt": {"straight": 9, "left": 3},
+               "objects": [{"object_id": 42, "lcStatus": ["straight"]}]},
+              {"pad_index": 1, "frame_num": 8, "ntp_timestamp": 13,
+               "buf_pts": 14}]
+    fd, path = tempfile.mkstemp(suffix=".dsml")
+    os.close(fd)
+    try:
+        # recording from the probe's AnalyticsBatch round-trips
+        pyds = FakePyds()
+        batch = extract_analytics_batch(pyds, make_batch(frames),
+                                        AnalyticsLabels(lc=labels))
+        writer = MetaLogWriter(path, labels)
+        writer.write_batch(pyds, batch)
+        writer.write_frames([])
+        writer.close()
+        reader = MetaLogReader(path)
+        assert reader.labels == labels
+        assert list(reader) == [frames, []]
+
+        num_frames = write_synthetic_log(path, labels, num_streams=2,
+                                         num_batches=100)
+        batches = list(MetaLogReader(path))
+        assert sum(len(b) for b in batches) == num_frames == 200
+        print("{0} frames, {1:.1f} bytes/frame".format(
+            num_frames, os.path.getsize(path) / float(num_frames)))
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    _check_meta_log()
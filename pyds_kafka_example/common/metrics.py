@@ -0,0 +1,292 @@
+################################################################################
+# SPDX-FileCopyrightText: Copyright (c) 2019-2021 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+################################################################################
+
+"""Per-stream pipeline metrics in Prometheus text format.
+
+Counters and histograms keep their values in NumPy arrays indexed by
+stream (pad_index). They are written only from the streaming thread that
+runs the probe and readers render a copy, so neither side takes a lock;
+a scrape may see one batch half applied, which Prometheus tolerates.
+
+    metrics = PipelineMetrics(num_streams=4)
+    metrics.frames.add(batch.pad_index)
+    metrics.probe_seconds.observe(elapsed)
+    MetricsServer(metrics.registry, 9464).start()
+"""
+
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# probe execution time, 50 us .. 100 ms
+PROBE_SECONDS_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+                         0.005, 0.01, 0.025, 0.05, 0.1)
+EVENTS_PER_FRAME_BUCKETS = (0, 1, 2, 4, 8, 16)
+
+
+def _format_value(value):
+    if isinstance(value, (float, np.floating)):
+        return repr(float(value))
+    return str(int(value))
+
+
+class Counter:
+    def __init__(self, name, help, num_streams=None):
+        """num_streams=None makes a counter without a stream label."""
+        self.name = name
+        self.help = help
+        self.per_stream = num_streams is not None
+        self.values = np.zeros(num_streams or 1, dtype=np.uint64)
+
+    def inc(self, stream=0, value=1):
+        self.values[stream] += value
+
+    def add(self, streams, values=1):
+        """Adds values (scalar or per element) to each stream in streams."""
+        np.add.at(self.values, streams, values)
+
+    def render(self, lines):
+        lines.append("# HELP {0} {1}".format(self.name, self.help))
+        lines.append("# TYPE {0} counter".format(self.name))
+        values = self.values.copy()
+        if not self.per_stream:
+            lines.append("{0} {1}".format(self.name, int(values[0])))
+            return
+        for stream, value in enumerate(values):
+            lines.append('{0}{{stream="{1}"}} {2}'.format(
+                self.name, stream, int(value)))
+
+
+class Histogram:
+    def __init__(self, name, help, buckets, num_streams=None):
+        self.name = name
+        self.help = help
+        self.per_stream = num_streams is not None
+        self.bounds = np.asarray(buckets, dtype=np.float64)
+        # last column counts the values above the largest bound (+Inf)
+        self.counts = np.zeros((num_streams or 1, len(self.bounds) + 1),
+                               dtype=np.uint64)
+        self.sums = np.zeros(num_streams or 1, dtype=np.float64)
+
+    def observe(self, value, stream=0):
+        # le semantics: a value equal to a bound falls into that bucket
+        self.counts[stream, np.searchsorted(self.bounds, value)] += 1
+        self.sums[stream] += value
+
+    def observe_many(self, streams, values):
+        values = np.asarray(values, dtype=np.float64)
+        np.add.at(self.counts, (streams, np.searchsorted(self.bounds, values)), 1)
+        np.add.at(self.sums, streams, values)
+
+    def render(self, lines):
+        lines.append("# HELP {0} {1}".format(self.name, self.help))
+        lines.append("# TYPE {0} histogram".format(self.name))
+        counts = np.cumsum(self.counts, axis=1)
+        sums = self.sums.copy()
+        for stream in range(len(sums)):
+            label = 'stream="{0}",'.format(stream) if self.per_stream else ""
+            for bound, count in zip(self.bounds, counts[stream]):
+                lines.append('{0}_bucket{{{1}le="{2}"}} {3}'.format(
+                    self.name, label, _format_value(bound), int(count)))
+            lines.append('{0}_bucket{{{1}le="+Inf"}} {2}'.format(
+                self.name, label, int(counts[stream, -1])))
+            suffix = "{{{0}}}".format(label.rstrip(",")) if label else ""
+            lines.append("{0}_sum{1} {2}".format(self.name, suffix,
+                                                 repr(float(sums[stream]))))
+            lines.append("{0}_count{1} {2}".format(self.name, suffix,
+                                                   int(counts[stream, -1])))
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            metric.render(lines)
+        return "\n".join(lines) + "\n"
+
+
+class PipelineMetrics:
+    """The metrics updated by the analytics probe."""
+
+    def __init__(self, num_streams=1):
+        self.registry = registry = MetricsRegistry()
+        self.batches = registry.register(Counter(
+            "ds_batches_total", "Batches seen by the analytics probe"))
+        self.frames = registry.register(Counter(
+            "ds_frames_total", "Frames seen by the analytics probe",
+            num_streams))
+        self.line_crossings = registry.register(Counter(
+            "ds_line_crossings_total",
+            "Line crossings of all labels reported by nvdsanalytics",
+            num_streams))
+        self.events = registry.register(Counter(
+            "ds_events_total", "Event msg metas attached for nvmsgconv",
+            num_streams))
+        self.ring_dropped = registry.register(Counter(
+            "ds_ring_dropped_total",
+            "Frame counts dropped because the --ring-size ring was full"))
+        self.skipped_batches = registry.register(Counter(
+            "ds_skipped_batches_total",
+            "Batches the probe did not inspect because of --probe-interval"))
+        self.probe_seconds = registry.register(Histogram(
+            "ds_probe_seconds", "Execution time of the analytics probe",
+            PROBE_SECONDS_BUCKETS))
+        self.events_per_frame = registry.register(Histogram(
+            "ds_events_per_frame", "Event msg metas attached per frame",
+            EVENTS_PER_FRAME_BUCKETS, num_streams))
+
+    def observe_batch(self, batch, events_per_frame, probe_seconds):
+        """Updates all metrics for one AnalyticsBatch; events_per_frame holds
+        the number of event msg metas attached to each of its frames."""
+        streams = batch.pad_index
+        events_per_frame = np.asarray(events_per_frame, dtype=np.uint64)
+        self.batches.inc()
+        self.frames.add(streams)
+        self.line_crossings.add(streams,
+                                batch.lc_curr.sum(axis=1, dtype=np.uint64))
+        self.events.add(streams, events_per_frame)
+        self.events_per_frame.observe_many(streams, events_per_frame)
+        self.probe_seconds.observe(probe_seconds)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = None
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # no access log on stderr for every scrape
+        pass
+
+
+class MetricsServer:
+    """Serves the registry on http://<host>:<port>/metrics from a daemon
+    thread."""
+
+    def __init__(self, registry, port, host=""):
+        handler = type("MetricsHandler", (_MetricsHandler,),
+                       {"registry": registry})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       name="metrics-http", daemon=True)
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class MetricsFileDumper:
+    """Writes the registry to path every interval seconds, e.g. for the
+    node_exporter textfile collector. The file is replaced atomically."""
+
+    def __init__(self, registry, path, interval=10.0):
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="metrics-dump",
+                                       daemon=True)
+
+    def dump(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.registry.render())
+        os.replace(tmp_path, self.path)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.dump()
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self.thread.join()
+        self.dump()
+
+
+def _check_metrics():
+    from urllib.request import urlopen
+
+    metrics = PipelineMetrics(num_streams=2)
+    metrics.batches.inc()
+    metrics.frames.add(np.array([0, 1, 1]))
+    metrics.line_crossings.add(np.array([0, 1]), np.array([3, 2]))
+    metrics.probe_seconds.observe(0.0001)
+    metrics.probe_seconds.observe(0.2)
+    metrics.events_per_frame.observe_many(np.array([0, 1, 1]),
+                                          np.array([1, 0, 3]))
+    text = metrics.registry.render()
+    assert 'ds_frames_total{stream="1"} 2' in text
+    assert 'ds_line_crossings_total{stream="0"} 3' in text
+    assert 'ds_probe_seconds_bucket{le="0.0001"} 1' in text
+    assert 'ds_probe_seconds_bucket{le="+Inf"} 2' in text
+    assert 'ds_events_per_frame_bucket{stream="1",le="0.0"} 1' in text
+    assert 'ds_events_per_frame_count{stream="1"} 2' in text
+
+    server = MetricsServer(metrics.registry, 0, "127.0.0.1").start()
+    try:
+        url = "http://127.0.0.1:{0}/metrics".format(server.port)
+        assert urlopen(url).read().decode("utf-8") == text
+    finally:
+        server.stop()
+
+    # cost of the per-batch updates done by the probe
+    metrics = PipelineMetrics(num_streams=4)
+    streams = np.arange(4)
+    runs = 10000
+    start = time.perf_counter()
+    for _ in range(runs):
+        metrics.batches.inc()
+        metrics.frames.add(streams)
+        metrics.probe_seconds.observe(0.0003)
+    elapsed = time.perf_counter() - start
+    print("metrics update: {0:.2f} us/batch".format(elapsed * 1e6 / runs))
+
+
+if __name__ == "__main__":
+    _check_metrics()
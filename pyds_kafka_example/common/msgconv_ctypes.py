@@ -0,0 +1,376 @@
+################################################################################
+# SPDX-FileCopyrightText: Copyright (c) 2019-2021 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+################################################################################
+
+"""ctypes access to libnvds_msgconv.so for benchmarks.
+
+The structures mirror src/deepstream-sources/includes/nvdsmeta_schema.h
+and must be kept in sync with it.
+
+    msgconv = Msgconv("/opt/nvidia/deepstream/deepstream/lib/libnvds_msgconv.so",
+                      "dstest4_msgconv_config.txt", payload_type=0)
+    events = EventArray([("device_test", {"straight": (1, 12)})])
+    sizes = msgconv.generate_multiple(events)
+    msgconv.close()
+
+request_reload() makes the contexts of a running nvmsgconv plugin reload
+their config file.
+
+python3 -m common.msgconv_ctypes [libnvds_msgconv.so] checks the payloads
+of nvds_msg2p_generate_multiple for synthetic events on the CPU.
+"""
+
+import ctypes
+import os
+import sys
+import time
+
+NVDS_EVENT_ENTRY = 0
+NVDS_PAYLOAD_DEEPSTREAM = 0
+# NVDS_PAYLOAD_DEEPSTREAM_BINARY of nvmsgconv.h, the custom payload slot
+NVDS_PAYLOAD_DEEPSTREAM_BINARY = 0x101
+NVDS_OBJECT_TYPE_UNKNOWN = 0x102
+MAX_TIME_STAMP_LEN = 32
+NVDS_LC_LABEL_LEN = 32
+# library nvmsgconv loads unless its msg2p-lib property is set
+DEFAULT_MSG2P_LIB = "/opt/nvidia/deepstream/deepstream/lib/libnvds_msgconv.so"
+
+
+class NvDsRect(ctypes.Structure):
+    _fields_ = [("top", ctypes.c_float), ("left", ctypes.c_float),
+                ("width", ctypes.c_float), ("height", ctypes.c_float)]
+
+
+class NvDsGeoLocation(ctypes.Structure):
+    _fields_ = [("lat", ctypes.c_double), ("lon", ctypes.c_double),
+                ("alt", ctypes.c_double)]
+
+
+class NvDsCoordinate(ctypes.Structure):
+    _fields_ = [("x", ctypes.c_double), ("y", ctypes.c_double),
+                ("z", ctypes.c_double)]
+
+
+class NvDsObjectSignature(ctypes.Structure):
+    _fields_ = [("signature", ctypes.POINTER(ctypes.c_double)),
+                ("size", ctypes.c_uint)]
+
+
+class NvDsLineCrossingCount(ctypes.Structure):
+    _fields_ = [("label", ctypes.c_char * NVDS_LC_LABEL_LEN),
+                ("current", ctypes.c_uint),
+                ("cumulative", ctypes.c_uint)]
+
+
+class NvDsLineCrossingObject(ctypes.Structure):
+    _fields_ = [("trackingId", ctypes.c_uint64),
+                ("bbox", NvDsRect),
+                ("classId", ctypes.c_int),
+                ("lcIndex", ctypes.c_uint)]
+
+
+class NvDsEventTrace(ctypes.Structure):
+    _fields_ = [("captureTs", ctypes.c_uint64),
+                ("bufPts", ctypes.c_uint64),
+                ("probeTs", ctypes.c_uint64),
+                ("serializeTs", ctypes.c_uint64),
+                ("flags", ctypes.c_uint)]
+
+
+class NvDsEventMsgMeta(ctypes.Structure):
+    _fields_ = [("type", ctypes.c_int),
+                ("objType", ctypes.c_int),
+                ("bbox", NvDsRect),
+                ("location", NvDsGeoLocation),
+                ("coordinate", NvDsCoordinate),
+                ("objSignature", NvDsObjectSignature),
+                ("objClassId", ctypes.c_int),
+                ("sensorId", ctypes.c_int),
+                ("moduleId", ctypes.c_int),
+                ("placeId", ctypes.c_int),
+                ("componentId", ctypes.c_int),
+                ("frameId", ctypes.c_int),
+                ("confidence", ctypes.c_double),
+                ("trackingId", ctypes.c_uint64),
+                ("ts", ctypes.c_char_p),
+                ("objectId", ctypes.c_char_p),
+                ("sensorStr", ctypes.c_char_p),
+                ("otherAttrs", ctypes.c_char_p),
+                ("videoPath", ctypes.c_char_p),
+                ("extMsg", ctypes.c_void_p),
+                ("extMsgSize", ctypes.c_uint),
+                ("lc_curr_straight", ctypes.c_uint),
+                ("lc_cum_straight", ctypes.c_uint),
+                ("lcCounts", ctypes.POINTER(NvDsLineCrossingCount)),
+                ("numLcCounts", ctypes.c_uint),
+                ("lcObjects", ctypes.POINTER(NvDsLineCrossingObject)),
+                ("numLcObjects", ctypes.c_uint),
+                ("trace", NvDsEventTrace)]
+
+
+class NvDsEvent(ctypes.Structure):
+    _fields_ = [("eventType", ctypes.c_int),
+                ("metadata", ctypes.POINTER(NvDsEventMsgMeta))]
+
+
+class NvDsPayload(ctypes.Structure):
+    _fields_ = [("payload", ctypes.c_void_p),
+                ("payloadSize", ctypes.c_uint),
+                ("componentId", ctypes.c_uint)]
+
+
+class NvDsMsg2pCtx(ctypes.Structure):
+    _fields_ = [("payloadType", ctypes.c_int),
+                ("privData", ctypes.c_void_p)]
+
+
+def request_reload(lib_path=DEFAULT_MSG2P_LIB):
+    """Makes every msgconv context of the process, e.g. the one of the
+    nvmsgconv plugin, reload its config file before its next payload.
+
+    Raises AttributeError for a library without nvds_msg2p_request_reload.
+    """
+    # the same path gives the handle the plugin already loaded
+    lib = ctypes.CDLL(lib_path)
+    lib.nvds_msg2p_request_reload.restype = None
+    lib.nvds_msg2p_request_reload()
+
+
+class EventArray:
+    """An NvDsEvent array of (sensor id, {label: (current, cumulative)})
+    events.
+
+    Keeps the metas, strings and counts alive as long as the array is used.
+    """
+
+    def __init__(self, events):
+        self._strings = []
+        self.metas = (NvDsEventMsgMeta * len(events))()
+        self.events = (NvDsEvent * len(events))()
+        ts = time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime()).encode()
+        for i, (sensor_id, counts) in enumerate(events):
+            meta = self.metas[i]
+            meta.type = NVDS_EVENT_ENTRY
+            meta.objType = NVDS_OBJECT_TYPE_UNKNOWN
+            meta.frameId = i
+            meta.ts = self._keep(ts)
+            meta.sensorStr = self._keep(sensor_id.encode("utf-8"))
+            lc_counts = (NvDsLineCrossingCount * len(counts))()
+            for j, (label, (curr, cum)) in enumerate(counts.items()):
+                lc_counts[j].label = label.encode("utf-8")[:NVDS_LC_LABEL_LEN - 1]
+                lc_counts[j].current = curr
+                lc_counts[j].cumulative = cum
+            meta.lcCounts = self._keep(lc_counts)
+            meta.numLcCounts = len(counts)
+            self.events[i].eventType = NVDS_EVENT_ENTRY
+            self.events[i].metadata = ctypes.pointer(meta)
+
+    def _keep(self, value):
+        self._strings.append(value)
+        return value
+
+    def __len__(self):
+        return len(self.events)
+
+
+class Msgconv:
+    def __init__(self, lib_path, config_file, payload_type=0):
+        self.lib = lib = ctypes.CDLL(lib_path)
+        lib.nvds_msg2p_ctx_create.restype = ctypes.POINTER(NvDsMsg2pCtx)
+        lib.nvds_msg2p_ctx_create.argtypes = [ctypes.c_char_p, ctypes.c_int]
+        lib.nvds_msg2p_ctx_destroy.argtypes = [ctypes.POINTER(NvDsMsg2pCtx)]
+        lib.nvds_msg2p_generate.restype = ctypes.POINTER(NvDsPayload)
+        lib.nvds_msg2p_generate.argtypes = [ctypes.POINTER(NvDsMsg2pCtx),
+                                            ctypes.POINTER(NvDsEvent),
+                                            ctypes.c_uint]
+        lib.nvds_msg2p_generate_multiple.restype = \
+            ctypes.POINTER(ctypes.POINTER(NvDsPayload))
+        lib.nvds_msg2p_generate_multiple.argtypes = [
+            ctypes.POINTER(NvDsMsg2pCtx), ctypes.POINTER(NvDsEvent),
+            ctypes.c_uint, ctypes.POINTER(ctypes.c_uint)]
+        lib.nvds_msg2p_release.argtypes = [ctypes.POINTER(NvDsMsg2pCtx),
+                                           ctypes.POINTER(NvDsPayload)]
+        lib.nvds_msg2p_ctx_reload.restype = ctypes.c_int
+        lib.nvds_msg2p_ctx_reload.argtypes = [ctypes.POINTER(NvDsMsg2pCtx),
+                                              ctypes.c_char_p]
+        self.glib = glib = ctypes.CDLL("libglib-2.0.so.0")
+        glib.g_free.argtypes = [ctypes.c_void_p]
+
+        self.ctx = lib.nvds_msg2p_ctx_create(config_file.encode("utf-8"),
+                                             payload_type)
+        if not self.ctx:
+            raise RuntimeError("nvds_msg2p_ctx_create failed for {0}".format(
+                config_file))
+
+    def generate(self, events, i=0):
+        """Generates and releases the payload of events[i]; returns its
+        size in bytes."""
+        payload = self.lib.nvds_msg2p_generate(
+            self.ctx, ctypes.byref(events.events[i]), 1)
+        if not payload:
+            return 0
+        size = payload.contents.payloadSize
+        self.lib.nvds_msg2p_release(self.ctx, payload)
+        return size
+
+    def generate_multiple(self, events, copy=False):
+        """Generates and releases the payloads of all events in one call;
+        returns their sizes, or their bytes if copy is set."""
+        count = ctypes.c_uint(0)
+        payloads = self.lib.nvds_msg2p_generate_multiple(
+            self.ctx, events.events, len(events), ctypes.byref(count))
+        if not payloads:
+            return []
+        results = []
+        for i in range(count.value):
+            payload = payloads[i].contents
+            if not copy:
+                results.append(payload.payloadSize)
+            elif payload.payload:
+                results.append(ctypes.string_at(payload.payload,
+                                                payload.payloadSize))
+            else:
+                results.append(b"")
+            self.lib.nvds_msg2p_release(self.ctx, payloads[i])
+        self.glib.g_free(ctypes.cast(payloads, ctypes.c_void_p))
+        return results
+
+    def reload(self, config_file=None):
+        """Swaps in config_file, by default the current one re-read;
+        returns False if it could not be parsed."""
+        return bool(self.lib.nvds_msg2p_ctx_reload(
+            self.ctx, config_file.encode("utf-8") if config_file else None))
+
+    def close(self):
+        if self.ctx:
+            self.lib.nvds_msg2p_ctx_destroy(self.ctx)
+            self.ctx = None
+
+
+def _write_config(directory, name, batch_mode=None):
+    # two sensors and the analytics group the events refer to (moduleId 0)
+    if name.endswith(".yml"):
+        text = "".join("sensor{0}:\n  enable: 1\n  type: Camera\n"
+                       "  id: cam-{0}\n".format(i) for i in range(2))
+        text += ("analytics0:\n  enable: 1\n  id: XYZ\n"
+                 "  description: Line crossing\n  source: nvdsanalytics\n"
+                 "  version: 1.0\n")
+        if batch_mode is not None:
+            text += "message:\n  batch-mode: {0}\n".format(batch_mode)
+    else:
+        text = "".join("[sensor{0}]\nenable=1\ntype=Camera\nid=cam-{0}\n\n"
+                       .format(i) for i in range(2))
+        text += ("[analytics0]\nenable=1\nid=XYZ\n"
+                 "description=Line crossing\nsource=nvdsanalytics\n"
+                 "version=1.0\n\n")
+        if batch_mode is not None:
+            text += "[message]\nbatch-mode={0}\n".format(batch_mode)
+    path = os.path.join(directory, name)
+    with open(path, "w") as f:
+        f.write(text)
+    return path
+
+
+def _check_msgconv(lib_path):
+    import json
+    import shutil
+    import tempfile
+    from common.binary_payload import decode_event_message
+
+    try:
+        ctypes.CDLL(lib_path)
+    except OSError as e:
+        print("msgconv checks skipped, cannot load {0}: {1}".format(
+            lib_path, e))
+        return
+    counts = [("cam-{0}".format(i % 2), {"entry": (i, 10 + i), "exit": (1, i)})
+              for i in range(5)]
+    events = EventArray(counts)
+    empty = EventArray([])
+
+    def check_json(message, i):
+        module = message["analyticsModule"]
+        assert message["deviceId"] == counts[i][0], message
+        assert module["id"] == "XYZ", message
+        assert module["lc_curr_entry"] == i and \
+            module["lc_cum_entry"] == 10 + i, message
+        assert module["lc_curr_exit"] == 1 and module["lc_cum_exit"] == i
+
+    def check_binary(event, i):
+        assert event["deviceId"] == counts[i][0], event
+        assert event["moduleId"] == "XYZ", event
+        assert event["lineCrossings"] == counts[i][1], event
+
+    directory = tempfile.mkdtemp(prefix="ds-msgconv-")
+    try:
+        for name in ("msgconv.txt", "msgconv.yml"):
+            per_event = _write_config(directory, "per_event_" + name)
+            array = _write_config(directory, "array_" + name, 1)
+
+            # default batch mode: one payload per event, in event order
+            msgconv = Msgconv(lib_path, per_event, NVDS_PAYLOAD_DEEPSTREAM)
+            payloads = msgconv.generate_multiple(events, copy=True)
+            assert len(payloads) == len(counts), payloads
+            for i, payload in enumerate(payloads):
+                check_json(json.loads(payload.decode("utf-8")), i)
+            assert msgconv.generate_multiple(empty, copy=True) == []
+            msgconv.close()
+
+            # batch-mode=1: one payload holding a JSON array
+            msgconv = Msgconv(lib_path, array, NVDS_PAYLOAD_DEEPSTREAM)
+            payloads = msgconv.generate_multiple(events, copy=True)
+            assert len(payloads) == 1, payloads
+            messages = json.loads(payloads[0].decode("utf-8"))
+            assert len(messages) == len(counts), messages
+            for i, message in enumerate(messages):
+                check_json(message, i)
+            assert msgconv.generate_multiple(empty, copy=True) == [b"[]"]
+            msgconv.close()
+
+            # binary schema, per event and as one MessagePack array
+            msgconv = Msgconv(lib_path, per_event,
+                              NVDS_PAYLOAD_DEEPSTREAM_BINARY)
+            payloads = msgconv.generate_multiple(events, copy=True)
+            assert len(payloads) == len(counts), payloads
+            for i, payload in enumerate(payloads):
+                check_binary(decode_event_message(payload), i)
+            assert msgconv.generate_multiple(empty, copy=True) == []
+            msgconv.close()
+            msgconv = Msgconv(lib_path, array, NVDS_PAYLOAD_DEEPSTREAM_BINARY)
+            payloads = msgconv.generate_multiple(events, copy=True)
+            assert len(payloads) == 1, payloads
+            decoded = decode_event_message(payloads[0])
+            assert len(decoded) == len(counts), decoded
+            for i, event in enumerate(decoded):
+                check_binary(event, i)
+            assert decode_event_message(
+                msgconv.generate_multiple(empty, copy=True)[0]) == []
+            msgconv.close()
+
+            # batch-mode is 0 or 1
+            try:
+                Msgconv(lib_path, _write_config(directory, "bad_" + name, 2))
+            except RuntimeError:
+                pass
+            else:
+                raise AssertionError("batch-mode=2 accepted in " + name)
+        print("msgconv checks passed")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    _check_msgconv(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_MSG2P_LIB)
@@ -0,0 +1,306 @@
+################################################################################
+# SPDX-FileCopyrightText: Copyright (c) 2019-2021 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+################################################################################
+
+"""Retunes nvstreammux batch-size and batched-push-timeout while running.
+
+nvstreammux pushes a batch once it holds batch-size frames or
+batched-push-timeout after the batch was started. A batch-size above the
+number of sources that deliver frames makes every batch wait for the
+timeout; a timeout below the frame interval of a source splits its frames
+off into extra, partly filled batches. MuxTuner measures the frame rate of
+every source and the fill ratio of the batches from the batches leaving
+streammux and picks:
+
+    batch-size            number of sources whose frame interval, times
+                          a margin, fits into max_timeout (at least 1)
+    batched-push-timeout  that margin times the longest frame interval of
+                          those sources, within [min_timeout, max_timeout]
+
+Slower sources still get their frames into the batches, they just do not
+hold them up. The margin grows when batches stay partly filled (frame
+jitter) and shrinks back when they are full.
+
+    tuner = MuxTuner(num_sources, max_timeout=0.1)
+    # streammux src pad probe
+    tuner.observe(time.monotonic(), pad_indices)
+    # every few seconds on the main loop
+    for name, value in tuner.retune(time.monotonic()).items():
+        streammux.set_property(name, value)
+
+simulate() runs the tuner against a model of nvstreammux fed by synthetic
+sources, so the tuning can be checked and compared without a GPU:
+python3 -m common.mux_tuner.
+"""
+
+import collections
+import threading
+
+import numpy as np
+
+# margin on the frame interval of the timeout, and how far the fill
+# feedback may move it
+MARGIN = 1.5
+MAX_MARGIN = 4.0
+# batches filled less than this raise the margin, fuller ones lower it
+FILL_TARGET = 0.9
+# timeout changes below this fraction are not applied
+HYSTERESIS = 0.2
+# sources below this frame rate count as offline
+MIN_FPS = 0.5
+
+
+def batch_pad_indices(pyds, batch_meta):
+    """Returns the pad_index of every frame of batch_meta."""
+    pad_indices = []
+    l_frame = batch_meta.frame_meta_list
+    while l_frame is not None:
+        pad_indices.append(pyds.NvDsFrameMeta.cast(l_frame.data).pad_index)
+        l_frame = l_frame.next
+    return pad_indices
+
+
+class MuxTuner:
+    def __init__(self, num_sources, max_batch_size=None, min_timeout=0.004,
+                 max_timeout=0.1, timeout=0.04, margin=MARGIN):
+        # seconds; max_timeout bounds the time a frame waits in streammux
+        self.num_sources = num_sources
+        self.max_batch_size = max_batch_size or num_sources
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.batch_size = self.max_batch_size
+        # False keeps batch_size, e.g. if streammux cannot change it
+        self.tune_batch_size = True
+        self.timeout = min(max(timeout, min_timeout), max_timeout)
+        self.margin = margin
+        self.base_margin = margin
+        self.rates = None
+        self.fill = None
+        self._counts = np.zeros(num_sources, dtype=np.int64)
+        self._frames = 0
+        self._batches = 0
+        self._since = None
+        self._lock = threading.Lock()
+
+    def observe(self, now, pad_indices):
+        """Counts one batch leaving streammux (streaming thread)."""
+        with self._lock:
+            if self._since is None:
+                self._since = now
+            for pad_index in pad_indices:
+                if pad_index < self.num_sources:
+                    self._counts[pad_index] += 1
+            self._frames += len(pad_indices)
+            self._batches += 1
+
+    def properties(self):
+        return {"batch-size": self.batch_size,
+                "batched-push-timeout": int(round(self.timeout * 1e6))}
+
+    def retune(self, now):
+        """Updates the settings from the batches observed since the last
+        call; returns the streammux properties that changed."""
+        with self._lock:
+            counts = self._counts.copy()
+            frames, batches = self._frames, self._batches
+            self._counts[:] = 0
+            self._frames = self._batches = 0
+            since, self._since = self._since, now
+        if since is None or now <= since or not batches:
+            return {}
+        rates = counts / (now - since)
+        self.rates = rates if self.rates is None else \
+            0.5 * rates + 0.5 * self.rates
+        self.fill = frames / float(batches * self.batch_size)
+        if self.fill < FILL_TARGET:
+            self.margin = min(self.margin * 1.25, MAX_MARGIN)
+        elif self.fill > 0.98:
+            self.margin = max(self.margin / 1.1, self.base_margin)
+
+        # offline is decided on the last interval alone, so a source that
+        # stops leaves the batch at once
+        live = (rates >= MIN_FPS) & (self.rates >= MIN_FPS)
+        intervals = self.margin / self.rates[live]
+        fitting = intervals[intervals <= self.max_timeout]
+        batch_size = int(min(max(len(fitting), 1), self.max_batch_size))
+        if len(fitting):
+            timeout = fitting.max()
+        else:
+            timeout = self.max_timeout
+        timeout = min(max(timeout, self.min_timeout), self.max_timeout)
+
+        old = self.properties()
+        if self.tune_batch_size:
+            self.batch_size = batch_size
+        if abs(timeout - self.timeout) > HYSTERESIS * self.timeout:
+            self.timeout = timeout
+        return dict((name, value) for name, value in
+                    self.properties().items() if old[name] != value)
+
+
+class _SimMux:
+    # nvstreammux as far as batching goes: an arriving frame joins the
+    # batch unless its source is in it already, a new batch takes the
+    # queued frames round-robin, several of a source that fell behind;
+    # pushed when full or timeout after its first frame
+    def __init__(self, num_sources, batch_size, timeout, tuner=None):
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.tuner = tuner
+        self.queues = [collections.deque() for _ in range(num_sources)]
+        # (source, arrival time) of the frames of the batch
+        self.batch = []
+        self.start = None
+        self.latencies = []
+        self.fills = []
+
+    def push(self, now):
+        while self.batch:
+            self.latencies.extend(now - t for _, t in self.batch)
+            self.fills.append(len(self.batch) / float(self.batch_size))
+            if self.tuner is not None:
+                self.tuner.observe(now, [source for source, _ in self.batch])
+            self.batch = []
+            while len(self.batch) < self.batch_size and any(self.queues):
+                for source, queue in enumerate(self.queues):
+                    if queue and len(self.batch) < self.batch_size:
+                        self.batch.append((source, queue.popleft()))
+            self.start = now if self.batch else None
+            if len(self.batch) < self.batch_size:
+                break
+
+    def advance(self, now):
+        while self.batch and self.start + self.timeout <= now:
+            self.push(self.start + self.timeout)
+
+    def arrive(self, now, source):
+        if (self.queues[source] or len(self.batch) >= self.batch_size or
+                any(s == source for s, _ in self.batch)):
+            self.queues[source].append(now)
+            return
+        self.batch.append((source, now))
+        if self.start is None:
+            self.start = now
+        if len(self.batch) >= self.batch_size:
+            self.push(now)
+
+
+def synthetic_arrivals(rates, duration, offline=(), jitter=0.3, seed=0):
+    """Returns sorted (time, source) frame arrivals of sources delivering
+    rates[i] frames per second, each frame off its clock by up to
+    +-jitter/2 of the interval; offline lists (source, start, end)
+    outages."""
+    rng = np.random.default_rng(seed)
+    arrivals = []
+    for source, rate in enumerate(rates):
+        phase = rng.random()
+        for k in range(int(duration * rate)):
+            t = (k + phase + jitter * (rng.random() - 0.5)) / rate
+            if not any(s == source and start <= t < end
+                       for s, start, end in offline):
+                arrivals.append((t, source))
+    arrivals.sort()
+    return arrivals
+
+
+def simulate(arrivals, num_sources, duration, batch_size, timeout,
+             tuner=None, period=1.0):
+    """Feeds arrivals through the streammux model, retuned by tuner every
+    period seconds if given. Returns per frame latencies (s), batch fill
+    ratios and the (time, properties) of every retune that changed
+    something."""
+    mux = _SimMux(num_sources, batch_size, timeout, tuner)
+    changes = []
+    next_tune = period
+    for now, source in arrivals + [(duration, None)]:
+        while tuner is not None and next_tune <= now:
+            mux.advance(next_tune)
+            changed = tuner.retune(next_tune)
+            if changed:
+                mux.batch_size = tuner.batch_size
+                mux.timeout = tuner.timeout
+                changes.append((next_tune, changed))
+            next_tune += period
+        mux.advance(now)
+        if source is None:
+            break
+        mux.arrive(now, source)
+    return np.array(mux.latencies), np.array(mux.fills), changes
+
+
+def _summary(latencies, fills):
+    return {"mean_latency_ms": 1000.0 * latencies.mean(),
+            "p99_latency_ms": 1000.0 * np.percentile(latencies, 99),
+            "fill": fills.mean(), "batches": len(fills)}
+
+
+def _check_mux_tuner():
+    import time
+    from common.fake_pyds import FakePyds, make_batch
+
+    pyds = FakePyds()
+    batch_meta = make_batch([{"pad_index": 2}, {"pad_index": 0}])
+    assert batch_pad_indices(pyds, batch_meta) == [2, 0]
+
+    duration = 60.0
+    max_timeout = 0.1
+    scenarios = [
+        # 8 cameras at 30 fps, half of them offline from 20 s to 40 s
+        ("8x30fps, 4 offline", [30.0] * 8,
+         [(s, 20.0, 40.0) for s in range(4, 8)]),
+        # 4 cameras at 30 fps and 4 at 5 fps
+        ("4x30fps + 4x5fps", [30.0] * 4 + [5.0] * 4, []),
+        # 6 cameras at 25 fps
+        ("6x25fps", [25.0] * 6, []),
+    ]
+    for name, rates, offline in scenarios:
+        arrivals = synthetic_arrivals(rates, duration, offline)
+        # the usual fixed setting: one batch per frame interval of the
+        # fastest camera
+        timeout = 1.0 / max(rates)
+        fixed = _summary(*simulate(arrivals, len(rates), duration,
+                                   len(rates), timeout)[:2])
+        tuner = MuxTuner(len(rates), max_timeout=max_timeout, timeout=timeout)
+        start = time.perf_counter()
+        latencies, fills, changes = simulate(arrivals, len(rates), duration,
+                                             len(rates), timeout, tuner)
+        elapsed = time.perf_counter() - start
+        tuned = _summary(latencies, fills)
+        print("{0}: fixed batch-size {1} / {2:.0f} ms: {3:.1f} ms mean, "
+              "{4:.1f} ms p99, fill {5:.2f}, {6} batches".format(
+                  name, len(rates), timeout * 1000, fixed["mean_latency_ms"],
+                  fixed["p99_latency_ms"], fixed["fill"], fixed["batches"]))
+        print("    tuned: {0:.1f} ms mean, {1:.1f} ms p99, fill {2:.2f}, {3} "
+              "batches, {4} retunes, last {5} ({6:.0f} frames/s "
+              "simulated)".format(
+                  tuned["mean_latency_ms"], tuned["p99_latency_ms"],
+                  tuned["fill"], tuned["batches"], len(changes),
+                  tuner.properties(), len(arrivals) / elapsed))
+        assert tuned["fill"] >= fixed["fill"] - 0.02
+        assert tuned["mean_latency_ms"] <= fixed["mean_latency_ms"] + 1.0
+        assert tuner.timeout <= max_timeout
+    # the first scenario ends with all 8 cameras back in the batch
+    arrivals = synthetic_arrivals(scenarios[0][1], duration, scenarios[0][2])
+    tuner = MuxTuner(8, max_timeout=max_timeout)
+    changes = simulate(arrivals, 8, duration, 8, 0.04, tuner)[2]
+    sizes = [props["batch-size"] for t, props in changes
+             if "batch-size" in props]
+    assert 4 in sizes and tuner.batch_size == 8, changes
+    print("mux tuner checks passed")
+
+
+if __name__ == "__main__":
+    _check_mux_tuner()
@@ -0,0 +1,414 @@
+################################################################################
+# SPDX-FileCopyrightText: Copyright (c) 2019-2021 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+################################################################################
+
+"""Batching message producer for the --sink python mode of run.py.
+
+BatchingProducer collects messages per (topic, partition) and hands a
+batch to its transport once it holds batch_size bytes or its oldest
+message is linger seconds old. At most max_in_flight batches are being
+sent at a time and at most one per (topic, partition), so the messages of
+a partition arrive in the order they were sent; send() never blocks the
+caller, messages beyond buffer_messages are dropped and counted instead.
+
+Transports:
+
+    KafkaTransport   kafka-python producer, only imported when used
+    LocalBroker      in-process stand-in that records the batches
+
+    broker = LocalBroker(partitions=4, compression="gzip")
+    producer = BatchingProducer(broker, linger=0.01).start()
+    producer.send("ds-kafka", b"device_test", payload)
+    producer.close()
+    broker.batches  # [RecordBatch(...), ...]
+"""
+
+import collections
+import gzip
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+COMPRESSIONS = (None, "gzip", "zlib")
+
+
+def default_partitioner(key, partitions):
+    if key is None:
+        return 0
+    return zlib.crc32(key) % partitions
+
+
+def compress(data, compression):
+    if compression is None:
+        return data
+    if compression == "gzip":
+        return gzip.compress(data)
+    if compression == "zlib":
+        return zlib.compress(data)
+    raise ValueError("unsupported compression {0!r}".format(compression))
+
+
+RecordBatch = collections.namedtuple(
+    "RecordBatch", ["topic", "partition", "records", "size", "wire_size"])
+
+
+class LocalBroker:
+    """Records every batch it receives; latency simulates the broker
+    round trip of a send and setting down makes sends fail."""
+
+    def __init__(self, partitions=1, compression=None, latency=0.0):
+        if compression not in COMPRESSIONS:
+            raise ValueError("unsupported compression {0!r}".format(compression))
+        self.num_partitions = partitions
+        self.compression = compression
+        self.latency = latency
+        self.down = False
+        self.batches = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def partitions(self, topic):
+        return self.num_partitions
+
+    def send_batch(self, topic, partition, records):
+        if self.down:
+            raise ConnectionError("local broker is down")
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            size = sum(len(value) for _, value in records)
+            wire = compress(b"".join(value for _, value in records),
+                            self.compression)
+            if self.latency:
+                time.sleep(self.latency)
+            with self._lock:
+                self.batches.append(RecordBatch(topic, partition,
+                                                list(records), size,
+                                                len(wire)))
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def messages(self, topic=None):
+        with self._lock:
+            return [record for batch in self.batches
+                    if topic is None or batch.topic == topic
+                    for record in batch.records]
+
+    def close(self):
+        pass
+
+
+class KafkaTransport:
+    """Sends the batches with kafka-python (pip install kafka-python)."""
+
+    def __init__(self, bootstrap_servers, compression=None, **config):
+        from kafka import KafkaProducer
+
+        # the batches are already formed, send them right away
+        self.producer = KafkaProducer(bootstrap_servers=bootstrap_servers,
+                                      compression_type=compression,
+                                      linger_ms=0, **config)
+
+    def partitions(self, topic):
+        partitions = self.producer.partitions_for(topic)
+        return len(partitions) if partitions else 1
+
+    def send_batch(self, topic, partition, records):
+        futures = [self.producer.send(topic, key=key, value=value,
+                                      partition=partition)
+                   for key, value in records]
+        self.producer.flush()
+        for future in futures:
+            future.get()
+
+    def close(self):
+        self.producer.close()
+
+
+def parse_conn_str(conn_str):
+    """Splits an nvmsgbroker "host;port[;topic]" connection string into
+    ("host:port", topic or None)."""
+    parts = conn_str.split(";")
+    if len(parts) < 2:
+        raise ValueError("connection string must be host;port[;topic]")
+    topic = parts[2] if len(parts) > 2 and parts[2] else None
+    return "{0}:{1}".format(parts[0], parts[1]), topic
+
+
+class _Accumulator:
+    def __init__(self, created):
+        self.records = []
+        # traces of the records sent with one, see send()
+        self.traces = []
+        self.size = 0
+        self.created = created
+
+
+class BatchingProducer:
+    def __init__(self, transport, linger=0.005, batch_size=16384,
+                 max_in_flight=5, buffer_messages=100000, retries=2,
+                 retry_backoff=0.1, partitioner=default_partitioner,
+                 on_error=None, on_sent=None, divert=None):
+        """on_error(topic, partition, records) receives the batches that
+        failed after all retries instead of dropping them, on_sent(topic,
+        partition, traces, handoff_ts) the traces of the messages of each
+        batch the transport took, with its time in ns since the epoch.
+        Batches for which divert(topic, partition) is true go to on_error
+        without being sent."""
+        self.transport = transport
+        self.linger = linger
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.buffer_messages = buffer_messages
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.partitioner = partitioner
+        self.on_error = on_error
+        self.on_sent = on_sent
+        self.divert = divert
+        self._batches = {}
+        # batches that reached batch_size, sealed so new messages of the
+        # partition start a new batch
+        self._full = collections.deque()
+        # (topic, partition) of the batches being sent, their next batch
+        # waits for them
+        self._sending = set()
+        self._buffered = 0
+        self._partitions = {}
+        self._cond = threading.Condition()
+        self._closed = False
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self._executor = ThreadPoolExecutor(max_in_flight,
+                                            thread_name_prefix="producer-send")
+        self._sender = threading.Thread(target=self._run, name="producer",
+                                        daemon=True)
+        self.stats = {"messages": 0, "batches": 0, "bytes": 0,
+                      "dropped": 0, "errors": 0, "retries": 0,
+                      "diverted": 0}
+
+    def start(self):
+        self._sender.start()
+        return self
+
+    @property
+    def pending(self):
+        """Messages queued or being sent."""
+        return self._buffered
+
+    def partition(self, topic, key):
+        partitions = self._partitions.get(topic)
+        if partitions is None:
+            partitions = self._partitions[topic] = \
+                self.transport.partitions(topic)
+        return self.partitioner(key, partitions)
+
+    def send(self, topic, key, value, trace=None):
+        """Queues one message; returns False if it was dropped. trace is
+        handed to on_sent once the message was sent."""
+        partition = self.partition(topic, key)
+        with self._cond:
+            if self._closed or self._buffered >= self.buffer_messages:
+                self.stats["dropped"] += 1
+                return False
+            batch = self._batches.get((topic, partition))
+            if batch is None:
+                batch = self._batches[(topic, partition)] = \
+                    _Accumulator(time.monotonic())
+            batch.records.append((key, value))
+            if trace is not None:
+                batch.traces.append(trace)
+            batch.size += len(value)
+            self._buffered += 1
+            if batch.size >= self.batch_size:
+                self._full.append(((topic, partition),
+                                   self._batches.pop((topic, partition))))
+                self._cond.notify()
+        return True
+
+    def _ready(self, now, flush):
+        # pops the batches that are full, lingered long enough, or all of
+        # them when flushing, the oldest one of each partition without a
+        # batch in flight; called with _cond held
+        ready = []
+        taken = set(self._sending)
+        held = collections.deque()
+        for key, batch in self._full:
+            if key in taken:
+                held.append((key, batch))
+            else:
+                ready.append((key, batch))
+                taken.add(key)
+        self._full = held
+        for key, batch in list(self._batches.items()):
+            if key not in taken and (flush or
+                                     now - batch.created >= self.linger):
+                ready.append((key, self._batches.pop(key)))
+                taken.add(key)
+        self._sending.update(key for key, _ in ready)
+        return ready
+
+    def _full_ready(self):
+        return any(key not in self._sending for key, _ in self._full)
+
+    def _send(self, topic, partition, batch):
+        try:
+            if self.on_error is not None and self.divert is not None and \
+                    self.divert(topic, partition):
+                with self._cond:
+                    self.stats["diverted"] += 1
+                self.on_error(topic, partition, batch.records)
+                return
+            for attempt in range(self.retries + 1):
+                try:
+                    self.transport.send_batch(topic, partition, batch.records)
+                    break
+                except Exception as e:
+                    if attempt == self.retries:
+                        with self._cond:
+                            self.stats["errors"] += 1
+                        if self.on_error is not None:
+                            self.on_error(topic, partition, batch.records)
+                        else:
+                            print("Producer: dropping batch of {0} messages "
+                                  "to {1}[{2}]: {3}".format(
+                                      len(batch.records), topic, partition, e))
+                        return
+                    with self._cond:
+                        self.stats["retries"] += 1
+                    time.sleep(self.retry_backoff * (attempt + 1))
+            if batch.traces and self.on_sent is not None:
+                self.on_sent(topic, partition, batch.traces, time.time_ns())
+            with self._cond:
+                self.stats["messages"] += len(batch.records)
+                self.stats["batches"] += 1
+                self.stats["bytes"] += batch.size
+        finally:
+            with self._cond:
+                self._buffered -= len(batch.records)
+                self._sending.discard((topic, partition))
+                self._cond.notify()
+            self._in_flight.release()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closed and not self._full_ready():
+                    self._cond.wait(self.linger)
+                closed = self._closed
+                ready = self._ready(time.monotonic(), closed)
+                if closed and not ready:
+                    if not self._batches and not self._full:
+                        return
+                    # the rest waits for the batches in flight of its
+                    # partitions
+                    self._cond.wait()
+            for (topic, partition), batch in ready:
+                # bounds the batches being sent, the sender waits here
+                self._in_flight.acquire()
+                self._executor.submit(self._send, topic, partition, batch)
+
+    def flush(self, timeout=None):
+        """Waits until everything queued so far has been sent."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            for batch in self._batches.values():
+                batch.created = float("-inf")
+            self._cond.notify()
+        while True:
+            with self._cond:
+                if not self._buffered:
+                    return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(self.linger / 2 or 0.001)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._sender.is_alive():
+            self._sender.join()
+        self._executor.shutdown(wait=True)
+        self.transport.close()
+
+
+def _check_producer():
+    import random
+
+    from common.binary_payload import (new_event, encode_event_message,
+                                       decode_event_message)
+
+    broker = LocalBroker(partitions=2, compression="gzip", latency=0.002)
+    producer = BatchingProducer(broker, linger=0.01, batch_size=4096,
+                                max_in_flight=2).start()
+    events = [new_event("device_{0}".format(n % 4), "XYZ",
+                        {"straight": (1, n)}) for n in range(2000)]
+    start = time.perf_counter()
+    for event in events:
+        producer.send("ds-kafka", event["deviceId"].encode(),
+                      encode_event_message(event))
+    send_seconds = time.perf_counter() - start
+    assert producer.flush(timeout=10)
+    producer.close()
+
+    received = [decode_event_message(value)
+                for _, value in broker.messages("ds-kafka")]
+    assert sorted(e["messageid"] for e in received) == \
+        sorted(e["messageid"] for e in events)
+    # one device always lands in the same partition
+    partitions = set((key, batch.partition) for batch in broker.batches
+                     for key, _ in batch.records)
+    assert len(partitions) == 4
+    assert broker.max_in_flight <= 2
+    size = sum(b.size for b in broker.batches)
+    wire = sum(b.wire_size for b in broker.batches)
+    print("{0} messages in {1} batches, {2} -> {3} bytes gzip, "
+          "{4:.1f} us/send".format(len(received), len(broker.batches),
+                                   size, wire,
+                                   send_seconds * 1e6 / len(events)))
+
+    # one batch in flight per partition keeps the order of each device,
+    # also when the round trips vary
+    class JitterBroker(LocalBroker):
+        def send_batch(self, topic, partition, records):
+            time.sleep(random.random() * 0.004)
+            LocalBroker.send_batch(self, topic, partition, records)
+
+    broker = JitterBroker(partitions=2)
+    producer = BatchingProducer(broker, linger=0.001, batch_size=64,
+                                max_in_flight=4).start()
+    for n in range(400):
+        producer.send("t", b"device_%d" % (n % 4), b"%08d" % n)
+    producer.close()
+    for device in range(4):
+        values = [value for key, value in broker.messages("t")
+                  if key == b"device_%d" % device]
+        assert values == sorted(values) and len(values) == 100
+
+    # buffer limit drops instead of blocking
+    producer = BatchingProducer(LocalBroker(latency=0.05), linger=1.0,
+                                max_in_flight=1, buffer_messages=10)
+    sent = sum(producer.send("t", None, b"x") for _ in range(20))
+    assert sent == 10 and producer.stats["dropped"] == 10
+    producer.start().close()
+
+
+if __name__ == "__main__":
+    _check_producer()
@@ -0,0 +1,255 @@
+################################################################################
+# SPDX-FileCopyrightText: Copyright (c) 2019-2021 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+################################################################################
+
+"""Hands per-frame counts from the probe to a worker thread.
+
+In ring mode the probe only copies the counts of the frames with a line
+crossing into a preallocated NumPy structured ring and returns; the
+EventWorker drains it, does the formatting, aggregation and event building
+off the streaming thread, and leaves the finished events in an outbox the
+probe attaches to the next batch:
+
+    ring = CountRing(4096, num_lc_labels=len(labels.lc))
+    worker = EventWorker(ring, build_events).start()
+    # probe
+    ring.push(batch, rows)
+    for event in worker.take_events():
+        ...
+
+The ring has one producer (the probe) and one consumer (the worker); each
+side only moves its own index, so no lock is taken. When the ring is full
+the newest rows are dropped and counted in dropped.
+"""
+
+import collections
+import threading
+import time
+
+import numpy as np
+
+
+def count_dtype(num_lc_labels):
+    return np.dtype([("pad_index", np.uint32),
+                     ("frame_num", np.int32),
+                     ("ts", np.float64),
+                     ("lc_curr", np.uint32, (num_lc_labels,)),
+                     ("lc_cum", np.uint32, (num_lc_labels,))])
+
+
+class CountRing:
+    def __init__(self, capacity, num_lc_labels):
+        self.capacity = capacity
+        self.records = np.zeros(capacity, dtype=count_dtype(num_lc_labels))
+        # total rows written / read; only the producer moves head and only
+        # the consumer moves tail
+        self.head = 0
+        self.tail = 0
+        self.pushed = 0
+        self.dropped = 0
+        self.high_water = 0
+
+    def __len__(self):
+        return self.head - self.tail
+
+    def push(self, batch, rows, ts=None):
+        """Copies rows (frame indices) of an AnalyticsBatch into the ring.
+
+        Returns the number of rows that did not fit and were dropped.
+        """
+        n = len(rows)
+        if not n:
+            return 0
+        free = self.capacity - (self.head - self.tail)
+        dropped = max(n - free, 0)
+        if dropped:
+            self.dropped += dropped
+            rows = rows[:free]
+            n = free
+            if not n:
+                return dropped
+        ts = time.monotonic() if ts is None else ts
+        # copy in at most two slices, the second one wraps around
+        first = self.head % self.capacity
+        split = min(n, self.capacity - first)
+        for dst, src in ((slice(first, first + split), rows[:split]),
+                         (slice(0, n - split), rows[split:])):
+            if not len(src):
+                continue
+            records = self.records[dst]
+            records["pad_index"] = batch.pad_index[src]
+            records["frame_num"] = batch.frame_num[src]
+            records["ts"] = ts
+            records["lc_curr"] = batch.lc_curr[src]
+            records["lc_cum"] = batch.lc_cum[src]
+        # publish the rows only after they are written
+        self.head += n
+        self.pushed += n
+        self.high_water = max(self.high_water, self.head - self.tail)
+        return dropped
+
+    def pop(self, max_rows=None):
+        """Returns a copy of the oldest rows and frees their slots."""
+        n = self.head - self.tail
+        if max_rows is not None:
+            n = min(n, max_rows)
+        if not n:
+            return self.records[:0].copy()
+        slots = (self.tail + np.arange(n)) % self.capacity
+        rows = self.records[slots]
+        self.tail += n
+        return rows
+
+    def stats(self):
+        return {"capacity": self.capacity, "pushed": self.pushed,
+                "dropped": self.dropped, "high_water": self.high_water,
+                "pending": len(self)}
+
+
+class EventWorker:
+    """Drains a CountRing on a daemon thread.
+
+    build_events(rows, now) turns the popped rows into events; they are
+    queued in an outbox of at most max_events until take_events(). Events
+    that do not fit are counted in outbox_dropped, events the caller could
+    not publish any more in unpublished.
+    """
+
+    def __init__(self, ring, build_events, max_events=1024, interval=0.005):
+        self.ring = ring
+        self.build_events = build_events
+        self.max_events = max_events
+        self.interval = interval
+        self.outbox = collections.deque()
+        self.outbox_dropped = 0
+        self.unpublished = 0
+        self.busy_seconds = 0.0
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="event-worker",
+                                       daemon=True)
+
+    def _drain(self):
+        rows = self.ring.pop()
+        start = time.perf_counter()
+        for event in self.build_events(rows, time.monotonic()):
+            if len(self.outbox) >= self.max_events:
+                self.outbox_dropped += 1
+            else:
+                self.outbox.append(event)
+        self.busy_seconds += time.perf_counter() - start
+
+    def _run(self):
+        # polls instead of waking on every push, so the probe does not
+        # take the lock of a threading.Event
+        while not self._stop.wait(self.interval):
+            self._drain()
+
+    def take_events(self):
+        """Returns the events built so far (called from the probe)."""
+        events = []
+        outbox = self.outbox
+        while outbox:
+            events.append(outbox.popleft())
+        return events
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stops the thread and builds the events of the rows still in the
+        ring; calling it again builds those pushed since."""
+        self._stop.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        self._drain()
+
+    def stats(self):
+        stats = self.ring.stats()
+        stats.update(outbox=len(self.outbox),
+                     outbox_dropped=self.outbox_dropped,
+                     unpublished=self.unpublished,
+                     worker_busy_seconds=round(self.busy_seconds, 3))
+        return stats
+
+
+def _check_ring():
+    import io
+    from contextlib import redirect_stdout
+    from common.analytics_batch import extract_analytics_batch
+    from common.analytics_config import AnalyticsLabels
+    from common.fake_pyds import FakePyds, make_batch
+
+    pyds = FakePyds()
+    labels = AnalyticsLabels(lc=["straight"])
+    batches = [extract_analytics_batch(pyds, make_batch([
+        {"pad_index": p, "frame_num": n,
+         "objLCCurrCnt": {"straight": (n + p) % 3},
+         "objLCCumCnt": {"straight": n}} for p in range(4)]), labels)
+        for n in range(500)]
+
+    ring = CountRing(8, num_lc_labels=1)
+    batch = batches[1]
+    assert ring.push(batch, np.arange(4)) == 0
+    assert ring.pop(3)["pad_index"].tolist() == [0, 1, 2]
+    assert ring.push(batch, np.arange(4)) == 0
+    assert ring.push(batch, np.arange(4)) == 1
+    rows = ring.pop()
+    assert rows["pad_index"].tolist() == [3, 0, 1, 2, 3, 0, 1, 2]
+    assert ring.stats()["dropped"] == 1 and len(ring) == 0
+
+    def build_events(rows, now):
+        return [(int(r["pad_index"]), int(r["lc_curr"][0])) for r in rows]
+
+    ring = CountRing(4096, num_lc_labels=1)
+    worker = EventWorker(ring, build_events, max_events=4096,
+                         interval=0.001).start()
+    expected = 0
+    for batch in batches:
+        rows = batch.frames_with_crossings()
+        expected += len(rows)
+        ring.push(batch, rows)
+    worker.stop()
+    assert len(worker.take_events()) == expected
+    # rows pushed after stop() are built by the next stop()
+    ring.push(batches[1], np.arange(4))
+    worker.stop()
+    assert len(worker.take_events()) == 4
+
+    # probe time of the synchronous path vs. the ring push
+    def sync_probe(batch):
+        for i in batch.frames_with_crossings():
+            curr = dict(zip(labels.lc, batch.lc_curr[i].tolist()))
+            cum = dict(zip(labels.lc, batch.lc_cum[i].tolist()))
+            print("Linecrossing Cumulative: {0}".format(cum))
+            print("Linecrossing Current Frame: {0}".format(curr))
+
+    ring = CountRing(len(batches) * 4, num_lc_labels=1)
+    with redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for batch in batches:
+            sync_probe(batch)
+        sync_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    for batch in batches:
+        ring.push(batch, batch.frames_with_crossings())
+    ring_seconds = time.perf_counter() - start
+    print("probe time per batch: sync {0:.1f} us, ring {1:.1f} us".format(
+        sync_seconds * 1e6 / len(batches), ring_seconds * 1e6 / len(batches)))
+
+
+if __name__ == "__main__":
+    _check_ring()
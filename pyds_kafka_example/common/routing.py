@@ -0,0 +1,237 @@
+################################################################################
+# SPDX-FileCopyrightText: Copyright (c) 2019-2021 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+################################################################################
+
+"""Sensor ids, topics and partitions of the published events.
+
+read_sensor_ids() returns the ids of the [sensorN] groups of the nvmsgconv
+config; source N (pad_index N) publishes with that id unless --sensor-id
+overrides it.
+
+A route file sends events to other topics than the default one
+(cfg_routes.txt):
+
+    [route-entrance]
+    # device ids, fnmatch patterns separated by ';', default every device
+    sensor=gate-*;door-*
+    # line-crossing labels, the event needs a current count on one of them
+    label=straight
+    topic=ds-entrance
+
+An event goes to the topic of every route it matches, or to the default
+topic if it matches none.
+
+EvenPartitioner gives source i partition i % partitions, so N sources use
+min(N, partitions) partitions with at most one source difference between
+them, where hashing the device ids can put several sources on one
+partition and leave others empty.
+"""
+
+import fnmatch
+import threading
+
+from common.analytics_config import read_analytics_config
+from common.producer import default_partitioner
+
+SENSOR_GROUP = "sensor"
+ROUTE_GROUP = "route-"
+# default sensor id of the first source; source i > 0 gets "<SENSOR_ID>_<i>"
+SENSOR_ID = "device_test"
+
+
+def read_sensor_ids(config_file):
+    """Returns {N: id} of the enabled [sensorN] groups with an id."""
+    config = read_analytics_config(config_file)
+    ids = {}
+    for section in config.sections():
+        index = section[len(SENSOR_GROUP):]
+        if not section.startswith(SENSOR_GROUP) or not index.isdigit():
+            continue
+        if config.get(section, "enable", fallback="1").strip() != "1":
+            continue
+        sensor_id = config.get(section, "id", fallback="").strip()
+        if sensor_id:
+            ids[int(index)] = sensor_id
+    return ids
+
+
+def resolve_sensor_ids(num_sources, sensor_ids=(), config_ids=None):
+    """Returns the sensor id of each source: the i-th of sensor_ids (the
+    --sensor-id options), else config_ids[i] (read_sensor_ids()), else
+    the default."""
+    config_ids = config_ids or {}
+    ids = list(sensor_ids)[:num_sources]
+    for i in range(len(ids), num_sources):
+        ids.append(config_ids.get(i) or (
+            SENSOR_ID if i == 0 else "{0}_{1}".format(SENSOR_ID, i)))
+    return ids
+
+
+def _split(value):
+    return tuple(part.strip() for part in value.split(";") if part.strip())
+
+
+class Route:
+    def __init__(self, name, topic, sensors=(), labels=()):
+        if not topic:
+            raise ValueError("route {0} has no topic".format(name))
+        self.name = name
+        self.topic = topic
+        self.sensors = tuple(sensors)
+        self.labels = tuple(labels)
+
+    def matches_sensor(self, sensor_id):
+        return not self.sensors or any(fnmatch.fnmatchcase(sensor_id, pattern)
+                                       for pattern in self.sensors)
+
+    def matches_counts(self, counts):
+        # counts: {label: (current, cumulative)}
+        return not self.labels or any(counts.get(label, (0, 0))[0] > 0
+                                      for label in self.labels)
+
+    def __repr__(self):
+        return "Route({0!r}, topic={1!r}, sensors={2!r}, labels={3!r})".format(
+            self.name, self.topic, self.sensors, self.labels)
+
+
+def read_routes(config_file):
+    """Returns the Routes of the enabled [route-<name>] groups."""
+    config = read_analytics_config(config_file)
+    routes = []
+    for section in config.sections():
+        if not section.startswith(ROUTE_GROUP):
+            continue
+        if config.get(section, "enable", fallback="1").strip() != "1":
+            continue
+        routes.append(Route(section[len(ROUTE_GROUP):],
+                            config.get(section, "topic", fallback="").strip(),
+                            _split(config.get(section, "sensor", fallback="")),
+                            _split(config.get(section, "label", fallback=""))))
+    return routes
+
+
+class Router:
+    """Picks the topics of an event from its device id and counts."""
+
+    def __init__(self, routes, default_topic):
+        self.routes = list(routes)
+        self.default_topic = default_topic
+        # device id -> routes matching it, sensor patterns are only
+        # matched once per device
+        self._sensor_routes = {}
+
+    def topics(self, sensor_id, counts):
+        routes = self._sensor_routes.get(sensor_id)
+        if routes is None:
+            routes = self._sensor_routes[sensor_id] = [
+                route for route in self.routes
+                if route.matches_sensor(sensor_id)]
+        topics = [route.topic for route in routes
+                  if route.matches_counts(counts)]
+        return topics or [self.default_topic]
+
+
+class EvenPartitioner:
+    """Partitioner for BatchingProducer that spreads sources round-robin.
+
+    keys lists the message keys (encoded device ids) in source order; keys
+    seen later are appended in order of arrival. offset is the global
+    index of the first source when several processes share the topic
+    (supervisor.py shards). key None goes to partition 0 like
+    default_partitioner.
+    """
+
+    def __init__(self, keys=(), offset=0):
+        self.offset = offset
+        self._index = {}
+        self._lock = threading.Lock()
+        for key in keys:
+            self._index.setdefault(key, len(self._index))
+
+    def __call__(self, key, partitions):
+        if key is None:
+            return 0
+        index = self._index.get(key)
+        if index is None:
+            with self._lock:
+                index = self._index.setdefault(key, len(self._index))
+        return (self.offset + index) % partitions
+
+
+def _check_routing():
+    import collections
+    import os
+    import tempfile
+    from common.producer import BatchingProducer, LocalBroker
+
+    fd, path = tempfile.mkstemp(suffix=".txt")
+    with os.fdopen(fd, "w") as f:
+        f.write("[sensor0]\nenable=1\nid=gate-0\n"
+                "[sensor1]\nenable=0\nid=gate-1\n"
+                "[sensor2]\nenable=1\nid=door-2\n"
+                "[place0]\nid=1\n"
+                "[route-gates]\nsensor=gate-*\ntopic=ds-gates\n"
+                "[route-straight]\nlabel=straight\ntopic=ds-straight\n"
+                "[route-off]\nenable=0\ntopic=ds-off\n")
+    try:
+        assert read_sensor_ids(path) == {0: "gate-0", 2: "door-2"}
+        router = Router(read_routes(path), "ds-kafka")
+    finally:
+        os.remove(path)
+    assert router.topics("gate-0", {"straight": (0, 5)}) == ["ds-gates"]
+    assert router.topics("gate-0", {"straight": (1, 6)}) == \
+        ["ds-gates", "ds-straight"]
+    assert router.topics("door-2", {"straight": (1, 6)}) == ["ds-straight"]
+    assert router.topics("door-2", {"left": (1, 1)}) == ["ds-kafka"]
+
+    # partition distribution of 8 sources over 8 partitions: hashing the
+    # device ids leaves partitions empty, the even partitioner gives each
+    # source its own
+    keys = [name.encode() for name in (
+        "north-gate", "south-gate", "garage-in", "garage-out", "lobby",
+        "dock-a", "dock-b", "parking")]
+    for name, partitioner in (("hash", default_partitioner),
+                              ("even", EvenPartitioner(keys))):
+        broker = LocalBroker(partitions=8)
+        producer = BatchingProducer(broker, linger=0.001,
+                                    partitioner=partitioner).start()
+        for n in range(100):
+            for key in keys:
+                producer.send("ds-kafka", key, b"x")
+        producer.close()
+        messages = collections.Counter()
+        sources = collections.defaultdict(set)
+        for batch in broker.batches:
+            messages[batch.partition] += len(batch.records)
+            sources[batch.partition].update(k for k, _ in batch.records)
+        per_partition = [len(sources[p]) for p in range(8)]
+        print("{0}: sources per partition {1}, messages {2}".format(
+            name, per_partition, [messages[p] for p in range(8)]))
+        assert sum(messages.values()) == 800
+        # a key always maps to the same partition
+        assert sum(per_partition) == len(keys)
+        if name == "hash":
+            assert per_partition.count(0) == 2
+    assert per_partition == [1] * 8
+    assert [messages[p] for p in range(8)] == [100] * 8
+    assert EvenPartitioner(keys)(keys[5], 4) == 1
+    assert EvenPartitioner()(b"new", 4) == 0
+    assert EvenPartitioner(keys[4:], offset=4)(keys[5], 8) == 5
+    print("routing checks passed")
+
+
+if __name__ == "__main__":
+    _check_routing()
@@ -0,0 +1,484 @@
+################################################################################
+# SPDX-FileCopyrightText: Copyright (c) 2019-2021 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+################################################################################
+
+"""One pipeline process per group of sources, see supervisor.py.
+
+The sources are split into shards of consecutive pad indices and each
+shard runs in its own worker process (run.py, or stand_in_worker.py for
+tests), so the probes of different shards do not share a GIL:
+
+    shards = plan_shards(num_sources=8, num_shards=2)  # [[0..3], [4..7]]
+    metrics = MergedMetrics(shards, ["shard0.prom", "shard1.prom"])
+    workers = [ShardWorker(k, command_of_shard_k) for k in range(2)]
+    Supervisor(workers, metrics).run(stop_event)
+
+Workers that exit with an error are restarted after restart_delay,
+doubling up to max_delay for consecutive failures, and given up after
+max_restarts restarts within restart_window seconds. A worker exiting
+with 0 reached the end of its streams and stays down.
+
+MergedMetrics sums the --metrics-file of every worker, renumbers their
+stream labels to global source indices and adds the counters of earlier
+runs of a worker, so merged counters keep growing across restarts. What a
+crashed worker counted after its last metrics dump is lost. Quantiles of
+summaries do not add up: the merge reports the largest one of the running
+workers, an upper bound of the quantile over all shards, and drops those
+of finished runs.
+"""
+
+import collections
+import os
+import re
+import signal
+import subprocess
+import threading
+import time
+
+# environment of the workers: shard index, its global source indices
+# ("0,1,2") and how often it was restarted
+SHARD_ENV = "DS_SHARD"
+SHARD_STREAMS_ENV = "DS_SHARD_STREAMS"
+SHARD_RESTARTS_ENV = "DS_SHARD_RESTARTS"
+
+_SAMPLE = re.compile(r"^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})?\s+(\S+)$")
+_LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+# types whose values of finished worker runs are carried over
+_CUMULATIVE_TYPES = ("counter", "histogram", "summary")
+_SUFFIX_ORDER = {"_bucket": 0, "_sum": 1, "_count": 2}
+
+
+def plan_shards(num_sources, num_shards):
+    """Returns the global source indices of each shard: consecutive, at
+    most one source difference in size, no empty shards."""
+    num_shards = max(1, min(num_shards, num_sources))
+    size, extra = divmod(num_sources, num_shards)
+    shards = []
+    start = 0
+    for k in range(num_shards):
+        end = start + size + (k < extra)
+        shards.append(list(range(start, end)))
+        start = end
+    return shards
+
+
+def parse_metrics(text):
+    """Parses Prometheus text format into (families, samples).
+
+    families maps each metric family to its (HELP line, TYPE name),
+    samples maps (family, sample name, labels) to the value, labels
+    being a tuple of (name, value) pairs.
+    """
+    families = collections.OrderedDict()
+    samples = collections.OrderedDict()
+    family = None
+    for line in text.splitlines():
+        if line.startswith("# HELP "):
+            family = line.split()[2]
+            help_line, metric_type = families.get(family, (None, "untyped"))
+            families[family] = (line, metric_type)
+        elif line.startswith("# TYPE "):
+            family, metric_type = line.split()[2:4]
+            help_line, _ = families.get(family, (None, None))
+            families[family] = (help_line, metric_type)
+        elif line and not line.startswith("#"):
+            match = _SAMPLE.match(line)
+            if match is None:
+                continue
+            name = match.group(1)
+            if family is None or not name.startswith(family):
+                family = name
+                families.setdefault(family, (None, "untyped"))
+            labels = tuple(_LABEL.findall(match.group(2) or ""))
+            samples[(family, name, labels)] = float(match.group(3))
+    return families, samples
+
+
+def _is_quantile(key):
+    # quantile="..." samples of a summary, the other ones add up
+    return any(label == "quantile" for label, _ in key[2])
+
+
+def _sample_order(key):
+    family, name, labels = key
+    labels = dict(labels)
+    stream = labels.pop("stream", None)
+    le = labels.pop("le", None)
+    le = float("inf") if le in (None, "+Inf") else float(le)
+    return (int(stream) if stream is not None else -1,
+            sorted(labels.items()),
+            _SUFFIX_ORDER.get(name[len(family):], 0), le)
+
+
+def _format_sample(name, labels, value):
+    if name.endswith("_sum") or value != int(value):
+        text = repr(float(value))
+    else:
+        text = str(int(value))
+    if not labels:
+        return "{0} {1}".format(name, text)
+    return "{0}{{{1}}} {2}".format(name, ",".join(
+        '{0}="{1}"'.format(key, label) for key, label in labels), text)
+
+
+class MergedMetrics:
+    """Merged metrics of the shard workers.
+
+    render() makes it usable as registry of MetricsServer and
+    MetricsFileDumper.
+    """
+
+    def __init__(self, shards, paths):
+        self.offsets = [shard[0] if shard else 0 for shard in shards]
+        self.paths = list(paths)
+        self.restarts = [0] * len(self.paths)
+        self.up = [0] * len(self.paths)
+        self._families = collections.OrderedDict()
+        # values of the finished runs of each worker
+        self._base = [{} for _ in self.paths]
+        self._lock = threading.Lock()
+
+    def _read(self, shard):
+        # called with _lock held
+        try:
+            with open(self.paths[shard]) as f:
+                text = f.read()
+        except OSError:
+            return {}
+        families, samples = parse_metrics(text)
+        for family, header in families.items():
+            if header[0] is not None or family not in self._families:
+                self._families[family] = header
+        offset = self.offsets[shard]
+        renumbered = {}
+        for (family, name, labels), value in samples.items():
+            labels = tuple((key, str(int(label) + offset) if key == "stream"
+                            else label) for key, label in labels)
+            renumbered[(family, name, labels)] = value
+        return renumbered
+
+    def worker_exited(self, shard):
+        """Adds the last metrics of the worker of shard to the values of
+        its finished runs and removes its metrics file, so its next run
+        counts on from them."""
+        with self._lock:
+            base = self._base[shard]
+            for key, value in self._read(shard).items():
+                if self._families.get(key[0], (None, None))[1] in \
+                        _CUMULATIVE_TYPES and not _is_quantile(key):
+                    base[key] = base.get(key, 0) + value
+            try:
+                os.remove(self.paths[shard])
+            except OSError:
+                pass
+
+    def samples(self):
+        """Returns the merged {(family, name, labels): value}."""
+        totals = {}
+        with self._lock:
+            for shard in range(len(self.paths)):
+                for source in (self._base[shard], self._read(shard)):
+                    for key, value in source.items():
+                        if _is_quantile(key):
+                            totals[key] = max(totals.get(key, value), value)
+                        else:
+                            totals[key] = totals.get(key, 0) + value
+            families = list(self._families.items())
+        return families, totals
+
+    def render(self):
+        families, totals = self.samples()
+        by_family = collections.defaultdict(list)
+        for key in totals:
+            by_family[key[0]].append(key)
+        lines = []
+        for family, (help_line, metric_type) in families:
+            if family not in by_family:
+                continue
+            if help_line:
+                lines.append(help_line)
+            lines.append("# TYPE {0} {1}".format(family, metric_type))
+            for key in sorted(by_family[family], key=_sample_order):
+                lines.append(_format_sample(key[1], key[2], totals[key]))
+        lines.append("# HELP ds_worker_up Whether the worker of the shard "
+                     "is running")
+        lines.append("# TYPE ds_worker_up gauge")
+        for shard, up in enumerate(self.up):
+            lines.append('ds_worker_up{{shard="{0}"}} {1}'.format(shard, up))
+        lines.append("# HELP ds_worker_restarts_total Restarts of the worker "
+                     "of the shard")
+        lines.append("# TYPE ds_worker_restarts_total counter")
+        for shard, restarts in enumerate(self.restarts):
+            lines.append('ds_worker_restarts_total{{shard="{0}"}} {1}'.format(
+                shard, restarts))
+        return "\n".join(lines) + "\n"
+
+
+class ShardWorker:
+    """The worker process of one shard; command is its argument list."""
+
+    def __init__(self, shard, command, streams=(), cwd=None):
+        self.shard = shard
+        self.command = list(command)
+        self.streams = list(streams)
+        self.cwd = cwd
+        self.process = None
+        self.state = "stopped"
+        self.restarts = 0
+        self.started = 0.0
+        self.next_start = 0.0
+        self.returncode = None
+        # consecutive failures, for the backoff
+        self.failures = 0
+        self.restart_times = collections.deque()
+
+    def start(self, now):
+        env = dict(os.environ)
+        env[SHARD_ENV] = str(self.shard)
+        env[SHARD_STREAMS_ENV] = ",".join(str(s) for s in self.streams)
+        env[SHARD_RESTARTS_ENV] = str(self.restarts)
+        self.process = subprocess.Popen(self.command, cwd=self.cwd, env=env)
+        self.state = "running"
+        self.started = now
+
+    def stop(self, timeout):
+        """Interrupts the worker like Ctrl-C, so run.py shuts its pipeline
+        down and dumps its metrics; kills it after timeout seconds."""
+        if self.process is None or self.process.poll() is not None:
+            return
+        self.process.send_signal(signal.SIGINT)
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+class Supervisor:
+    def __init__(self, workers, metrics=None, restart_delay=1.0,
+                 max_delay=30.0, max_restarts=5, restart_window=300.0,
+                 poll_interval=0.2, stop_timeout=10.0):
+        self.workers = list(workers)
+        self.metrics = metrics
+        self.restart_delay = restart_delay
+        self.max_delay = max_delay
+        self.max_restarts = max_restarts
+        self.restart_window = restart_window
+        self.poll_interval = poll_interval
+        self.stop_timeout = stop_timeout
+
+    def _update_metrics(self, worker):
+        if self.metrics is not None:
+            self.metrics.up[worker.shard] = int(worker.state == "running")
+            self.metrics.restarts[worker.shard] = worker.restarts
+
+    def start(self):
+        now = time.monotonic()
+        for worker in self.workers:
+            worker.start(now)
+            self._update_metrics(worker)
+        return self
+
+    def _exited(self, worker, now):
+        worker.returncode = worker.process.returncode
+        if self.metrics is not None:
+            self.metrics.worker_exited(worker.shard)
+        if worker.returncode == 0:
+            worker.state = "finished"
+            print("Shard {0}: worker finished".format(worker.shard))
+            return
+        # a worker that ran for a while starts the backoff over
+        if now - worker.started > self.restart_window:
+            worker.failures = 0
+        worker.failures += 1
+        while worker.restart_times and \
+                now - worker.restart_times[0] > self.restart_window:
+            worker.restart_times.popleft()
+        if len(worker.restart_times) >= self.max_restarts:
+            worker.state = "failed"
+            print("Shard {0}: worker exited with {1}, {2} restarts in {3:.0f}s, "
+                  "giving up".format(worker.shard, worker.returncode,
+                                     len(worker.restart_times),
+                                     self.restart_window))
+            return
+        delay = min(self.restart_delay * 2 ** (worker.failures - 1),
+                    self.max_delay)
+        worker.state = "waiting"
+        worker.next_start = now + delay
+        print("Shard {0}: worker exited with {1}, restarting in {2:.1f}s"
+              .format(worker.shard, worker.returncode, delay))
+
+    def poll(self, now=None):
+        """Restarts exited workers; returns False once none runs or waits
+        for a restart."""
+        now = time.monotonic() if now is None else now
+        for worker in self.workers:
+            if worker.state == "running" and worker.process.poll() is not None:
+                self._exited(worker, now)
+            if worker.state == "waiting" and now >= worker.next_start:
+                worker.restarts += 1
+                worker.restart_times.append(now)
+                worker.start(now)
+            self._update_metrics(worker)
+        return any(worker.state in ("running", "waiting")
+                   for worker in self.workers)
+
+    def stop(self):
+        for worker in self.workers:
+            if worker.state == "running":
+                worker.stop(self.stop_timeout)
+                self._exited_on_stop(worker)
+            elif worker.state == "waiting":
+                worker.state = "stopped"
+            self._update_metrics(worker)
+
+    def _exited_on_stop(self, worker):
+        worker.returncode = worker.process.returncode
+        worker.state = "stopped"
+        if self.metrics is not None:
+            self.metrics.worker_exited(worker.shard)
+
+    def run(self, stop_event):
+        """Runs the workers until all of them finished or failed, or until
+        stop_event is set. Returns 0 if no worker failed."""
+        self.start()
+        try:
+            while not stop_event.is_set() and self.poll():
+                stop_event.wait(self.poll_interval)
+        finally:
+            self.stop()
+        return int(any(worker.state == "failed" for worker in self.workers))
+
+
+def _check_shards():
+    import shutil
+    import sys
+    import tempfile
+    from common.analytics_config import (read_analytics_config, shard_config,
+                                         LC_GROUP)
+    from common.meta_log import MetaLogReader, write_synthetic_log
+    from common.tracing import StageLatencies
+
+    assert plan_shards(7, 3) == [[0, 1, 2], [3, 4], [5, 6]]
+    assert plan_shards(2, 4) == [[0], [1]]
+
+    config = read_analytics_config([])
+    config.read_string("[property]\nenable=1\n"
+                       "[line-crossing-stream-0]\nline-crossing-a=1;2;3;4\n"
+                       "[line-crossing-stream-3]\nline-crossing-b=5;6;7;8\n")
+    shard = shard_config(config, [2, 3])
+    assert shard.get(LC_GROUP + "0", "line-crossing-a") == "1;2;3;4"
+    assert shard.get(LC_GROUP + "1", "line-crossing-b") == "5;6;7;8"
+    assert shard.has_section("property")
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        # merging renumbers streams and carries counters over restarts
+        paths = [os.path.join(work_dir, "shard{0}.prom".format(k))
+                 for k in range(2)]
+        metrics = MergedMetrics([[0, 1], [2, 3]], paths)
+        shard_text = ("# HELP ds_frames_total Frames\n"
+                      "# TYPE ds_frames_total counter\n"
+                      'ds_frames_total{{stream="0"}} {0}\n'
+                      'ds_frames_total{{stream="1"}} 5\n'
+                      "# HELP ds_probe_seconds Probe\n"
+                      "# TYPE ds_probe_seconds histogram\n"
+                      'ds_probe_seconds_bucket{{le="0.001"}} 2\n'
+                      'ds_probe_seconds_bucket{{le="+Inf"}} 3\n'
+                      "ds_probe_seconds_sum 0.5\n"
+                      "ds_probe_seconds_count 3\n")
+        for path in paths:
+            with open(path, "w") as f:
+                f.write(shard_text.format(10))
+        metrics.worker_exited(1)
+        with open(paths[1], "w") as f:
+            f.write(shard_text.format(1))
+        text = metrics.render()
+        assert 'ds_frames_total{stream="0"} 10' in text
+        assert 'ds_frames_total{stream="2"} 11' in text
+        assert 'ds_frames_total{stream="3"} 10' in text
+        assert 'ds_probe_seconds_bucket{le="+Inf"} 9' in text
+        assert "ds_probe_seconds_sum 1.5" in text
+        families, samples = parse_metrics(text)
+        assert families["ds_probe_seconds"][1] == "histogram"
+
+        # summary quantiles of --trace are not summed, also not over restarts
+        metrics = MergedMetrics([[0, 1], [2, 3]], paths)
+        for run, path in ((0, paths[0]), (0, paths[1]), (1, paths[1])):
+            latencies = StageLatencies()
+            for _ in range(10):
+                latencies.observe("probe", 0.01)
+            lines = []
+            latencies.render(lines)
+            with open(path, "w") as f:
+                f.write("\n".join(lines) + "\n")
+            if run == 0 and path == paths[1]:
+                metrics.worker_exited(1)
+        _, samples = metrics.samples()
+        key = ("ds_event_latency_seconds", "ds_event_latency_seconds",
+               (("stage", "probe"), ("quantile", "0.5")))
+        assert samples[key] == 0.01, samples[key]
+        assert samples[("ds_event_latency_seconds",
+                        "ds_event_latency_seconds_count",
+                        (("stage", "probe"),))] == 30
+
+        # two stand-in workers replaying a recorded 4 stream log; the first
+        # run of each crashes after 20 batches and is restarted
+        log_file = os.path.join(work_dir, "run.dsml")
+        write_synthetic_log(log_file, ["straight"], num_streams=4,
+                            num_batches=100)
+        shards = plan_shards(4, 2)
+        paths = [os.path.join(work_dir, "shard{0}.prom".format(k))
+                 for k in range(len(shards))]
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+        metrics = MergedMetrics(shards, paths)
+        here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        workers = []
+        for k, streams in enumerate(shards):
+            command = [sys.executable, "stand_in_worker.py", "-l", log_file,
+                       "--crash-after", "20", "--metrics-file", paths[k],
+                       "--metrics-interval", "0"]
+            for stream in streams:
+                command += ["-u", "stream{0}".format(stream)]
+            workers.append(ShardWorker(k, command, streams, cwd=here))
+        supervisor = Supervisor(workers, metrics, restart_delay=0.05,
+                                poll_interval=0.05)
+        start = time.monotonic()
+        assert supervisor.run(threading.Event()) == 0
+        elapsed = time.monotonic() - start
+        assert [w.restarts for w in workers] == [1, 1]
+        assert all(w.state == "finished" for w in workers)
+
+        frames = collections.Counter(f["pad_index"] for b in
+                                     MetaLogReader(log_file) for f in b)
+        _, samples = metrics.samples()
+        for stream in range(4):
+            # every frame of the full run plus 20 batches before the crash
+            key = ("ds_frames_total", "ds_frames_total",
+                   (("stream", str(stream)),))
+            assert samples[key] == frames[stream] + 20, samples[key]
+        text = metrics.render()
+        assert 'ds_worker_restarts_total{shard="1"} 1' in text
+        print("2 shards, 1 restart each, {0:.1f}s".format(elapsed))
+    finally:
+        shutil.rmtree(work_dir)
+    print("shard checks passed")
+
+
+if __name__ == "__main__":
+    _check_shards()
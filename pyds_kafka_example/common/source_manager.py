@@ -0,0 +1,158 @@
+################################################################################
+# SPDX-FileCopyrightText: Copyright (c) 2019-2021 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+################################################################################
+
+"""One uridecodebin branch per source URI, linked into nvstreammux.
+
+Source i is linked to streammux sink_i, so the pad_index of its frames is
+i and sensor_ids[i] is the sensor id published for it: the i-th
+--sensor-id, else the id of the [sensor<i>] group of the nvmsgconv config,
+else a default.
+"""
+
+import math
+import os
+import sys
+import gi
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst
+
+from common.routing import SENSOR_ID, resolve_sensor_ids
+
+
+def to_uri(location):
+    """Returns location as URI, plain paths become file:// URIs."""
+    if "://" in location:
+        return location
+    return "file://" + os.path.abspath(location)
+
+
+def is_live_uri(uri):
+    return uri.startswith(("rtsp://", "rtmp://", "http://", "https://",
+                           "udp://"))
+
+
+def cb_newpad(decodebin, decoder_src_pad, data):
+    caps = decoder_src_pad.get_current_caps()
+    if caps is None:
+        caps = decoder_src_pad.query_caps()
+    gststruct = caps.get_structure(0)
+    gstname = gststruct.get_name()
+    source_bin = data
+    features = caps.get_features(0)
+
+    # Only link the video pad, and only if decodebin picked the NVIDIA
+    # decoder, i.e. the pad has NVMM memory features.
+    if gstname.find("video") != -1:
+        if features.contains("memory:NVMM"):
+            bin_ghost_pad = source_bin.get_static_pad("src")
+            if not bin_ghost_pad.set_target(decoder_src_pad):
+                sys.stderr.write("Failed to link decoder src pad to source bin ghost pad\n")
+        else:
+            sys.stderr.write(" Error: Decodebin did not pick nvidia decoder plugin.\n")
+
+
+def decodebin_child_added(child_proxy, obj, name, user_data):
+    if name.find("decodebin") != -1:
+        obj.connect("child-added", decodebin_child_added, user_data)
+
+
+def create_source_bin(index, uri):
+    # A bin around uridecodebin with a ghost src pad that gets its target
+    # once decodebin has created the decoded video pad.
+    bin_name = "source-bin-%02d" % index
+    nbin = Gst.Bin.new(bin_name)
+    if not nbin:
+        sys.stderr.write(" Unable to create source bin \n")
+
+    uri_decode_bin = Gst.ElementFactory.make("uridecodebin", "uri-decode-bin")
+    if not uri_decode_bin:
+        sys.stderr.write(" Unable to create uri decode bin \n")
+    uri_decode_bin.set_property("uri", uri)
+    uri_decode_bin.connect("pad-added", cb_newpad, nbin)
+    uri_decode_bin.connect("child-added", decodebin_child_added, nbin)
+
+    Gst.Bin.add(nbin, uri_decode_bin)
+    bin_pad = nbin.add_pad(Gst.GhostPad.new_no_target("src",
+                                                      Gst.PadDirection.SRC))
+    if not bin_pad:
+        sys.stderr.write(" Failed to add ghost pad in source bin \n")
+        return None
+    return nbin
+
+
+def tiler_layout(num_sources):
+    """Returns (rows, columns) of a tiler showing num_sources streams."""
+    rows = int(math.sqrt(num_sources))
+    columns = int(math.ceil(num_sources / rows))
+    return rows, columns
+
+
+class SourceManager:
+    def __init__(self, uris, sensor_ids=(), config_ids=None):
+        # config_ids: {i: id} of the [sensor<i>] groups, see
+        # routing.read_sensor_ids()
+        self.uris = [to_uri(uri) for uri in uris]
+        self._sensor_id_options = list(sensor_ids)
+        self.sensor_ids = resolve_sensor_ids(len(self.uris), sensor_ids,
+                                             config_ids)
+        self.source_bins = []
+
+    def __len__(self):
+        return len(self.uris)
+
+    @property
+    def is_live(self):
+        return any(is_live_uri(uri) for uri in self.uris)
+
+    def update_sensor_ids(self, config_ids):
+        """Re-resolves the ids not given as sensor_ids from a reloaded
+        msgconv config; returns {pad_index: new id} of those that
+        changed."""
+        sensor_ids = resolve_sensor_ids(len(self.uris),
+                                        self._sensor_id_options, config_ids)
+        changed = dict((i, new) for i, (old, new) in
+                       enumerate(zip(self.sensor_ids, sensor_ids))
+                       if old != new)
+        # one assignment, the probe thread sees the old or the new list
+        self.sensor_ids = sensor_ids
+        return changed
+
+    def sensor_id(self, pad_index):
+        if 0 <= pad_index < len(self.sensor_ids):
+            return self.sensor_ids[pad_index]
+        return SENSOR_ID
+
+    def add_to_pipeline(self, pipeline, streammux):
+        """Creates the source bins and links source i to streammux sink_i."""
+        for i, uri in enumerate(self.uris):
+            print("Creating source_bin {0} for {1} \n".format(i, uri))
+            source_bin = create_source_bin(i, uri)
+            if not source_bin:
+                sys.stderr.write("Unable to create source bin \n")
+                return False
+            pipeline.add(source_bin)
+            sinkpad = streammux.get_request_pad("sink_%u" % i)
+            if not sinkpad:
+                sys.stderr.write("Unable to create sink pad bin \n")
+                return False
+            srcpad = source_bin.get_static_pad("src")
+            if not srcpad:
+                sys.stderr.write("Unable to create src pad bin \n")
+                return False
+            srcpad.link(sinkpad)
+            self.source_bins.append(source_bin)
+        return True
@@ -0,0 +1,529 @@
+################################################################################
+# SPDX-FileCopyrightText: Copyright (c) 2019-2021 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+################################################################################
+
+"""Disk spool for the messages of the --sink python producer.
+
+Spool is an append-only log of memory-mapped segment files. Every record
+carries a CRC32, so a torn or corrupted record ends the readable part of
+its segment instead of being replayed. A cursor file remembers what has
+been replayed, segments are deleted once fully replayed, and the oldest
+segments are dropped (and counted) when the spool exceeds max_bytes or a
+segment is older than retention seconds.
+
+SpoolingProducer puts a Spool in front of a BatchingProducer: messages go
+to the spool while the broker fails or the producer has more than
+high_water messages pending, and a replay thread sends the spooled
+messages in order once the broker takes them again. New messages keep
+going to the spool until it is drained. Batches that fail after their
+retries are spooled too, and so are the batches the producer still had
+queued while the spool holds older messages; messages sent meanwhile are
+held back in memory until the producer is idle, so they land in the spool
+after the failed batches and the order of each partition is kept. Nothing is spooled while
+the producer still has batches in flight: beyond high_water held messages
+new ones are dropped and counted in held_dropped.
+
+Segment record layout (little endian):
+
+    u32 body length (0 = end of data), u32 crc32(body),
+    body: u16 topic length, u16 key length (0xffff = no key),
+          topic, key, value
+"""
+
+import collections
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+SEGMENT_PREFIX = "spool-"
+SEGMENT_SUFFIX = ".seg"
+CURSOR_FILE = "cursor"
+
+_HEADER = struct.Struct("<II")
+_BODY = struct.Struct("<HH")
+_NO_KEY = 0xffff
+
+
+def _encode(topic, key, value):
+    topic = topic.encode("utf-8")
+    body = _BODY.pack(len(topic), _NO_KEY if key is None else len(key)) + \
+        topic + (key or b"") + value
+    return _HEADER.pack(len(body), zlib.crc32(body)) + body
+
+
+def _decode(body):
+    topic_len, key_len = _BODY.unpack_from(body)
+    pos = _BODY.size
+    topic = bytes(body[pos:pos + topic_len]).decode("utf-8")
+    pos += topic_len
+    key = None
+    if key_len != _NO_KEY:
+        key = bytes(body[pos:pos + key_len])
+        pos += key_len
+    return topic, key, bytes(body[pos:])
+
+
+class _Segment:
+    def __init__(self, directory, seq, size, create=False):
+        self.seq = seq
+        self.path = os.path.join(directory, "{0}{1:012d}{2}".format(
+            SEGMENT_PREFIX, seq, SEGMENT_SUFFIX))
+        mode = "w+b" if create else "r+b"
+        with open(self.path, mode) as f:
+            if create:
+                f.truncate(size)
+            self.size = os.fstat(f.fileno()).st_size
+            self.mm = mmap.mmap(f.fileno(), self.size)
+        self.mtime = time.time() if create else os.path.getmtime(self.path)
+        self.end, self.records, self.corrupt = self.scan(0)
+
+    def scan(self, pos, max_records=None):
+        """Walks the valid records from pos; returns (end position,
+        record count, whether it stopped at a corrupt record)."""
+        records = 0
+        while pos + _HEADER.size <= self.size and \
+                (max_records is None or records < max_records):
+            length, crc = _HEADER.unpack_from(self.mm, pos)
+            if length == 0:
+                return pos, records, False
+            body_end = pos + _HEADER.size + length
+            if body_end > self.size or \
+                    zlib.crc32(self.mm[pos + _HEADER.size:body_end]) != crc:
+                return pos, records, True
+            records += 1
+            pos = body_end
+        return pos, records, False
+
+    def read(self, pos, max_records):
+        records = []
+        while pos < self.end and len(records) < max_records:
+            length, _ = _HEADER.unpack_from(self.mm, pos)
+            body_start = pos + _HEADER.size
+            records.append(_decode(self.mm[body_start:body_start + length]))
+            pos = body_start + length
+        return records, pos
+
+    def append(self, record):
+        self.mm[self.end:self.end + len(record)] = record
+        self.end += len(record)
+        self.records += 1
+        self.mtime = time.time()
+
+    def fits(self, record):
+        return self.end + len(record) <= self.size
+
+    def close(self):
+        self.mm.flush()
+        self.mm.close()
+
+    def delete(self):
+        self.mm.close()
+        os.remove(self.path)
+
+
+class Spool:
+    def __init__(self, directory, segment_bytes=16 << 20, max_bytes=1 << 30,
+                 retention=None):
+        if max_bytes < segment_bytes:
+            raise ValueError("max_bytes must hold at least one segment")
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.retention = retention
+        self.stats = {"appended": 0, "replayed": 0, "dropped": 0,
+                      "corrupt_segments": 0, "too_large": 0}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        self._segments = []
+        for name in sorted(os.listdir(directory)):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+                seq = int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+                segment = _Segment(directory, seq, segment_bytes)
+                if segment.corrupt:
+                    self.stats["corrupt_segments"] += 1
+                self._segments.append(segment)
+        self._next_seq = self._segments[-1].seq + 1 if self._segments else 0
+
+        # replay position, (segment seq, offset)
+        self._cursor = self._load_cursor()
+        while self._segments and self._segments[0].seq < self._cursor[0]:
+            self._segments.pop(0).delete()
+        self.pending = self._count_pending()
+
+    def _load_cursor(self):
+        try:
+            with open(os.path.join(self.directory, CURSOR_FILE)) as f:
+                seq, offset = f.read().split()
+            return int(seq), int(offset)
+        except (OSError, ValueError):
+            if self._segments:
+                return self._segments[0].seq, 0
+            return 0, 0
+
+    def _save_cursor(self):
+        path = os.path.join(self.directory, CURSOR_FILE)
+        with open(path + ".tmp", "w") as f:
+            f.write("{0} {1}\n".format(*self._cursor))
+        os.replace(path + ".tmp", path)
+
+    def _count_pending(self):
+        pending = 0
+        for segment in self._segments:
+            if segment.seq == self._cursor[0]:
+                pending += segment.scan(self._cursor[1])[1]
+            elif segment.seq > self._cursor[0]:
+                pending += segment.records
+        return pending
+
+    def _unread(self, segment):
+        # records of segment that have not been replayed yet
+        if segment.seq == self._cursor[0]:
+            return segment.scan(self._cursor[1])[1]
+        return segment.records
+
+    def _drop_oldest(self):
+        segment = self._segments.pop(0)
+        dropped = self._unread(segment)
+        self.stats["dropped"] += dropped
+        self.pending -= dropped
+        if segment.seq >= self._cursor[0]:
+            self._cursor = (segment.seq + 1, 0)
+            self._save_cursor()
+        segment.delete()
+
+    def _roll(self):
+        if self._segments:
+            self._segments[-1].mm.flush()
+        while self._segments and \
+                (len(self._segments) + 1) * self.segment_bytes > self.max_bytes:
+            self._drop_oldest()
+        segment = _Segment(self.directory, self._next_seq, self.segment_bytes,
+                           create=True)
+        self._next_seq += 1
+        if not self._segments and self._cursor[0] < segment.seq:
+            self._cursor = (segment.seq, 0)
+        self._segments.append(segment)
+        return segment
+
+    def append(self, topic, key, value):
+        """Appends one message; returns False if it can never fit."""
+        record = _encode(topic, key, value)
+        if len(record) > self.segment_bytes:
+            self.stats["too_large"] += 1
+            return False
+        with self._lock:
+            segment = self._segments[-1] if self._segments else None
+            if segment is None or not segment.fits(record):
+                segment = self._roll()
+            segment.append(record)
+            self.pending += 1
+            self.stats["appended"] += 1
+        return True
+
+    def read(self, max_records):
+        """Returns (records, position) of up to max_records unreplayed
+        (topic, key, value) messages; pass position to commit() once they
+        are delivered."""
+        with self._lock:
+            records = []
+            seq, offset = self._cursor
+            for segment in self._segments:
+                if segment.seq < seq:
+                    continue
+                if segment.seq > seq:
+                    seq, offset = segment.seq, 0
+                chunk, offset = segment.read(offset, max_records - len(records))
+                records += chunk
+                if len(records) >= max_records:
+                    break
+            return records, (seq, offset)
+
+    def commit(self, position, count):
+        """Marks the count records up to position as replayed."""
+        with self._lock:
+            self._cursor = position
+            self.pending -= count
+            self.stats["replayed"] += count
+            # keep the segment being written, delete the replayed ones
+            while len(self._segments) > 1 and \
+                    self._segments[0].seq < position[0]:
+                self._segments.pop(0).delete()
+            if len(self._segments) > 1 and \
+                    self._segments[0].seq == position[0] and \
+                    position[1] >= self._segments[0].end:
+                self._segments.pop(0).delete()
+                self._cursor = (self._segments[0].seq, 0)
+            self._save_cursor()
+
+    def expire(self, now=None):
+        """Drops the segments (except the one being written) last written
+        more than retention seconds ago."""
+        if self.retention is None:
+            return
+        now = time.time() if now is None else now
+        with self._lock:
+            while len(self._segments) > 1 and \
+                    now - self._segments[0].mtime > self.retention:
+                self._drop_oldest()
+
+    @property
+    def disk_bytes(self):
+        return len(self._segments) * self.segment_bytes
+
+    def close(self):
+        with self._lock:
+            for segment in self._segments:
+                segment.close()
+            self._segments = []
+            self._save_cursor()
+
+
+class SpoolingProducer:
+    def __init__(self, producer, spool, high_water=10000, chunk=500,
+                 interval=0.2):
+        self.producer = producer
+        self.spool = spool
+        self.high_water = high_water
+        self.chunk = chunk
+        self.interval = interval
+        self.broker_ok = True
+        self.stats = {"spooled": 0, "held_dropped": 0}
+        # messages waiting for the producer to finish (or fail) its older
+        # messages before they may be spooled
+        self._held = collections.deque()
+        self._lock = threading.Lock()
+        producer.on_error = self._on_error
+        producer.divert = self._divert
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="spool-replay",
+                                       daemon=True)
+
+    def _on_error(self, topic, partition, records):
+        # batch failed after all retries: keep it for the replay
+        with self._lock:
+            self.broker_ok = False
+            for key, value in records:
+                self._append(topic, key, value)
+
+    def _divert(self, topic, partition):
+        # a queued batch must not overtake the spooled messages
+        return not self.broker_ok or self.spool.pending > 0
+
+    def _append(self, topic, key, value):
+        if self.spool.append(topic, key, value):
+            self.stats["spooled"] += 1
+            return True
+        return False
+
+    def _spool_held(self):
+        # called with _lock held
+        held = self._held
+        while held:
+            self._append(*held.popleft())
+
+    def send(self, topic, key, value, trace=None):
+        # spooled messages go without their trace
+        with self._lock:
+            if self.broker_ok and not self.spool.pending and \
+                    not self._held and self.producer.pending < self.high_water:
+                return self.producer.send(topic, key, value, trace)
+            if self.producer.pending:
+                # a batch in flight may still fail and go to the spool
+                # first
+                if len(self._held) >= self.high_water:
+                    self.stats["held_dropped"] += 1
+                    return False
+                self._held.append((topic, key, value))
+                return True
+            self._spool_held()
+            return self._append(topic, key, value)
+
+    def _replay_chunk(self):
+        records, position = self.spool.read(self.chunk)
+        if not records:
+            return False
+        # send in spool order, one batch per run of the same partition
+        transport = self.producer.transport
+        run = []
+        run_key = None
+        try:
+            for topic, key, value in records:
+                partition_key = (topic, self.producer.partition(topic, key))
+                if run and partition_key != run_key:
+                    transport.send_batch(run_key[0], run_key[1], run)
+                    run = []
+                run_key = partition_key
+                run.append((key, value))
+            transport.send_batch(run_key[0], run_key[1], run)
+        except Exception as e:
+            if self.broker_ok:
+                print("Spool: replay failed, retrying: {0}".format(e))
+            self.broker_ok = False
+            return False
+        self.spool.commit(position, len(records))
+        self.broker_ok = True
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.spool.expire()
+            if self.producer.pending:
+                self._stop.wait(self.interval)
+                continue
+            with self._lock:
+                self._spool_held()
+            # the replay also probes whether the broker is back
+            if self.spool.pending and self._replay_chunk():
+                continue
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def flush(self, timeout=None):
+        """Waits until the spool is drained and the producer is idle."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.spool.pending or self._held:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(self.interval / 2)
+        remaining = None if deadline is None else \
+            max(deadline - time.monotonic(), 0)
+        return self.producer.flush(remaining)
+
+    def close(self):
+        self._stop.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        self.producer.close()
+        self.spool.close()
+
+
+def _check_spool():
+    import shutil
+    import tempfile
+    from common.producer import BatchingProducer, LocalBroker
+
+    directory = tempfile.mkdtemp(prefix="ds-spool-")
+    try:
+        # append, reopen, replay in order
+        spool = Spool(directory, segment_bytes=4096, max_bytes=4096 * 8)
+        for n in range(100):
+            spool.append("t", None if n % 10 else b"k", b"m%03d" % n)
+        spool.close()
+        spool = Spool(directory, segment_bytes=4096, max_bytes=4096 * 8)
+        assert spool.pending == 100
+        records, position = spool.read(60)
+        assert [v for _, _, v in records] == [b"m%03d" % n for n in range(60)]
+        assert records[0][1] == b"k" and records[1][1] is None
+        spool.commit(position, len(records))
+        spool.close()
+        spool = Spool(directory, segment_bytes=4096, max_bytes=4096 * 8)
+        records, position = spool.read(1000)
+        assert [v for _, _, v in records] == [b"m%03d" % n for n in range(60, 100)]
+        spool.commit(position, len(records))
+        assert spool.pending == 0
+
+        # a corrupted record ends the readable part of its segment
+        spool.append("t", None, b"good")
+        spool.append("t", None, b"torn")
+        path = spool._segments[-1].path
+        spool.close()
+        with open(path, "r+b") as f:
+            data = f.read()
+            f.seek(data.rindex(b"torn"))
+            f.write(b"xxxx")
+        spool = Spool(directory, segment_bytes=4096, max_bytes=4096 * 8)
+        assert [v for _, _, v in spool.read(10)[0]] == [b"good"]
+        assert spool.stats["corrupt_segments"] == 1
+        spool.close()
+        shutil.rmtree(directory)
+
+        # size cap drops the oldest segments
+        spool = Spool(directory, segment_bytes=4096, max_bytes=4096 * 2)
+        for n in range(1000):
+            spool.append("t", None, b"x" * 100)
+        assert spool.disk_bytes <= 4096 * 2
+        assert spool.stats["dropped"] + spool.pending == 1000
+        records, _ = spool.read(10000)
+        assert len(records) == spool.pending
+        spool.close()
+        shutil.rmtree(directory)
+
+        # the broker goes away and comes back
+        broker = LocalBroker(partitions=2)
+        producer = BatchingProducer(broker, linger=0.002, max_in_flight=2,
+                                    retries=1, retry_backoff=0.01)
+        spooling = SpoolingProducer(producer.start(),
+                                    Spool(directory, segment_bytes=1 << 16),
+                                    interval=0.01).start()
+        messages = [b"event-%04d" % n for n in range(3000)]
+        for n, value in enumerate(messages):
+            if n == 1000:
+                broker.down = True
+            elif n == 2000:
+                broker.down = False
+            spooling.send("ds-kafka", b"device_%d" % (n % 3), value)
+            if n % 100 == 0:
+                time.sleep(0.01)
+        assert spooling.flush(timeout=20)
+        spooled = spooling.stats["spooled"]
+        spooling.close()
+        received = [value for _, value in broker.messages("ds-kafka")]
+        assert sorted(received) == messages, "lost or duplicated messages"
+        # per device the messages arrive in the order they were sent
+        for device in range(3):
+            key = b"device_%d" % device
+            values = [v for batch in broker.batches for k, v in batch.records
+                      if k == key]
+            assert values == sorted(values)
+        print("broker outage: {0} messages, {1} went through the spool".format(
+            len(received), spooled))
+
+        # more than high_water messages while a failing batch is retried:
+        # nothing is spooled ahead of it
+        shutil.rmtree(directory)
+        broker = LocalBroker()
+        broker.down = True
+        producer = BatchingProducer(broker, linger=0.001, retries=2,
+                                    retry_backoff=0.02)
+        spooling = SpoolingProducer(producer.start(),
+                                    Spool(directory, segment_bytes=1 << 16),
+                                    high_water=5, interval=0.01).start()
+        sent = 0
+        for n in range(30):
+            sent += spooling.send("t", b"k", b"%04d" % n)
+            time.sleep(0.002)
+        broker.down = False
+        assert spooling.flush(timeout=20)
+        spooling.close()
+        received = [value for _, value in broker.messages("t")]
+        assert received == sorted(received), received
+        assert len(received) == sent
+        assert sent + spooling.stats["held_dropped"] == 30
+        print("high water during retries: {0} sent in order, {1} "
+              "dropped".format(sent, spooling.stats["held_dropped"]))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    _check_spool()
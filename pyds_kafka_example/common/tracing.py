@@ -0,0 +1,223 @@
+################################################################################
+# SPDX-FileCopyrightText: Copyright (c) 2019-2021 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+################################################################################
+
+"""Per-stage latency of the events, from frame capture to broker hand-off.
+
+run.py --trace stamps each event with the times (ns since the epoch) its
+frame went through the stages, carried in the payload as its "trace":
+
+    capture    ntp_timestamp of the frame (set by nvstreammux, from the
+               RTSP sender reports or the system clock at streammux)
+    probe      the analytics probe starting on the batch
+    serialize  nvmsgconv (or the Python encoder) writing the payload
+    handoff    the payload reaching nvmsgbroker / the producer's transport
+
+StageLatencies keeps the latest window observations of each stage below,
+computed from those times, and renders them as a Prometheus summary:
+
+    pipeline   capture -> probe: decode, streammux, inference, tracker and
+               nvdsanalytics
+    probe      execution time of the probe itself
+    serialize  probe -> serialize: rest of the probe, the queue in front of
+               nvmsgconv and the conversion
+    handoff    serialize -> handoff: producer batching or nvmsgbroker
+    total      capture -> handoff
+
+    tracer = StageLatencies()
+    metrics.registry.register(tracer)
+    tracer.observe_trace(trace, time.time_ns())
+
+Stages whose start or end is unknown (0) are not observed. The capture
+time shares the clock of the host only with streammux attach-sys-ts or
+synchronized RTSP senders; differences below 0 are dropped.
+"""
+
+import threading
+import time
+
+import numpy as np
+
+STAGES = ("pipeline", "probe", "serialize", "handoff", "total")
+QUANTILES = (0.5, 0.9, 0.99)
+# observations kept per stage for the quantiles
+WINDOW = 4096
+
+
+def trace_ns():
+    """Timestamp of a trace stage: ns since the epoch."""
+    return time.time_ns()
+
+
+def stage_seconds(start, end):
+    """Seconds from start to end (ns), None if either is unknown or end is
+    earlier."""
+    if not start or not end or end < start:
+        return None
+    return (end - start) / 1e9
+
+
+class StageLatencies:
+    def __init__(self, window=WINDOW, quantiles=QUANTILES,
+                 name="ds_event_latency_seconds"):
+        self.name = name
+        self.quantiles = quantiles
+        self.window = window
+        self._index = dict((stage, k) for k, stage in enumerate(STAGES))
+        self._trace_stages = [self._index[stage] for stage in
+                              ("pipeline", "serialize", "handoff", "total")]
+        # ring of the last window values of each stage
+        self._values = np.zeros((len(STAGES), window), dtype=np.float64)
+        self._counts = [0] * len(STAGES)
+        self._sums = np.zeros(len(STAGES), dtype=np.float64)
+        # observed from the probe, producer and nvmsgbroker threads
+        self._lock = threading.Lock()
+
+    def _add(self, k, seconds):
+        # called with _lock held
+        self._values[k, self._counts[k] % self.window] = seconds
+        self._counts[k] += 1
+        self._sums[k] += seconds
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            self._add(self._index[stage], seconds)
+
+    def observe_trace(self, trace, handoff_ts=0):
+        """Observes the stages of a (capture, pts, probe, serialize) trace
+        handed off at handoff_ts."""
+        capture, _, probe, serialize = trace[:4]
+        spans = ((capture, probe), (probe, serialize), (serialize, handoff_ts),
+                 (capture, handoff_ts))
+        with self._lock:
+            for k, (start, end) in zip(self._trace_stages, spans):
+                seconds = stage_seconds(start, end)
+                if seconds is not None:
+                    self._add(k, seconds)
+
+    def percentiles(self):
+        """Returns {stage: (count, [value of each quantile])} of the stages
+        observed so far, over the last window observations."""
+        with self._lock:
+            values = self._values.copy()
+            counts = list(self._counts)
+        result = {}
+        for k, stage in enumerate(STAGES):
+            n = min(counts[k], self.window)
+            if n:
+                result[stage] = (counts[k], np.quantile(
+                    values[k, :n], self.quantiles).tolist())
+        return result
+
+    def render(self, lines):
+        lines.append("# HELP {0} Event latency of each stage from frame "
+                     "capture to broker hand-off".format(self.name))
+        lines.append("# TYPE {0} summary".format(self.name))
+        observed = self.percentiles()
+        with self._lock:
+            sums = self._sums.copy()
+        for k, stage in enumerate(STAGES):
+            count, values = observed.get(stage, (0, None))
+            if values is not None:
+                for q, value in zip(self.quantiles, values):
+                    lines.append('{0}{{stage="{1}",quantile="{2}"}} {3}'.format(
+                        self.name, stage, q, repr(float(value))))
+            lines.append('{0}_sum{{stage="{1}"}} {2}'.format(
+                self.name, stage, repr(float(sums[k]))))
+            lines.append('{0}_count{{stage="{1}"}} {2}'.format(
+                self.name, stage, count))
+
+    def summary(self):
+        """One line per observed stage for the exit report."""
+        lines = []
+        for stage, (count, values) in self.percentiles().items():
+            lines.append("{0:<9} {1}".format(stage, ", ".join(
+                "p{0:g} {1:.1f} ms".format(q * 100, v * 1000)
+                for q, v in zip(self.quantiles, values)) +
+                " ({0} events)".format(count)))
+        return lines
+
+
+def _check_tracing():
+    from common.binary_payload import (new_event, encode_event_message,
+                                       decode_event_message,
+                                       json_event_message)
+    from common.metrics import MetricsRegistry
+    from common.producer import BatchingProducer, LocalBroker
+    import json
+
+    tracer = StageLatencies(window=100)
+    assert tracer.percentiles() == {}
+    for n in range(1, 201):
+        tracer.observe("probe", n / 1000.0)
+    count, (p50, p90, p99) = tracer.percentiles()["probe"]
+    # the window holds the last 100 values, 0.101 .. 0.2
+    assert count == 200 and abs(p50 - 0.1505) < 1e-9 and p99 < 0.2
+    tracer.observe_trace((0, 0, 5, 7), 9)
+    assert "pipeline" not in tracer.percentiles()
+    assert "total" not in tracer.percentiles()
+    assert tracer.percentiles()["handoff"][0] == 1
+
+    # an event from capture to the broker through the Python sink
+    tracer = StageLatencies()
+    registry = MetricsRegistry()
+    registry.register(tracer)
+    broker = LocalBroker()
+    producer = BatchingProducer(broker, linger=0.001)
+    producer.on_sent = lambda topic, partition, traces, now: [
+        tracer.observe_trace(trace, now) for trace in traces]
+    producer.start()
+    capture = trace_ns() - 80 * 1000000
+    probe = trace_ns()
+    event = new_event("device_test", "XYZ", {"straight": (1, 5)},
+                      trace=(capture, 3000000000, probe))
+    payload = encode_event_message(event)
+    assert event["trace"]["serializeTs"] >= probe
+    assert producer.send("t", b"device_test", payload,
+                         trace=tuple(event["trace"].values()))
+    assert producer.flush(timeout=5)
+    producer.close()
+    decoded = decode_event_message(broker.messages("t")[0][1])
+    assert decoded["trace"]["captureTs"] == capture
+    assert 79000 <= decoded["trace"]["captureToProbeUs"] <= 90000
+    observed = tracer.percentiles()
+    assert sorted(observed) == ["handoff", "pipeline", "serialize", "total"]
+    assert 0.079 < observed["total"][1][0] < 1.0
+    text = registry.render()
+    assert 'ds_event_latency_seconds_count{stage="total"} 1' in text
+    assert 'ds_event_latency_seconds_count{stage="probe"} 0' in text
+
+    full = json.loads(json_event_message(event))
+    assert full["trace"]["probeTs"] == probe
+    compact = json.loads(json_event_message(event, compact_trace=True))
+    assert compact["trace"][:2] == [capture, 3000000000]
+    assert "trace" not in json.loads(json_event_message(
+        new_event("device_test", "XYZ", {"straight": (1, 5)})))
+
+    # cost of one observation in the probe / sender threads
+    runs = 10000
+    start = time.perf_counter()
+    for _ in range(runs):
+        tracer.observe_trace((capture, 0, probe, probe + 1000), probe + 5000)
+    elapsed = time.perf_counter() - start
+    print("trace observation: {0:.2f} us/event".format(elapsed * 1e6 / runs))
+    for line in tracer.summary():
+        print(line)
+    print("tracing checks passed")
+
+
+if __name__ == "__main__":
+    _check_tracing()
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+
+################################################################################
+# SPDX-FileCopyrightText: Copyright (c) 2019-2021 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+################################################################################
+
+"""Replays a run.py --record log without a GPU or a pipeline.
+
+probe mode feeds every recorded batch through osd_sink_pad_buffer_probe of
+run.py with common.fake_pyds standing in for the bindings, msgconv mode
+feeds the line crossings of the log through libnvds_msgconv.so via ctypes.
+Both run as fast as they can and report events/sec, e.g.
+
+    python3 replay_bench.py --synthetic 4 --json
+    python3 replay_bench.py -l run.dsml --mode msgconv \\
+        --msgconv-lib /opt/nvidia/deepstream/deepstream/lib/libnvds_msgconv.so
+"""
+
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+from optparse import OptionParser
+from common.fake_pyds import FakePyds, FakeProbeInfo, make_batch
+from common.meta_log import MetaLogReader, write_synthetic_log
+
+MSCONV_CONFIG_FILE = "dstest4_msgconv_config.txt"
+PAYLOAD_TYPES = {"0": 0, "1": 1, "2": 257}
+
+
+def import_run(pyds):
+    # run.py imports gi and pyds at module level; the fake pyds always
+    # replaces the bindings, gi only when it is not installed.
+    try:
+        import gi
+        gi.require_version("Gst", "1.0")
+        from gi.repository import Gst
+    except (ImportError, ValueError):
+        gi = types.ModuleType("gi")
+        gi.require_version = lambda name, version: None
+        gi.repository = types.ModuleType("gi.repository")
+        gi.repository.GLib = types.ModuleType("GLib")
+        gi.repository.Gst = types.ModuleType("Gst")
+        gi.repository.Gst.PadProbeReturn = types.SimpleNamespace(OK=1)
+        sys.modules["gi"] = gi
+        sys.modules["gi.repository"] = gi.repository
+    sys.modules["pyds"] = pyds
+    import run
+    return run
+
+
+def read_log(path):
+    reader = MetaLogReader(path)
+    return reader.labels, list(reader)
+
+
+def bench_probe(labels, batches, options):
+    pyds = FakePyds()
+    run = import_run(pyds)
+    from common.analytics_config import AnalyticsLabels
+    from common.aggregator import WindowAggregator
+    from common.decimation import Decimator
+    from common.metrics import PipelineMetrics
+    from common.producer import BatchingProducer, LocalBroker
+    from common.routing import Router
+    from common.source_manager import SourceManager
+
+    num_streams = max([f["pad_index"] for b in batches for f in b] or [0]) + 1
+    run.analytics_labels = AnalyticsLabels(lc=labels)
+    run.sources = SourceManager(["stream{0}".format(i)
+                                 for i in range(num_streams)])
+    if options.window > 0:
+        run.aggregator = WindowAggregator(options.window)
+    if options.probe_interval > 1:
+        run.decimator = Decimator(options.probe_interval)
+    if options.sink == "local":
+        run.producer = BatchingProducer(LocalBroker()).start()
+        run.producer_topic = "bench"
+        run.router = Router([], run.producer_topic)
+        run.analytics_module_id = "bench"
+    if not options.no_metrics:
+        run.metrics = PipelineMetrics(num_streams)
+    pyds.event_msg_meta_pool_init(options.event_pool_size)
+
+    infos = [FakeProbeInfo(pyds.make_buffer(make_batch(b))) for b in batches]
+
+    def replay():
+        events = 0
+        if run.producer is not None:
+            # events went to the producer instead of the frames
+            events -= run.producer.stats["messages"]
+        for info in infos:
+            run.osd_sink_pad_buffer_probe(None, info, 0)
+            # downstream releases the attached metas once the buffer is sent
+            for frame_meta, user_meta in pyds.attached:
+                pyds.release_nvds_event_msg_meta(user_meta.user_meta_data)
+                frame_meta.remove_user_meta(user_meta)
+            events += len(pyds.attached)
+            del pyds.attached[:]
+        if run.producer is not None:
+            run.producer.flush()
+            events += run.producer.stats["messages"]
+        return events
+
+    with open(os.devnull, "w") as devnull, \
+            contextlib.redirect_stdout(devnull):
+        result = measure(replay, options.repeat)
+        if run.producer is not None:
+            run.producer.close()
+    return result
+
+
+def bench_msgconv(labels, batches, options):
+    from common.msgconv_ctypes import EventArray, Msgconv
+
+    arrays = []
+    for frames in batches:
+        # one event per frame with a crossing, carrying every label
+        events = [(options.sensor_id,
+                   dict((label, (f["objLCCurrCnt"][label],
+                                 f["objLCCumCnt"][label])) for label in labels))
+                  for f in frames if any(f.get("objLCCurrCnt", {}).values())]
+        if events:
+            arrays.append(EventArray(events))
+    msgconv = Msgconv(options.msgconv_lib, options.msgconv_config,
+                      PAYLOAD_TYPES[options.payload_type])
+
+    def generate():
+        total = 0
+        for events in arrays:
+            for i in range(len(events)):
+                msgconv.generate(events, i)
+            total += len(events)
+        return total
+
+    def generate_multiple():
+        total = 0
+        for events in arrays:
+            msgconv.generate_multiple(events)
+            total += len(events)
+        return total
+
+    try:
+        result = {"generate": measure(generate, options.repeat),
+                  "generate_multiple": measure(generate_multiple,
+                                               options.repeat)}
+    finally:
+        msgconv.close()
+    return result
+
+
+def measure(replay, repeat):
+    """Times repeat passes of replay(), which returns the events it
+    produced, then runs one more pass under tracemalloc.
+
+    net_blocks_per_event is the growth of the traced memory blocks over
+    that pass per event, what the probe keeps (pools, caches, leaks). It
+    is not an allocation count: temporaries freed within the pass do not
+    show up in it, only in peak_traced_bytes."""
+    replay()  # warm up caches and pools
+    start = time.perf_counter()
+    events = 0
+    for _ in range(repeat):
+        events += replay()
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    traced_events = replay()
+    after = tracemalloc.take_snapshot()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    net_blocks = sum(max(s.count_diff, 0) for s in stats)
+
+    return {"events": events // repeat,
+            "seconds": elapsed / repeat,
+            "events_per_sec": events / elapsed if elapsed else 0.0,
+            "peak_traced_bytes": peak,
+            "net_blocks_per_event":
+                net_blocks / float(traced_events or 1)}
+
+
+def print_result(name, result, batches):
+    print("{0}: {1} events in {2:.3f}s, {3:.0f} events/s, {4:.1f} us/batch, "
+          "{5:.2f} net blocks/event, peak {6} bytes traced".format(
+              name, result["events"], result["seconds"],
+              result["events_per_sec"],
+              result["seconds"] * 1e6 / max(batches, 1),
+              result["net_blocks_per_event"],
+              result["peak_traced_bytes"]))
+
+
+def main(args):
+    (options, args) = parse_args(args)
+    if not (options.log_file or options.synthetic):
+        print("Usage: python3 replay_bench.py -l <run.py --record file> | "
+              "--synthetic <streams>")
+        return 1
+    if options.mode == "msgconv" and not options.msgconv_lib:
+        print("--mode msgconv needs --msgconv-lib")
+        return 1
+
+    if options.log_file:
+        labels, batches = read_log(options.log_file)
+    else:
+        fd, path = tempfile.mkstemp(suffix=".dsml")
+        os.close(fd)
+        try:
+            write_synthetic_log(path, ["straight"], options.synthetic,
+                                options.batches, options.crossing_rate)
+            labels, batches = read_log(path)
+        finally:
+            os.remove(path)
+
+    if options.mode == "probe":
+        results = {"probe": bench_probe(labels, batches, options)}
+    else:
+        try:
+            results = bench_msgconv(labels, batches, options)
+        except (OSError, RuntimeError) as e:
+            print("Unable to load msgconv: {0}".format(e))
+            return 1
+    if options.json:
+        print(json.dumps(dict(results, batches=len(batches),
+                              frames=sum(len(b) for b in batches))))
+    else:
+        for name in sorted(results):
+            print_result(name, results[name], len(batches))
+    return 0
+
+
+def parse_args(args):
+    parser = OptionParser()
+    parser.add_option("-l", "--log-file", dest="log_file",
+                      help="Log written by run.py --record", metavar="FILE")
+    parser.add_option("", "--synthetic", dest="synthetic", type="int",
+                      default=0,
+                      help="Replay a synthetic log of N streams instead",
+                      metavar="N")
+    parser.add_option("", "--batches", dest="batches", type="int",
+                      default=1000,
+                      help="Batches of the synthetic log, default=1000",
+                      metavar="N")
+    parser.add_option("", "--crossing-rate", dest="crossing_rate",
+                      type="float", default=0.1,
+                      help="Line crossings per frame of the synthetic log, "
+                           "default=0.1", metavar="RATE")
+    parser.add_option("", "--mode", dest="mode", type="choice",
+                      choices=["probe", "msgconv"], default="probe",
+                      help="probe: run.py probe with fake bindings, "
+                           "msgconv: libnvds_msgconv.so, default=probe")
+    parser.add_option("", "--repeat", dest="repeat", type="int", default=3,
+                      help="Timed passes over the log, default=3",
+                      metavar="N")
+    parser.add_option("", "--window", dest="window", type="float",
+                      default=0.0,
+                      help="Probe mode: aggregate into windows of SECONDS "
+                           "(of wall-clock time, so a replay closes few)",
+                      metavar="SECONDS")
+    parser.add_option("", "--probe-interval", dest="probe_interval",
+                      type="int", default=1,
+                      help="Probe mode: inspect every Nth batch only, "
+                           "default=1", metavar="N")
+    parser.add_option("", "--sink", dest="sink", type="choice",
+                      choices=["msgbroker", "local"], default="msgbroker",
+                      help="Probe mode: attach event msg metas (msgbroker) "
+                           "or send through the producer to an in-process "
+                           "broker (local), default=msgbroker")
+    parser.add_option("", "--no-metrics", action="store_true",
+                      dest="no_metrics", default=False,
+                      help="Probe mode: do not collect probe metrics")
+    parser.add_option("", "--event-pool-size", dest="event_pool_size",
+                      type="int", default=256,
+                      help="Probe mode: event msg meta pool size, "
+                           "default=256", metavar="N")
+    parser.add_option("", "--msgconv-lib", dest="msgconv_lib",
+                      help="Msgconv mode: path of libnvds_msgconv.so",
+                      metavar="LIB")
+    parser.add_option("", "--msgconv-config", dest="msgconv_config",
+                      default=MSCONV_CONFIG_FILE,
+                      help="Msgconv mode: msgconv config file, "
+                           "default=" + MSCONV_CONFIG_FILE, metavar="FILE")
+    parser.add_option("-s", "--schema-type", dest="payload_type",
+                      type="choice", choices=["0", "1", "2"], default="0",
+                      help="Msgconv mode: 0 full, 1 minimal, 2 binary "
+                           "payload, default=0", metavar="<0|1|2>")
+    parser.add_option("", "--sensor-id", dest="sensor_id",
+                      default="device_test",
+                      help="Msgconv mode: sensor id of the events, "
+                           "default=device_test", metavar="ID")
+    parser.add_option("", "--json", action="store_true", dest="json",
+                      default=False, help="Print the results as JSON")
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
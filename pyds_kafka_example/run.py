@@ -17,9 +17,14 @@
 # limitations under the License.
 ################################################################################
 
+import functools
+import os
+import signal
 import sys
+import time
 import gi
 import configparser
+import numpy as np
 gi.require_version("Gst", "1.0")
 from gi.repository import GLib, Gst
 import sys
@@ -27,6 +32,28 @@ from optparse import OptionParser
 from common.is_aarch_64 import is_aarch64
 from common.bus_call import bus_call
 from common.utils import long_to_uint64
+from common.analytics_batch import (extract_analytics_batch,
+                                    extract_crossing_objects)
+from common.analytics_config import (AnalyticsLabels, read_analytics_config,
+                                     stream_config_file)
+from common.aggregator import WindowAggregator
+from common.source_manager import SourceManager, tiler_layout
+from common.metrics import PipelineMetrics, MetricsServer, MetricsFileDumper
+from common.ring_buffer import CountRing, EventWorker
+from common.binary_payload import (new_event, encode_event_message,
+                                   json_event_message, ANALYTICS_MODULE_KEYS)
+from common.producer import (BatchingProducer, KafkaTransport, LocalBroker,
+                             default_partitioner, parse_conn_str)
+from common.routing import (EvenPartitioner, Router, read_routes,
+                            read_sensor_ids)
+from common.spool import Spool, SpoolingProducer
+from common.meta_log import MetaLogWriter
+from common.decimation import Decimator
+from common.mux_tuner import MIN_FPS, MuxTuner, batch_pad_indices
+from common.tracing import StageLatencies, trace_ns
+from common.hot_reload import ConfigReloader
+from common.count_archive import CountArchive
+from common.msgconv_ctypes import DEFAULT_MSG2P_LIB, request_reload
 import pyds
 
 MAX_DISPLAY_LEN = 64
@@ -37,76 +64,292 @@ PGIE_CLASS_ID_PERSON = 2
 PGIE_CLASS_ID_ROADSIGN = 3
 MUXER_OUTPUT_WIDTH = 1920
 MUXER_OUTPUT_HEIGHT = 1080
-MUXER_BATCH_TIMEOUT_USEC = 4000000
+MUXER_BATCH_TIMEOUT_USEC = 40000
+TILED_OUTPUT_WIDTH = 1280
+TILED_OUTPUT_HEIGHT = 720
 input_file = None
+# SourceManager of the input URIs, pad_index i is sources.uris[i]
+sources = None
 schema_type = 0
+# nvmsgconv payload-type values; the binary payload uses the custom slot (257)
+SCHEMA_TYPES = {"0": 0, "1": 1, "2": 257}
 proto_lib = None
 conn_str = "localhost;2181;testTopic"
 cfg_file = None
 topic = None
 no_display = False
+event_pool_size = 256
+no_probe = False
+frame_interval = 30
+# max buffers in queue1 in front of nvmsgconv; it leaks the oldest buffers
+# instead of backpressuring the video path, 0 = unlimited
+msg_queue_size = 30
+# line-crossing window aggregator, None sends one message per frame
+aggregator = None
+# events published at EOS, attached by msgconv_sink_event_probe to a last
+# buffer for nvmsgconv
+held_events = []
+# PipelineMetrics of the probe, None with --no-metrics
+metrics = None
+metrics_port = 0
+metrics_file = None
+metrics_interval = 10.0
+# --ring-size mode: the probe pushes counts to ring, worker builds events
+ring = None
+worker = None
+# --sink python/local: BatchingProducer replacing nvmsgconv + nvmsgbroker
+producer = None
+producer_topic = None
+# Router picking the topics of each event, see --routes
+router = None
+# analyticsModule id and description / source / version of the payloads
+# sent by the producer, from the [analytics0] group of the msgconv config
+analytics_module_id = None
+analytics_module_info = {}
+# MetaLogWriter of --record, None otherwise
+recorder = None
+# CountArchive of --archive-dir, None otherwise
+archive = None
+# most crossing objects per frame message with --object-events, 0 disables
+object_events = 0
+# Decimator of --probe-interval, None inspects every batch
+decimator = None
+# MuxTuner of --mux-tune retuning streammux every mux_tune_interval seconds
+mux_tuner = None
+mux_tune_interval = 5.0
+# StageLatencies of --trace, None sends events without a trace
+tracer = None
+trace_compact = False
+# --watch-config: labels of a reloaded analytics config, swapped in by the
+# probe at the next batch
+watch_config = False
+pending_labels = None
 
 PGIE_CONFIG_FILE = "dstest4_pgie_config.txt"
 MSCONV_CONFIG_FILE = "dstest4_msgconv_config.txt"
 
 TRACKER_CONFIG_FILE = "dsnvanalytics_tracker_config.txt"
+ANALYTICS_CONFIG_FILE = "config_nvdsanalytics.txt"
+# custom event nvstreammux sends downstream when one of its streams ends
+NVEVENT_STREAM_EOS = "nv-stream-eos"
 pgie_classes_str = ["Vehicle", "TwoWheeler", "Person", "Roadsign"]
-
-
-# Callback function for deep-copying an NvDsEventMsgMeta struct
-def meta_copy_func(data, user_data):
-    # Cast data to pyds.NvDsUserMeta
-    user_meta = pyds.NvDsUserMeta.cast(data)
-    src_meta_data = user_meta.user_meta_data
-    # Cast src_meta_data to pyds.NvDsEventMsgMeta
-    srcmeta = pyds.NvDsEventMsgMeta.cast(src_meta_data)
-    # Duplicate the memory contents of srcmeta to dstmeta
-    # First use pyds.get_ptr() to get the C address of srcmeta, then
-    # use pyds.memdup() to allocate dstmeta and copy srcmeta into it.
-    # pyds.memdup returns C address of the allocated duplicate.
-    dstmeta_ptr = pyds.memdup(pyds.get_ptr(srcmeta),
-                              sys.getsizeof(pyds.NvDsEventMsgMeta))
-    # Cast the duplicated memory to pyds.NvDsEventMsgMeta
-    dstmeta = pyds.NvDsEventMsgMeta.cast(dstmeta_ptr)
-
-    # Duplicate contents of ts field. Note that reading srcmeat.ts
-    # returns its C address. This allows to memory operations to be
-    # performed on it.
-    dstmeta.ts = pyds.memdup(srcmeta.ts, MAX_TIME_STAMP_LEN + 1)
-
-    if srcmeta.objSignature.size > 0:
-        dstmeta.objSignature.signature = pyds.memdup(
-            srcmeta.objSignature.signature, srcmeta.objSignature.size)
-        dstmeta.objSignature.size = srcmeta.objSignature.size
-
-    return dstmeta
-
-
-# Callback function for freeing an NvDsEventMsgMeta instance
-def meta_free_func(data, user_data):
-    user_meta = pyds.NvDsUserMeta.cast(data)
-    srcmeta = pyds.NvDsEventMsgMeta.cast(user_meta.user_meta_data)
-
-    # pyds.free_buffer takes C address of a buffer and frees the memory
-    # It"s a NOP if the address is NULL
-    pyds.free_buffer(srcmeta.ts)
-
-    if srcmeta.objSignature.size > 0:
-        pyds.free_buffer(srcmeta.objSignature.signature)
-        srcmeta.objSignature.size = 0
-
-
+# nvdsanalytics config of the pipeline, see --analytics-config
+analytics_config_file = ANALYTICS_CONFIG_FILE
+# label axis of the per-batch analytics count arrays
+analytics_labels = AnalyticsLabels.from_config(ANALYTICS_CONFIG_FILE)
 
 
 def generate_event_msg_meta(data):
     meta = pyds.NvDsEventMsgMeta.cast(data)
-    meta.ts = pyds.alloc_buffer(MAX_TIME_STAMP_LEN + 1)
+    # metas from acquire_nvds_event_msg_meta() carry inline storage for ts
     pyds.generate_ts_rfc3339(meta.ts, MAX_TIME_STAMP_LEN)
 
 
     return meta
 
 
+def frame_trace(frame_meta, probe_ts):
+    # --trace: (capture, buffer PTS, probe) ns of the event of a frame
+    if not probe_ts:
+        return None
+    return (frame_meta.ntp_timestamp, frame_meta.buf_pts, probe_ts)
+
+
+def attach_event_msg_meta(batch_meta, frame_meta, sensor_id, lc_curr, lc_cum,
+                          crossings=None, rows=None, probe_ts=0):
+    # lc_curr / lc_cum hold the counts of every analytics_labels.lc label,
+    # crossings[rows] the objects that crossed a line in the frame
+    # Acquiring an NvDsEventMsgMeta instance from the bindings pool and
+    # getting reference to it. The underlying memory is not manged by
+    # Python so that downstream plugins can access it. Otherwise
+    # the garbage collector will free it when this probe exits.
+    msg_meta = pyds.acquire_nvds_event_msg_meta()
+    # device ID of the source, see --sensor-id
+    msg_meta.sensorStr = sensor_id
+
+    # all labels go into one meta, stored inline in pooled metas
+    msg_meta.set_lc_counts(analytics_labels.lc, lc_curr, lc_cum)
+    if crossings is not None:
+        msg_meta.set_lc_objects(crossings.object_id[rows],
+                                crossings.class_id[rows],
+                                crossings.bbox[rows], crossings.label[rows])
+    trace = frame_trace(frame_meta, probe_ts)
+    if trace is not None:
+        # nvmsgconv adds its serialization time and writes the trace
+        msg_meta.set_trace(*trace, compact=trace_compact)
+
+    msg_meta = generate_event_msg_meta(msg_meta)
+    user_event_meta = pyds.nvds_acquire_user_meta_from_pool(
+        batch_meta)
+    if user_event_meta:
+        user_event_meta.user_meta_data = msg_meta
+        user_event_meta.base_meta.meta_type = pyds.NvDsMetaType.NVDS_EVENT_MSG_META
+        # Use the native copy / release functions of the bindings for
+        # the event msg meta, so copies and frees downstream neither
+        # call back into Python nor take the GIL.
+        pyds.set_event_msg_meta_callbacks(user_event_meta)
+        pyds.nvds_add_user_meta_to_frame(frame_meta,
+                                            user_event_meta)
+        return True
+    pyds.release_nvds_event_msg_meta(msg_meta)
+    print("Error in attaching event meta to buffer\n")
+    return False
+
+
+def send_event(pad_index, counts, crossings=None, rows=None, trace=None):
+    # --sink python: hands one event to the producer, encoded like the
+    # nvmsgconv payload of the schema type (binary, otherwise full JSON).
+    sensor_id = sources.sensor_id(pad_index)
+    objects = None
+    if crossings is not None:
+        objects = [(tracking_id, class_id, analytics_labels.lc[label],
+                    tuple(bbox)) for tracking_id, class_id, label, bbox in
+                   zip(crossings.object_id[rows].tolist(),
+                       crossings.class_id[rows].tolist(),
+                       crossings.label[rows].tolist(),
+                       crossings.bbox[rows].tolist())]
+    event = new_event(sensor_id, analytics_module_id, counts,
+                      crossing_objects=objects, trace=trace)
+    if schema_type == SCHEMA_TYPES["2"]:
+        payload = encode_event_message(event)
+    else:
+        payload = json_event_message(event, trace_compact,
+                                     analytics_module_info).encode("utf-8")
+    if trace is not None:
+        # with the serialization time the encoder stamped
+        trace = tuple(event["trace"].values())
+    key = sensor_id.encode("utf-8")
+    ok = True
+    for event_topic in router.topics(sensor_id, counts):
+        ok = producer.send(event_topic, key, payload, trace=trace) and ok
+    return ok
+
+
+def publish_events(batch_meta, batch, events, probe_ts=0):
+    # Publishes each (pad_index, {label: (current, cumulative)}) event, by
+    # attaching it to the frame of its stream in this batch (or the first
+    # frame if the stream has none) or through the producer. Returns the
+    # events published per frame; a --trace trace is that of the frame.
+    published = np.zeros(len(batch), dtype=np.uint32)
+    pad_frames = dict((p, i) for i, p in
+                      reversed(list(enumerate(batch.pad_index.tolist()))))
+    for pad_index, counts in events:
+        i = pad_frames.get(pad_index, 0)
+        if producer is not None:
+            trace = None
+            if probe_ts:
+                trace = frame_trace(batch.get_frame_meta(pyds, i), probe_ts)
+            ok = send_event(pad_index, counts, trace=trace)
+        else:
+            pairs = [counts.get(label, (0, 0)) for label in analytics_labels.lc]
+            curr = [c for c, _ in pairs]
+            cum = [c for _, c in pairs]
+            ok = attach_event_msg_meta(batch_meta,
+                                       batch.get_frame_meta(pyds, i),
+                                       sources.sensor_id(pad_index), curr, cum,
+                                       probe_ts=probe_ts)
+        if ok:
+            published[i] += 1
+    return published
+
+
+def publish_windows(batch_meta, batch, probe_ts=0):
+    # Feeds the frames of the batch to the aggregator and attaches one event
+    # msg meta per closed window. Returns the events attached per frame.
+    now = time.monotonic()
+    for i in batch.frames_with_crossings():
+        aggregator.add(int(batch.pad_index[i]),
+                       dict(zip(analytics_labels.lc,
+                                zip(batch.lc_curr[i].tolist(),
+                                    batch.lc_cum[i].tolist()))),
+                       now)
+    if not len(batch):
+        # windows stay open until a batch with a frame to attach to
+        return np.zeros(0, dtype=np.uint32)
+    events = []
+    for w in aggregator.flush(now):
+        print("Linecrossing window: {0}".format(w))
+        events.append((w.pad_index, w.counts))
+    return publish_events(batch_meta, batch, events, probe_ts)
+
+
+def build_events(rows, now):
+    # Runs on the EventWorker thread in --ring-size mode: turns the count
+    # rows the probe pushed into (pad_index, counts) events.
+    events = []
+    for row in rows:
+        pad_index = int(row["pad_index"])
+        counts = dict(zip(analytics_labels.lc,
+                          zip(row["lc_curr"].tolist(), row["lc_cum"].tolist())))
+        if aggregator is not None:
+            aggregator.add(pad_index, counts, float(row["ts"]))
+        else:
+            print("Linecrossing stream {0} frame {1}: {2}".format(
+                pad_index, int(row["frame_num"]), counts))
+            events.append((pad_index, counts))
+    if aggregator is not None:
+        for w in aggregator.flush(now):
+            print("Linecrossing window: {0}".format(w))
+            events.append((w.pad_index, w.counts))
+    return events
+
+
+def frame_crossing_rows(crossings, i):
+    # rows of the objects that crossed a line in frame i, at most
+    # --object-events of them
+    rows = crossings.frame_rows(i)
+    return slice(rows.start, min(rows.stop, rows.start + object_events))
+
+
+def publish_frames(batch_meta, batch, probe_ts=0):
+    # Attaches one event msg meta per frame with a line crossing, with the
+    # objects that crossed if --object-events is set. Returns the events
+    # attached per frame.
+    events = np.zeros(len(batch), dtype=np.uint32)
+    frames = batch.frames_with_crossings()
+    crossings = rows = None
+    if object_events and len(frames):
+        crossings = extract_crossing_objects(pyds, batch_meta, analytics_labels)
+    for i in frames:
+        # line crossing current / cumulative count of frame, keyed by label
+        obj_lc_curr_cnt = dict(zip(analytics_labels.lc, batch.lc_curr[i].tolist()))
+        obj_lc_cum_cnt = dict(zip(analytics_labels.lc, batch.lc_cum[i].tolist()))
+        print("Linecrossing Cumulative: {0}".format(obj_lc_cum_cnt))
+        print("Linecrossing Current Frame: {0}".format(obj_lc_curr_cnt))
+
+        # Ideally NVDS_EVENT_MSG_META should be attached to buffer by the
+        # component implementing detection / recognition logic.
+        # Here it demonstrates how to use / attach that meta data.
+        # A message is sent for every frame with a line crossing.
+        pad_index = int(batch.pad_index[i])
+        if crossings is not None:
+            rows = frame_crossing_rows(crossings, i)
+        if producer is not None:
+            trace = None
+            if probe_ts:
+                trace = frame_trace(batch.get_frame_meta(pyds, i), probe_ts)
+            ok = send_event(pad_index, dict(
+                (label, (obj_lc_curr_cnt[label], obj_lc_cum_cnt[label]))
+                for label in analytics_labels.lc), crossings, rows, trace)
+        else:
+            frame_meta = batch.get_frame_meta(pyds, i)
+            ok = attach_event_msg_meta(batch_meta, frame_meta,
+                                       sources.sensor_id(pad_index),
+                                       batch.lc_curr[i], batch.lc_cum[i],
+                                       crossings, rows, probe_ts)
+        if ok:
+            events[i] += 1
+    return events
+
+
+def build_and_send_events(rows, now):
+    # --ring-size with --sink python: the worker publishes itself, nothing
+    # goes back to the probe
+    for pad_index, counts in build_events(rows, now):
+        send_event(pad_index, counts)
+    return []
+
+
 # osd_sink_pad_buffer_probe  will extract metadata received on OSD sink pad
 # and update params for drawing rectangle, object information etc.
 # IMPORTANT NOTE:
@@ -115,18 +358,15 @@ def generate_event_msg_meta(data):
 # b) loops inside probe() callback could be costly in python.
 #    So users shall optimize according to their use-case.
 def osd_sink_pad_buffer_probe(pad, info, u_data):
-    frame_number = 0
-    # Intiallizing object counter with 0.
-    obj_counter = {
-        PGIE_CLASS_ID_VEHICLE: 0,
-        PGIE_CLASS_ID_PERSON: 0,
-        PGIE_CLASS_ID_BICYCLE: 0,
-        PGIE_CLASS_ID_ROADSIGN: 0
-    }
     gst_buffer = info.get_buffer()
     if not gst_buffer:
         print("Unable to get GstBuffer ")
         return
+    if decimator is not None and decimator.skip():
+        # its crossings come with the next inspected frame of each stream
+        if metrics is not None:
+            metrics.skipped_batches.inc()
+        return Gst.PadProbeReturn.OK
 
     # Retrieve batch metadata from the gst_buffer
     # Note that pyds.gst_buffer_get_nvds_batch_meta() expects the
@@ -134,109 +374,265 @@ def osd_sink_pad_buffer_probe(pad, info, u_data):
     batch_meta = pyds.gst_buffer_get_nvds_batch_meta(hash(gst_buffer))
     if not batch_meta:
         return Gst.PadProbeReturn.OK
+
+    if pending_labels is not None:
+        apply_pending_labels()
+
+    probe_start = time.perf_counter()
+    probe_ts = trace_ns() if tracer is not None else 0
+    # Gather the analytics counts of all frames in the batch with a single
+    # call instead of walking frame_meta_list / frame_user_meta_list here.
+    batch = extract_analytics_batch(pyds, batch_meta, analytics_labels)
+    if recorder is not None:
+        recorder.write_batch(pyds, batch)
+    if decimator is not None:
+        # crossings since the last inspected frame of each stream
+        batch.lc_curr = decimator.reconcile(batch)
+    if archive is not None:
+        archive.add_batch(batch, sources.sensor_id, analytics_labels.lc,
+                          int(time.time() * 1000))
+
+    if worker is not None:
+        # copy the counts for the worker and attach what it built so far
+        dropped = ring.push(batch, batch.frames_with_crossings())
+        if dropped and metrics is not None:
+            metrics.ring_dropped.inc(value=dropped)
+        if len(batch):
+            events = publish_events(batch_meta, batch, worker.take_events(),
+                                    probe_ts)
+        else:
+            events = np.zeros(0, dtype=np.uint32)
+    elif aggregator is not None:
+        events = publish_windows(batch_meta, batch, probe_ts)
+    else:
+        events = publish_frames(batch_meta, batch, probe_ts)
+
+    probe_seconds = time.perf_counter() - probe_start
+    if metrics is not None:
+        metrics.observe_batch(batch, events, probe_seconds)
+    if tracer is not None:
+        tracer.observe("probe", probe_seconds)
+
+    return Gst.PadProbeReturn.OK
+
+
+def msgbroker_sink_pad_buffer_probe(pad, info, u_data):
+    # --trace with nvmsgbroker: nvmsgconv stamped the serialization time
+    # into the traces of the event msg metas of the buffer, it now goes to
+    # the broker
+    gst_buffer = info.get_buffer()
+    if not gst_buffer:
+        return Gst.PadProbeReturn.OK
+    batch_meta = pyds.gst_buffer_get_nvds_batch_meta(hash(gst_buffer))
+    if not batch_meta:
+        return Gst.PadProbeReturn.OK
+    handoff_ts = trace_ns()
     l_frame = batch_meta.frame_meta_list
     while l_frame is not None:
-        try:
-            # Note that l_frame.data needs a cast to pyds.NvDsFrameMeta
-            # The casting is done by pyds.NvDsFrameMeta.cast()
-            # The casting also keeps ownership of the underlying memory
-            # in the C code, so the Python garbage collector will leave
-            # it alone.
-            frame_meta = pyds.NvDsFrameMeta.cast(l_frame.data)
-        except StopIteration:
-            continue
-
+        frame_meta = pyds.NvDsFrameMeta.cast(l_frame.data)
         l_user = frame_meta.frame_user_meta_list
-        source_id = frame_meta.pad_index
-        frame_number = frame_meta.frame_num
-
-        # Short example of attribute access for frame_meta:
-        # print("Frame Number is ", frame_meta.frame_num)
-        # print("Source id is ", frame_meta.source_id)
-        # print("Batch id is ", frame_meta.batch_id)
-        # print("Source Frame Width ", frame_meta.source_frame_width)
-        # print("Source Frame Height ", frame_meta.source_frame_height)
-        # print("Num object meta ", frame_meta.num_obj_meta)
-
-        while l_user:
-            try:
-                user_meta = pyds.NvDsUserMeta.cast(l_user.data)
-                if user_meta.base_meta.meta_type == pyds.nvds_get_user_meta_type("NVIDIA.DSANALYTICSFRAME.USER_META"):
-                    user_meta_data = pyds.NvDsAnalyticsFrameMeta.cast(
-                        user_meta.user_meta_data)
-
-                    if user_meta_data.objLCCumCnt: print("Linecrossing Cumulative: {0}".format(user_meta_data.objLCCumCnt))
-                    if user_meta_data.objLCCurrCnt: print("Linecrossing Current Frame: {0}".format(user_meta_data.objLCCurrCnt))
-
-                    # line crossing current count of frame
-                    obj_lc_curr_cnt = user_meta_data.objLCCurrCnt
-                    # line crossing cumulative count 
-                    obj_lc_cum_cnt = user_meta_data.objLCCumCnt
-
-
-            
-                    # Ideally NVDS_EVENT_MSG_META should be attached to buffer by the
-                    # component implementing detection / recognition logic.
-                    # Here it demonstrates how to use / attach that meta data.
-                    # Frequency of messages to be send will be based on use case.
-                    # Here message is being sent for first object every 30 frames.
-
-                    # Allocating an NvDsEventMsgMeta instance and getting
-                    # reference to it. The underlying memory is not manged by
-                    # Python so that downstream plugins can access it. Otherwise
-                    # the garbage collector will free it when this probe exits.
-                    curr_cnt_sum = sum([ obj_lc_curr_cnt[i] for i in obj_lc_curr_cnt])
-                    # if frame_number % 30 == 0:
-                    if curr_cnt_sum > 0:
-                        msg_meta = pyds.alloc_nvds_event_msg_meta()
-                        # you can assign your own device ID here
-                        msg_meta.sensorStr = "device_test"
-
-                        if obj_lc_curr_cnt.get("straight"):  msg_meta.lc_curr_straight = obj_lc_curr_cnt["straight"]
-                        if obj_lc_cum_cnt.get("straight") :  msg_meta.lc_cum_straight = obj_lc_cum_cnt["straight"] 
-
-                        msg_meta = generate_event_msg_meta(msg_meta)
-                        user_event_meta = pyds.nvds_acquire_user_meta_from_pool(
-                            batch_meta)
-                        if user_event_meta:
-                            user_event_meta.user_meta_data = msg_meta
-                            user_event_meta.base_meta.meta_type = pyds.NvDsMetaType.NVDS_EVENT_MSG_META
-                            # Setting callbacks in the event msg meta. The bindings
-                            # layer will wrap these callables in C functions.
-                            # Currently only one set of callbacks is supported.
-                            pyds.user_copyfunc(user_event_meta, meta_copy_func)
-                            pyds.user_releasefunc(user_event_meta, meta_free_func)
-                            pyds.nvds_add_user_meta_to_frame(frame_meta,
-                                                                user_event_meta)
-                        else:
-                            print("Error in attaching event meta to buffer\n")
-
-            except StopIteration:
-                continue
-            try:
-                l_user = l_user.next
-            except StopIteration:
-                break
-
-        # Update frame rate through this probe
-        # stream_index = "stream{0}".format(frame_meta.pad_index)
-        # global perf_data
-        # perf_data.update_fps(stream_index)
+        while l_user is not None:
+            user_meta = pyds.NvDsUserMeta.cast(l_user.data)
+            if user_meta.base_meta.meta_type == \
+                    pyds.NvDsMetaType.NVDS_EVENT_MSG_META:
+                trace = pyds.NvDsEventMsgMeta.cast(
+                    user_meta.user_meta_data).trace
+                if trace[2]:
+                    tracer.observe_trace(trace, handoff_ts)
+            l_user = l_user.next
+        l_frame = l_frame.next
+    return Gst.PadProbeReturn.OK
+
+
+def apply_pending_labels():
+    # --watch-config, probe thread: switch the label axis between batches
+    global analytics_labels
+    global pending_labels
+    labels, pending_labels = pending_labels, None
+    if decimator is not None:
+        decimator.relabel(analytics_labels.lc, labels.lc)
+    analytics_labels = labels
+
+
+def reload_analytics_config(nvanalytics, path):
+    # --watch-config: hands the new lines to nvdsanalytics, which keeps
+    # running; the probe picks up changed labels at its next batch
+    global pending_labels
+    labels = AnalyticsLabels.from_config(path)
+    if not (labels.lc or labels.roi or labels.oc):
+        print("Reload: no analytics rules in {0}".format(path))
+        return False
+    changed = labels.lc != analytics_labels.lc
+    if changed and (ring is not None or recorder is not None):
+        print("Reload: --ring-size and --record cannot change the "
+              "line-crossing labels while running")
+        return False
+    pspec = nvanalytics.find_property("config-file")
+    if not pspec.flags & Gst.PARAM_MUTABLE_PLAYING:
+        print("Reload: nvdsanalytics cannot change config-file while "
+              "playing")
+        return False
+    nvanalytics.set_property("config-file",
+                             stream_config_file(path, len(sources)))
+    if changed or labels.roi != analytics_labels.roi or \
+            labels.oc != analytics_labels.oc:
+        pending_labels = labels
+    print("Reloaded {0}: lines {1}".format(path, ", ".join(labels.lc)))
+    return True
+
+
+def read_analytics_module(path):
+    # the analyticsModule members nvmsgconv takes from [analytics0]
+    global analytics_module_id
+    global analytics_module_info
+    config = read_analytics_config(path)
+    analytics_module_id = config.get("analytics0", "id", fallback=None)
+    analytics_module_info = dict(
+        (key, config.get("analytics0", key, fallback=""))
+        for key in ANALYTICS_MODULE_KEYS)
+
+
+def reload_msgconv_config(msgconv, path):
+    # --watch-config: new sensor ids for the probe; nvmsgconv swaps in the
+    # sensor / place / analytics groups before its next payload
+    changed = sources.update_sensor_ids(read_sensor_ids(path))
+    if producer is not None:
+        read_analytics_module(path)
+    else:
         try:
-            l_frame = l_frame.next
-        except StopIteration:
-            break
+            request_reload(msgconv.get_property("msg2p-lib") or
+                           DEFAULT_MSG2P_LIB)
+        except (OSError, AttributeError) as e:
+            print("Reload: the msgconv library cannot reload: {0}".format(e))
+            return False
+    print("Reloaded {0}: {1}".format(path, ", ".join(
+        "stream {0} is {1}".format(i, sensor_id)
+        for i, sensor_id in sorted(changed.items())) or "same sensor ids"))
+    return True
+
+
+def observe_sent_traces(topic, partition, traces, handoff_ts):
+    # --trace with the producer: a batch reached the transport
+    for trace in traces:
+        tracer.observe_trace(trace, handoff_ts)
+
+
+def streammux_sink_event_probe(pad, info, pad_index):
+    # --probe-interval: EOS or a flush reached streammux sink_<pad_index>,
+    # inspect every batch until the last frames of the stream went by
+    event = info.get_event()
+    if event.type in (Gst.EventType.EOS, Gst.EventType.FLUSH_STOP):
+        decimator.hold(pad_index)
+    return Gst.PadProbeReturn.OK
+
+
+def take_held_events():
+    # EOS or shutdown: the events of the rows still in the --ring-size ring
+    # and of the --window windows still open
+    events = []
+    if worker is not None:
+        # once stopped the aggregator is no longer used by the worker thread
+        worker.stop()
+        events.extend(worker.take_events())
+    if aggregator is not None:
+        for w in aggregator.flush_all():
+            print("Linecrossing window: {0}".format(w))
+            events.append((w.pad_index, w.counts))
+    return events
+
+
+def publish_held_events():
+    # EOS on the nvdsanalytics src pad, after its last buffer: the producer
+    # sends the held events now, nvmsgconv gets them with the EOS
+    events = take_held_events()
+    if producer is not None:
+        for pad_index, counts in events:
+            send_event(pad_index, counts)
+    else:
+        held_events.extend(events)
+
+
+def msgconv_sink_event_probe(pad, info, u_data):
+    # Runs before nvmsgconv handles the EOS: chains one more buffer, without
+    # video frames, carrying the held events so they are sent ahead of it
+    global held_events
+    if info.get_event().type != Gst.EventType.EOS or not held_events:
+        return Gst.PadProbeReturn.OK
+    events, held_events = held_events, []
+    pad_indices = sorted(set(pad_index for pad_index, _ in events))
+    buffer = Gst.Buffer.new()
+    pyds.gst_buffer_add_event_batch_meta(hash(buffer), pad_indices)
+    batch_meta = pyds.gst_buffer_get_nvds_batch_meta(hash(buffer))
+    frames = {}
+    l_frame = batch_meta.frame_meta_list
+    while l_frame is not None:
+        frame_meta = pyds.NvDsFrameMeta.cast(l_frame.data)
+        frames[frame_meta.pad_index] = frame_meta
+        l_frame = l_frame.next
+    for pad_index, counts in events:
+        pairs = [counts.get(label, (0, 0)) for label in analytics_labels.lc]
+        attach_event_msg_meta(batch_meta, frames[pad_index],
+                              sources.sensor_id(pad_index),
+                              [c for c, _ in pairs], [c for _, c in pairs])
+    print("Publishing {0} held events at EOS".format(len(events)))
+    pad.chain(buffer)
+    return Gst.PadProbeReturn.OK
 
 
+def analytics_src_event_probe(pad, info, u_data):
+    # nvstreammux sends its stream-eos event after the last frame of the
+    # stream, EOS after the last frame of all of them
+    event = info.get_event()
+    if event.type == Gst.EventType.EOS:
+        if decimator is not None:
+            decimator.release()
+        publish_held_events()
+        return Gst.PadProbeReturn.OK
+    if decimator is None:
+        return Gst.PadProbeReturn.OK
+    structure = event.get_structure()
+    if structure is not None and structure.has_name(NVEVENT_STREAM_EOS):
+        parsed, source_id = structure.get_uint("source-id")
+        if parsed:
+            decimator.release(source_id)
     return Gst.PadProbeReturn.OK
 
 
+def streammux_src_pad_buffer_probe(pad, info, u_data):
+    # --mux-tune: count the frames of each source in the batch
+    gst_buffer = info.get_buffer()
+    if gst_buffer:
+        batch_meta = pyds.gst_buffer_get_nvds_batch_meta(hash(gst_buffer))
+        if batch_meta:
+            mux_tuner.observe(time.monotonic(),
+                              batch_pad_indices(pyds, batch_meta))
+    return Gst.PadProbeReturn.OK
+
+
+def retune_streammux(streammux):
+    # GLib timeout of --mux-tune, sets the properties streammux allows to
+    # change while playing
+    changes = mux_tuner.retune(time.monotonic())
+    for name, value in sorted(changes.items()):
+        pspec = streammux.find_property(name)
+        if not pspec.flags & Gst.PARAM_MUTABLE_PLAYING:
+            print("streammux {0} cannot change while playing".format(name))
+            if name == "batch-size":
+                mux_tuner.tune_batch_size = False
+                mux_tuner.batch_size = streammux.get_property(name)
+            continue
+        streammux.set_property(name, value)
+        print("streammux {0} = {1} (fill {2:.2f}, {3} sources live)".format(
+            name, value, mux_tuner.fill,
+            int((mux_tuner.rates >= MIN_FPS).sum())))
+    return True
+
+
 def main(args):
     Gst.init(None)
 
-    # registering callbacks
-    pyds.register_user_copyfunc(meta_copy_func)
-    pyds.register_user_releasefunc(meta_free_func)
+    # preallocate the event msg metas attached by the probe
+    pyds.event_msg_meta_pool_init(event_pool_size)
 
     print("Creating Pipeline \n ")
 
@@ -245,21 +641,6 @@ def main(args):
     if not pipeline:
         sys.stderr.write(" Unable to create Pipeline \n")
 
-    print("Creating Source \n ")
-    source = Gst.ElementFactory.make("filesrc", "file-source")
-    if not source:
-        sys.stderr.write(" Unable to create Source \n")
-
-    print("Creating H264Parser \n")
-    h264parser = Gst.ElementFactory.make("h264parse", "h264-parser")
-    if not h264parser:
-        sys.stderr.write(" Unable to create h264 parser \n")
-
-    print("Creating Decoder \n")
-    decoder = Gst.ElementFactory.make("nvv4l2decoder", "nvv4l2-decoder")
-    if not decoder:
-        sys.stderr.write(" Unable to create Nvv4l2 Decoder \n")
-
     print("Creating Streammux \n")
     streammux = Gst.ElementFactory.make("nvstreammux", "Stream-muxer")
     if not streammux:
@@ -280,7 +661,21 @@ def main(args):
     nvanalytics = Gst.ElementFactory.make("nvdsanalytics", "analytics")
     if not nvanalytics:
         sys.stderr.write(" Unable to create nvanalytics \n")
-    nvanalytics.set_property("config-file", "config_nvdsanalytics.txt")
+    # one rule group per stream, stream-0 groups are reused for the others
+    nvanalytics.set_property("config-file", stream_config_file(
+        analytics_config_file, len(sources)))
+
+    tiler = None
+    if len(sources) > 1:
+        print("Creating tiler \n ")
+        tiler = Gst.ElementFactory.make("nvmultistreamtiler", "nvtiler")
+        if not tiler:
+            sys.stderr.write(" Unable to create tiler \n")
+        tiler_rows, tiler_columns = tiler_layout(len(sources))
+        tiler.set_property("rows", tiler_rows)
+        tiler.set_property("columns", tiler_columns)
+        tiler.set_property("width", TILED_OUTPUT_WIDTH)
+        tiler.set_property("height", TILED_OUTPUT_HEIGHT)
 
     print("Creating nvvidconv \n ")
     nvvidconv = Gst.ElementFactory.make("nvvideoconvert", "convertor")
@@ -292,25 +687,34 @@ def main(args):
     if not nvosd:
         sys.stderr.write(" Unable to create nvosd \n")
 
-    print("Creating nvmsgconv \n ")
-    msgconv = Gst.ElementFactory.make("nvmsgconv", "nvmsg-converter")
-    if not msgconv:
-        sys.stderr.write(" Unable to create msgconv \n")
+    # --sink python publishes from Python, without the broker branch
+    if producer is None:
+        print("Creating nvmsgconv \n ")
+        msgconv = Gst.ElementFactory.make("nvmsgconv", "nvmsg-converter")
+        if not msgconv:
+            sys.stderr.write(" Unable to create msgconv \n")
     
-    print("Creating nvmsgbroker \n ")
-    msgbroker = Gst.ElementFactory.make("nvmsgbroker", "nvmsg-broker")
-    if not msgbroker:
-        sys.stderr.write(" Unable to create msgbroker \n")
+        print("Creating nvmsgbroker \n ")
+        msgbroker = Gst.ElementFactory.make("nvmsgbroker", "nvmsg-broker")
+        if not msgbroker:
+            sys.stderr.write(" Unable to create msgbroker \n")
 
     print("Creating tee\n ")
     tee = Gst.ElementFactory.make("tee", "nvsink-tee")
     if not tee:
         sys.stderr.write(" Unable to create tee \n")
 
-    print("Creating queue1\n ")
-    queue1 = Gst.ElementFactory.make("queue", "nvtee-que1")
-    if not queue1:
-        sys.stderr.write(" Unable to create queue1 \n")
+    if producer is None:
+        print("Creating queue1\n ")
+        queue1 = Gst.ElementFactory.make("queue", "nvtee-que1")
+        if not queue1:
+            sys.stderr.write(" Unable to create queue1 \n")
+        if msg_queue_size:
+            queue1.set_property("max-size-buffers", msg_queue_size)
+            queue1.set_property("max-size-bytes", 0)
+            queue1.set_property("max-size-time", 0)
+            # 2 = downstream, drop the oldest buffer when full
+            queue1.set_property("leaky", 2)
 
     print("Creating queue2\n ")
     queue2 = Gst.ElementFactory.make("queue", "nvtee-que2")
@@ -332,13 +736,19 @@ def main(args):
         if not sink:
             sys.stderr.write(" Unable to create egl sink \n")
 
-    print("Playing file %s " % input_file)
-    source.set_property("location", input_file)
     streammux.set_property("width", MUXER_OUTPUT_WIDTH)
     streammux.set_property("height", MUXER_OUTPUT_HEIGHT)
-    streammux.set_property("batch-size", 1)
-    streammux.set_property("batched-push-timeout", 40000)
+    # one frame of every source per batch, so inference runs once per batch
+    streammux.set_property("batch-size", len(sources))
+    streammux.set_property("batched-push-timeout", MUXER_BATCH_TIMEOUT_USEC)
+    if sources.is_live:
+        streammux.set_property("live-source", 1)
     pgie.set_property("config-file-path", PGIE_CONFIG_FILE)
+    pgie_batch_size = pgie.get_property("batch-size")
+    if pgie_batch_size != len(sources):
+        print("WARNING: Overriding infer-config batch-size", pgie_batch_size,
+              " with number of sources ", len(sources), " \n")
+        pgie.set_property("batch-size", len(sources))
 
 
     #Set properties of tracker
@@ -369,70 +779,75 @@ def main(args):
             tracker_enable_past_frame = config.getint("tracker", key)
             tracker.set_property("enable_past_frame", tracker_enable_past_frame)
 
-    msgconv.set_property("config", MSCONV_CONFIG_FILE)
-    msgconv.set_property("payload-type", schema_type)
-    msgbroker.set_property("proto-lib", proto_lib)
-    msgbroker.set_property("conn-str", conn_str)
-    if cfg_file is not None:
-        msgbroker.set_property("config", cfg_file)
-    if topic is not None:
-        msgbroker.set_property("topic", topic)
-    msgbroker.set_property("sync", False)
+    if producer is None:
+        msgconv.set_property("config", MSCONV_CONFIG_FILE)
+        msgconv.set_property("payload-type", schema_type)
+        if no_probe:
+            # generate payloads from frame meta (nvds_msg2p_generate_new) every
+            # frame_interval frames instead of from NvDsEventMsgMeta
+            msgconv.set_property("msg2p-newapi", True)
+            msgconv.set_property("frame-interval", frame_interval)
+        msgbroker.set_property("proto-lib", proto_lib)
+        msgbroker.set_property("conn-str", conn_str)
+        if cfg_file is not None:
+            msgbroker.set_property("config", cfg_file)
+        if topic is not None:
+            msgbroker.set_property("topic", topic)
+        msgbroker.set_property("sync", False)
 
     print("Adding elements to Pipeline \n")
-    pipeline.add(source)
-    pipeline.add(h264parser)
-    pipeline.add(decoder)
     pipeline.add(streammux)
+    if not sources.add_to_pipeline(pipeline, streammux):
+        return -1
     pipeline.add(pgie)
     
     pipeline.add(tracker)
     pipeline.add(nvanalytics)
+    if tiler:
+        pipeline.add(tiler)
     
     pipeline.add(nvvidconv)
     pipeline.add(nvosd)
     pipeline.add(tee)
-    pipeline.add(queue1)
     pipeline.add(queue2)
-    pipeline.add(msgconv)
-    pipeline.add(msgbroker)
+    if producer is None:
+        pipeline.add(queue1)
+        pipeline.add(msgconv)
+        pipeline.add(msgbroker)
     pipeline.add(sink)
     if is_aarch64() and not no_display:
         pipeline.add(transform)
 
     print("Linking elements in the Pipeline \n")
-    source.link(h264parser)
-    h264parser.link(decoder)
-
-    sinkpad = streammux.get_request_pad("sink_0")
-    if not sinkpad:
-        sys.stderr.write(" Unable to get the sink pad of streammux \n")
-    srcpad = decoder.get_static_pad("src")
-    if not srcpad:
-        sys.stderr.write(" Unable to get source pad of decoder \n")
-    srcpad.link(sinkpad)
-
     streammux.link(pgie)
     # pgie.link(nvvidconv)
     pgie.link(tracker)
     tracker.link(nvanalytics)
-    nvanalytics.link(nvvidconv)
+    if tiler:
+        nvanalytics.link(tiler)
+        tiler.link(nvvidconv)
+    else:
+        nvanalytics.link(nvvidconv)
     
     nvvidconv.link(nvosd)
     nvosd.link(tee)
-    queue1.link(msgconv)
-    msgconv.link(msgbroker)
+    if producer is None:
+        queue1.link(msgconv)
+        msgconv.link(msgbroker)
     if is_aarch64() and not no_display:
         queue2.link(transform)
         transform.link(sink)
     else:
         queue2.link(sink)
-    sink_pad = queue1.get_static_pad("sink")
-    tee_msg_pad = tee.get_request_pad("src_%u")
+    if producer is None:
+        sink_pad = queue1.get_static_pad("sink")
+        tee_msg_pad = tee.get_request_pad("src_%u")
+        if not tee_msg_pad:
+            sys.stderr.write("Unable to get request pads\n")
+        tee_msg_pad.link(sink_pad)
     tee_render_pad = tee.get_request_pad("src_%u")
-    if not tee_msg_pad or not tee_render_pad:
+    if not tee_render_pad:
         sys.stderr.write("Unable to get request pads\n")
-    tee_msg_pad.link(sink_pad)
     sink_pad = queue2.get_static_pad("sink")
     tee_render_pad.link(sink_pad)
 
@@ -449,11 +864,57 @@ def main(args):
 
 
     # custom insert  
-    nvanalytics_src_pad=nvanalytics.get_static_pad("src")
-    nvanalytics_src_pad.add_probe(Gst.PadProbeType.BUFFER, osd_sink_pad_buffer_probe, 0)
-
-
-
+    # Without the probe, nvmsgconv reads the nvdsanalytics frame meta itself
+    if not no_probe:
+        nvanalytics_src_pad=nvanalytics.get_static_pad("src")
+        nvanalytics_src_pad.add_probe(Gst.PadProbeType.BUFFER, osd_sink_pad_buffer_probe, 0)
+        nvanalytics_src_pad.add_probe(Gst.PadProbeType.EVENT_DOWNSTREAM,
+                                      analytics_src_event_probe, 0)
+        if producer is None:
+            msgconv.get_static_pad("sink").add_probe(
+                Gst.PadProbeType.EVENT_DOWNSTREAM, msgconv_sink_event_probe, 0)
+        if decimator is not None:
+            for i in range(len(sources)):
+                streammux.get_static_pad("sink_%u" % i).add_probe(
+                    Gst.PadProbeType.EVENT_DOWNSTREAM,
+                    streammux_sink_event_probe, i)
+
+
+
+
+    reloader = None
+    if watch_config:
+        reloader = ConfigReloader()
+        reloader.watch(analytics_config_file,
+                       functools.partial(reload_analytics_config, nvanalytics))
+        # no nvmsgconv with --sink python/local
+        reloader.watch(MSCONV_CONFIG_FILE, functools.partial(
+            reload_msgconv_config, msgconv if producer is None else None))
+        GLib.timeout_add(500, reloader.poll)
+        GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGHUP,
+                             reloader.request)
+
+    if tracer is not None and producer is None:
+        msgbroker.get_static_pad("sink").add_probe(
+            Gst.PadProbeType.BUFFER, msgbroker_sink_pad_buffer_probe, 0)
+
+    if mux_tuner is not None:
+        streammux.get_static_pad("src").add_probe(
+            Gst.PadProbeType.BUFFER, streammux_src_pad_buffer_probe, 0)
+        GLib.timeout_add(int(mux_tune_interval * 1000), retune_streammux,
+                         streammux)
+
+    exporters = []
+    if metrics is not None:
+        if metrics_port:
+            exporters.append(MetricsServer(metrics.registry, metrics_port).start())
+            print("Serving metrics on port {0} \n".format(metrics_port))
+        if metrics_file:
+            exporters.append(MetricsFileDumper(metrics.registry, metrics_file,
+                                               metrics_interval).start())
+
+    if worker is not None:
+        worker.start()
 
     print("Starting pipeline \n")
 
@@ -464,8 +925,61 @@ def main(args):
     except:
         pass
     # cleanup
+    if worker is not None:
+        # interrupted: what the worker built still goes out on the next
+        # buffers while the pipeline runs
+        worker.stop()
     pyds.unset_callback_funcs()
     pipeline.set_state(Gst.State.NULL)
+    print("Event msg meta pool: {0}".format(pyds.event_msg_meta_pool_stats()))
+    for exporter in exporters:
+        exporter.stop()
+    if recorder is not None:
+        recorder.close()
+    if archive is not None:
+        archive.close()
+        print("Count archive: {0}".format(archive.stats))
+    if decimator is not None:
+        print("Probe interval: {0}".format(decimator.stats))
+    if reloader is not None:
+        print("Config reloads: {0}".format(reloader.stats))
+    if tracer is not None and producer is None:
+        print_trace_summary()
+    # without an EOS (interrupted) the events are still held: the producer
+    # sends them, nvmsgconv is gone
+    held = held_events + take_held_events()
+    if held and producer is not None:
+        for pad_index, counts in held:
+            send_event(pad_index, counts)
+    elif held:
+        print("Held events not published, no EOS reached nvmsgconv: "
+              "{0}".format(len(held)))
+        if worker is not None:
+            worker.unpublished += len(held)
+    if worker is not None:
+        print("Event worker: {0}".format(worker.stats()))
+    if producer is not None:
+        producer.close()
+        batching = producer
+        if isinstance(producer, SpoolingProducer):
+            print("Spool: {0}, {1} messages left".format(
+                dict(producer.spool.stats, **producer.stats),
+                producer.spool.pending))
+            batching = producer.producer
+        print("Producer: {0}".format(batching.stats))
+        if tracer is not None:
+            print_trace_summary()
+        if isinstance(batching.transport, LocalBroker):
+            batches = batching.transport.batches
+            print("Local broker: {0} batches, {1} messages, {2} bytes on "
+                  "the wire".format(len(batches),
+                                    sum(len(b.records) for b in batches),
+                                    sum(b.wire_size for b in batches)))
+
+def print_trace_summary():
+    print("Event latency:")
+    for line in tracer.summary():
+        print("  " + line)
 
 
 # Parse and validate input arguments
@@ -476,21 +990,192 @@ def parse_args():
                            "connection string has relevant  details.",
                       metavar="FILE")
     parser.add_option("-i", "--input-file", dest="input_file",
-                      help="Set the input H264 file", metavar="FILE")
+                      help="Set the input H264 file, same as --uri FILE",
+                      metavar="FILE")
+    parser.add_option("-u", "--uri", dest="uris", action="append",
+                      default=[],
+                      help="Add an input source URI (file://, rtsp://, ...) "
+                           "or file path, repeat for more sources",
+                      metavar="URI")
+    parser.add_option("", "--sensor-id", dest="sensor_ids", action="append",
+                      default=[],
+                      help="Device ID sent for the next source, in --uri "
+                           "order, default=device_test[_<index>]",
+                      metavar="ID")
     parser.add_option("-p", "--proto-lib", dest="proto_lib",
                       help="Absolute path of adaptor library", metavar="PATH")
     parser.add_option("", "--conn-str", dest="conn_str",
                       help="Connection string of backend server. Optional if "
                            "it is part of config file.", metavar="STR")
     parser.add_option("-s", "--schema-type", dest="schema_type", default="0",
-                      help="Type of message schema (0=Full, 1=minimal), "
-                           "default=0", metavar="<0|1>")
+                      help="Type of message schema (0=Full, 1=minimal, "
+                           "2=binary), default=0", metavar="<0|1|2>")
     parser.add_option("-t", "--topic", dest="topic",
                       help="Name of message topic. Optional if it is part of "
                            "connection string or config file.", metavar="TOPIC")
     parser.add_option("", "--no-display", action="store_true",
                       dest="no_display", default=False,
                       help="Disable display")
+    parser.add_option("", "--no-probe", action="store_true",
+                      dest="no_probe", default=False,
+                      help="Skip the Python probe and let nvmsgconv read the "
+                           "nvdsanalytics frame meta directly (-s 0 or 1)")
+    parser.add_option("", "--frame-interval", dest="frame_interval",
+                      type="int", default=30,
+                      help="Frame interval of the payloads generated with "
+                           "--no-probe, default=30", metavar="N")
+    parser.add_option("", "--window", dest="window", type="float",
+                      default=0.0,
+                      help="Aggregate line crossings into windows of this "
+                           "many seconds per stream and send one message "
+                           "per window, default=0 (one message per frame)",
+                      metavar="SECONDS")
+    parser.add_option("", "--window-hop", dest="window_hop", type="float",
+                      help="Start a window every this many seconds "
+                           "(hopping windows), default=--window (tumbling)",
+                      metavar="SECONDS")
+    parser.add_option("", "--max-latency", dest="max_latency", type="float",
+                      default=1.0,
+                      help="Send a window at most this many seconds after "
+                           "it ended, default=1", metavar="SECONDS")
+    parser.add_option("", "--ring-size", dest="ring_size", type="int",
+                      default=0,
+                      help="Only copy the counts in the probe, into a ring "
+                           "of this many frames, and build the events on a "
+                           "worker thread, default=0 (off)", metavar="N")
+    parser.add_option("", "--probe-interval", dest="probe_interval",
+                      type="int", default=1,
+                      help="Inspect the analytics meta of every Nth batch "
+                           "only; the crossings of the skipped ones are "
+                           "recovered from the cumulative counts, default=1 "
+                           "(every batch)", metavar="N")
+    parser.add_option("", "--probe-interval-max", dest="probe_interval_max",
+                      type="int", default=0,
+                      help="Grow the --probe-interval up to N while no line "
+                           "is crossed, default=0 (fixed interval)",
+                      metavar="N")
+    parser.add_option("", "--mux-tune", action="store_true", dest="mux_tune",
+                      default=False,
+                      help="Retune the streammux batch-size and "
+                           "batched-push-timeout to the sources that "
+                           "deliver frames and their frame rates")
+    parser.add_option("", "--mux-max-timeout-ms", dest="mux_max_timeout_ms",
+                      type="float", default=100.0,
+                      help="--mux-tune: longest batched-push-timeout, the "
+                           "most a frame waits for its batch, default=100",
+                      metavar="MS")
+    parser.add_option("", "--mux-min-timeout-ms", dest="mux_min_timeout_ms",
+                      type="float", default=4.0,
+                      help="--mux-tune: shortest batched-push-timeout, "
+                           "default=4", metavar="MS")
+    parser.add_option("", "--mux-tune-interval", dest="mux_tune_interval",
+                      type="float", default=5.0,
+                      help="--mux-tune: seconds between retunes, default=5",
+                      metavar="SECONDS")
+    parser.add_option("", "--trace", dest="trace",
+                      choices=["off", "full", "compact"], default="off",
+                      help="Add the capture, probe and serialization times "
+                           "of the frame to each message, as an object of "
+                           "ns timestamps (full) or [capture ns, PTS ns, "
+                           "pipeline us, serialize us] (compact), and report "
+                           "the latency of each stage, default=off",
+                      metavar="<off|full|compact>")
+    parser.add_option("", "--watch-config", action="store_true",
+                      dest="watch_config", default=False,
+                      help="Reload --analytics-config and the msgconv "
+                           "config when they change or on SIGHUP, without "
+                           "restarting the pipeline")
+    parser.add_option("", "--sink", dest="sink", default="msgbroker",
+                      choices=["msgbroker", "python", "local"],
+                      help="Publish through nvmsgconv + nvmsgbroker, a "
+                           "Python batching Kafka producer (kafka-python), "
+                           "or an in-process local broker for testing, "
+                           "default=msgbroker", metavar="<msgbroker|python|local>")
+    parser.add_option("", "--analytics-config", dest="analytics_config",
+                      default=ANALYTICS_CONFIG_FILE,
+                      help="nvdsanalytics config file, default="
+                           + ANALYTICS_CONFIG_FILE, metavar="FILE")
+    parser.add_option("", "--partition-offset", dest="partition_offset",
+                      type="int", default=0,
+                      help="Producer: global index of the first source for "
+                           "--partitioner even when several processes "
+                           "publish to the topic (set by supervisor.py), "
+                           "default=0", metavar="N")
+    parser.add_option("", "--routes", dest="routes_file",
+                      help="Producer: send events to the topics of the "
+                           "[route-<name>] groups of FILE (see "
+                           "cfg_routes.txt), the default topic otherwise",
+                      metavar="FILE")
+    parser.add_option("", "--partitioner", dest="partitioner",
+                      default="even", choices=["even", "hash"],
+                      help="Producer: spread the sources round-robin over "
+                           "the partitions, or hash their device ids, "
+                           "default=even", metavar="<even|hash>")
+    parser.add_option("", "--linger-ms", dest="linger_ms", type="float",
+                      default=5.0,
+                      help="Producer: max time a message waits for its "
+                           "batch, default=5", metavar="MS")
+    parser.add_option("", "--batch-bytes", dest="batch_bytes", type="int",
+                      default=16384,
+                      help="Producer: batch size in bytes, default=16384",
+                      metavar="N")
+    parser.add_option("", "--compression", dest="compression",
+                      default="none", choices=["none", "gzip", "zlib"],
+                      help="Producer: batch compression (zlib only with "
+                           "--sink local), default=none",
+                      metavar="<none|gzip|zlib>")
+    parser.add_option("", "--max-in-flight", dest="max_in_flight", type="int",
+                      default=5,
+                      help="Producer: max batches being sent at once, "
+                           "default=5", metavar="N")
+    parser.add_option("", "--spool-dir", dest="spool_dir",
+                      help="Producer: spool messages to this directory "
+                           "while the broker is down or behind and replay "
+                           "them later", metavar="DIR")
+    parser.add_option("", "--spool-max-mb", dest="spool_max_mb", type="int",
+                      default=1024,
+                      help="Spool size cap, the oldest messages are "
+                           "dropped beyond it, default=1024", metavar="MB")
+    parser.add_option("", "--spool-retention-hours",
+                      dest="spool_retention_hours", type="float", default=24,
+                      help="Drop spooled messages older than this, "
+                           "default=24", metavar="HOURS")
+    parser.add_option("", "--msg-queue-size", dest="msg_queue_size",
+                      type="int", default=30,
+                      help="Max buffers queued in front of nvmsgconv, the "
+                           "oldest are dropped when full, 0=unlimited, "
+                           "default=30", metavar="N")
+    parser.add_option("", "--metrics-port", dest="metrics_port", type="int",
+                      default=0,
+                      help="Serve Prometheus metrics on this port, "
+                           "default=0 (off)", metavar="PORT")
+    parser.add_option("", "--metrics-file", dest="metrics_file",
+                      help="Write Prometheus metrics to this file every "
+                           "--metrics-interval seconds", metavar="FILE")
+    parser.add_option("", "--metrics-interval", dest="metrics_interval",
+                      type="float", default=10.0,
+                      help="Interval of --metrics-file, default=10",
+                      metavar="SECONDS")
+    parser.add_option("", "--no-metrics", action="store_true",
+                      dest="no_metrics", default=False,
+                      help="Do not collect any metrics in the probe")
+    parser.add_option("", "--object-events", dest="object_events",
+                      type="int", default=0,
+                      help="Add up to N objects that crossed a line, with "
+                           "tracking id, class, bbox and line label, to the "
+                           "message of their frame, default=0 (off)",
+                      metavar="N")
+    parser.add_option("", "--record", dest="record_file",
+                      help="Record the analytics metadata of every batch "
+                           "to FILE for replay_bench.py", metavar="FILE")
+    parser.add_option("", "--archive-dir", dest="archive_dir",
+                      help="Keep the line-crossing counts in a local "
+                           "archive in DIR, see common/count_archive.py",
+                      metavar="DIR")
+    parser.add_option("", "--event-pool-size", dest="event_pool_size",
+                      type="int", default=256,
+                      help="Number of preallocated event msg metas, "
+                           "default=256", metavar="N")
 
     (options, args) = parser.parse_args()
 
@@ -501,19 +1186,198 @@ def parse_args():
     global topic
     global schema_type
     global no_display
+    global event_pool_size
+    global no_probe
+    global frame_interval
+    global msg_queue_size
+    global aggregator
+    global sources
+    global metrics
+    global metrics_port
+    global metrics_file
+    global metrics_interval
+    global ring
+    global worker
+    global producer
+    global producer_topic
+    global router
+    global analytics_config_file
+    global analytics_labels
+    global recorder
+    global archive
+    global object_events
+    global decimator
+    global mux_tuner
+    global mux_tune_interval
+    global tracer
+    global trace_compact
+    global watch_config
     cfg_file = options.cfg_file
     input_file = options.input_file
     proto_lib = options.proto_lib
     conn_str = options.conn_str
     topic = options.topic
     no_display = options.no_display
+    event_pool_size = options.event_pool_size
+    no_probe = options.no_probe
+    watch_config = options.watch_config
+    frame_interval = options.frame_interval
+    msg_queue_size = options.msg_queue_size
+    if options.window > 0:
+        try:
+            aggregator = WindowAggregator(options.window, options.window_hop,
+                                          options.max_latency)
+        except ValueError as e:
+            print("Invalid window options: {0}".format(e))
+            return 1
+
+    if not ((proto_lib or options.sink != "msgbroker") and
+            (input_file or options.uris)):
+        print("Usage: python3 run.py -i <H264 filename> | -u <URI> [-u <URI> ...] "
+              "-p <Proto adaptor library> --conn-str=<Connection string>")
+        return 1
 
-    if not (proto_lib and input_file):
-        print("Usage: python3 deepstream_test_4.py -i <H264 filename> -p "
-              "<Proto adaptor library> --conn-str=<Connection string>")
+    if options.analytics_config != analytics_config_file:
+        if not os.path.exists(options.analytics_config):
+            print("No such analytics config: {0}".format(
+                options.analytics_config))
+            return 1
+        analytics_config_file = options.analytics_config
+        analytics_labels = AnalyticsLabels.from_config(analytics_config_file)
+
+    uris = ([input_file] if input_file else []) + options.uris
+    sources = SourceManager(uris, options.sensor_ids,
+                            read_sensor_ids(MSCONV_CONFIG_FILE))
+    if no_probe and options.schema_type == "2":
+        print("--no-probe needs the full (-s 0) or minimal (-s 1) schema, "
+              "nvmsgconv encodes the binary one from event msg metas only")
+        return 1
+    if options.sink != "msgbroker":
+        if no_probe:
+            print("--no-probe needs --sink msgbroker")
+            return 1
+        compression = None if options.compression == "none" else \
+            options.compression
+        servers, producer_topic = parse_conn_str(
+            conn_str or "localhost;9092")
+        producer_topic = topic or producer_topic
+        if not producer_topic:
+            print("--sink {0} needs a topic (--topic or --conn-str "
+                  "host;port;topic)".format(options.sink))
+            return 1
+        if options.sink == "local":
+            transport = LocalBroker(compression=compression)
+        elif compression == "zlib":
+            print("Kafka does not support zlib compression, use gzip")
+            return 1
+        else:
+            try:
+                transport = KafkaTransport(servers, compression)
+            except ImportError:
+                print("--sink python needs kafka-python: "
+                      "pip3 install kafka-python")
+                return 1
+        try:
+            routes = read_routes(options.routes_file) \
+                if options.routes_file else []
+        except ValueError as e:
+            print("Invalid routes: {0}".format(e))
+            return 1
+        router = Router(routes, producer_topic)
+        if options.partitioner == "even":
+            partitioner = EvenPartitioner(
+                [sensor_id.encode("utf-8") for sensor_id in sources.sensor_ids],
+                options.partition_offset)
+        else:
+            partitioner = default_partitioner
+        producer = BatchingProducer(transport,
+                                    linger=options.linger_ms / 1000.0,
+                                    batch_size=options.batch_bytes,
+                                    max_in_flight=options.max_in_flight,
+                                    partitioner=partitioner).start()
+        read_analytics_module(MSCONV_CONFIG_FILE)
+        if options.spool_dir:
+            max_bytes = max(options.spool_max_mb, 1) << 20
+            spool = Spool(options.spool_dir,
+                          segment_bytes=min(16 << 20, max_bytes),
+                          max_bytes=max_bytes,
+                          retention=options.spool_retention_hours * 3600)
+            if spool.pending:
+                print("Replaying {0} spooled messages".format(spool.pending))
+            producer = SpoolingProducer(producer, spool).start()
+    elif options.spool_dir or options.routes_file:
+        print("--spool-dir and --routes need --sink python or local")
         return 1
 
-    schema_type = 0 if options.schema_type == "0" else 1
+    if options.object_events > 0:
+        if no_probe or options.window > 0 or options.ring_size > 0:
+            print("--object-events needs the per-frame probe, drop "
+                  "--no-probe, --window and --ring-size")
+            return 1
+        object_events = options.object_events
+
+    if options.record_file:
+        if no_probe:
+            print("--record needs the probe, drop --no-probe")
+            return 1
+        recorder = MetaLogWriter(options.record_file, analytics_labels.lc)
+
+    if options.archive_dir:
+        if no_probe:
+            print("--archive-dir needs the probe, drop --no-probe")
+            return 1
+        archive = CountArchive(options.archive_dir).start()
+
+    if options.probe_interval > 1 or options.probe_interval_max > 1:
+        if no_probe or options.object_events > 0 or options.record_file:
+            print("--probe-interval cannot be combined with --no-probe, "
+                  "--object-events and --record, which need every batch")
+            return 1
+        decimator = Decimator(options.probe_interval,
+                              options.probe_interval_max)
+
+    if options.mux_tune:
+        if not 0 < options.mux_min_timeout_ms <= options.mux_max_timeout_ms:
+            print("--mux-min-timeout-ms must be positive and at most "
+                  "--mux-max-timeout-ms")
+            return 1
+        mux_tuner = MuxTuner(len(sources),
+                             min_timeout=options.mux_min_timeout_ms / 1000.0,
+                             max_timeout=options.mux_max_timeout_ms / 1000.0,
+                             timeout=MUXER_BATCH_TIMEOUT_USEC / 1e6)
+        mux_tune_interval = max(options.mux_tune_interval, 0.5)
+
+    if options.trace != "off":
+        if no_probe:
+            print("--trace needs the probe, drop --no-probe")
+            return 1
+        if options.ring_size > 0 and options.sink != "msgbroker":
+            print("--trace with --ring-size needs --sink msgbroker, the "
+                  "event worker has no frames to trace")
+            return 1
+        if options.sink == "msgbroker" and options.schema_type == "1":
+            print("--trace needs the full (-s 0) or binary (-s 2) schema")
+            return 1
+        tracer = StageLatencies()
+        trace_compact = options.trace == "compact"
+        if producer is not None:
+            batching = producer.producer \
+                if isinstance(producer, SpoolingProducer) else producer
+            batching.on_sent = observe_sent_traces
+
+    if options.ring_size > 0:
+        ring = CountRing(options.ring_size, len(analytics_labels.lc))
+        worker = EventWorker(ring, build_and_send_events if producer
+                             else build_events)
+    if not options.no_metrics:
+        metrics = PipelineMetrics(len(sources))
+        metrics_port = options.metrics_port
+        metrics_file = options.metrics_file
+        metrics_interval = options.metrics_interval
+        if tracer is not None:
+            metrics.registry.register(tracer)
+
+    schema_type = SCHEMA_TYPES.get(options.schema_type, 1)
 
 
 if __name__ == "__main__":
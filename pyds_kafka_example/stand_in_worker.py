@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+################################################################################
+# SPDX-FileCopyrightText: Copyright (c) 2019-2021 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+################################################################################
+
+"""A run.py worker for supervisor.py that needs no GPU or pipeline.
+
+Replays the batches of a run.py --record log through
+osd_sink_pad_buffer_probe of run.py with common.fake_pyds, like
+replay_bench.py, and writes --metrics-file like run.py, e.g.
+
+    python3 supervisor.py --shards 2 -u a -u b -u c -u d \\
+        --worker-command "python3 stand_in_worker.py -l run.dsml"
+
+Source j of the worker replays the log stream of the j-th global source
+index in DS_SHARD_STREAMS (set by supervisor.py), so the merged metrics
+of the shards match those of one process replaying the whole log.
+--crash-after N exits with status 3 after N batches in the first run of
+the worker (DS_SHARD_RESTARTS=0), to exercise restarts.
+"""
+
+import contextlib
+import os
+import sys
+import time
+from optparse import OptionParser
+from common.fake_pyds import FakePyds, FakeProbeInfo, make_batch
+from common.meta_log import MetaLogReader
+from common.shards import SHARD_RESTARTS_ENV, SHARD_STREAMS_ENV
+from replay_bench import import_run
+
+CRASH_STATUS = 3
+
+
+def shard_batches(batches, streams):
+    """Returns the frames of the log streams in streams, renumbered to
+    pad index j of streams[j]; batches left without frames are dropped."""
+    local = dict((stream, j) for j, stream in enumerate(streams))
+    shard = []
+    for frames in batches:
+        frames = [dict(frame, pad_index=local[frame["pad_index"]])
+                  for frame in frames if frame["pad_index"] in local]
+        if frames:
+            shard.append(frames)
+    return shard
+
+
+def main(args):
+    (options, args) = parse_args(args)
+    if not options.log_file or not options.uris:
+        print("Usage: python3 stand_in_worker.py -l <run.py --record file> "
+              "-u <uri> [-u <uri> ...]")
+        return 1
+    streams = [int(s) for s in
+               os.environ.get(SHARD_STREAMS_ENV, "").split(",") if s]
+    if not streams:
+        streams = list(range(len(options.uris)))
+    if len(streams) != len(options.uris):
+        print("{0} has {1} streams for {2} sources".format(
+            SHARD_STREAMS_ENV, len(streams), len(options.uris)))
+        return 1
+    crash_after = options.crash_after \
+        if os.environ.get(SHARD_RESTARTS_ENV, "0") == "0" else 0
+
+    reader = MetaLogReader(options.log_file)
+    batches = shard_batches(reader, streams)
+
+    pyds = FakePyds()
+    run = import_run(pyds)
+    from common.analytics_config import AnalyticsLabels
+    from common.metrics import PipelineMetrics, MetricsFileDumper
+    from common.source_manager import SourceManager
+
+    run.analytics_labels = AnalyticsLabels(lc=reader.labels)
+    run.sources = SourceManager(options.uris, options.sensor_ids)
+    run.metrics = PipelineMetrics(len(options.uris))
+    pyds.event_msg_meta_pool_init(256)
+    dumper = None
+    if options.metrics_file:
+        dumper = MetricsFileDumper(run.metrics.registry, options.metrics_file,
+                                   options.metrics_interval)
+        if options.metrics_interval > 0:
+            dumper.start()
+
+    period = 1.0 / options.fps if options.fps > 0 else 0.0
+    start = time.monotonic()
+    try:
+        with open(os.devnull, "w") as devnull, \
+                contextlib.redirect_stdout(devnull):
+            for n, frames in enumerate(batches):
+                info = FakeProbeInfo(pyds.make_buffer(make_batch(frames)))
+                run.osd_sink_pad_buffer_probe(None, info, 0)
+                # downstream releases the attached metas with the buffer
+                for frame_meta, user_meta in pyds.attached:
+                    pyds.release_nvds_event_msg_meta(user_meta.user_meta_data)
+                    frame_meta.remove_user_meta(user_meta)
+                del pyds.attached[:]
+                if dumper is not None and options.metrics_interval <= 0:
+                    dumper.dump()
+                if n + 1 == crash_after:
+                    sys.stderr.write("Crashing after {0} batches\n".format(
+                        crash_after))
+                    sys.stderr.flush()
+                    os._exit(CRASH_STATUS)
+                if period:
+                    delay = start + (n + 1) * period - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+    except KeyboardInterrupt:
+        pass
+    if dumper is not None:
+        if options.metrics_interval > 0:
+            dumper.stop()
+        else:
+            dumper.dump()
+    return 0
+
+
+def parse_args(args):
+    parser = OptionParser()
+    parser.add_option("-l", "--log-file", dest="log_file",
+                      help="Log written by run.py --record", metavar="FILE")
+    parser.add_option("", "--fps", dest="fps", type="float", default=0.0,
+                      help="Replay at FPS batches per second, default=0 "
+                           "(as fast as possible)", metavar="FPS")
+    parser.add_option("", "--crash-after", dest="crash_after", type="int",
+                      default=0,
+                      help="Exit with status 3 after N batches of the first "
+                           "run, default=0 (never)", metavar="N")
+    # the run.py options set by supervisor.py
+    parser.add_option("-u", "--uri", dest="uris", action="append",
+                      default=[], metavar="URI")
+    parser.add_option("", "--sensor-id", dest="sensor_ids", action="append",
+                      default=[], metavar="ID")
+    parser.add_option("", "--analytics-config", dest="analytics_config",
+                      help="Ignored, the labels come from the log",
+                      metavar="FILE")
+    parser.add_option("", "--partition-offset", dest="partition_offset",
+                      type="int", default=0, help="Ignored", metavar="N")
+    parser.add_option("", "--metrics-file", dest="metrics_file",
+                      help="Write the metrics to FILE", metavar="FILE")
+    parser.add_option("", "--metrics-interval", dest="metrics_interval",
+                      type="float", default=10.0,
+                      help="Interval of --metrics-file, 0 writes it after "
+                           "every batch, default=10", metavar="SECONDS")
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+################################################################################
+# SPDX-FileCopyrightText: Copyright (c) 2019-2021 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+################################################################################
+
+"""Runs the sources in --shards run.py processes and supervises them.
+
+Each worker gets a consecutive group of the sources with their global
+sensor ids, the nvdsanalytics config groups of those sources and its own
+metrics file; options after -- go to every worker:
+
+    python3 supervisor.py --shards 2 -u a.h264 -u b.h264 -u c.h264 \\
+        --metrics-port 9400 -- --sink python --conn-str "kafka;9092;ds"
+
+Crashed workers are restarted, see common/shards.py. The metrics of all
+workers are merged with global stream labels and served on
+--metrics-port / written to --metrics-file.
+"""
+
+import os
+import shlex
+import signal
+import sys
+import threading
+from optparse import OptionParser
+from common.analytics_config import write_shard_config
+from common.metrics import MetricsServer, MetricsFileDumper
+from common.routing import read_sensor_ids, resolve_sensor_ids
+from common.shards import MergedMetrics, ShardWorker, Supervisor, plan_shards
+
+MSCONV_CONFIG_FILE = "dstest4_msgconv_config.txt"
+ANALYTICS_CONFIG_FILE = "config_nvdsanalytics.txt"
+# options the supervisor sets for every worker
+WORKER_OPTIONS = ("-u", "--uri", "-i", "--input-file", "--sensor-id",
+                  "--analytics-config", "--partition-offset",
+                  "--metrics-port", "--metrics-file", "--metrics-interval",
+                  "--no-metrics")
+
+
+def worker_commands(command, shards, uris, sensor_ids, work_dir,
+                    analytics_config, metrics_interval, worker_args=()):
+    """Returns (argument list, metrics file) of the worker of each shard."""
+    commands = []
+    for k, streams in enumerate(shards):
+        metrics_file = os.path.join(work_dir, "shard{0}.prom".format(k))
+        args = list(command)
+        for stream in streams:
+            args += ["-u", uris[stream], "--sensor-id", sensor_ids[stream]]
+        args += ["--analytics-config", write_shard_config(
+                    analytics_config, streams, os.path.join(
+                        work_dir, "config_nvdsanalytics_shard{0}.txt"
+                        .format(k))),
+                 "--partition-offset", str(streams[0]),
+                 "--metrics-file", metrics_file,
+                 "--metrics-interval", str(metrics_interval)]
+        commands.append((args + list(worker_args), metrics_file))
+    return commands
+
+
+def main(args):
+    (options, worker_args) = parse_args(args)
+    if not options.uris:
+        print("Usage: python3 supervisor.py -u <uri> [-u <uri> ...] "
+              "[--shards N] [-- <run.py options>]")
+        return 1
+    for arg in worker_args:
+        if arg.split("=")[0] in WORKER_OPTIONS:
+            print("{0} is set by the supervisor".format(arg.split("=")[0]))
+            return 1
+    if not os.path.exists(options.analytics_config):
+        print("No such analytics config: {0}".format(options.analytics_config))
+        return 1
+    if options.metrics_interval <= 0:
+        print("--metrics-interval must be positive")
+        return 1
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    work_dir = os.path.abspath(options.work_dir)
+    os.makedirs(work_dir, exist_ok=True)
+    uris = [uri if "://" in uri else os.path.abspath(uri)
+            for uri in options.uris]
+    sensor_ids = resolve_sensor_ids(len(uris), options.sensor_ids,
+                                    read_sensor_ids(options.msgconv_config))
+    shards = plan_shards(len(uris), options.shards)
+    commands = worker_commands(shlex.split(options.worker_command), shards,
+                               uris, sensor_ids, work_dir,
+                               options.analytics_config,
+                               options.metrics_interval, worker_args)
+    for path in [path for _, path in commands]:
+        # left over by an earlier run, would be counted as this one's
+        if os.path.exists(path):
+            os.remove(path)
+    metrics = MergedMetrics(shards, [path for _, path in commands])
+    workers = [ShardWorker(k, command, shards[k], cwd=script_dir)
+               for k, (command, _) in enumerate(commands)]
+    for k, streams in enumerate(shards):
+        print("Shard {0}: sources {1}".format(
+            k, ", ".join(sensor_ids[s] for s in streams)))
+
+    exporters = []
+    if options.metrics_port:
+        exporters.append(MetricsServer(metrics, options.metrics_port).start())
+        print("Serving merged metrics on port {0}".format(
+            options.metrics_port))
+    if options.metrics_file:
+        exporters.append(MetricsFileDumper(metrics, options.metrics_file,
+                                           options.metrics_interval).start())
+
+    stop = threading.Event()
+
+    def on_signal(signum, frame):
+        stop.set()
+
+    signal.signal(signal.SIGINT, on_signal)
+    signal.signal(signal.SIGTERM, on_signal)
+    supervisor = Supervisor(workers, metrics,
+                            restart_delay=options.restart_delay,
+                            max_restarts=options.max_restarts,
+                            restart_window=options.restart_window)
+    ret = supervisor.run(stop)
+    for exporter in exporters:
+        exporter.stop()
+    print("Workers: {0}".format(", ".join(
+        "shard {0} {1} ({2} restarts)".format(w.shard, w.state, w.restarts)
+        for w in workers)))
+    return ret
+
+
+def parse_args(args):
+    parser = OptionParser(usage="%prog -u <uri> [-u <uri> ...] [options] "
+                                "[-- <run.py options>]")
+    parser.add_option("-u", "--uri", dest="uris", action="append",
+                      default=[],
+                      help="Add an input source URI or file path, repeat "
+                           "for more sources", metavar="URI")
+    parser.add_option("", "--sensor-id", dest="sensor_ids", action="append",
+                      default=[],
+                      help="Device ID of the next source, in --uri order, "
+                           "default=[sensorN] groups of --msgconv-config",
+                      metavar="ID")
+    parser.add_option("", "--shards", dest="shards", type="int", default=2,
+                      help="Number of worker processes, default=2",
+                      metavar="N")
+    parser.add_option("", "--worker-command", dest="worker_command",
+                      default="python3 run.py",
+                      help="Command of a worker, run in the directory of "
+                           "this script, default=\"python3 run.py\"",
+                      metavar="COMMAND")
+    parser.add_option("", "--work-dir", dest="work_dir",
+                      default="shards",
+                      help="Directory of the shard configs and metrics "
+                           "files, default=shards", metavar="DIR")
+    parser.add_option("", "--analytics-config", dest="analytics_config",
+                      default=ANALYTICS_CONFIG_FILE,
+                      help="nvdsanalytics config of all sources, default="
+                           + ANALYTICS_CONFIG_FILE, metavar="FILE")
+    parser.add_option("", "--msgconv-config", dest="msgconv_config",
+                      default=MSCONV_CONFIG_FILE,
+                      help="msgconv config with the [sensorN] ids, default="
+                           + MSCONV_CONFIG_FILE, metavar="FILE")
+    parser.add_option("", "--metrics-port", dest="metrics_port", type="int",
+                      default=0,
+                      help="Serve the merged metrics on http://0.0.0.0:PORT"
+                           "/metrics, default=0 (off)", metavar="PORT")
+    parser.add_option("", "--metrics-file", dest="metrics_file",
+                      help="Write the merged metrics to FILE", metavar="FILE")
+    parser.add_option("", "--metrics-interval", dest="metrics_interval",
+                      type="float", default=10.0,
+                      help="Metrics file interval of the workers and of "
+                           "--metrics-file, default=10", metavar="SECONDS")
+    parser.add_option("", "--restart-delay", dest="restart_delay",
+                      type="float", default=1.0,
+                      help="Delay before restarting a crashed worker, "
+                           "doubled for each consecutive crash, default=1",
+                      metavar="SECONDS")
+    parser.add_option("", "--max-restarts", dest="max_restarts", type="int",
+                      default=5,
+                      help="Give a worker up after N restarts within "
+                           "--restart-window, default=5", metavar="N")
+    parser.add_option("", "--restart-window", dest="restart_window",
+                      type="float", default=300.0,
+                      help="default=300", metavar="SECONDS")
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -19,11 +19,516 @@
 
 #include "bind_string_property_definitions.h"
 #include "bindschema.hpp"
+#include "nvdsmeta.h"
+#include "gstnvdsmeta.h"
+#include "nvds_analytics_meta.h"
+#include <pybind11/numpy.h>
+#include <pybind11/stl.h>
+#include <cstring>
+#include <mutex>
+#include <string>
+#include <vector>
 
 namespace py = pybind11;
 
 namespace pydeepstream {
 
+    /* Inline timestamp storage of pooled event metas. Large enough for
+     * generate_ts_rfc3339 output with any MAX_TIME_STAMP_LEN up to it. */
+#define EVENT_MSG_META_TS_LEN 64
+
+    /* Line-crossing counts and crossing objects stored inline in pooled
+     * event metas; metas with more get heap arrays from set_lc_counts /
+     * set_lc_objects. */
+#define EVENT_MSG_META_LC_COUNTS 8
+#define EVENT_MSG_META_LC_OBJECTS 16
+
+    /* Layout of pooled and pool-fallback event metas: the meta followed by
+     * its timestamp buffer, line-crossing counts and crossing objects, so
+     * one allocation covers all of them. */
+    struct EventMsgMetaSlot {
+        NvDsEventMsgMeta meta;
+        gchar ts[EVENT_MSG_META_TS_LEN + 1];
+        NvDsLineCrossingCount lc_counts[EVENT_MSG_META_LC_COUNTS];
+        NvDsLineCrossingObject lc_objects[EVENT_MSG_META_LC_OBJECTS];
+    };
+
+    /* True if meta is a slot whose lcCounts points to its inline array. */
+    static bool
+    has_inline_lc_counts(NvDsEventMsgMeta *meta) {
+        return meta->lcCounts == ((EventMsgMetaSlot *) meta)->lc_counts;
+    }
+
+    /* True if meta is a slot whose lcObjects points to its inline array. */
+    static bool
+    has_inline_lc_objects(NvDsEventMsgMeta *meta) {
+        return meta->lcObjects == ((EventMsgMetaSlot *) meta)->lc_objects;
+    }
+
+    /* Returns an array for num items of an event meta field: the current
+     * one if it is large enough (inline storage holds inline_capacity
+     * items, a heap array the current_num it was set with), otherwise a
+     * new heap array, freeing a previous heap array. */
+    template<typename T>
+    static T *
+    event_meta_array(T *current, guint current_num, bool is_inline,
+                     size_t inline_capacity, size_t num) {
+        if (num <= (is_inline ? inline_capacity : current_num))
+            return current;
+        if (!is_inline)
+            g_free(current);
+        return g_new(T, num);
+    }
+
+    /* Copies num items into the inline storage of a new slot, or a heap
+     * array when they do not fit. */
+    template<typename T>
+    static T *
+    copy_event_meta_array(const T *src, guint num, T *inline_items,
+                          size_t inline_capacity) {
+        T *dst = num > inline_capacity ? g_new(T, num) : inline_items;
+        if (num > 0)
+            memcpy(dst, src, num * sizeof(T));
+        return dst;
+    }
+
+    /* Bounded pool of preallocated event metas. acquire() hands out a
+     * zeroed slot with ts pointing at its inline storage and falls back to
+     * a heap slot once the pool is exhausted; release() puts pooled slots
+     * back on the free list and frees the others. */
+    class EventMsgMetaPool {
+    public:
+        ~EventMsgMetaPool() {
+            g_free(slots);
+        }
+
+        bool init(size_t new_capacity) {
+            std::lock_guard<std::mutex> guard(lock);
+            if (in_use > 0)
+                return false;
+            g_free(slots);
+            slots = new_capacity ? (EventMsgMetaSlot *) g_malloc0(
+                    new_capacity * sizeof(EventMsgMetaSlot)) : NULL;
+            capacity = new_capacity;
+            free_list.clear();
+            free_list.reserve(capacity);
+            for (size_t i = capacity; i > 0; i--)
+                free_list.push_back(&slots[i - 1]);
+            hits = misses = high_water = 0;
+            return true;
+        }
+
+        NvDsEventMsgMeta *acquire() {
+            EventMsgMetaSlot *slot = NULL;
+            {
+                std::lock_guard<std::mutex> guard(lock);
+                if (!free_list.empty()) {
+                    slot = free_list.back();
+                    free_list.pop_back();
+                    hits++;
+                    if (++in_use > high_water)
+                        high_water = in_use;
+                } else {
+                    misses++;
+                }
+            }
+            if (slot)
+                memset(slot, 0, sizeof(EventMsgMetaSlot));
+            else
+                slot = (EventMsgMetaSlot *) g_malloc0(sizeof(EventMsgMetaSlot));
+            slot->meta.ts = slot->ts;
+            slot->meta.lcCounts = slot->lc_counts;
+            slot->meta.lcObjects = slot->lc_objects;
+            return &slot->meta;
+        }
+
+        /* Releases the struct, and a ts, lcCounts and lcObjects that do not
+         * point to the inline storage (metas from alloc_nvds_event_msg_meta,
+         * a ts replaced with alloc_buffer or more counts / objects than fit
+         * inline). Other owned buffers are the caller's. */
+        void release(NvDsEventMsgMeta *meta) {
+            EventMsgMetaSlot *slot = (EventMsgMetaSlot *) meta;
+            if (meta->ts != slot->ts)
+                g_free(meta->ts);
+            if (!has_inline_lc_counts(meta))
+                g_free(meta->lcCounts);
+            if (!has_inline_lc_objects(meta))
+                g_free(meta->lcObjects);
+            if (owns(slot)) {
+                std::lock_guard<std::mutex> guard(lock);
+                free_list.push_back(slot);
+                in_use--;
+                return;
+            }
+            g_free(meta);
+        }
+
+        bool owns(EventMsgMetaSlot *slot) const {
+            return slots && slot >= slots && slot < slots + capacity;
+        }
+
+        py::dict stats() {
+            std::lock_guard<std::mutex> guard(lock);
+            py::dict result;
+            result["capacity"] = capacity;
+            result["available"] = free_list.size();
+            result["in_use"] = in_use;
+            result["hits"] = hits;
+            result["misses"] = misses;
+            result["high_water"] = high_water;
+            return result;
+        }
+
+    private:
+        std::mutex lock;
+        EventMsgMetaSlot *slots = NULL;
+        size_t capacity = 0;
+        std::vector<EventMsgMetaSlot *> free_list;
+        guint64 hits = 0;
+        guint64 misses = 0;
+        guint64 in_use = 0;
+        guint64 high_water = 0;
+    };
+
+    static EventMsgMetaPool event_msg_meta_pool;
+
+    /* Deep-copies the NvDsEventMsgMeta held by an NvDsUserMeta into a
+     * pooled meta. Scalar fields come with the struct copy; ts, the
+     * line-crossing counts and objects go to the inline storage of the
+     * new slot and
+     * the other owned buffers are duplicated so both copies can be
+     * released independently. Registered as a native copy_func so copies
+     * never enter the interpreter. */
+    static gpointer
+    event_msg_meta_copy_func(gpointer data, gpointer user_data) {
+        NvDsUserMeta *user_meta = (NvDsUserMeta *) data;
+        NvDsEventMsgMeta *src = (NvDsEventMsgMeta *) user_meta->user_meta_data;
+        NvDsEventMsgMeta *dst = event_msg_meta_pool.acquire();
+        gchar *ts = dst->ts;
+        NvDsLineCrossingCount *lc_counts = dst->lcCounts;
+        NvDsLineCrossingObject *lc_objects = dst->lcObjects;
+
+        memcpy(dst, src, sizeof(NvDsEventMsgMeta));
+        dst->ts = ts;
+        if (src->ts)
+            g_strlcpy(dst->ts, src->ts, EVENT_MSG_META_TS_LEN + 1);
+        dst->lcCounts = copy_event_meta_array(src->lcCounts, src->numLcCounts,
+                                              lc_counts,
+                                              EVENT_MSG_META_LC_COUNTS);
+        dst->lcObjects = copy_event_meta_array(src->lcObjects,
+                                               src->numLcObjects, lc_objects,
+                                               EVENT_MSG_META_LC_OBJECTS);
+        dst->sensorStr = g_strdup(src->sensorStr);
+        dst->objectId = g_strdup(src->objectId);
+        dst->otherAttrs = g_strdup(src->otherAttrs);
+        dst->videoPath = g_strdup(src->videoPath);
+
+        if (src->objSignature.size > 0) {
+            dst->objSignature.signature = (gdouble *) g_memdup(
+                    src->objSignature.signature, src->objSignature.size);
+        } else {
+            dst->objSignature.signature = NULL;
+        }
+
+        return dst;
+    }
+
+    /* Frees the buffers owned by an event meta and returns the meta
+     * itself to the pool, or to the heap if it did not come from there. */
+    static void
+    free_event_msg_meta(NvDsEventMsgMeta *meta) {
+        g_free(meta->sensorStr);
+        g_free(meta->objectId);
+        g_free(meta->otherAttrs);
+        g_free(meta->videoPath);
+
+        if (meta->objSignature.size > 0) {
+            g_free(meta->objSignature.signature);
+            meta->objSignature.size = 0;
+        }
+
+        event_msg_meta_pool.release(meta);
+    }
+
+    /* Releases the NvDsEventMsgMeta held by an NvDsUserMeta. */
+    static void
+    event_msg_meta_release_func(gpointer data, gpointer user_data) {
+        NvDsUserMeta *user_meta = (NvDsUserMeta *) data;
+        NvDsEventMsgMeta *meta = (NvDsEventMsgMeta *) user_meta->user_meta_data;
+
+        if (!meta)
+            return;
+
+        free_event_msg_meta(meta);
+        user_meta->user_meta_data = NULL;
+    }
+
+    /* Stores one line-crossing count per label in an event meta, in the
+     * inline storage of pooled metas when the labels fit. current and
+     * cumulative follow the order of labels, like the lc_curr / lc_cum
+     * rows of analytics_batch_counts. */
+    static void
+    set_lc_counts(NvDsEventMsgMeta *meta, const std::vector<std::string> &labels,
+                  py::array_t<guint32, py::array::c_style | py::array::forcecast> current,
+                  py::array_t<guint32, py::array::c_style | py::array::forcecast> cumulative) {
+        const size_t num = labels.size();
+        if ((size_t) current.size() != num || (size_t) cumulative.size() != num)
+            throw std::invalid_argument(
+                    "set_lc_counts needs one current and cumulative count "
+                    "per label");
+
+        NvDsLineCrossingCount *counts = event_meta_array(
+                meta->lcCounts, meta->numLcCounts, has_inline_lc_counts(meta),
+                EVENT_MSG_META_LC_COUNTS, num);
+
+        const guint32 *curr = current.data();
+        const guint32 *cum = cumulative.data();
+        for (size_t i = 0; i < num; i++) {
+            g_strlcpy(counts[i].label, labels[i].c_str(), NVDS_LC_LABEL_LEN);
+            counts[i].current = curr[i];
+            counts[i].cumulative = cum[i];
+        }
+        meta->lcCounts = counts;
+        meta->numLcCounts = num;
+    }
+
+    /* Stores the objects that crossed a line in an event meta, in the
+     * inline storage of pooled metas when they fit. bbox rows hold
+     * (left, top, width, height) and lc_index the index of the crossed
+     * line's label in the lcCounts of the meta. */
+    static void
+    set_lc_objects(NvDsEventMsgMeta *meta,
+                   py::array_t<guint64, py::array::c_style | py::array::forcecast> tracking_id,
+                   py::array_t<gint32, py::array::c_style | py::array::forcecast> class_id,
+                   py::array_t<float, py::array::c_style | py::array::forcecast> bbox,
+                   py::array_t<guint32, py::array::c_style | py::array::forcecast> lc_index) {
+        const size_t num = tracking_id.size();
+        if ((size_t) class_id.size() != num || (size_t) lc_index.size() != num ||
+            (size_t) bbox.size() != 4 * num)
+            throw std::invalid_argument(
+                    "set_lc_objects needs a class id, bbox and lc index per "
+                    "tracking id");
+
+        NvDsLineCrossingObject *objects = event_meta_array(
+                meta->lcObjects, meta->numLcObjects,
+                has_inline_lc_objects(meta), EVENT_MSG_META_LC_OBJECTS, num);
+
+        const guint64 *ids = tracking_id.data();
+        const gint32 *classes = class_id.data();
+        const float *boxes = bbox.data();
+        const guint32 *labels = lc_index.data();
+        for (size_t i = 0; i < num; i++) {
+            objects[i].trackingId = ids[i];
+            objects[i].classId = classes[i];
+            objects[i].bbox.left = boxes[4 * i];
+            objects[i].bbox.top = boxes[4 * i + 1];
+            objects[i].bbox.width = boxes[4 * i + 2];
+            objects[i].bbox.height = boxes[4 * i + 3];
+            objects[i].lcIndex = labels[i];
+        }
+        meta->lcObjects = objects;
+        meta->numLcObjects = num;
+    }
+
+    /* Collects every object of the batch whose NvDsAnalyticsObjInfo
+     * reports a crossing of one of lc_labels, one row per object and
+     * crossed label, in frame order. The meta walk runs without the GIL
+     * into vectors that are then copied to NumPy arrays. */
+    static py::dict
+    analytics_batch_crossings(NvDsBatchMeta *batch_meta,
+                              const std::vector<std::string> &lc_labels) {
+        static const NvDsMetaType analytics_obj_meta_type =
+                nvds_get_user_meta_type(
+                        (gchar *) "NVIDIA.DSANALYTICSOBJ.USER_META");
+
+        std::vector<gint32> frames;
+        std::vector<guint64> object_ids;
+        std::vector<gint32> class_ids;
+        std::vector<float> boxes;
+        std::vector<guint32> labels;
+        {
+            py::gil_scoped_release release;
+
+            gint32 i = 0;
+            for (NvDsFrameMetaList *l_frame = batch_meta ?
+                         batch_meta->frame_meta_list : NULL;
+                 l_frame; l_frame = l_frame->next, i++) {
+                NvDsFrameMeta *frame = (NvDsFrameMeta *) l_frame->data;
+                for (NvDsObjectMetaList *l_obj = frame->obj_meta_list; l_obj;
+                     l_obj = l_obj->next) {
+                    NvDsObjectMeta *obj = (NvDsObjectMeta *) l_obj->data;
+                    for (NvDsUserMetaList *l_user = obj->obj_user_meta_list;
+                         l_user; l_user = l_user->next) {
+                        NvDsUserMeta *user_meta = (NvDsUserMeta *) l_user->data;
+                        if (!user_meta || user_meta->base_meta.meta_type !=
+                                          analytics_obj_meta_type)
+                            continue;
+
+                        NvDsAnalyticsObjInfo *info =
+                                (NvDsAnalyticsObjInfo *) user_meta->user_meta_data;
+                        for (const std::string &status : info->lcStatus) {
+                            for (size_t j = 0; j < lc_labels.size(); j++) {
+                                if (lc_labels[j] != status)
+                                    continue;
+                                frames.push_back(i);
+                                object_ids.push_back(obj->object_id);
+                                class_ids.push_back(obj->class_id);
+                                boxes.push_back(obj->rect_params.left);
+                                boxes.push_back(obj->rect_params.top);
+                                boxes.push_back(obj->rect_params.width);
+                                boxes.push_back(obj->rect_params.height);
+                                labels.push_back(j);
+                                break;
+                            }
+                        }
+                    }
+                }
+            }
+        }
+
+        const py::ssize_t num = frames.size();
+        py::dict result;
+        result["frame"] = py::array_t<gint32>(num, frames.data());
+        result["object_id"] = py::array_t<guint64>(num, object_ids.data());
+        result["class_id"] = py::array_t<gint32>(num, class_ids.data());
+        result["bbox"] = py::array_t<float>({num, (py::ssize_t) 4},
+                                            boxes.data());
+        result["label"] = py::array_t<guint32>(num, labels.data());
+        return result;
+    }
+
+    /* Copies the counts of the requested labels from one analytics map
+     * into a row of a (frame, label) array. Labels missing from the map
+     * keep the zero the row was initialised with. */
+    template<typename K, typename V, typename T>
+    static void
+    fill_label_row(const std::unordered_map<K, V> &counts,
+                   const std::vector<K> &labels, T *row) {
+        for (size_t j = 0; j < labels.size(); j++) {
+            auto it = counts.find(labels[j]);
+            if (it != counts.end())
+                row[j] = (T) it->second;
+        }
+    }
+
+    /* Gives a new, frameless buffer an NvDsBatchMeta with one frame meta
+     * per pad index, so event msg metas can be attached to it and pushed
+     * to nvmsgconv, which only reads the meta, after the last frame of the
+     * streams went by. */
+    static void
+    buffer_add_event_batch_meta(size_t gst_buffer,
+                                const std::vector<guint> &pad_indices) {
+        auto *buffer = (GstBuffer *) gst_buffer;
+        if (!gst_buffer_is_writable(buffer))
+            throw std::invalid_argument("buffer is not writable");
+        NvDsBatchMeta *batch_meta =
+                nvds_create_batch_meta(MAX(pad_indices.size(), 1));
+        NvDsMeta *meta = gst_buffer_add_nvds_meta(
+                buffer, batch_meta, NULL, nvds_batch_meta_copy_func,
+                nvds_batch_meta_release_func);
+        meta->meta_type = NVDS_BATCH_GST_META;
+        batch_meta->base_meta.batch_meta = batch_meta;
+        batch_meta->base_meta.copy_func = nvds_batch_meta_copy_func;
+        batch_meta->base_meta.release_func = nvds_batch_meta_release_func;
+        for (guint pad_index : pad_indices) {
+            NvDsFrameMeta *frame = nvds_acquire_frame_meta_from_pool(
+                    batch_meta);
+            frame->pad_index = pad_index;
+            frame->source_id = pad_index;
+            frame->batch_id = batch_meta->num_frames_in_batch;
+            nvds_add_frame_meta_to_batch(batch_meta, frame);
+        }
+    }
+
+    /* Walks the frames of a batch once and gathers the nvdsanalytics
+     * counts of every frame into NumPy arrays indexed by (frame, label).
+     * The list walk runs without the GIL; only the array allocation and
+     * the final dict creation need it. */
+    static py::dict
+    analytics_batch_counts(NvDsBatchMeta *batch_meta,
+                           const std::vector<std::string> &lc_labels,
+                           const std::vector<std::string> &roi_labels,
+                           const std::vector<std::string> &oc_labels) {
+        static const NvDsMetaType analytics_meta_type =
+                nvds_get_user_meta_type(
+                        (gchar *) "NVIDIA.DSANALYTICSFRAME.USER_META");
+
+        const py::ssize_t num_frames = batch_meta ?
+                g_list_length(batch_meta->frame_meta_list) : 0;
+        const py::ssize_t num_lc = lc_labels.size();
+        const py::ssize_t num_roi = roi_labels.size();
+        const py::ssize_t num_oc = oc_labels.size();
+
+        py::array_t<guint64> frame_meta(num_frames);
+        py::array_t<guint32> pad_index(num_frames);
+        py::array_t<gint32> frame_num(num_frames);
+        py::array_t<bool> has_analytics(num_frames);
+        py::array_t<guint32> lc_curr({num_frames, num_lc});
+        py::array_t<guint32> lc_cum({num_frames, num_lc});
+        py::array_t<guint32> roi({num_frames, num_roi});
+        py::array_t<bool> oc({num_frames, num_oc});
+
+        guint64 *frame_meta_ptr = frame_meta.mutable_data();
+        guint32 *pad_index_ptr = pad_index.mutable_data();
+        gint32 *frame_num_ptr = frame_num.mutable_data();
+        bool *has_analytics_ptr = has_analytics.mutable_data();
+        guint32 *lc_curr_ptr = lc_curr.mutable_data();
+        guint32 *lc_cum_ptr = lc_cum.mutable_data();
+        guint32 *roi_ptr = roi.mutable_data();
+        bool *oc_ptr = oc.mutable_data();
+
+        {
+            py::gil_scoped_release release;
+
+            memset(has_analytics_ptr, 0, num_frames * sizeof(bool));
+            memset(lc_curr_ptr, 0, num_frames * num_lc * sizeof(guint32));
+            memset(lc_cum_ptr, 0, num_frames * num_lc * sizeof(guint32));
+            memset(roi_ptr, 0, num_frames * num_roi * sizeof(guint32));
+            memset(oc_ptr, 0, num_frames * num_oc * sizeof(bool));
+
+            py::ssize_t i = 0;
+            for (NvDsFrameMetaList *l_frame = batch_meta ?
+                         batch_meta->frame_meta_list : NULL;
+                 l_frame && i < num_frames; l_frame = l_frame->next, i++) {
+                NvDsFrameMeta *frame = (NvDsFrameMeta *) l_frame->data;
+                frame_meta_ptr[i] = (guint64) frame;
+                pad_index_ptr[i] = frame->pad_index;
+                frame_num_ptr[i] = frame->frame_num;
+
+                for (NvDsUserMetaList *l_user = frame->frame_user_meta_list;
+                     l_user; l_user = l_user->next) {
+                    NvDsUserMeta *user_meta = (NvDsUserMeta *) l_user->data;
+                    if (!user_meta ||
+                        user_meta->base_meta.meta_type != analytics_meta_type)
+                        continue;
+
+                    NvDsAnalyticsFrameMeta *meta =
+                            (NvDsAnalyticsFrameMeta *) user_meta->user_meta_data;
+                    has_analytics_ptr[i] = true;
+                    fill_label_row(meta->objLCCurrCnt, lc_labels,
+                                   lc_curr_ptr + i * num_lc);
+                    fill_label_row(meta->objLCCumCnt, lc_labels,
+                                   lc_cum_ptr + i * num_lc);
+                    fill_label_row(meta->objInROIcnt, roi_labels,
+                                   roi_ptr + i * num_roi);
+                    fill_label_row(meta->ocStatus, oc_labels,
+                                   oc_ptr + i * num_oc);
+                }
+            }
+        }
+
+        py::dict result;
+        result["frame_meta"] = frame_meta;
+        result["pad_index"] = pad_index;
+        result["frame_num"] = frame_num;
+        result["has_analytics"] = has_analytics;
+        result["lc_curr"] = lc_curr;
+        result["lc_cum"] = lc_cum;
+        result["roi"] = roi;
+        result["oc"] = oc;
+        return result;
+    }
+
     void bindschema(py::module &m) {
         /*Start of Bindings for nvdsmeta_schema.h*/
         py::enum_<NvDsEventType>(m, "NvDsEventType",
@@ -424,7 +929,79 @@ namespace pydeepstream {
                 .def_readwrite("extMsgSize", &NvDsEventMsgMeta::extMsgSize)
                 
                 .def_readwrite("lc_curr_straight", &NvDsEventMsgMeta::lc_curr_straight)
-                .def_readwrite("lc_cum_straight", &NvDsEventMsgMeta::lc_cum_straight);
+                .def_readwrite("lc_cum_straight", &NvDsEventMsgMeta::lc_cum_straight)
+                .def_readonly("numLcCounts", &NvDsEventMsgMeta::numLcCounts)
+                .def_property_readonly("lc_counts",
+                     [](NvDsEventMsgMeta &self) {
+                         py::list counts;
+                         for (guint i = 0; i < self.numLcCounts; i++) {
+                             NvDsLineCrossingCount &count = self.lcCounts[i];
+                             counts.append(py::make_tuple(
+                                     std::string(count.label), count.current,
+                                     count.cumulative));
+                         }
+                         return counts;
+                     },
+                     "List of (label, current, cumulative) line-crossing "
+                     "counts of the event.")
+                .def("set_lc_counts", &set_lc_counts,
+                     "labels"_a, "current"_a, "cumulative"_a,
+                     "Sets one (label, current, cumulative) line-crossing "
+                     "count per label, taking the counts from two arrays in "
+                     "label order. Metas from acquire_nvds_event_msg_meta "
+                     "hold up to 8 labels without another allocation; "
+                     "labels are truncated to 31 bytes.")
+                .def_readonly("numLcObjects", &NvDsEventMsgMeta::numLcObjects)
+                .def_property_readonly("lc_objects",
+                     [](NvDsEventMsgMeta &self) {
+                         py::list objects;
+                         for (guint i = 0; i < self.numLcObjects; i++) {
+                             NvDsLineCrossingObject &obj = self.lcObjects[i];
+                             objects.append(py::make_tuple(
+                                     obj.trackingId, obj.classId,
+                                     py::make_tuple(obj.bbox.left, obj.bbox.top,
+                                                    obj.bbox.width,
+                                                    obj.bbox.height),
+                                     obj.lcIndex));
+                         }
+                         return objects;
+                     },
+                     "List of (tracking id, class id, (left, top, width, "
+                     "height), lc index) of the objects that crossed a line.")
+                .def("set_lc_objects", &set_lc_objects,
+                     "tracking_id"_a, "class_id"_a, "bbox"_a, "lc_index"_a,
+                     "Sets the objects that crossed a line in the frame of "
+                     "the event from arrays with one entry per object and "
+                     "crossed line: bbox rows hold (left, top, width, height) "
+                     "and lc_index the index of the line's label in "
+                     "lc_counts. Metas from acquire_nvds_event_msg_meta hold "
+                     "up to 16 objects without another allocation.")
+                .def_property_readonly("trace",
+                     [](NvDsEventMsgMeta &self) {
+                         return py::make_tuple(
+                                 self.trace.captureTs, self.trace.bufPts,
+                                 self.trace.probeTs, self.trace.serializeTs);
+                     },
+                     "(capture, buffer PTS, probe, serialization) "
+                     "timestamps of the event in nanoseconds, 0 where "
+                     "unknown; nvmsgconv sets the serialization time.")
+                .def("set_trace",
+                     [](NvDsEventMsgMeta &self, guint64 capture_ts,
+                        guint64 buf_pts, guint64 probe_ts, bool compact) {
+                         self.trace.captureTs = capture_ts;
+                         self.trace.bufPts = buf_pts;
+                         self.trace.probeTs = probe_ts;
+                         self.trace.serializeTs = 0;
+                         self.trace.flags =
+                                 compact ? NVDS_EVENT_TRACE_COMPACT : 0;
+                     },
+                     "capture_ts"_a, "buf_pts"_a, "probe_ts"_a,
+                     "compact"_a = false,
+                     "Makes nvmsgconv add a latency trace to the event's "
+                     "payload: the frame's capture time (ntp_timestamp), "
+                     "buffer PTS and the probe time in nanoseconds, as "
+                     "timestamps or, with compact, as stage durations. "
+                     "probe_ts 0 removes the trace.");
 
         m.def("alloc_nvds_event_msg_meta",
               []() {
@@ -436,6 +1013,56 @@ namespace pydeepstream {
               pydsdoc::methodsDoc::alloc_nvds_event_msg_meta);
 
 
+        m.def("event_msg_meta_pool_init",
+              [](size_t capacity) {
+                  if (!event_msg_meta_pool.init(capacity))
+                      throw std::runtime_error(
+                              "event msg meta pool has slots in use");
+              },
+              "capacity"_a,
+              "Preallocates capacity NvDsEventMsgMeta slots with inline "
+              "timestamp storage for acquire_nvds_event_msg_meta. Fails if "
+              "slots of a previous pool are still in use.");
+
+        m.def("acquire_nvds_event_msg_meta",
+              []() {
+                  return event_msg_meta_pool.acquire();
+              },
+              py::return_value_policy::reference,
+              "Returns a zeroed NvDsEventMsgMeta from the pool, or from the "
+              "heap when the pool is exhausted. Its ts already points to "
+              "storage for the timestamp, so no alloc_buffer is needed. "
+              "Release it with the set_event_msg_meta_callbacks functions "
+              "once attached, or with release_nvds_event_msg_meta.");
+
+        m.def("release_nvds_event_msg_meta",
+              &free_event_msg_meta,
+              "meta"_a,
+              "Releases an event msg meta that was never attached to a "
+              "buffer, returning it to the pool if it came from there.");
+
+        m.def("event_msg_meta_pool_stats",
+              []() {
+                  return event_msg_meta_pool.stats();
+              },
+              "Returns the pool capacity, available and in-use slots, hits, "
+              "heap-fallback misses and the high-water mark of slots in use.");
+
+        m.def("set_event_msg_meta_callbacks",
+              [](NvDsUserMeta *user_meta) {
+                  user_meta->base_meta.copy_func = event_msg_meta_copy_func;
+                  user_meta->base_meta.release_func =
+                          event_msg_meta_release_func;
+              },
+              "user_meta"_a,
+              "Sets the built-in native copy and release functions for an "
+              "NvDsUserMeta holding an NvDsEventMsgMeta. They deep-copy and "
+              "free ts, sensorStr, objectId, otherAttrs, videoPath, "
+              "objSignature and the line-crossing counts and objects without "
+              "calling back into Python, replacing user_copyfunc / "
+              "user_releasefunc for event msg metas.");
+
+
         m.def("generate_ts_rfc3339",
               [](size_t buffer, size_t size) {
                   char *bufptr = (char *) buffer;
@@ -504,6 +1131,39 @@ namespace pydeepstream {
               py::return_value_policy::reference,
               pydsdoc::methodsDoc::alloc_nvds_payload);
 
+
+        m.def("gst_buffer_add_event_batch_meta",
+              &buffer_add_event_batch_meta,
+              "buffer"_a, "pad_indices"_a,
+              "Adds an NvDsBatchMeta with one frame meta per pad index to a "
+              "new, writable buffer (its address, hash(buffer)) without "
+              "video frames. Event msg metas attached to its frames reach "
+              "nvmsgconv like those of a real batch; elements that map the "
+              "video surface must not see the buffer.");
+
+        m.def("nvds_analytics_batch_counts",
+              &analytics_batch_counts,
+              "batch_meta"_a, "lc_labels"_a,
+              "roi_labels"_a = std::vector<std::string>(),
+              "oc_labels"_a = std::vector<std::string>(),
+              "Extracts the nvdsanalytics line-crossing, ROI and overcrowding "
+              "counts of every frame in the batch in a single call. Returns a "
+              "dict of NumPy arrays: frame_meta (frame meta addresses usable "
+              "with NvDsFrameMeta.cast), pad_index, frame_num and "
+              "has_analytics indexed by frame, and lc_curr, lc_cum, roi and "
+              "oc indexed by (frame, label) in the order of the label lists.");
+
+        m.def("nvds_analytics_batch_crossings",
+              &analytics_batch_crossings,
+              "batch_meta"_a, "lc_labels"_a,
+              "Collects the objects of every frame in the batch whose "
+              "nvdsanalytics object meta reports a crossing of one of "
+              "lc_labels, in a single call. Returns a dict of NumPy arrays "
+              "with one entry per object and crossed line, in frame order: "
+              "frame (index in the batch), object_id, class_id, bbox "
+              "((left, top, width, height) rows) and label (index in "
+              "lc_labels).");
+
     }
 
 }
@@ -132,6 +132,59 @@ typedef struct NvDsObjectSignature {
   guint size;
 } NvDsObjectSignature;
 
+/** Defines the size of @ref NvDsLineCrossingCount::label, including the
+ terminating NUL. Longer nvdsanalytics labels are truncated. */
+#define NVDS_LC_LABEL_LEN 32
+
+/**
+ * Holds the counts of one line-crossing label of nvdsanalytics.
+ */
+typedef struct NvDsLineCrossingCount {
+  /** Holds the label of the line, "straight" for line-crossing-straight. */
+  gchar label[NVDS_LC_LABEL_LEN];
+  /** Holds the number of crossings in the frame (objLCCurrCnt). */
+  guint current;
+  /** Holds the number of crossings since the start (objLCCumCnt). */
+  guint cumulative;
+} NvDsLineCrossingCount;
+
+/**
+ * Holds a tracked object that crossed a line in the frame of an event.
+ */
+typedef struct NvDsLineCrossingObject {
+  /** Holds the tracking ID of the object. */
+  guint64 trackingId;
+  /** Holds the object's bounding box in the frame. */
+  NvDsRect bbox;
+  /** Holds the object's class ID. */
+  gint classId;
+  /** Holds the index of the crossed line's label in the event's
+   @ref NvDsEventMsgMeta::lcCounts. */
+  guint lcIndex;
+} NvDsLineCrossingObject;
+
+/** Flag of @ref NvDsEventTrace::flags: serialize the trace as an array of
+ stage durations instead of an object of timestamps. */
+#define NVDS_EVENT_TRACE_COMPACT 0x1
+
+/**
+ * Holds the timestamps of an event on its way from the camera to the
+ * message broker. Timestamps are nanoseconds since the Unix epoch, 0 where
+ * a stage is unknown; an event with @a probeTs 0 carries no trace.
+ */
+typedef struct NvDsEventTrace {
+  /** Holds the capture time of the event's frame (NvDsFrameMeta::ntp_timestamp). */
+  guint64 captureTs;
+  /** Holds the PTS of the event's frame buffer, in nanoseconds. */
+  guint64 bufPts;
+  /** Holds the time the analytics probe handled the frame. */
+  guint64 probeTs;
+  /** Holds the time nvmsgconv serialized the event, set by nvmsgconv. */
+  guint64 serializeTs;
+  /** Holds NVDS_EVENT_TRACE_* flags. */
+  guint flags;
+} NvDsEventTrace;
+
 /**
  * Holds a vehicle object's parameters.
  */
@@ -279,6 +332,18 @@ typedef struct NvDsEventMsgMeta {
 
   guint lc_curr_straight;
   guint lc_cum_straight;
+  /** Holds a pointer to the counts of every line-crossing label. When set,
+   payloads carry these instead of @a lc_curr_straight / @a lc_cum_straight. */
+  NvDsLineCrossingCount *lcCounts;
+  /** Holds the number of counts at @a lcCounts. */
+  guint numLcCounts;
+  /** Holds a pointer to the objects that crossed a line in the frame, one
+   entry per object and crossed line. */
+  NvDsLineCrossingObject *lcObjects;
+  /** Holds the number of objects at @a lcObjects. */
+  guint numLcObjects;
+  /** Holds the latency trace of the event, see @ref NvDsEventTrace. */
+  NvDsEventTrace trace;
 } NvDsEventMsgMeta;
 
 /**
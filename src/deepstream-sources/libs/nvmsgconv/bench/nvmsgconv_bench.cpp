@@ -0,0 +1,775 @@
+/*
+ * Copyright (c) 2022, NVIDIA CORPORATION.  All rights reserved.
+ *
+ * NVIDIA Corporation and its licensors retain all intellectual property
+ * and proprietary rights in and to this software, related documentation
+ * and any modifications thereto.  Any use, reproduction, disclosure or
+ * distribution of this software and related documentation without an express
+ * license agreement from NVIDIA Corporation is strictly prohibited.
+ *
+ */
+
+/*
+ * Microbenchmark of the nvmsgconv payload generators.
+ *
+ * Generates synthetic event metas (nvds_msg2p_generate / _multiple) and
+ * frame metas (nvds_msg2p_generate_new) and reports messages/s,
+ * bytes/message and mallocs/message for every payload type and config
+ * file format, plus the cost of nvds_msg2p_ctx_create for the key-value,
+ * CSV and YAML formats:
+ *
+ *   make bench
+ *   G_SLICE=always-malloc ./nvmsgconv_bench [--iterations N] [--events N]
+ *       [--sensors N] [--json FILE] [--baseline FILE] [--tolerance PCT]
+ *
+ * --json writes the results as JSON ("-" for stdout). --baseline compares
+ * them with an earlier --json file and exits with 1 if a case lost more
+ * than --tolerance percent of its messages/s or allocates more per
+ * message. Allocations are counted by wrapping malloc, calloc and realloc
+ * of glibc; G_SLICE=always-malloc makes GSlice allocations visible too.
+ */
+
+#include <json-glib/json-glib.h>
+#include <glib/gstdio.h>
+#include <stdlib.h>
+#include <cstring>
+#include <functional>
+#include <iostream>
+#include <string>
+#include <vector>
+#include "../nvmsgconv.h"
+#include "nvdsmeta.h"
+#include "nvds_analytics_meta.h"
+
+using namespace std;
+
+extern "C" {
+void *__libc_malloc (size_t size);
+void *__libc_calloc (size_t nmemb, size_t size);
+void *__libc_realloc (void *ptr, size_t size);
+
+/* The benchmark is single threaded, a plain counter is enough. */
+static guint64 num_mallocs = 0;
+
+void *malloc (size_t size)
+{
+  num_mallocs++;
+  return __libc_malloc (size);
+}
+
+void *calloc (size_t nmemb, size_t size)
+{
+  num_mallocs++;
+  return __libc_calloc (nmemb, size);
+}
+
+void *realloc (void *ptr, size_t size)
+{
+  num_mallocs++;
+  return __libc_realloc (ptr, size);
+}
+}
+
+#define BENCH_VERSION 1
+#define WARMUP_CALLS 100
+#define LC_LABELS 2
+#define LC_OBJECTS 4
+#define FRAME_OBJECTS 8
+
+static const gchar *lc_labels[LC_LABELS] = { "straight", "left" };
+
+enum ConfigFormat {
+  CONFIG_KEY_VALUE,
+  CONFIG_CSV,
+  CONFIG_YAML,
+  NUM_CONFIG_FORMATS
+};
+
+static const gchar *config_names[NUM_CONFIG_FORMATS] = {
+  "key-value", "csv", "yaml"
+};
+
+enum BenchApi {
+  API_GENERATE,           /* nvds_msg2p_generate, events[0] or all events */
+  API_GENERATE_MULTIPLE,  /* nvds_msg2p_generate_multiple, all events */
+  API_GENERATE_NEW        /* nvds_msg2p_generate_new, frame metas */
+};
+
+struct PayloadCase {
+  const gchar *name;
+  NvDsPayloadType type;
+  BenchApi api;
+  guint batchMode;
+  /* Called per object like nvmsgconv does for the full schema. */
+  gboolean perObject;
+};
+
+static const PayloadCase payload_cases[] = {
+  { "event", NVDS_PAYLOAD_DEEPSTREAM, API_GENERATE, 0, FALSE },
+  { "event_multiple", NVDS_PAYLOAD_DEEPSTREAM, API_GENERATE_MULTIPLE, 0, FALSE },
+  { "event_array", NVDS_PAYLOAD_DEEPSTREAM, API_GENERATE_MULTIPLE, 1, FALSE },
+  { "event_minimal", NVDS_PAYLOAD_DEEPSTREAM_MINIMAL, API_GENERATE, 0, FALSE },
+  { "event_binary", NVDS_PAYLOAD_DEEPSTREAM_BINARY, API_GENERATE_MULTIPLE, 0, FALSE },
+  { "dsmeta", NVDS_PAYLOAD_DEEPSTREAM, API_GENERATE_NEW, 0, TRUE },
+  { "dsmeta_minimal", NVDS_PAYLOAD_DEEPSTREAM_MINIMAL, API_GENERATE_NEW, 0, FALSE },
+};
+
+static const gchar *
+payload_type_name (NvDsPayloadType type)
+{
+  switch (type) {
+    case NVDS_PAYLOAD_DEEPSTREAM:
+      return "deepstream";
+    case NVDS_PAYLOAD_DEEPSTREAM_MINIMAL:
+      return "deepstream_minimal";
+    case NVDS_PAYLOAD_DEEPSTREAM_BINARY:
+      return "deepstream_binary";
+    default:
+      return "unknown";
+  }
+}
+
+/* Only the full schema reads CSV files, and only the key-value and YAML
+ * formats have a [message] group for batch-mode. */
+static gboolean
+case_supports_config (const PayloadCase &c, ConfigFormat format)
+{
+  if (format != CONFIG_CSV)
+    return TRUE;
+  return c.type == NVDS_PAYLOAD_DEEPSTREAM && c.batchMode == 0;
+}
+
+struct BenchResult {
+  string name;
+  string payloadType;
+  string config;
+  guint64 calls = 0;
+  guint64 messages = 0;
+  guint64 events = 0;
+  guint64 bytes = 0;
+  guint64 mallocs = 0;
+  gdouble seconds = 0;
+
+  gdouble messagesPerSec () const
+  { return seconds > 0 ? messages / seconds : 0; }
+  gdouble bytesPerMessage () const
+  { return messages ? (gdouble) bytes / messages : 0; }
+  gdouble mallocsPerMessage () const
+  { return messages ? (gdouble) mallocs / messages : 0; }
+};
+
+/* Returns the messages produced by one call and adds their size to bytes. */
+typedef std::function<guint (guint64 *bytes)> BenchCall;
+
+static void
+run_case (BenchResult &result, guint iterations, const BenchCall &call)
+{
+  guint64 bytes = 0;
+  guint64 messages = 0;
+  guint64 mallocs;
+  gint64 start;
+
+  // first calls pay for GType registration, uuid state etc.
+  for (guint i = 0; i < MIN (iterations, WARMUP_CALLS); i++)
+    call (&bytes);
+
+  bytes = 0;
+  mallocs = num_mallocs;
+  start = g_get_monotonic_time ();
+  for (guint i = 0; i < iterations; i++)
+    messages += call (&bytes);
+  result.seconds = (g_get_monotonic_time () - start) / 1e6;
+  result.mallocs = num_mallocs - mallocs;
+  result.calls = iterations;
+  result.messages = messages;
+  result.bytes = bytes;
+}
+
+/* Synthetic config files with one sensor, place and analytics group per
+ * sensor id, in the three formats nvds_msg2p_ctx_create understands. */
+static gchar *
+write_config (const gchar *dir, ConfigFormat format, guint sensors,
+    guint batchMode)
+{
+  GString *text = g_string_new (NULL);
+  gchar *path;
+  GError *error = NULL;
+
+  if (format == CONFIG_CSV) {
+    g_string_append (text, "cameraId,sensorId,description,cameraIDString,"
+        "field1,field2,field3\n");
+    for (guint i = 0; i < sensors; i++)
+      g_string_append_printf (text, "%u,camera-%u,Entrance %u,cam%u,"
+          "walsh,lane%u,P2\n", i, i, i, i, i);
+    path = g_strdup_printf ("%s/msgconv_config.csv", dir);
+  } else if (format == CONFIG_YAML) {
+    for (guint i = 0; i < sensors; i++) {
+      g_string_append_printf (text,
+          "sensor%u:\n"
+          "  enable: 1\n"
+          "  type: Camera\n"
+          "  id: camera-%u\n"
+          "  location: 45.293701447;-75.8303914499;48.1557479338\n"
+          "  description: Entrance %u\n"
+          "  coordinate: 5.2;10.1;11.2\n"
+          "place%u:\n"
+          "  enable: 1\n"
+          "  id: %u\n"
+          "  type: garage\n"
+          "  name: XYZ\n"
+          "  location: 30.32;-40.55;100.0\n"
+          "  coordinate: 1.0;2.0;3.0\n"
+          "  place-sub-field1: walsh\n"
+          "  place-sub-field2: lane%u\n"
+          "  place-sub-field3: P2\n"
+          "analytics%u:\n"
+          "  enable: 1\n"
+          "  id: XYZ\n"
+          "  description: Line crossing\n"
+          "  source: nvdsanalytics\n"
+          "  version: 1.0\n", i, i, i, i, i, i, i);
+    }
+    g_string_append_printf (text, "message:\n  batch-mode: %u\n", batchMode);
+    path = g_strdup_printf ("%s/msgconv_config_%u.yml", dir, batchMode);
+  } else {
+    for (guint i = 0; i < sensors; i++) {
+      g_string_append_printf (text,
+          "[sensor%u]\n"
+          "enable=1\n"
+          "type=Camera\n"
+          "id=camera-%u\n"
+          "location=45.293701447;-75.8303914499;48.1557479338\n"
+          "description=Entrance %u\n"
+          "coordinate=5.2;10.1;11.2\n\n"
+          "[place%u]\n"
+          "enable=1\n"
+          "id=%u\n"
+          "type=garage\n"
+          "name=XYZ\n"
+          "location=30.32;-40.55;100.0\n"
+          "coordinate=1.0;2.0;3.0\n"
+          "place-sub-field1=walsh\n"
+          "place-sub-field2=lane%u\n"
+          "place-sub-field3=P2\n\n"
+          "[analytics%u]\n"
+          "enable=1\n"
+          "id=XYZ\n"
+          "description=Line crossing\n"
+          "source=nvdsanalytics\n"
+          "version=1.0\n\n", i, i, i, i, i, i, i);
+    }
+    g_string_append_printf (text, "[message]\nbatch-mode=%u\n", batchMode);
+    path = g_strdup_printf ("%s/msgconv_config_%u.txt", dir, batchMode);
+  }
+
+  if (!g_file_set_contents (path, text->str, text->len, &error)) {
+    cout << "Error: " << error->message << endl;
+    g_error_free (error);
+    g_free (path);
+    path = NULL;
+  }
+  g_string_free (text, TRUE);
+  return path;
+}
+
+/* Event metas as the Python probe attaches them: line-crossing counts of
+ * every label, a few crossing objects and a vehicle object. */
+struct SyntheticEvents {
+  vector<NvDsEventMsgMeta> metas;
+  vector<NvDsEvent> events;
+  vector<NvDsLineCrossingCount> counts;
+  vector<NvDsLineCrossingObject> objects;
+  vector<gchar *> strings;
+  NvDsVehicleObject vehicle;
+  gchar ts[32];
+
+  SyntheticEvents (guint num, guint sensors)
+      : metas (num), events (num), counts (num * LC_LABELS),
+        objects (num * LC_OBJECTS)
+  {
+    g_strlcpy (ts, "2022-08-20T09:05:01.695Z", sizeof (ts));
+    vehicle.type = (gchar *) "sedan";
+    vehicle.make = (gchar *) "Bugatti";
+    vehicle.model = (gchar *) "M";
+    vehicle.color = (gchar *) "blue";
+    vehicle.region = (gchar *) "CA";
+    vehicle.license = (gchar *) "XX1234";
+
+    for (guint i = 0; i < num; i++) {
+      NvDsEventMsgMeta &meta = metas[i];
+      memset (&meta, 0, sizeof (meta));
+      meta.type = NVDS_EVENT_ENTRY;
+      meta.objType = NVDS_OBJECT_TYPE_VEHICLE;
+      meta.bbox.top = 640;
+      meta.bbox.left = 812;
+      meta.bbox.width = 96;
+      meta.bbox.height = 180;
+      meta.sensorId = i % sensors;
+      meta.placeId = i % sensors;
+      meta.moduleId = i % sensors;
+      meta.frameId = i;
+      meta.confidence = 0.9;
+      meta.trackingId = 1000 + i;
+      meta.ts = ts;
+      meta.objectId = keep (g_strdup_printf ("object-%u", i));
+      meta.sensorStr = keep (g_strdup_printf ("camera-%u", i % sensors));
+      meta.extMsg = &vehicle;
+      meta.extMsgSize = sizeof (vehicle);
+
+      meta.lcCounts = &counts[i * LC_LABELS];
+      meta.numLcCounts = LC_LABELS;
+      for (guint j = 0; j < LC_LABELS; j++) {
+        NvDsLineCrossingCount &count = meta.lcCounts[j];
+        g_strlcpy (count.label, lc_labels[j], sizeof (count.label));
+        count.current = j == 0;
+        count.cumulative = 1000 + i;
+      }
+
+      meta.lcObjects = &objects[i * LC_OBJECTS];
+      meta.numLcObjects = LC_OBJECTS;
+      for (guint j = 0; j < LC_OBJECTS; j++) {
+        NvDsLineCrossingObject &obj = meta.lcObjects[j];
+        memset (&obj, 0, sizeof (obj));
+        obj.trackingId = 1000 * i + j;
+        obj.bbox.top = 100 * j;
+        obj.bbox.left = 200;
+        obj.bbox.width = 96;
+        obj.bbox.height = 180;
+        obj.classId = 0;
+        obj.lcIndex = j % LC_LABELS;
+      }
+
+      events[i].eventType = NVDS_EVENT_ENTRY;
+      events[i].metadata = &meta;
+    }
+  }
+
+  ~SyntheticEvents ()
+  {
+    for (gchar *str : strings)
+      g_free (str);
+  }
+
+  gchar *keep (gchar *str)
+  {
+    strings.push_back (str);
+    return str;
+  }
+};
+
+/* Frame metas as nvdsanalytics leaves them: FRAME_OBJECTS objects and an
+ * NvDsAnalyticsFrameMeta with line-crossing, ROI and object counts. */
+struct SyntheticFrames {
+  vector<NvDsFrameMeta> frames;
+  vector<NvDsObjectMeta> objects;
+  vector<NvDsUserMeta> userMetas;
+  vector<NvDsAnalyticsFrameMeta> analytics;
+
+  SyntheticFrames (guint num, guint sensors)
+      : frames (num), objects (num * FRAME_OBJECTS), userMetas (num),
+        analytics (num)
+  {
+    for (guint i = 0; i < num; i++) {
+      NvDsFrameMeta &frame = frames[i];
+      memset (&frame, 0, sizeof (frame));
+      frame.source_id = i % sensors;
+      frame.pad_index = i % sensors;
+      frame.frame_num = i;
+      frame.source_frame_width = 1920;
+      frame.source_frame_height = 1080;
+      frame.pipeline_width = 1920;
+      frame.pipeline_height = 1080;
+
+      for (guint j = 0; j < FRAME_OBJECTS; j++) {
+        NvDsObjectMeta &obj = objects[i * FRAME_OBJECTS + j];
+        memset (&obj, 0, sizeof (obj));
+        obj.class_id = 0;
+        obj.object_id = 1000 * i + j;
+        obj.confidence = 0.9;
+        obj.rect_params.left = 100 * j;
+        obj.rect_params.top = 200;
+        obj.rect_params.width = 96;
+        obj.rect_params.height = 180;
+        g_strlcpy (obj.obj_label, "Vehicle", sizeof (obj.obj_label));
+        frame.obj_meta_list = g_list_append (frame.obj_meta_list, &obj);
+      }
+      frame.num_obj_meta = FRAME_OBJECTS;
+
+      NvDsAnalyticsFrameMeta &meta = analytics[i];
+      for (guint j = 0; j < LC_LABELS; j++) {
+        meta.objLCCurrCnt[lc_labels[j]] = j == 0;
+        meta.objLCCumCnt[lc_labels[j]] = 1000 + i;
+      }
+      meta.objInROIcnt["RF"] = 3;
+      meta.ocStatus["OC"] = false;
+      meta.objCnt[0] = FRAME_OBJECTS;
+
+      NvDsUserMeta &userMeta = userMetas[i];
+      memset (&userMeta, 0, sizeof (userMeta));
+      userMeta.base_meta.meta_type = NVDS_USER_FRAME_META_NVDSANALYTICS;
+      userMeta.user_meta_data = &meta;
+      frame.frame_user_meta_list = g_list_append (NULL, &userMeta);
+    }
+  }
+
+  ~SyntheticFrames ()
+  {
+    for (NvDsFrameMeta &frame : frames) {
+      g_list_free (frame.obj_meta_list);
+      g_list_free (frame.frame_user_meta_list);
+    }
+  }
+};
+
+static guint
+release_payload (NvDsMsg2pCtx *ctx, NvDsPayload *payload, guint64 *bytes)
+{
+  guint messages = 0;
+
+  if (!payload)
+    return 0;
+  if (payload->payload) {
+    *bytes += payload->payloadSize;
+    messages = 1;
+  }
+  nvds_msg2p_release (ctx, payload);
+  return messages;
+}
+
+static guint
+release_payloads (NvDsMsg2pCtx *ctx, NvDsPayload **payloads, guint count,
+    guint64 *bytes)
+{
+  guint messages = 0;
+
+  if (!payloads)
+    return 0;
+  for (guint i = 0; i < count; i++)
+    messages += release_payload (ctx, payloads[i], bytes);
+  g_free (payloads);
+  return messages;
+}
+
+static BenchCall
+make_call (NvDsMsg2pCtx *ctx, const PayloadCase &c, SyntheticEvents &events,
+    SyntheticFrames &frames, guint64 *eventsPerCall)
+{
+  guint numEvents = events.events.size ();
+
+  if (c.api == API_GENERATE_NEW) {
+    // one call per frame, or per object of the frame for the full schema
+    *eventsPerCall = c.perObject ? FRAME_OBJECTS : 1;
+    return [ctx, &frames, &c] (guint64 *bytes) -> guint {
+      static guint frame = 0;
+      NvDsFrameMeta *frameMeta = &frames.frames[frame++ % frames.frames.size ()];
+      NvDsMsg2pMetaInfo info = { NULL, frameMeta, (gchar *) "video" };
+      guint messages = 0;
+      NvDsObjectMetaList *l = c.perObject ? frameMeta->obj_meta_list : NULL;
+
+      do {
+        info.objMeta = l ? l->data : NULL;
+        messages += release_payload (ctx,
+            nvds_msg2p_generate_new (ctx, &info), bytes);
+        l = l ? l->next : NULL;
+      } while (l);
+      return messages;
+    };
+  }
+
+  if (c.api == API_GENERATE_MULTIPLE) {
+    *eventsPerCall = numEvents;
+    return [ctx, &events, numEvents] (guint64 *bytes) -> guint {
+      guint count = 0;
+      NvDsPayload **payloads = nvds_msg2p_generate_multiple (ctx,
+          events.events.data (), numEvents, &count);
+      return release_payloads (ctx, payloads, count, bytes);
+    };
+  }
+
+  // nvds_msg2p_generate only looks at the first event of the full and
+  // binary schemas, the minimal schema packs all of them
+  *eventsPerCall = c.type == NVDS_PAYLOAD_DEEPSTREAM_MINIMAL ? numEvents : 1;
+  return [ctx, &events, numEvents] (guint64 *bytes) -> guint {
+    static guint event = 0;
+    NvDsPayload *payload;
+
+    if (ctx->payloadType == NVDS_PAYLOAD_DEEPSTREAM_MINIMAL)
+      payload = nvds_msg2p_generate (ctx, events.events.data (), numEvents);
+    else
+      payload = nvds_msg2p_generate (ctx,
+          &events.events[event++ % numEvents], 1);
+    return release_payload (ctx, payload, bytes);
+  };
+}
+
+static void
+print_results (const vector<BenchResult> &results)
+{
+  g_print ("%-16s %-10s %12s %12s %12s %14s\n", "case", "config", "msgs/s",
+      "events/s", "bytes/msg", "mallocs/msg");
+  for (const BenchResult &r : results) {
+    g_print ("%-16s %-10s %12.0f %12.0f %12.1f %14.2f\n", r.name.c_str (),
+        r.config.c_str (), r.messagesPerSec (),
+        r.seconds > 0 ? r.events / r.seconds : 0, r.bytesPerMessage (),
+        r.mallocsPerMessage ());
+  }
+}
+
+static gchar *
+results_to_json (const vector<BenchResult> &results, guint iterations,
+    guint numEvents, guint sensors)
+{
+  JsonBuilder *builder = json_builder_new ();
+  JsonGenerator *generator = json_generator_new ();
+  JsonNode *root;
+  gchar *json;
+
+  json_builder_begin_object (builder);
+  json_builder_set_member_name (builder, "version");
+  json_builder_add_int_value (builder, BENCH_VERSION);
+  json_builder_set_member_name (builder, "iterations");
+  json_builder_add_int_value (builder, iterations);
+  json_builder_set_member_name (builder, "events");
+  json_builder_add_int_value (builder, numEvents);
+  json_builder_set_member_name (builder, "sensors");
+  json_builder_add_int_value (builder, sensors);
+  json_builder_set_member_name (builder, "results");
+  json_builder_begin_array (builder);
+  for (const BenchResult &r : results) {
+    json_builder_begin_object (builder);
+    json_builder_set_member_name (builder, "case");
+    json_builder_add_string_value (builder, r.name.c_str ());
+    json_builder_set_member_name (builder, "payload_type");
+    json_builder_add_string_value (builder, r.payloadType.c_str ());
+    json_builder_set_member_name (builder, "config");
+    json_builder_add_string_value (builder, r.config.c_str ());
+    json_builder_set_member_name (builder, "calls");
+    json_builder_add_int_value (builder, r.calls);
+    json_builder_set_member_name (builder, "messages");
+    json_builder_add_int_value (builder, r.messages);
+    json_builder_set_member_name (builder, "events");
+    json_builder_add_int_value (builder, r.events);
+    json_builder_set_member_name (builder, "seconds");
+    json_builder_add_double_value (builder, r.seconds);
+    json_builder_set_member_name (builder, "messages_per_sec");
+    json_builder_add_double_value (builder, r.messagesPerSec ());
+    json_builder_set_member_name (builder, "bytes_per_message");
+    json_builder_add_double_value (builder, r.bytesPerMessage ());
+    json_builder_set_member_name (builder, "mallocs_per_message");
+    json_builder_add_double_value (builder, r.mallocsPerMessage ());
+    json_builder_end_object (builder);
+  }
+  json_builder_end_array (builder);
+  json_builder_end_object (builder);
+
+  root = json_builder_get_root (builder);
+  json_generator_set_root (generator, root);
+  json_generator_set_pretty (generator, TRUE);
+  json = json_generator_to_data (generator, NULL);
+
+  json_node_free (root);
+  g_object_unref (generator);
+  g_object_unref (builder);
+  return json;
+}
+
+/* Compares the results with the "results" of an earlier --json file.
+ * Returns the number of regressions, or -1 if the file can't be read. */
+static gint
+compare_baseline (const vector<BenchResult> &results, const gchar *file,
+    gdouble tolerance)
+{
+  JsonParser *parser = json_parser_new ();
+  GError *error = NULL;
+  JsonArray *baseline;
+  gint regressions = 0;
+
+  if (!json_parser_load_from_file (parser, file, &error)) {
+    cout << "Error: " << error->message << endl;
+    g_error_free (error);
+    g_object_unref (parser);
+    return -1;
+  }
+  baseline = json_object_get_array_member (
+      json_node_get_object (json_parser_get_root (parser)), "results");
+
+  g_print ("\n%-16s %-10s %12s %14s\n", "case", "config", "msgs/s",
+      "mallocs/msg");
+  for (const BenchResult &r : results) {
+    for (guint i = 0; i < json_array_get_length (baseline); i++) {
+      JsonObject *old = json_array_get_object_element (baseline, i);
+      if (r.name != json_object_get_string_member (old, "case") ||
+          r.config != json_object_get_string_member (old, "config"))
+        continue;
+
+      gdouble oldRate = json_object_get_double_member (old, "messages_per_sec");
+      gdouble oldMallocs =
+          json_object_get_double_member (old, "mallocs_per_message");
+      gdouble change = oldRate > 0 ?
+          100.0 * (r.messagesPerSec () - oldRate) / oldRate : 0;
+      // allocation counts are deterministic, allow for rounding only
+      gboolean regressed = change < -tolerance ||
+          r.mallocsPerMessage () > oldMallocs + 0.01;
+
+      g_print ("%-16s %-10s %+11.1f%% %+14.2f%s\n", r.name.c_str (),
+          r.config.c_str (), change, r.mallocsPerMessage () - oldMallocs,
+          regressed ? "  REGRESSION" : "");
+      regressions += regressed;
+      break;
+    }
+  }
+  g_object_unref (parser);
+  return regressions;
+}
+
+int
+main (int argc, char *argv[])
+{
+  gint iterations = 20000;
+  gint numEvents = 8;
+  gint sensors = 16;
+  gchar *jsonFile = NULL;
+  gchar *baselineFile = NULL;
+  gdouble tolerance = 10.0;
+  GError *error = NULL;
+  GOptionEntry entries[] = {
+    { "iterations", 'n', 0, G_OPTION_ARG_INT, &iterations,
+      "Calls per case (default 20000)", "N" },
+    { "events", 'e', 0, G_OPTION_ARG_INT, &numEvents,
+      "Events per nvds_msg2p_generate_multiple call (default 8)", "N" },
+    { "sensors", 's', 0, G_OPTION_ARG_INT, &sensors,
+      "Sensor, place and analytics groups per config (default 16)", "N" },
+    { "json", 'j', 0, G_OPTION_ARG_FILENAME, &jsonFile,
+      "Write the results as JSON to FILE, - for stdout", "FILE" },
+    { "baseline", 'b', 0, G_OPTION_ARG_FILENAME, &baselineFile,
+      "Compare with the JSON results in FILE", "FILE" },
+    { "tolerance", 't', 0, G_OPTION_ARG_DOUBLE, &tolerance,
+      "Allowed messages/s loss against the baseline in percent "
+      "(default 10)", "PCT" },
+    { NULL }
+  };
+  GOptionContext *options = g_option_context_new ("- nvmsgconv benchmark");
+  vector<BenchResult> results;
+  gchar *dir;
+  gint ret = 0;
+
+  g_option_context_add_main_entries (options, entries, NULL);
+  if (!g_option_context_parse (options, &argc, &argv, &error)) {
+    cout << "Error: " << error->message << endl;
+    return 2;
+  }
+  g_option_context_free (options);
+  if (iterations <= 0 || numEvents <= 0 || sensors <= 0) {
+    cout << "Error: --iterations, --events and --sensors must be positive"
+        << endl;
+    return 2;
+  }
+  if (!g_getenv ("G_SLICE"))
+    cerr << "Note: set G_SLICE=always-malloc to count GSlice allocations"
+        << endl;
+
+  dir = g_dir_make_tmp ("nvmsgconv-bench-XXXXXX", &error);
+  if (!dir) {
+    cout << "Error: " << error->message << endl;
+    return 2;
+  }
+
+  SyntheticEvents events (numEvents, sensors);
+  SyntheticFrames frames (numEvents, sensors);
+  vector<gchar *> files;
+
+  for (guint f = 0; f < (guint) NUM_CONFIG_FORMATS; f++) {
+    ConfigFormat format = (ConfigFormat) f;
+    gchar *config = write_config (dir, format, sensors, 0);
+    if (!config) {
+      ret = 2;
+      goto done;
+    }
+    files.push_back (config);
+
+    // parsing the config and building the payload templates
+    BenchResult create;
+    create.name = "ctx_create";
+    create.payloadType = payload_type_name (NVDS_PAYLOAD_DEEPSTREAM);
+    create.config = config_names[f];
+    run_case (create, MAX (iterations / 100, 10), [config] (guint64 *) -> guint {
+      NvDsMsg2pCtx *ctx = nvds_msg2p_ctx_create (config, NVDS_PAYLOAD_DEEPSTREAM);
+      if (!ctx)
+        return 0;
+      nvds_msg2p_ctx_destroy (ctx);
+      return 1;
+    });
+    create.events = create.messages;
+    results.push_back (create);
+
+    for (const PayloadCase &c : payload_cases) {
+      if (!case_supports_config (c, format))
+        continue;
+
+      gchar *caseConfig = config;
+      if (c.batchMode) {
+        caseConfig = write_config (dir, format, sensors, c.batchMode);
+        if (!caseConfig) {
+          ret = 2;
+          goto done;
+        }
+        files.push_back (caseConfig);
+      }
+
+      NvDsMsg2pCtx *ctx = nvds_msg2p_ctx_create (caseConfig, c.type);
+      if (!ctx) {
+        cout << "Error: no context for " << c.name << " with "
+            << config_names[f] << " config" << endl;
+        ret = 2;
+        goto done;
+      }
+
+      BenchResult result;
+      guint64 eventsPerCall = 0;
+      result.name = c.name;
+      result.payloadType = payload_type_name (c.type);
+      result.config = config_names[f];
+      run_case (result, iterations,
+          make_call (ctx, c, events, frames, &eventsPerCall));
+      result.events = result.calls * eventsPerCall;
+      results.push_back (result);
+      nvds_msg2p_ctx_destroy (ctx);
+    }
+  }
+
+  if (jsonFile && !g_strcmp0 (jsonFile, "-")) {
+    gchar *json = results_to_json (results, iterations, numEvents, sensors);
+    g_print ("%s\n", json);
+    g_free (json);
+  } else {
+    print_results (results);
+    if (jsonFile) {
+      gchar *json = results_to_json (results, iterations, numEvents, sensors);
+      if (!g_file_set_contents (jsonFile, json, -1, &error)) {
+        cout << "Error: " << error->message << endl;
+        g_clear_error (&error);
+        ret = 2;
+      }
+      g_free (json);
+    }
+  }
+
+  if (baselineFile) {
+    gint regressions = compare_baseline (results, baselineFile, tolerance);
+    if (regressions < 0)
+      ret = 2;
+    else if (regressions > 0 && ret == 0)
+      ret = 1;
+  }
+
+done:
+  for (gchar *file : files) {
+    g_unlink (file);
+    g_free (file);
+  }
+  g_rmdir (dir);
+  g_free (dir);
+  g_free (jsonFile);
+  g_free (baselineFile);
+  return ret;
+}
@@ -367,6 +367,46 @@ done:
   return ret;
 }
 
+static bool
+nvds_msg2p_parse_message (void *privData, GKeyFile *key_file, gchar *group)
+{
+  bool ret = false;
+  gchar **keys = NULL;
+  gchar **key = NULL;
+  GError *error = NULL;
+  NvDsPayloadPriv *privObj = (NvDsPayloadPriv *) privData;
+
+  keys = g_key_file_get_keys (key_file, group, NULL, &error);
+  CHECK_ERROR (error);
+
+  for (key = keys; *key; key++) {
+    if (!g_strcmp0 (*key, CONFIG_KEY_BATCH_MODE)) {
+      privObj->batchMode = g_key_file_get_integer (key_file, group,
+                                                   CONFIG_KEY_BATCH_MODE, &error);
+      CHECK_ERROR (error);
+      if (privObj->batchMode > NVDS_MSG_BATCH_ARRAY) {
+        cout << "Wrong value for " CONFIG_KEY_BATCH_MODE ", it should be "
+            "0 (payload per event) or 1 (JSON array)" << endl;
+        goto done;
+      }
+    } else {
+      cout << "Unknown key " << *key << " for group [" << group <<"]\n";
+    }
+  }
+
+  ret = true;
+
+done:
+  if (error) {
+    g_error_free (error);
+  }
+  if (keys) {
+    g_strfreev (keys);
+  }
+
+  return ret;
+}
+
 /* Separate a config file entry with delimiters
  * into strings. */
 static std::vector<std::string>
@@ -714,6 +754,18 @@ bool nvds_msg2p_parse_yaml (void *privData, const gchar *file)
       retVal = nvds_msg2p_parse_place_yaml (privData, cfg_file, paramKey);
     } else if (paramKey.compare(0, analytics_str.size(), analytics_str) == 0) {
       retVal = nvds_msg2p_parse_analytics_yaml (privData, cfg_file, paramKey);
+    } else if (paramKey == CONFIG_GROUP_MESSAGE) {
+      if (itr->second[CONFIG_KEY_BATCH_MODE]) {
+        gint batchMode = itr->second[CONFIG_KEY_BATCH_MODE].as<gint>();
+        if (batchMode < NVDS_MSG_BATCH_PER_EVENT ||
+            batchMode > NVDS_MSG_BATCH_ARRAY) {
+          cout << "Wrong value for " CONFIG_KEY_BATCH_MODE ", it should be "
+              "0 (payload per event) or 1 (JSON array)" << endl;
+          retVal = false;
+        } else {
+          ((NvDsPayloadPriv *) privData)->batchMode = batchMode;
+        }
+      }
     } else {
       cout << "Unknown group " << paramKey << endl;
     }
@@ -752,6 +804,8 @@ bool nvds_msg2p_parse_key_value (void *privData, const gchar *file)
       retVal = nvds_msg2p_parse_place (privData, cfgFile, *group);
     } else if (!strncmp (*group, CONFIG_GROUP_ANALYTICS, strlen (CONFIG_GROUP_ANALYTICS))) {
       retVal = nvds_msg2p_parse_analytics (privData, cfgFile, *group);
+    } else if (!g_strcmp0 (*group, CONFIG_GROUP_MESSAGE)) {
+      retVal = nvds_msg2p_parse_message (privData, cfgFile, *group);
     } else {
       cout << "Unknown group " << *group << endl;
     }
@@ -32,6 +32,7 @@ using namespace std;
 #define CONFIG_GROUP_SENSOR "sensor"
 #define CONFIG_GROUP_PLACE "place"
 #define CONFIG_GROUP_ANALYTICS "analytics"
+#define CONFIG_GROUP_MESSAGE "message"
 
 #define CONFIG_KEY_COORDINATE "coordinate"
 #define CONFIG_KEY_DESCRIPTION "description"
@@ -44,6 +45,7 @@ using namespace std;
 #define CONFIG_KEY_SOURCE "source"
 #define CONFIG_KEY_TYPE "type"
 #define CONFIG_KEY_VERSION "version"
+#define CONFIG_KEY_BATCH_MODE "batch-mode"
 
 
 #define CONFIG_KEY_PLACE_SUB_FIELD1 "place-sub-field1"
@@ -52,6 +54,11 @@ using namespace std;
 
 #define DEFAULT_CSV_FIELDS 10
 
+/* batch-mode values of the [message] group: how nvds_msg2p_generate_multiple
+ * packs the events of one call with the full deepstream schema. */
+#define NVDS_MSG_BATCH_PER_EVENT 0  /* one payload per event */
+#define NVDS_MSG_BATCH_ARRAY 1      /* one payload holding a JSON array */
+
 
 #define CHECK_ERROR(error) \
     if (error) { \
@@ -99,16 +106,35 @@ struct NvDsAnalyticsObject {
   guint lc_cum_straight;
 };
 
+/**
+ * Static JSON fragments serialized once per config id when the context is
+ * created, the analytics objects of the full-schema fast path. They lack
+ * their closing brace so per-event fields can be appended.
+ */
+struct NvDsPayloadTemplates {
+  unordered_map<int, string> analytics;
+};
+
 struct NvDsPayloadPriv {
+  /* references of the context and of the generate calls using it, see
+   * nvds_msg2p_ctx_reload () */
+  gint refCount = 1;
   unordered_map<int, NvDsSensorObject> sensorObj;
   unordered_map<int, NvDsPlaceObject> placeObj;
   unordered_map<int, NvDsAnalyticsObject> analyticsObj;
+  guint batchMode = NVDS_MSG_BATCH_PER_EVENT;
+  NvDsPayloadTemplates templates;
 };
 
 gchar* generate_event_message (void *privData, NvDsEventMsgMeta *meta);
 gchar* generate_event_message_minimal (void *privData, NvDsEvent *events, guint size);
+gchar* generate_event_message_array (void *privData, NvDsEvent *events, guint size);
+guint8* generate_event_message_binary (void *privData, NvDsEventMsgMeta *meta, guint *len);
+guint8* generate_event_message_binary_array (void *privData, NvDsEvent *events,
+    guint size, guint *len);
 gchar* generate_dsmeta_message (void *privData, void *frameMeta, void *objMeta);
 gchar* generate_dsmeta_message_minimal (void *privData, void *frameMeta);
+void nvds_msg2p_build_templates (void *privData);
 void *create_deepstream_schema_ctx();
 void destroy_deepstream_schema_ctx(void *privData);
 bool nvds_msg2p_parse_key_value (void *privData, const gchar *file);
@@ -17,6 +17,7 @@
 #include <cstring>
 #include <vector>
 #include "deepstream_schema.h"
+#include "nvds_analytics_meta.h"
 
 using namespace std;
 
@@ -271,6 +272,65 @@ generate_object_object (void *privData, NvDsFrameMeta *frame_meta, NvDsObjectMet
   return objectObj;
 }
 
+static NvDsAnalyticsFrameMeta* get_analytics_frame_meta (NvDsFrameMeta *frame_meta)
+{
+  static NvDsMetaType analyticsMetaType = NVDS_USER_FRAME_META_NVDSANALYTICS;
+
+  for (NvDsUserMetaList *l = frame_meta->frame_user_meta_list; l; l = l->next) {
+    NvDsUserMeta *frame_usermeta = (NvDsUserMeta *) l->data;
+    if (frame_usermeta && frame_usermeta->base_meta.meta_type == analyticsMetaType)
+      return (NvDsAnalyticsFrameMeta *) frame_usermeta->user_meta_data;
+  }
+  return NULL;
+}
+
+/* Adds the counts of the nvdsanalytics frame meta attached to the frame,
+ * so line crossings reach the payload without an event msg meta.
+ * Returns FALSE if the frame carries no analytics meta.
+ *
+ *  "lineCrossing": { "<label>": { "current": 1, "cumulative": 39 } },
+ *  "roi": { "<label>": 3 },
+ *  "overcrowding": { "<label>": false },
+ *  "objectCount": { "<class-id>": 5 }
+ */
+static gboolean add_frame_analytics (JsonObject *jobject, NvDsFrameMeta *frame_meta)
+{
+  NvDsAnalyticsFrameMeta *meta = get_analytics_frame_meta (frame_meta);
+  JsonObject *lcObj;
+  JsonObject *countObj;
+
+  if (!meta)
+    return FALSE;
+
+  lcObj = json_object_new ();
+  for (auto &cum : meta->objLCCumCnt) {
+    auto curr = meta->objLCCurrCnt.find (cum.first);
+    countObj = json_object_new ();
+    json_object_set_int_member (countObj, "current",
+        curr != meta->objLCCurrCnt.end() ? curr->second : 0);
+    json_object_set_int_member (countObj, "cumulative", cum.second);
+    json_object_set_object_member (lcObj, cum.first.c_str(), countObj);
+  }
+  json_object_set_object_member (jobject, "lineCrossing", lcObj);
+
+  countObj = json_object_new ();
+  for (auto &roi : meta->objInROIcnt)
+    json_object_set_int_member (countObj, roi.first.c_str(), roi.second);
+  json_object_set_object_member (jobject, "roi", countObj);
+
+  countObj = json_object_new ();
+  for (auto &oc : meta->ocStatus)
+    json_object_set_boolean_member (countObj, oc.first.c_str(), oc.second);
+  json_object_set_object_member (jobject, "overcrowding", countObj);
+
+  countObj = json_object_new ();
+  for (auto &cnt : meta->objCnt)
+    json_object_set_int_member (countObj, to_string(cnt.first).c_str(), cnt.second);
+  json_object_set_object_member (jobject, "objectCount", countObj);
+
+  return TRUE;
+}
+
 static JsonObject* generate_event_object (NvDsObjectMeta *obj_meta)
 {
   JsonObject *eventObj;
@@ -322,10 +382,14 @@ gchar* generate_dsmeta_message (void *privData, void *frameMeta, void *objMeta)
   // analytics object
   analyticsObj = generate_analytics_module_object (privData, frame_meta);
 
-  // object object
-  objectObj = generate_object_object (privData, frame_meta, obj_meta);
-  // event object
-  eventObj = generate_event_object (obj_meta);
+  // nvdsanalytics counts of the frame, kept even without an analytics group
+  if (!analyticsObj)
+    analyticsObj = json_object_new ();
+  add_frame_analytics (analyticsObj, frame_meta);
+
+  // object and event objects, only when called for an object
+  objectObj = obj_meta ? generate_object_object (privData, frame_meta, obj_meta) : NULL;
+  eventObj = obj_meta ? generate_event_object (obj_meta) : NULL;
 
   char ts[MAX_TIME_STAMP_LEN + 1];
   generate_ts_rfc3339 (ts, MAX_TIME_STAMP_LEN);
@@ -338,8 +402,10 @@ gchar* generate_dsmeta_message (void *privData, void *frameMeta, void *objMeta)
   json_object_set_object_member (rootObj, "place", placeObj);
   json_object_set_object_member (rootObj, "sensor", sensorObj);
   json_object_set_object_member (rootObj, "analyticsModule", analyticsObj);
-  json_object_set_object_member (rootObj, "object", objectObj);
-  json_object_set_object_member (rootObj, "event", eventObj);
+  if (objectObj)
+    json_object_set_object_member (rootObj, "object", objectObj);
+  if (eventObj)
+    json_object_set_object_member (rootObj, "event", eventObj);
 
   json_object_set_string_member (rootObj, "videoPath", "");
 
@@ -469,6 +535,13 @@ gchar* generate_dsmeta_message_minimal (void *privData, void *frameMeta)
 
   json_object_set_array_member (jobject, "objects", jArray);
 
+  // nvdsanalytics counts of the frame
+  JsonObject *analyticsObj = json_object_new ();
+  if (add_frame_analytics (analyticsObj, frame_meta))
+    json_object_set_object_member (jobject, "analytics", analyticsObj);
+  else
+    json_object_unref (analyticsObj);
+
   JsonArray *custMsgjArray = json_array_new ();
   //Search for any custom message blob within frame usermeta list
   for (NvDsUserMetaList *l = frame_meta->frame_user_meta_list; l; l = l->next) {
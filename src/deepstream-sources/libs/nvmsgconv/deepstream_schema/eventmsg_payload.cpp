@@ -15,6 +15,7 @@
 #include <fstream>
 #include <sstream>
 #include <cstring>
+#include <ctime>
 #include <vector>
 #include "deepstream_schema.h"
 
@@ -217,10 +218,7 @@ generate_analytics_module_object (void *privData, NvDsEventMsgMeta *meta)
   json_object_set_string_member (analyticsObj, "description", dsObj->desc.c_str());
   json_object_set_string_member (analyticsObj, "source", dsObj->source.c_str());
   json_object_set_string_member (analyticsObj, "version", dsObj->version.c_str());
-  
-  // custom analytics data
-  json_object_set_int_member (analyticsObj, "lc_curr_straight", meta->lc_curr_straight);
-  json_object_set_int_member (analyticsObj, "lc_cum_straight", meta->lc_cum_straight);
+
   return analyticsObj;
 }
 
@@ -533,16 +531,126 @@ generate_object_object (void *privData, NvDsEventMsgMeta *meta)
   return objectObj;
 }
 
-gchar* generate_event_message (void *privData, NvDsEventMsgMeta *meta)
+/* Formats the analytics module key of one line-crossing count, e.g.
+ * "lc_curr_straight". */
+static void
+lc_count_key (gchar *key, gsize size, const gchar *prefix,
+              const NvDsLineCrossingCount *count)
+{
+  g_snprintf (key, size, "%s%s", prefix, count->label);
+}
+
+/* Line-crossing members of the analytics module: lc_curr_<label> and
+ * lc_cum_<label> for every count of the meta, or for "straight" from
+ * lc_curr_straight / lc_cum_straight when the meta has no counts. */
+static void
+set_line_crossing_members (JsonObject *analyticsObj, NvDsEventMsgMeta *meta)
+{
+  gchar key[NVDS_LC_LABEL_LEN + 8];
+  guint i;
+
+  if (meta->numLcCounts == 0) {
+    json_object_set_int_member (analyticsObj, "lc_curr_straight", meta->lc_curr_straight);
+    json_object_set_int_member (analyticsObj, "lc_cum_straight", meta->lc_cum_straight);
+    return;
+  }
+  for (i = 0; i < meta->numLcCounts; i++) {
+    lc_count_key (key, sizeof (key), "lc_curr_", &meta->lcCounts[i]);
+    json_object_set_int_member (analyticsObj, key, meta->lcCounts[i].current);
+    lc_count_key (key, sizeof (key), "lc_cum_", &meta->lcCounts[i]);
+    json_object_set_int_member (analyticsObj, key, meta->lcCounts[i].cumulative);
+  }
+}
+
+/* Label of the line a crossing object crossed, NULL if its index is not
+ * one of the meta's counts. */
+static const gchar *
+lc_object_label (NvDsEventMsgMeta *meta, const NvDsLineCrossingObject *obj)
+{
+  return obj->lcIndex < meta->numLcCounts ? meta->lcCounts[obj->lcIndex].label : NULL;
+}
+
+/* "crossingObjects" member: one {trackingId, classId, label, bbox} object
+ * per object and crossed line of the frame, bbox as whole pixels
+ * [left, top, width, height]. */
+static JsonArray*
+generate_crossing_objects_array (NvDsEventMsgMeta *meta)
+{
+  JsonArray *objects = json_array_sized_new (meta->numLcObjects);
+  guint i;
+
+  for (i = 0; i < meta->numLcObjects; i++) {
+    NvDsLineCrossingObject *obj = &meta->lcObjects[i];
+    JsonObject *objectObj = json_object_new ();
+    JsonArray *bbox = json_array_sized_new (4);
+
+    json_array_add_int_element (bbox, (gint64) obj->bbox.left);
+    json_array_add_int_element (bbox, (gint64) obj->bbox.top);
+    json_array_add_int_element (bbox, (gint64) obj->bbox.width);
+    json_array_add_int_element (bbox, (gint64) obj->bbox.height);
+    json_object_set_int_member (objectObj, "trackingId", obj->trackingId);
+    json_object_set_int_member (objectObj, "classId", obj->classId);
+    json_object_set_string_member (objectObj, "label", lc_object_label (meta, obj));
+    json_object_set_array_member (objectObj, "bbox", bbox);
+    json_array_add_object_element (objects, objectObj);
+  }
+  return objects;
+}
+
+/* Stamps the serialization time into the trace of a traced event, so
+ * probes downstream of nvmsgconv can read it from the meta too. */
+static void
+stamp_serialize_ts (NvDsEventMsgMeta *meta)
+{
+  if (meta->trace.probeTs)
+    meta->trace.serializeTs = (guint64) g_get_real_time () * 1000;
+}
+
+/* Microseconds from from to to, 0 if from is unknown or to is earlier. */
+static guint64
+trace_stage_us (guint64 from, guint64 to)
+{
+  return from && to > from ? (to - from) / 1000 : 0;
+}
+
+/* "trace" member of the full schema: the timestamps in nanoseconds. */
+static JsonObject*
+generate_trace_object (NvDsEventMsgMeta *meta)
+{
+  JsonObject *traceObj = json_object_new ();
+
+  json_object_set_int_member (traceObj, "captureTs", meta->trace.captureTs);
+  json_object_set_int_member (traceObj, "bufPts", meta->trace.bufPts);
+  json_object_set_int_member (traceObj, "probeTs", meta->trace.probeTs);
+  json_object_set_int_member (traceObj, "serializeTs", meta->trace.serializeTs);
+  return traceObj;
+}
+
+/* Compact "trace" member (NVDS_EVENT_TRACE_COMPACT): [captureTs ns,
+ * bufPts ns, capture to probe us, probe to serialization us]. */
+static JsonArray*
+generate_trace_array (NvDsEventMsgMeta *meta)
+{
+  JsonArray *traceArr = json_array_sized_new (4);
+
+  json_array_add_int_element (traceArr, meta->trace.captureTs);
+  json_array_add_int_element (traceArr, meta->trace.bufPts);
+  json_array_add_int_element (traceArr,
+      trace_stage_us (meta->trace.captureTs, meta->trace.probeTs));
+  json_array_add_int_element (traceArr,
+      trace_stage_us (meta->trace.probeTs, meta->trace.serializeTs));
+  return traceArr;
+}
+
+static JsonObject*
+generate_event_message_object (void *privData, NvDsEventMsgMeta *meta)
 {
-  JsonNode *rootNode;
   JsonObject *rootObj;
   JsonObject *placeObj;
   JsonObject *sensorObj;
   JsonObject *analyticsObj;
   JsonObject *eventObj;
   JsonObject *objectObj;
-  gchar *message;
 
   uuid_t msgId;
   gchar msgIdStr[37];
@@ -559,6 +667,11 @@ gchar* generate_event_message (void *privData, NvDsEventMsgMeta *meta)
   // analytics object
   analyticsObj = generate_analytics_module_object (privData, meta);
 
+  // custom analytics data
+  // json_object_set_int_member (analyticsObj, <the key of your msg to be send>, <corresponding value>);
+  if (analyticsObj)
+    set_line_crossing_members (analyticsObj, meta);
+
   // // object object
   // objectObj = generate_object_object (privData, meta);
 
@@ -575,6 +688,18 @@ gchar* generate_event_message (void *privData, NvDsEventMsgMeta *meta)
   // json_object_set_object_member (rootObj, "place", placeObj);
   // json_object_set_object_member (rootObj, "sensor", sensorObj);
   json_object_set_object_member (rootObj, "analyticsModule", analyticsObj);
+  if (meta->numLcObjects > 0)
+    json_object_set_array_member (rootObj, "crossingObjects",
+        generate_crossing_objects_array (meta));
+  if (meta->trace.probeTs) {
+    stamp_serialize_ts (meta);
+    if (meta->trace.flags & NVDS_EVENT_TRACE_COMPACT)
+      json_object_set_array_member (rootObj, "trace",
+          generate_trace_array (meta));
+    else
+      json_object_set_object_member (rootObj, "trace",
+          generate_trace_object (meta));
+  }
 
   // not use these metadata
   // json_object_set_object_member (rootObj, "object", objectObj);
@@ -585,6 +710,197 @@ gchar* generate_event_message (void *privData, NvDsEventMsgMeta *meta)
   // else
   //   json_object_set_string_member (rootObj, "videoPath", "");
 
+  return rootObj;
+}
+
+/* Appends str as a JSON string literal, or null when str is NULL. */
+static void
+append_json_string (GString *out, const gchar *str)
+{
+  const gchar *c;
+
+  if (!str) {
+    g_string_append (out, "null");
+    return;
+  }
+
+  g_string_append_c (out, '"');
+  for (c = str; *c; c++) {
+    switch (*c) {
+      case '"':
+        g_string_append (out, "\\\"");
+        break;
+      case '\\':
+        g_string_append (out, "\\\\");
+        break;
+      case '\n':
+        g_string_append (out, "\\n");
+        break;
+      case '\r':
+        g_string_append (out, "\\r");
+        break;
+      case '\t':
+        g_string_append (out, "\\t");
+        break;
+      default:
+        if ((guchar) *c < 0x20)
+          g_string_append_printf (out, "\\u%04x", (guchar) *c);
+        else
+          g_string_append_c (out, *c);
+    }
+  }
+  g_string_append_c (out, '"');
+}
+
+static gchar*
+serialize_json_object (JsonObject *obj)
+{
+  JsonNode *node;
+  gchar *str;
+
+  node = json_node_new (JSON_NODE_OBJECT);
+  json_node_set_object (node, obj);
+  str = json_to_string (node, FALSE);
+  json_node_free (node);
+  json_object_unref (obj);
+
+  return str;
+}
+
+/* Serializes the static analytics object of every config id once, so
+ * generate_event_message only splices the per-event fields into prebuilt
+ * text instead of rebuilding json-glib trees per message. The fragments
+ * are kept without their closing brace so the lc_* counts can be
+ * appended. */
+void nvds_msg2p_build_templates (void *privData)
+{
+  NvDsPayloadPriv *privObj = (NvDsPayloadPriv *) privData;
+  NvDsEventMsgMeta meta;
+  gchar *str;
+
+  if (!privObj)
+    return;
+
+  privObj->templates.analytics.clear ();
+  memset (&meta, 0, sizeof (meta));
+
+  for (auto &analytics : privObj->analyticsObj) {
+    meta.moduleId = analytics.first;
+    str = serialize_json_object (generate_analytics_module_object (privData, &meta));
+    string fragment = str;
+    g_free (str);
+    fragment.pop_back ();
+    privObj->templates.analytics[analytics.first] = fragment;
+  }
+}
+
+/* Builds the event message text from the prebuilt analytics fragment,
+ * producing the same members as generate_event_message_object. */
+static void
+append_event_message (GString *out, const string &analyticsTmpl,
+                      NvDsEventMsgMeta *meta)
+{
+  uuid_t msgId;
+  gchar msgIdStr[37];
+
+  uuid_generate_random (msgId);
+  uuid_unparse_lower(msgId, msgIdStr);
+
+  g_string_append (out, "{\"messageid\":\"");
+  g_string_append (out, msgIdStr);
+  g_string_append (out, "\",\"@timestamp\":");
+  append_json_string (out, meta->ts);
+  g_string_append (out, ",\"deviceId\":");
+  append_json_string (out, meta->sensorStr);
+  g_string_append (out, ",\"analyticsModule\":");
+  g_string_append_len (out, analyticsTmpl.data(), analyticsTmpl.size());
+  if (analyticsTmpl.size() > 1)
+    g_string_append_c (out, ',');
+  if (meta->numLcCounts == 0) {
+    g_string_append_printf (out, "\"lc_curr_straight\":%u,\"lc_cum_straight\":%u}",
+        meta->lc_curr_straight, meta->lc_cum_straight);
+  } else {
+    gchar key[NVDS_LC_LABEL_LEN + 8];
+    for (guint i = 0; i < meta->numLcCounts; i++) {
+      if (i > 0)
+        g_string_append_c (out, ',');
+      lc_count_key (key, sizeof (key), "lc_curr_", &meta->lcCounts[i]);
+      append_json_string (out, key);
+      g_string_append_printf (out, ":%u,", meta->lcCounts[i].current);
+      lc_count_key (key, sizeof (key), "lc_cum_", &meta->lcCounts[i]);
+      append_json_string (out, key);
+      g_string_append_printf (out, ":%u", meta->lcCounts[i].cumulative);
+    }
+    g_string_append_c (out, '}');
+  }
+
+  if (meta->numLcObjects > 0) {
+    g_string_append (out, ",\"crossingObjects\":[");
+    for (guint i = 0; i < meta->numLcObjects; i++) {
+      NvDsLineCrossingObject *obj = &meta->lcObjects[i];
+      if (i > 0)
+        g_string_append_c (out, ',');
+      g_string_append_printf (out, "{\"trackingId\":%" G_GUINT64_FORMAT
+          ",\"classId\":%d,\"label\":", obj->trackingId, obj->classId);
+      append_json_string (out, lc_object_label (meta, obj));
+      g_string_append_printf (out, ",\"bbox\":[%d,%d,%d,%d]}",
+          (gint) obj->bbox.left, (gint) obj->bbox.top,
+          (gint) obj->bbox.width, (gint) obj->bbox.height);
+    }
+    g_string_append_c (out, ']');
+  }
+
+  if (meta->trace.probeTs) {
+    NvDsEventTrace *trace = &meta->trace;
+
+    stamp_serialize_ts (meta);
+    if (trace->flags & NVDS_EVENT_TRACE_COMPACT) {
+      g_string_append_printf (out, ",\"trace\":[%" G_GUINT64_FORMAT ",%"
+          G_GUINT64_FORMAT ",%" G_GUINT64_FORMAT ",%" G_GUINT64_FORMAT "]",
+          trace->captureTs, trace->bufPts,
+          trace_stage_us (trace->captureTs, trace->probeTs),
+          trace_stage_us (trace->probeTs, trace->serializeTs));
+    } else {
+      g_string_append_printf (out, ",\"trace\":{\"captureTs\":%"
+          G_GUINT64_FORMAT ",\"bufPts\":%" G_GUINT64_FORMAT ",\"probeTs\":%"
+          G_GUINT64_FORMAT ",\"serializeTs\":%" G_GUINT64_FORMAT "}",
+          trace->captureTs, trace->bufPts, trace->probeTs,
+          trace->serializeTs);
+    }
+  }
+  g_string_append_c (out, '}');
+}
+
+static const string*
+find_analytics_template (void *privData, NvDsEventMsgMeta *meta)
+{
+  NvDsPayloadPriv *privObj = (NvDsPayloadPriv *) privData;
+
+  if (!privObj)
+    return NULL;
+
+  auto tmpl = privObj->templates.analytics.find (meta->moduleId);
+  if (tmpl == privObj->templates.analytics.end())
+    return NULL;
+  return &tmpl->second;
+}
+
+gchar* generate_event_message (void *privData, NvDsEventMsgMeta *meta)
+{
+  JsonNode *rootNode;
+  JsonObject *rootObj;
+  gchar *message;
+  const string *analyticsTmpl = find_analytics_template (privData, meta);
+
+  if (analyticsTmpl) {
+    GString *out = g_string_sized_new (256);
+    append_event_message (out, *analyticsTmpl, meta);
+    return g_string_free (out, FALSE);
+  }
+
+  // No template for this module id, build the message tree instead.
+  rootObj = generate_event_message_object (privData, meta);
+
   rootNode = json_node_new (JSON_NODE_OBJECT);
   json_node_set_object (rootNode, rootObj);
 
@@ -595,6 +911,261 @@ gchar* generate_event_message (void *privData, NvDsEventMsgMeta *meta)
   return message;
 }
 
+/* Serializes all events of a batch into one JSON array payload, each
+ * element being the message generate_event_message would produce for
+ * that event. */
+gchar* generate_event_message_array (void *privData, NvDsEvent *events, guint size)
+{
+  GString *out = g_string_sized_new (256 * MAX (size, 1));
+  guint i;
+
+  g_string_append_c (out, '[');
+  for (i = 0; i < size; i++) {
+    NvDsEventMsgMeta *meta = events[i].metadata;
+    const string *analyticsTmpl = find_analytics_template (privData, meta);
+
+    if (i > 0)
+      g_string_append_c (out, ',');
+
+    if (analyticsTmpl) {
+      append_event_message (out, *analyticsTmpl, meta);
+    } else {
+      gchar *message = serialize_json_object (
+          generate_event_message_object (privData, meta));
+      g_string_append (out, message);
+      g_free (message);
+    }
+  }
+  g_string_append_c (out, ']');
+
+  return g_string_free (out, FALSE);
+}
+
+/*
+ * Compact binary event message (NVDS_PAYLOAD_DEEPSTREAM_BINARY).
+ *
+ * Each message is a MessagePack array with positional fields, so no key
+ * names go on the wire:
+ *
+ *   [0] schema version     uint, currently 1
+ *   [1] message id         bin, 16 bytes (UUID)
+ *   [2] timestamp          uint, milliseconds since the Unix epoch (from ts)
+ *   [3] device id          str (sensorStr) or nil
+ *   [4] analytics module   str (analytics group id) or nil
+ *   [5] line crossings     array of [label str, current uint, cumulative uint]
+ *   [6] crossing objects   array of [tracking id uint, class id uint,
+ *                          label index uint (into [5]), left, top, width,
+ *                          height uint], only present when the event
+ *                          carries crossing objects or a trace, nil for
+ *                          a trace without crossing objects
+ *   [7] trace              [capture ns, buffer PTS ns, capture to probe us,
+ *                          probe to serialization us], only present when
+ *                          the event carries a trace (NvDsEventTrace)
+ *
+ * With batch-mode=1 the payload is a MessagePack array of such messages.
+ * Decoders must ignore trailing fields they do not know.
+ */
+#define BINARY_SCHEMA_VERSION 1
+#define BINARY_EVENT_FIELDS 6
+#define BINARY_EVENT_FIELDS_WITH_OBJECTS 7
+#define BINARY_EVENT_FIELDS_WITH_TRACE 8
+
+static void
+msgpack_pack_raw (GByteArray *out, guint8 tag, guint64 value, guint bytes)
+{
+  guint8 buf[9];
+  guint i;
+
+  buf[0] = tag;
+  for (i = 0; i < bytes; i++)
+    buf[1 + i] = (guint8) (value >> (8 * (bytes - 1 - i)));
+  g_byte_array_append (out, buf, bytes + 1);
+}
+
+static void
+msgpack_pack_uint (GByteArray *out, guint64 value)
+{
+  if (value < 0x80) {
+    guint8 fixint = (guint8) value;
+    g_byte_array_append (out, &fixint, 1);
+  } else if (value <= G_MAXUINT8) {
+    msgpack_pack_raw (out, 0xcc, value, 1);
+  } else if (value <= G_MAXUINT16) {
+    msgpack_pack_raw (out, 0xcd, value, 2);
+  } else if (value <= G_MAXUINT32) {
+    msgpack_pack_raw (out, 0xce, value, 4);
+  } else {
+    msgpack_pack_raw (out, 0xcf, value, 8);
+  }
+}
+
+static void
+msgpack_pack_array (GByteArray *out, guint32 size)
+{
+  if (size < 16) {
+    guint8 fixarray = 0x90 | size;
+    g_byte_array_append (out, &fixarray, 1);
+  } else if (size <= G_MAXUINT16) {
+    msgpack_pack_raw (out, 0xdc, size, 2);
+  } else {
+    msgpack_pack_raw (out, 0xdd, size, 4);
+  }
+}
+
+static void
+msgpack_pack_nil (GByteArray *out)
+{
+  guint8 nil = 0xc0;
+  g_byte_array_append (out, &nil, 1);
+}
+
+static void
+msgpack_pack_str (GByteArray *out, const gchar *str)
+{
+  guint32 len;
+
+  if (!str) {
+    msgpack_pack_nil (out);
+    return;
+  }
+
+  len = strlen (str);
+  if (len < 32) {
+    guint8 fixstr = 0xa0 | len;
+    g_byte_array_append (out, &fixstr, 1);
+  } else if (len <= G_MAXUINT8) {
+    msgpack_pack_raw (out, 0xd9, len, 1);
+  } else if (len <= G_MAXUINT16) {
+    msgpack_pack_raw (out, 0xda, len, 2);
+  } else {
+    msgpack_pack_raw (out, 0xdb, len, 4);
+  }
+  g_byte_array_append (out, (const guint8 *) str, len);
+}
+
+static void
+msgpack_pack_bin8 (GByteArray *out, const guint8 *data, guint8 len)
+{
+  msgpack_pack_raw (out, 0xc4, len, 1);
+  g_byte_array_append (out, data, len);
+}
+
+/* Parses the RFC3339 timestamps of generate_ts_rfc3339
+ * ("2022-08-20T09:05:01.695Z") into milliseconds since the epoch. */
+static guint64
+rfc3339_to_epoch_ms (const gchar *ts)
+{
+  struct tm tm_ts;
+  gint msec = 0;
+
+  if (!ts)
+    return 0;
+
+  memset (&tm_ts, 0, sizeof (tm_ts));
+  if (sscanf (ts, "%d-%d-%dT%d:%d:%d.%dZ", &tm_ts.tm_year, &tm_ts.tm_mon,
+          &tm_ts.tm_mday, &tm_ts.tm_hour, &tm_ts.tm_min, &tm_ts.tm_sec,
+          &msec) < 6)
+    return 0;
+
+  tm_ts.tm_year -= 1900;
+  tm_ts.tm_mon -= 1;
+  return (guint64) timegm (&tm_ts) * 1000 + msec;
+}
+
+static void
+append_binary_event (GByteArray *out, void *privData, NvDsEventMsgMeta *meta)
+{
+  NvDsPayloadPriv *privObj = (NvDsPayloadPriv *) privData;
+  const gchar *moduleId = NULL;
+  uuid_t msgId;
+
+  if (privObj) {
+    auto idMap = privObj->analyticsObj.find (meta->moduleId);
+    if (idMap != privObj->analyticsObj.end())
+      moduleId = idMap->second.id.c_str();
+  }
+
+  uuid_generate_random (msgId);
+
+  if (meta->trace.probeTs)
+    msgpack_pack_array (out, BINARY_EVENT_FIELDS_WITH_TRACE);
+  else
+    msgpack_pack_array (out, meta->numLcObjects > 0 ?
+        BINARY_EVENT_FIELDS_WITH_OBJECTS : BINARY_EVENT_FIELDS);
+  msgpack_pack_uint (out, BINARY_SCHEMA_VERSION);
+  msgpack_pack_bin8 (out, msgId, sizeof (uuid_t));
+  msgpack_pack_uint (out, rfc3339_to_epoch_ms (meta->ts));
+  msgpack_pack_str (out, meta->sensorStr);
+  msgpack_pack_str (out, moduleId);
+
+  if (meta->numLcCounts == 0) {
+    msgpack_pack_array (out, 1);
+    msgpack_pack_array (out, 3);
+    msgpack_pack_str (out, "straight");
+    msgpack_pack_uint (out, meta->lc_curr_straight);
+    msgpack_pack_uint (out, meta->lc_cum_straight);
+  } else {
+    msgpack_pack_array (out, meta->numLcCounts);
+    for (guint i = 0; i < meta->numLcCounts; i++) {
+      msgpack_pack_array (out, 3);
+      msgpack_pack_str (out, meta->lcCounts[i].label);
+      msgpack_pack_uint (out, meta->lcCounts[i].current);
+      msgpack_pack_uint (out, meta->lcCounts[i].cumulative);
+    }
+  }
+
+  if (meta->numLcObjects > 0) {
+    msgpack_pack_array (out, meta->numLcObjects);
+    for (guint i = 0; i < meta->numLcObjects; i++) {
+      NvDsLineCrossingObject *obj = &meta->lcObjects[i];
+      msgpack_pack_array (out, 7);
+      msgpack_pack_uint (out, obj->trackingId);
+      msgpack_pack_uint (out, MAX (obj->classId, 0));
+      msgpack_pack_uint (out, obj->lcIndex);
+      msgpack_pack_uint (out, (guint64) MAX (obj->bbox.left, 0.0f));
+      msgpack_pack_uint (out, (guint64) MAX (obj->bbox.top, 0.0f));
+      msgpack_pack_uint (out, (guint64) MAX (obj->bbox.width, 0.0f));
+      msgpack_pack_uint (out, (guint64) MAX (obj->bbox.height, 0.0f));
+    }
+  } else if (meta->trace.probeTs) {
+    msgpack_pack_nil (out);
+  }
+
+  if (meta->trace.probeTs == 0)
+    return;
+  stamp_serialize_ts (meta);
+  msgpack_pack_array (out, 4);
+  msgpack_pack_uint (out, meta->trace.captureTs);
+  msgpack_pack_uint (out, meta->trace.bufPts);
+  msgpack_pack_uint (out,
+      trace_stage_us (meta->trace.captureTs, meta->trace.probeTs));
+  msgpack_pack_uint (out,
+      trace_stage_us (meta->trace.probeTs, meta->trace.serializeTs));
+}
+
+guint8* generate_event_message_binary (void *privData, NvDsEventMsgMeta *meta,
+    guint *len)
+{
+  GByteArray *out = g_byte_array_sized_new (64);
+
+  append_binary_event (out, privData, meta);
+  *len = out->len;
+  return g_byte_array_free (out, FALSE);
+}
+
+guint8* generate_event_message_binary_array (void *privData, NvDsEvent *events,
+    guint size, guint *len)
+{
+  GByteArray *out = g_byte_array_sized_new (64 * MAX (size, 1));
+  guint i;
+
+  msgpack_pack_array (out, size);
+  for (i = 0; i < size; i++)
+    append_binary_event (out, privData, events[i].metadata);
+  *len = out->len;
+  return g_byte_array_free (out, FALSE);
+}
+
 static const gchar*
 object_enum_to_str (NvDsObjectType type, gchar* objectId)
 {
@@ -24,10 +24,30 @@
 using namespace std;
 
 
-NvDsMsg2pCtx* nvds_msg2p_ctx_create (const gchar *file, NvDsPayloadType type)
+/* A context as handed out by nvds_msg2p_ctx_create (): the public part
+ * first, followed by what reloading it needs. */
+typedef struct {
+  NvDsMsg2pCtx ctx;
+  /* configuration file the context was created or last reloaded with */
+  gchar *file;
+  /* reload_generation this context last reloaded at */
+  gint reloadGeneration;
+} NvDsMsg2pCtxPriv;
+
+/* Serializes swapping NvDsMsg2pCtx::privData with taking a reference on
+ * it in acquire_priv (). */
+G_LOCK_DEFINE_STATIC (priv_swap);
+/* Serializes reloads, which may come from several threads. */
+G_LOCK_DEFINE_STATIC (reload);
+/* Bumped by nvds_msg2p_request_reload (). */
+static gint reload_generation = 0;
+
+/* Parses file into a new NvDsPayloadPriv, nullptr for the schemas that
+ * do not need one. Returns FALSE if the file cannot be parsed. */
+static gboolean
+parse_config (NvDsPayloadType type, const gchar *file, gpointer *privData)
 {
-  NvDsMsg2pCtx *ctx = NULL;
-  string str;
+  gpointer priv = nullptr;
   bool retVal = true;
 
   /*
@@ -35,59 +55,167 @@ NvDsMsg2pCtx* nvds_msg2p_ctx_create (const gchar *file, NvDsPayloadType type)
    * components (e.g. sensor, place etc.) in case of full deepstream schema.
    */
   if (type == NVDS_PAYLOAD_DEEPSTREAM) {
-    g_return_val_if_fail (file, NULL);
+    g_return_val_if_fail (file, FALSE);
 
-    ctx = new NvDsMsg2pCtx;
-    ctx->privData = create_deepstream_schema_ctx();
+    priv = create_deepstream_schema_ctx();
 
     if (g_str_has_suffix (file, ".csv")) {
-      retVal = nvds_msg2p_parse_csv (ctx->privData, file);
+      retVal = nvds_msg2p_parse_csv (priv, file);
     } else if (g_str_has_suffix (file, ".yml") ||
                 g_str_has_suffix (file, ".yaml")) {
-      retVal = nvds_msg2p_parse_yaml (ctx->privData, file);
+      retVal = nvds_msg2p_parse_yaml (priv, file);
     } else {
-      retVal = nvds_msg2p_parse_key_value (ctx->privData, file);
+      retVal = nvds_msg2p_parse_key_value (priv, file);
     }
-  } else {
-    ctx = new NvDsMsg2pCtx;
+  } else if (file) {
     /* If configuration file is provided for minimal schema,
      * parse it for static values.
      */
-    if (file) {
-      ctx->privData = create_deepstream_schema_ctx();
-      if (g_str_has_suffix (file, ".yml") ||
-              g_str_has_suffix (file, ".yaml")) {
-        retVal = nvds_msg2p_parse_yaml (ctx->privData, file);
-      } else {
-        retVal = nvds_msg2p_parse_key_value (ctx->privData, file);
-      }
+    priv = create_deepstream_schema_ctx();
+    if (g_str_has_suffix (file, ".yml") ||
+            g_str_has_suffix (file, ".yaml")) {
+      retVal = nvds_msg2p_parse_yaml (priv, file);
     } else {
-      ctx->privData = nullptr;
-      retVal = true;
+      retVal = nvds_msg2p_parse_key_value (priv, file);
     }
   }
 
-  ctx->payloadType = type;
-
   if (!retVal) {
-    cout << "Error in creating instance" << endl;
+    if (priv)
+      destroy_deepstream_schema_ctx (priv);
+    return FALSE;
+  }
 
-    if (ctx && ctx->privData)
-        destroy_deepstream_schema_ctx(ctx->privData);
+  if (priv)
+    nvds_msg2p_build_templates (priv);
+  *privData = priv;
+  return TRUE;
+}
 
-    if (ctx) {
-      delete ctx;
-      ctx = NULL;
-    }
+/* Drops a reference on a configuration; the last one frees it. */
+static void
+release_priv (gpointer privData)
+{
+  NvDsPayloadPriv *priv = (NvDsPayloadPriv *) privData;
+
+  if (priv && g_atomic_int_dec_and_test (&priv->refCount))
+    destroy_deepstream_schema_ctx (priv);
+}
+
+/* Returns the configuration of ctx with a reference for one generate
+ * call, after reloading it if nvds_msg2p_request_reload () was called
+ * since the last reload. */
+static gpointer
+acquire_priv (NvDsMsg2pCtx *ctx)
+{
+  NvDsMsg2pCtxPriv *ctxPriv = (NvDsMsg2pCtxPriv *) ctx;
+  gint generation = g_atomic_int_get (&reload_generation);
+  gint seen = g_atomic_int_get (&ctxPriv->reloadGeneration);
+  NvDsPayloadPriv *priv;
+
+  if (seen != generation &&
+      g_atomic_int_compare_and_exchange (&ctxPriv->reloadGeneration, seen,
+          generation))
+    nvds_msg2p_ctx_reload (ctx, NULL);
+
+  G_LOCK (priv_swap);
+  priv = (NvDsPayloadPriv *) ctx->privData;
+  if (priv)
+    g_atomic_int_inc (&priv->refCount);
+  G_UNLOCK (priv_swap);
+  return priv;
+}
+
+/* Holds the configuration of ctx for the duration of a generate call, so
+ * a concurrent reload cannot free it underneath. */
+class PrivRef {
+public:
+  explicit PrivRef (NvDsMsg2pCtx *ctx) : priv (acquire_priv (ctx)) {}
+  ~PrivRef () { release_priv (priv); }
+  PrivRef (const PrivRef &) = delete;
+  PrivRef &operator= (const PrivRef &) = delete;
+
+  gpointer priv;
+};
+
+NvDsMsg2pCtx* nvds_msg2p_ctx_create (const gchar *file, NvDsPayloadType type)
+{
+  NvDsMsg2pCtxPriv *ctxPriv;
+  gpointer privData = nullptr;
+
+  if (!parse_config (type, file, &privData)) {
+    cout << "Error in creating instance" << endl;
+    return NULL;
   }
-  return ctx;
+
+  ctxPriv = new NvDsMsg2pCtxPriv;
+  ctxPriv->ctx.payloadType = type;
+  ctxPriv->ctx.privData = privData;
+  ctxPriv->file = g_strdup (file);
+  ctxPriv->reloadGeneration = g_atomic_int_get (&reload_generation);
+  return &ctxPriv->ctx;
 }
 
 void nvds_msg2p_ctx_destroy (NvDsMsg2pCtx *ctx)
 {
-  destroy_deepstream_schema_ctx(ctx->privData);
+  NvDsMsg2pCtxPriv *ctxPriv = (NvDsMsg2pCtxPriv *) ctx;
+
+  release_priv (ctx->privData);
   ctx->privData = nullptr;
-  delete ctx;
+  g_free (ctxPriv->file);
+  delete ctxPriv;
+}
+
+gboolean nvds_msg2p_ctx_reload (NvDsMsg2pCtx *ctx, const gchar *file)
+{
+  NvDsMsg2pCtxPriv *ctxPriv = (NvDsMsg2pCtxPriv *) ctx;
+  gpointer privData = nullptr;
+  gpointer oldPrivData;
+  gchar *newFile;
+
+  g_return_val_if_fail (ctx, FALSE);
+
+  G_LOCK (reload);
+  newFile = g_strdup (file ? file : ctxPriv->file);
+  if (!parse_config (ctx->payloadType, newFile, &privData)) {
+    cout << "Error in reloading " << (newFile ? newFile : "(null)")
+         << ", keeping the previous configuration" << endl;
+    g_free (newFile);
+    G_UNLOCK (reload);
+    return FALSE;
+  }
+
+  G_LOCK (priv_swap);
+  oldPrivData = ctx->privData;
+  ctx->privData = privData;
+  G_UNLOCK (priv_swap);
+
+  g_free (ctxPriv->file);
+  ctxPriv->file = newFile;
+  G_UNLOCK (reload);
+
+  /* freed here unless a generate call still uses it */
+  release_priv (oldPrivData);
+  return TRUE;
+}
+
+void nvds_msg2p_request_reload (void)
+{
+  g_atomic_int_inc (&reload_generation);
+}
+
+/* Wraps a generated message into a payload, taking ownership of it. */
+static NvDsPayload*
+create_payload (gchar *message)
+{
+  NvDsPayload *payload = (NvDsPayload *) g_malloc0 (sizeof (NvDsPayload));
+  gint len = strlen (message);
+
+  // Remove '\0' character at the end of string and just copy the content.
+  payload->payload = g_memdup (message, len);
+  payload->payloadSize = len;
+  g_free (message);
+  return payload;
 }
 
 NvDsPayload**
@@ -95,41 +223,63 @@ nvds_msg2p_generate_multiple (NvDsMsg2pCtx *ctx, NvDsEvent *events, guint eventS
                      guint *payloadCount)
 {
   gchar *message = NULL;
-  gint len = 0;
   NvDsPayload **payloads = NULL;
+  guint batchMode = NVDS_MSG_BATCH_PER_EVENT;
+  guint i;
+  PrivRef ref (ctx);
   *payloadCount = 0;
+
+  if (ref.priv)
+    batchMode = ((NvDsPayloadPriv *) ref.priv)->batchMode;
+
+  if (ctx->payloadType == NVDS_PAYLOAD_DEEPSTREAM &&
+      batchMode == NVDS_MSG_BATCH_PER_EVENT) {
+    // One payload per event; the array is sized for all of them up front.
+    payloads = (NvDsPayload **) g_malloc0 (sizeof (NvDsPayload*) * MAX (eventSize, 1));
+    for (i = 0; i < eventSize; i++) {
+      message = generate_event_message (ref.priv, events[i].metadata);
+      if (message)
+        payloads[(*payloadCount)++] = create_payload (message);
+    }
+    return payloads;
+  }
+
+  if (ctx->payloadType == NVDS_PAYLOAD_DEEPSTREAM_BINARY &&
+      batchMode == NVDS_MSG_BATCH_PER_EVENT) {
+    payloads = (NvDsPayload **) g_malloc0 (sizeof (NvDsPayload*) * MAX (eventSize, 1));
+    for (i = 0; i < eventSize; i++) {
+      payloads[i] = (NvDsPayload *) g_malloc0 (sizeof (NvDsPayload));
+      payloads[i]->payload = generate_event_message_binary (ref.priv,
+          events[i].metadata, &payloads[i]->payloadSize);
+    }
+    *payloadCount = eventSize;
+    return payloads;
+  }
+
   //Set how many payloads are being sent back to the plugin
   payloads = (NvDsPayload **) g_malloc0 (sizeof (NvDsPayload*) * 1);
 
   if (ctx->payloadType == NVDS_PAYLOAD_DEEPSTREAM) {
-    message = generate_event_message (ctx->privData, events->metadata);
+    message = generate_event_message_array (ref.priv, events, eventSize);
     if (message) {
-      payloads[*payloadCount]= (NvDsPayload *) g_malloc0 (sizeof (NvDsPayload));
-      len = strlen (message);
-      // Remove '\0' character at the end of string and just copy the content.
-      payloads[*payloadCount]->payload = g_memdup (message, len);
-      payloads[*payloadCount]->payloadSize = len;
+      payloads[*payloadCount] = create_payload (message);
       ++(*payloadCount);
-      g_free (message);
     }
   } else if (ctx->payloadType == NVDS_PAYLOAD_DEEPSTREAM_MINIMAL) {
-    message = generate_event_message_minimal (ctx->privData, events, eventSize);
+    message = generate_event_message_minimal (ref.priv, events, eventSize);
     if (message) {
-      len = strlen (message);
-      payloads[*payloadCount] = (NvDsPayload *) g_malloc0 (sizeof (NvDsPayload));
-      // Remove '\0' character at the end of string and just copy the content.
-      payloads[*payloadCount]->payload = g_memdup (message, len);
-      payloads[*payloadCount]->payloadSize = len;
+      payloads[*payloadCount] = create_payload (message);
       ++(*payloadCount);
-      g_free (message);
     }
-  } else if (ctx->payloadType == NVDS_PAYLOAD_CUSTOM) {
+  } else if (ctx->payloadType == NVDS_PAYLOAD_DEEPSTREAM_BINARY) {
     payloads[*payloadCount] = (NvDsPayload *) g_malloc0 (sizeof (NvDsPayload));
-    payloads[*payloadCount]->payload = (gpointer) g_strdup ("CUSTOM Schema");
-    payloads[*payloadCount]->payloadSize = strlen ((char *)payloads[*payloadCount]->payload) + 1;
+    payloads[*payloadCount]->payload = generate_event_message_binary_array (
+        ref.priv, events, eventSize, &payloads[*payloadCount]->payloadSize);
     ++(*payloadCount);
-  } else
+  } else {
+    g_free (payloads);
     payloads = NULL;
+  }
 
   return payloads;
 }
@@ -140,9 +290,10 @@ nvds_msg2p_generate (NvDsMsg2pCtx *ctx, NvDsEvent *events, guint size)
   gchar *message = NULL;
   gint len = 0;
   NvDsPayload *payload = (NvDsPayload *) g_malloc0 (sizeof (NvDsPayload));
+  PrivRef ref (ctx);
 
   if (ctx->payloadType == NVDS_PAYLOAD_DEEPSTREAM) {
-    message = generate_event_message (ctx->privData, events->metadata);
+    message = generate_event_message (ref.priv, events->metadata);
     if (message) {
       len = strlen (message);
       // Remove '\0' character at the end of string and just copy the content.
@@ -151,7 +302,7 @@ nvds_msg2p_generate (NvDsMsg2pCtx *ctx, NvDsEvent *events, guint size)
       g_free (message);
     }
   } else if (ctx->payloadType == NVDS_PAYLOAD_DEEPSTREAM_MINIMAL) {
-    message = generate_event_message_minimal (ctx->privData, events, size);
+    message = generate_event_message_minimal (ref.priv, events, size);
     if (message) {
       len = strlen (message);
       // Remove '\0' character at the end of string and just copy the content.
@@ -159,9 +310,9 @@ nvds_msg2p_generate (NvDsMsg2pCtx *ctx, NvDsEvent *events, guint size)
       payload->payloadSize = len;
       g_free (message);
     }
-  } else if (ctx->payloadType == NVDS_PAYLOAD_CUSTOM) {
-    payload->payload = (gpointer) g_strdup ("CUSTOM Schema");
-    payload->payloadSize = strlen ((char *)payload->payload) + 1;
+  } else if (ctx->payloadType == NVDS_PAYLOAD_DEEPSTREAM_BINARY) {
+    payload->payload = generate_event_message_binary (ref.priv,
+        events->metadata, &payload->payloadSize);
   } else
     payload->payload = NULL;
 
@@ -178,9 +329,10 @@ nvds_msg2p_generate_new (NvDsMsg2pCtx *ctx, void *metadataInfo)
   NvDsObjectMeta *obj_meta = (NvDsObjectMeta *) meta_info->objMeta;
 
   NvDsPayload *payload = (NvDsPayload *) g_malloc0 (sizeof (NvDsPayload));
+  PrivRef ref (ctx);
 
   if (ctx->payloadType == NVDS_PAYLOAD_DEEPSTREAM) {
-    message = generate_dsmeta_message(ctx->privData, frame_meta, obj_meta);
+    message = generate_dsmeta_message(ref.priv, frame_meta, obj_meta);
     if (message) {
         len = strlen (message);
         // Remove '\0' character at the end of string and just copy the content.
@@ -190,7 +342,7 @@ nvds_msg2p_generate_new (NvDsMsg2pCtx *ctx, void *metadataInfo)
     }
   }
   else if (ctx->payloadType == NVDS_PAYLOAD_DEEPSTREAM_MINIMAL) {
-    message = generate_dsmeta_message_minimal (ctx->privData, frame_meta);
+    message = generate_dsmeta_message_minimal (ref.priv, frame_meta);
     if (message) {
       len = strlen (message);
       // Remove '\0' character at the end of string and just copy the content.
@@ -220,9 +372,10 @@ nvds_msg2p_generate_multiple_new (NvDsMsg2pCtx *ctx, void *metadataInfo, guint *
   NvDsMsg2pMetaInfo *meta_info = (NvDsMsg2pMetaInfo *) metadataInfo;
   NvDsFrameMeta *frame_meta = (NvDsFrameMeta*) meta_info->frameMeta;
   NvDsObjectMeta *obj_meta = (NvDsObjectMeta *) meta_info->objMeta;
+  PrivRef ref (ctx);
 
   if (ctx->payloadType == NVDS_PAYLOAD_DEEPSTREAM) {
-    message = generate_dsmeta_message(ctx->privData, frame_meta, obj_meta);
+    message = generate_dsmeta_message(ref.priv, frame_meta, obj_meta);
     if (message) {
       payloads[*payloadCount]= (NvDsPayload *) g_malloc0 (sizeof (NvDsPayload));
       len = strlen (message);
@@ -233,7 +386,7 @@ nvds_msg2p_generate_multiple_new (NvDsMsg2pCtx *ctx, void *metadataInfo, guint *
       g_free (message);
     }
   } else if (ctx->payloadType == NVDS_PAYLOAD_DEEPSTREAM_MINIMAL) {
-    message = generate_dsmeta_message_minimal (ctx->privData, frame_meta);
+    message = generate_dsmeta_message_minimal (ref.priv, frame_meta);
     if (message) {
       len = strlen (message);
       payloads[*payloadCount] = (NvDsPayload *) g_malloc0 (sizeof (NvDsPayload));
@@ -29,6 +29,14 @@ extern "C"
 #endif
 
 
+/**
+ * Compact binary (MessagePack) event payload, see eventmsg_payload.cpp for
+ * the schema. It takes the place of the custom payload type, which is the
+ * value the nvmsgconv "payload-type" property accepts besides the two JSON
+ * schemas.
+ */
+#define NVDS_PAYLOAD_DEEPSTREAM_BINARY NVDS_PAYLOAD_CUSTOM
+
 /**
  * @ref NvDsMsg2pCtx is structure for library context.
  */
@@ -100,6 +108,9 @@ nvds_msg2p_generate (NvDsMsg2pCtx *ctx, NvDsEvent *events, guint size);
  * configuration file and dynamic values received in meta.
  * Payloads will be generated based on the @ref NvDsPayloadType type provided
  * in context creation (e.g. Deepstream, Custom etc.).
+ * With the full deepstream schema, one payload is generated per event, or a
+ * single payload holding a JSON array of all events when "batch-mode=1" is
+ * set in the [message] group of the configuration file.
  *
  * @param[in] ctx pointer to library context.
  * @param[in] events pointer to array of event objects.
@@ -149,6 +160,30 @@ nvds_msg2p_generate_new (NvDsMsg2pCtx *ctx, void *metadataInfo);
 NvDsPayload**
 nvds_msg2p_generate_multiple_new (NvDsMsg2pCtx *ctx, void *metadataInfo,  guint *payloadCount);
 
+/**
+ * Re-parses the configuration file of a context and swaps the result in.
+ *
+ * Generate calls already running finish with the previous configuration,
+ * later ones use the new one. If the file cannot be parsed the context
+ * keeps its configuration.
+ *
+ * @param[in] ctx pointer to library context created by
+ *                @ref nvds_msg2p_ctx_create.
+ * @param[in] file configuration file to parse, NULL for the file the
+ *                 context was created (or last reloaded) with.
+ *
+ * @return TRUE if the new configuration is in use.
+ */
+gboolean nvds_msg2p_ctx_reload (NvDsMsg2pCtx *ctx, const gchar *file);
+
+/**
+ * Makes every context of the process reload its configuration file before
+ * its next generate call. Meant for applications that do not own the
+ * context, e.g. one created by the nvmsgconv plugin; safe to call from
+ * any thread.
+ */
+void nvds_msg2p_request_reload (void);
+
 /**
  * This function should be called to release memory allocated for payload.
  *